@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Parse logfiles and load the resulting records into the database
+configured in database/settings.py, in large batches. This is meant
+for back-loading whole cruises' worth of logged data, e.g.
+
+  database/backfill_database.py \
+    --logfiles 'test/NBP1406/*/raw/NBP1406_*' \
+    --data_id_from_path \
+    --definition_path local/usap/nbp/devices/nbp_devices.yaml \
+    --database data --database_user rvdas --database_password rvdas
+
+Records are handed to the connector's write_records() method in
+batches of --batch_records records. With the PostgreSQLConnector, each
+batch is streamed into the database with COPY; with MySQLConnector,
+it is written with multi-row inserts in a single transaction.
+
+Logfile lines are expected to begin with a data_id, as in
+
+  s330 2017-11-04T05:12:19.479303Z $INZDA,000000.17,07,08,2014,,*78
+
+If they don't (as is the case for the sample logs in test/NBP1406),
+either specify the data_id to prefix them with using --data_id, or
+specify --data_id_from_path to take it from the name of each file's
+directory: the directory above 'raw' if the file is in a 'raw'
+directory, e.g. 'gyr1' for test/NBP1406/gyr1/raw/NBP1406_gyr1-2014-08-01.
+"""
+import glob
+import logging
+import os.path
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from logger.utils.record_parser import RecordParser, DEFAULT_DEFINITION_PATH
+
+# Don't freak out if we can't find database settings until we
+# actually try to use them.
+try:
+  from database.settings import DATABASE_ENABLED, Connector
+  from database.settings import DEFAULT_DATABASE, DEFAULT_DATABASE_HOST
+  from database.settings import DEFAULT_DATABASE_USER, DEFAULT_DATABASE_PASSWORD
+  DATABASE_SETTINGS_FOUND = True
+except ModuleNotFoundError:
+  DATABASE_SETTINGS_FOUND = False
+  DATABASE_ENABLED = False
+  DEFAULT_DATABASE = DEFAULT_DATABASE_HOST = None
+  DEFAULT_DATABASE_USER = DEFAULT_DATABASE_PASSWORD = None
+
+# Default number of records to write to the database at once
+DEFAULT_BATCH_RECORDS = 10000
+
+################################################################################
+def path_data_id(filename):
+  """Return the data_id implied by a logfile's path: the name of the
+  directory above its 'raw' directory if there is one, else the name
+  of the directory it's in."""
+  dir_name = os.path.dirname(os.path.realpath(filename))
+  if os.path.basename(dir_name) == 'raw':
+    dir_name = os.path.dirname(dir_name)
+  return os.path.basename(dir_name)
+
+################################################################################
+def backfill(db, parser, file_spec, data_id=None, data_id_from_path=False,
+             batch_records=DEFAULT_BATCH_RECORDS):
+  """Parse the lines of the files matching the (possibly wildcarded)
+  file_spec and write the resulting records to the database connector
+  'db' in batches of batch_records. Return a tuple of (number of lines
+  read, number of records written)."""
+  num_lines = num_records = 0
+  batch = []
+  for filename in sorted(glob.glob(file_spec)):
+    logging.info('Reading %s', filename)
+    prefix = ''
+    if data_id_from_path:
+      prefix = path_data_id(filename) + ' '
+    elif data_id:
+      prefix = data_id + ' '
+
+    with open(filename, 'r') as logfile:
+      for line in logfile:
+        line = line.rstrip('\n')
+        if not line:
+          continue
+        num_lines += 1
+        record = parser.parse_record(prefix + line)
+        if not record:
+          continue
+        batch.append(record)
+        if len(batch) >= batch_records:
+          db.write_records(batch)
+          num_records += len(batch)
+          batch = []
+  if batch:
+    db.write_records(batch)
+    num_records += len(batch)
+  return num_lines, num_records
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+
+  parser.add_argument('--logfiles', dest='logfiles', required=True,
+                      help='Wildcarded path of logfiles to load')
+  parser.add_argument('--definition_path', dest='definition_path',
+                      default=DEFAULT_DEFINITION_PATH,
+                      help='Comma-separated wildcarded paths of device '
+                      'and device type definitions.')
+  parser.add_argument('--data_id', dest='data_id', default=None,
+                      help='If specified, prefix each line with this data_id '
+                      'before parsing.')
+  parser.add_argument('--data_id_from_path', dest='data_id_from_path',
+                      action='store_true', default=False,
+                      help='Prefix each line with a data_id taken from the '
+                      'name of its file\'s directory before parsing.')
+  parser.add_argument('--batch_records', dest='batch_records', type=int,
+                      default=DEFAULT_BATCH_RECORDS,
+                      help='Number of records to write to the database at once')
+
+  parser.add_argument('--database', dest='database', default=DEFAULT_DATABASE,
+                      help='Name of database to write to')
+  parser.add_argument('--database_host', dest='database_host',
+                      default=DEFAULT_DATABASE_HOST, help='Database host')
+  parser.add_argument('--database_user', dest='database_user',
+                      default=DEFAULT_DATABASE_USER, help='Database user')
+  parser.add_argument('--database_password', dest='database_password',
+                      default=DEFAULT_DATABASE_PASSWORD,
+                      help='Database password')
+  parser.add_argument('--no_source', dest='save_source', action='store_false',
+                      default=True, help='Don\'t save source records')
+
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  if not DATABASE_SETTINGS_FOUND:
+    sys.exit('File database/settings.py not found. Have you copied over '
+             'database/settings.py.dist to settings.py?')
+  if not DATABASE_ENABLED:
+    sys.exit('Database not configured in database/settings.py.')
+
+  db = Connector(database=args.database, host=args.database_host,
+                 user=args.database_user, password=args.database_password,
+                 save_source=args.save_source)
+  if not callable(getattr(db, 'write_records', None)):
+    sys.exit('Database connector %s has no write_records() method.'
+             % type(db).__name__)
+
+  record_parser = RecordParser(definition_path=args.definition_path,
+                               return_das_record=True, quiet=True)
+  start = time.time()
+  num_lines, num_records = backfill(
+    db, record_parser, args.logfiles, data_id=args.data_id,
+    data_id_from_path=args.data_id_from_path,
+    batch_records=args.batch_records)
+  elapsed = time.time() - start
+  db.close()
+
+  print('Loaded %d records (from %d lines) in %.1f seconds (%.0f records/s)'
+        % (num_records, num_lines, elapsed, num_records / max(elapsed, 0.001)))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Process-local pools of database connections, shared by the
+database connectors.
+
+A connector gets a pool by calling get_pool() with a key that
+identifies the database it wants (e.g. its type, database name, host
+and user) and functions to open, check and close connections. All
+connectors in a process that ask for the same key share the same pool.
+A connector leases a connection with acquire() and hands it back with
+release() when it's done (or with discard(), if it found the
+connection to be broken).
+
+Connections are checked before being handed out, and broken ones are
+thrown away. If opening a new connection fails, the pool waits before
+trying again, doubling the wait after each consecutive failure (up to
+max_backoff seconds). While it's waiting, acquire() raises a
+ConnectionError immediately rather than blocking the caller, so that,
+e.g., a DatabaseWriter can spool records until the database is back.
+"""
+import logging
+import threading
+import time
+
+# Seconds to wait after a failed connection attempt before trying again,
+# and the most we'll ever wait.
+DEFAULT_INITIAL_BACKOFF = 1
+DEFAULT_MAX_BACKOFF = 60
+
+# Maximum number of idle connections to keep in each pool
+DEFAULT_MAX_IDLE = 4
+
+################################################################################
+class ConnectionPool:
+  """A pool of connections to a single database."""
+  ############################
+  def __init__(self, connect, is_healthy=None, close=None,
+               max_idle=DEFAULT_MAX_IDLE,
+               initial_backoff=DEFAULT_INITIAL_BACKOFF,
+               max_backoff=DEFAULT_MAX_BACKOFF):
+    """
+    ```
+    connect          Function of no arguments that opens and returns a
+                     new connection, raising an exception if it can't.
+
+    is_healthy       Function that takes a connection and returns True
+                     if it is still usable. If None, assume it is.
+
+    close            Function that takes a connection and closes it. If
+                     None, call the connection's close() method.
+
+    max_idle         Maximum number of idle connections to keep.
+
+    initial_backoff  Seconds to wait after a failed connection attempt
+                     before trying again.
+
+    max_backoff      Maximum seconds to wait between attempts.
+    ```
+    """
+    self.connect = connect
+    self.is_healthy = is_healthy or (lambda connection: True)
+    self.close = close or (lambda connection: connection.close())
+    self.max_idle = max_idle
+    self.initial_backoff = initial_backoff
+    self.max_backoff = max_backoff
+
+    self.idle = []
+    self.backoff = 0          # current wait between attempts
+    self.next_attempt = 0     # earliest time we may try to connect
+    self.lock = threading.Lock()
+
+  ############################
+  def acquire(self):
+    """Return a healthy connection, reusing an idle one if possible.
+    Raise ConnectionError if we can't connect, or if we're waiting
+    out a backoff period after a failed attempt."""
+    with self.lock:
+      while self.idle:
+        connection = self.idle.pop()
+        if self._healthy(connection):
+          return connection
+        logging.info('Discarding unhealthy pooled database connection')
+        self._close(connection)
+
+      now = time.time()
+      if now < self.next_attempt:
+        raise ConnectionError('Database unavailable; will retry in %.1f '
+                              'seconds' % (self.next_attempt - now))
+      try:
+        connection = self.connect()
+      except Exception as e:
+        self.backoff = min(max(self.backoff * 2, self.initial_backoff),
+                           self.max_backoff)
+        self.next_attempt = now + self.backoff
+        logging.warning('Unable to connect to database (%s); will retry '
+                        'in %g seconds', e, self.backoff)
+        raise ConnectionError('Unable to connect to database: %s' % e)
+
+      if self.backoff:
+        logging.warning('Reconnected to database')
+      self.backoff = 0
+      self.next_attempt = 0
+      return connection
+
+  ############################
+  def release(self, connection):
+    """Return a connection to the pool for reuse."""
+    with self.lock:
+      if len(self.idle) < self.max_idle and self._healthy(connection):
+        self.idle.append(connection)
+        return
+    self._close(connection)
+
+  ############################
+  def discard(self, connection):
+    """Throw away a connection that's been found to be broken."""
+    self._close(connection)
+
+  ############################
+  def _healthy(self, connection):
+    try:
+      return self.is_healthy(connection)
+    except Exception:
+      return False
+
+  ############################
+  def _close(self, connection):
+    try:
+      self.close(connection)
+    except Exception as e:
+      logging.debug('Error closing database connection: %s', e)
+
+################################################################################
+# Pools shared by everything in this process, keyed by whatever the
+# connectors use to identify a database.
+_pools = {}
+_pools_lock = threading.Lock()
+
+############################
+def get_pool(key, connect, is_healthy=None, close=None, **kwargs):
+  """Return the process's pool for 'key', creating it with the passed
+  arguments (see ConnectionPool) if it doesn't exist yet."""
+  with _pools_lock:
+    pool = _pools.get(key, None)
+    if pool is None:
+      pool = _pools[key] = ConnectionPool(connect, is_healthy=is_healthy,
+                                          close=close, **kwargs)
+    return pool
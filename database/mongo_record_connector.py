@@ -17,14 +17,89 @@ except ImportError:
 
 # Based on https://dev.mysql.com/doc/connector-python/en/connector-python-example-connecting.html
 
+################################################################################
+# In bucketed mode, each document holds the records of one table that
+# fall within the same bucket_seconds-long interval (and have the same
+# set of fields), stored as parallel arrays:
+#
+#   {'data_id': 'gyr1', 'message_type': None,
+#    'bucket': 1509772320.0, 'keys': ['Heading', 'HeadingTrue'],
+#    'first': 1509772339.0, 'last': 1509772398.9, 'count': 600,
+#    'timestamps': [1509772339.0, 1509772339.1, ...],
+#    'fields': {'Heading': [235.18, 235.19, ...],
+#               'HeadingTrue': [...]}}
+#
+# A bucket may be split across several documents if its records were
+# written in separate batches, or if it would otherwise exceed
+# MAX_BUCKET_RECORDS records.
+MAX_BUCKET_RECORDS = 10000
+
+def bucket_documents(records, bucket_seconds):
+  """Group a list of DASRecords (all belonging to the same table) into
+  bucket documents."""
+  docs = []
+  open_docs = {}  # (bucket_start, field names)->doc we're filling
+  for record in records:
+    bucket_start = (record.timestamp // bucket_seconds) * bucket_seconds
+    key = (bucket_start, tuple(record.fields))
+    doc = open_docs.get(key, None)
+    if doc is None or doc['count'] >= MAX_BUCKET_RECORDS:
+      doc = open_docs[key] = {'data_id': record.data_id,
+                              'message_type': record.message_type,
+                              'bucket': bucket_start,
+                              'keys': list(record.fields),
+                              'first': record.timestamp,
+                              'last': record.timestamp,
+                              'count': 0,
+                              'timestamps': [],
+                              'fields': {field: [] for field in record.fields}}
+      docs.append(doc)
+    doc['first'] = min(doc['first'], record.timestamp)
+    doc['last'] = max(doc['last'], record.timestamp)
+    doc['count'] += 1
+    doc['timestamps'].append(record.timestamp)
+    for field, value in record.fields.items():
+      doc['fields'][field].append(value)
+  return sorted(docs, key=lambda doc: doc['first'])
+
+############################
+def records_from_bucket(doc, start=0, stop=None):
+  """Expand a bucket document (possibly projected down to a subset of
+  its fields) into the DASRecords it holds, optionally only those from
+  index start up to, but not including, index stop."""
+  fields = doc.get('fields', {})
+  records = []
+  for i in range(start, len(doc['timestamps']) if stop is None else stop):
+    records.append(DASRecord(data_id=doc.get('data_id', None),
+                             message_type=doc.get('message_type', None),
+                             timestamp=doc['timestamps'][i],
+                             fields={field: values[i]
+                                     for field, values in fields.items()}))
+  return records
+
 ################################################################################
 class MongoRecordConnector:
   # Name of table in which we will store mappings from record field
   # names to the tnames of the tables containing those fields.
   FIELD_NAME_MAPPING_TABLE = 'FIELD_NAME_MAPPING_TABLE'
 
-  def __init__(self, database, host, user, password):
-    """Interface to MongoConnector, to be imported by, e.g. DatabaseWriter."""
+  def __init__(self, database, host, user, password,
+               bucket_seconds=0, buffer_records=0):
+    """Interface to MongoConnector, to be imported by, e.g. DatabaseWriter.
+    ```
+    bucket_seconds  If non-zero, store records in time-bucketed documents
+                    (see bucket_documents()) each holding up to this many
+                    seconds of a table's records, rather than one document
+                    per record.
+
+    buffer_records  If non-zero, write_record() buffers records and writes
+                    them with insert_many() once this many have accumulated
+                    (or flush() or close() is called).
+    ```
+    """
+    self.bucket_seconds = bucket_seconds
+    self.buffer_records = buffer_records
+    self.buffer = []
     if not MONGO_ENABLED:
       logging.warning('MongoDB not found, so Mongo functionality not available.')
       return
@@ -35,6 +110,17 @@ class MongoRecordConnector:
     # Map from table_name->next id we're going to read from that table
     self.next_id = {}
 
+    # Map from table_name->(first, _id, position) of the last bucket we
+    # read from that table, so that sequential reads of a bucketed table
+    # needn't count their way up from its first bucket each time.
+    # (Records written with timestamps earlier than those already read
+    # shift the positions of those after them, as they would anyway.)
+    self.bucket_position = {}
+
+    # Map from table_name->names of the fields we've registered for it,
+    # for tables we know have been set up.
+    self.table_fields = {}
+
     # self.exec_sql_command('set autocommit = 1')
 
   # ############################
@@ -154,6 +240,13 @@ class MongoRecordConnector:
 
     logging.info('Creating table: %s', table_name)
     result = self.db.create_collection(table_name)
+    if self.bucket_seconds:
+      # What _append_to_bucket() looks buckets up by
+      result.create_index([('bucket', pymongo.ASCENDING),
+                           ('keys', pymongo.ASCENDING),
+                           ('count', pymongo.ASCENDING)])
+      result.create_index([('first', pymongo.ASCENDING)])
+      result.create_index([('last', pymongo.ASCENDING)])
 
     # # Id and timestamp are needed for all tables
     # columns = ['`id` int(11) not null auto_increment',
@@ -181,6 +274,23 @@ class MongoRecordConnector:
     # Register the fields in the record as being contained in this table.
     self._register_record_fields(record)
 
+  ############################
+  def _prepare_table(self, record):
+    """Make sure the table the record belongs in has been created and
+    the record's fields registered, checking the database only the
+    first time we see a table or field."""
+    table_name = self.table_name_from_record(record)
+    fields = self.table_fields.get(table_name, None)
+    if fields is None:
+      if self.table_exists(table_name):
+        self._register_record_fields(record)
+      else:
+        self.create_table_from_record(record)
+      self.table_fields[table_name] = set(record.fields)
+    elif not fields.issuperset(record.fields):
+      self._register_record_fields(record)
+      fields.update(record.fields)
+
   ############################
   def write_record(self, record):
     """Write record to table."""
@@ -199,6 +309,16 @@ class MongoRecordConnector:
                       type(value), value)
       return '""'
 
+    if self.buffer_records:
+      self.buffer.append(record)
+      if len(self.buffer) >= self.buffer_records:
+        self.flush()
+      return
+    self._prepare_table(record)
+    if self.bucket_seconds:
+      self._append_to_bucket(record)
+      return
+
     table_name = self.table_name_from_record(record)
 
     logging.debug('Inserting record into table: %s', table_name)
@@ -213,6 +333,131 @@ class MongoRecordConnector:
     # logging.debug('Inserting record into table with command: %s', write_cmd)
     # self.exec_sql_command(write_cmd)
 
+  ############################
+  def write_records(self, records):
+    """Write a list of records, with one insert_many() per table."""
+    by_table = {}
+    for record in records:
+      by_table.setdefault(self.table_name_from_record(record), []).append(record)
+
+    for table_name, table_records in by_table.items():
+      for record in table_records:
+        self._prepare_table(record)
+      if self.bucket_seconds:
+        docs = bucket_documents(table_records, self.bucket_seconds)
+      else:
+        docs = [json.loads(record.as_json()) for record in table_records]
+      logging.debug('Inserting %d documents into table: %s',
+                    len(docs), table_name)
+      self.db[table_name].insert_many(docs, ordered=False)
+
+  ############################
+  def _append_to_bucket(self, record):
+    """Append a single record to its bucket document, creating the
+    document if there isn't one (or the existing one is full)."""
+    table_name = self.table_name_from_record(record)
+    timestamp = record.timestamp
+    bucket_start = (timestamp // self.bucket_seconds) * self.bucket_seconds
+    keys = list(record.fields)
+    push = {'timestamps': timestamp}
+    for field, value in record.fields.items():
+      push['fields.' + field] = value
+    self.db[table_name].update_one(
+      {'bucket': bucket_start, 'keys': keys,
+       'count': {'$lt': MAX_BUCKET_RECORDS}},
+      {'$push': push,
+       '$inc': {'count': 1},
+       '$min': {'first': timestamp},
+       '$max': {'last': timestamp},
+       '$setOnInsert': {'data_id': record.data_id,
+                        'message_type': record.message_type}},
+      upsert=True)
+
+  ############################
+  def flush(self):
+    """Write out any records buffered by write_record()."""
+    if self.buffer:
+      records = self.buffer
+      self.buffer = []
+      self.write_records(records)
+
+  ############################
+  def _projection(self, field_list):
+    """Return a projection that fetches only the named fields of our
+    records (or all of them, if field_list is empty)."""
+    projection = {'_id': 0}
+    if field_list:
+      for key in ['data_id', 'message_type', 'timestamp',
+                  'timestamps', 'count']:
+        projection[key] = 1
+      for field in field_list:
+        projection['fields.' + field] = 1
+    return projection
+
+  ############################
+  def _record_from_document(self, doc):
+    """Convert a one-record-per-document document into a DASRecord."""
+    return DASRecord(data_id=doc.get('data_id', None),
+                     message_type=doc.get('message_type', None),
+                     timestamp=doc['timestamp'],
+                     fields=doc.get('fields', {}))
+
+  ############################
+  def _read_buckets(self, table_name, field_list=None, start=0, stop=None):
+    """Return records of a bucketed table from index start up to (but
+    not including) index stop, reading only the buckets that hold them.
+    """
+    collection = self.db[table_name]
+    order = [('first', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]
+
+    # Find the bucket holding record 'start', resuming from the last
+    # bucket we read if we can, and fetching only the counts of the
+    # buckets we skip over.
+    query = {}
+    position = 0
+    resume = self.bucket_position.get(table_name, None)
+    if resume and resume[2] <= start:
+      query = self._buckets_from(resume[0], resume[1])
+      position = resume[2]
+    start_doc = None
+    cursor = collection.find(query, {'first': 1, 'count': 1}).sort(order)
+    for doc in cursor:
+      if position + doc['count'] > start:
+        start_doc = doc
+        break
+      position += doc['count']
+    cursor.close()
+    if start_doc is None:
+      return []
+
+    # Now read the buckets holding the records we want
+    results = []
+    projection = None
+    if field_list:
+      projection = self._projection(field_list)
+      projection.update({'_id': 1, 'first': 1})
+    cursor = collection.find(
+      self._buckets_from(start_doc['first'], start_doc['_id']),
+      projection).sort(order)
+    for doc in cursor:
+      count = doc['count']
+      self.bucket_position[table_name] = (doc['first'], doc['_id'], position)
+      first = max(start - position, 0)
+      last = count if stop is None else min(stop - position, count)
+      results.extend(records_from_bucket(doc, first, last))
+      position += count
+      if stop is not None and position >= stop:
+        break
+    cursor.close()
+    return results
+
+  ############################
+  def _buckets_from(self, first, doc_id):
+    """Return a query for the buckets at or after the one with the
+    passed 'first' timestamp and _id, in the order we read them."""
+    return {'$or': [{'first': {'$gt': first}},
+                    {'first': first, '_id': {'$gte': doc_id}}]}
+
   ############################
   def _parse_table_name(self, table_name):
     """Parse table name into data_id and message_type."""
@@ -243,6 +488,10 @@ class MongoRecordConnector:
 
   ############################
   def _num_rows(self, table_name):
+    if self.bucket_seconds:
+      result = list(self.db[table_name].aggregate(
+        [{'$group': {'_id': None, 'count': {'$sum': '$count'}}}]))
+      return result[0]['count'] if result else 0
     num_rows = self.db[table_name].count()
     # query = 'select count(1) from `%s`' % table_name
     # cursor = self.connection.cursor()
@@ -279,7 +528,7 @@ class MongoRecordConnector:
     to start at that position."""
 
     query = {}
-    projection = { '_id': 0 }
+    projection = self._projection(field_list)
 
     if start is None:
       if not table_name in self.next_id:
@@ -287,19 +536,18 @@ class MongoRecordConnector:
 
       start = self.next_id[table_name]
 
-    if field_list:
-      for field in field_list:
-        projection[field] = 1
-
-    result = list(self.db[table_name].find(query,projection).skip(start).limit(1))
+    if self.bucket_seconds:
+      result = self._read_buckets(table_name, field_list, start, start + 1)
+    else:
+      result = [self._record_from_document(doc) for doc in
+                self.db[table_name].find(query,projection).skip(start).limit(1)]
 
     if len(result) == 0:
       return None
 
     self.next_id[table_name] = start + 1
 
-    return DASRecord(data_id=result[0]['data_id'], message_type=result[0]['message_type'],
-                               timestamp=result[0]['timestamp'], fields=result[0]['fields'])
+    return result[0]
 
   ############################
   def seek(self,  table_name, offset=0, origin='current'):
@@ -332,17 +580,15 @@ class MongoRecordConnector:
         self.next_id[table_name] = 0
       start = self.next_id[table_name]
 
-    if stop is None:
-      stop = 0
-
-    projection = {'_id': 0}
-
-    if field_list:
-      for field in field_list:
-        projection[field] = 1
-
-    results = list(self.db[table_name].find({}, projection).skip(start).limit(stop))
+    if self.bucket_seconds:
+      results = self._read_buckets(table_name, field_list, start, stop)
+    else:
+      limit = 0 if stop is None else max(stop - start, 0)
+      projection = self._projection(field_list)
+      results = [self._record_from_document(doc) for doc in
+                 self.db[table_name].find({}, projection).skip(start).limit(limit)]
 
+    self.next_id[table_name] = start + len(results)
     return results
 
   ############################
@@ -352,29 +598,40 @@ class MongoRecordConnector:
     specified, begin reading at the earliest record. If stop_time is
     not specified, read to the most recent."""
 
-    projection = {'_id': 0}
+    projection = self._projection(field_list)
 
-    if field_list:
-      for field in field_list:
-        projection[field] = 1
+    def in_range(timestamp):
+      return ((start_time is None or timestamp >= start_time) and
+              (stop_time is None or timestamp < stop_time))
+
+    # With buckets, fetch those that overlap the time range, then pick
+    # out the records that fall within it.
+    if self.bucket_seconds:
+      query = {}
+      if start_time is not None:
+        query['last'] = {'$gte': start_time}
+      if stop_time is not None:
+        query['first'] = {'$lt': stop_time}
+      results = []
+      for doc in self.db[table_name].find(query, projection).sort(
+          [('first', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)]):
+        results.extend(record for record in records_from_bucket(doc)
+                       if in_range(record.timestamp))
+      return results
 
     query = {}
 
     if start_time is not None or stop_time is not None:
-
-      query.timestamp = {}
+      query['timestamp'] = {}
 
       if start_time is not None:
-        startTS = datetime.datetime(start_time);
-        query['timestamp']['$gte'] = startTS;
+        query['timestamp']['$gte'] = start_time
 
       if stop_time is not None:
-        stopTS = datetime.datetime(stop_time);
-        query['timestamp']['$lt'] = stopTS;
-
-    results = self.db[table_name].find(query, projection)
+        query['timestamp']['$lt'] = stop_time
 
-    return results
+    return [self._record_from_document(doc)
+            for doc in self.db[table_name].find(query, projection)]
 
   ############################
   def delete_table(self,  table_name):
@@ -387,6 +644,8 @@ class MongoRecordConnector:
     # Clear out our recollection of how far into the table we've read
     if table_name in self.next_id:
       del self.next_id[table_name]
+    self.table_fields.pop(table_name, None)
+    self.bucket_position.pop(table_name, None)
 
     # Delete any references to that table from the file name mapping
     query = {"table_name": table_name}
@@ -397,5 +656,6 @@ class MongoRecordConnector:
 
   ############################
   def close(self):
-    """Close connection."""
+    """Write out any buffered records and close connection."""
+    self.flush()
     self.client.close()
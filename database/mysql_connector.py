@@ -32,13 +32,22 @@ import sys
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
 from logger.utils.formats import Python_Record
 from logger.utils.das_record import DASRecord
+from database import connection_pool
 
 try:
   import mysql.connector
   MYSQL_ENABLED = True
+
+  # Errors that mean we've lost our connection, rather than that
+  # something was wrong with what we asked of it.
+  CONNECTION_ERRORS = (mysql.connector.errors.OperationalError,
+                       mysql.connector.errors.InterfaceError)
 except ImportError:
   MYSQL_ENABLED = False
 
+# How many rows to pull from the server at a time when reading results
+FETCH_SIZE = 1000
+
 ################################################################################
 class MySQLConnector:
   # Name of table in which we will store mappings from record field
@@ -47,6 +56,10 @@ class MySQLConnector:
   FIELD_TABLE = 'fields'
   SOURCE_TABLE = 'source'
 
+  # Composite index that lets time range queries on specific fields
+  # avoid scanning the whole data table.
+  FIELD_TIME_INDEX = 'field_time'
+
   def __init__(self, database, host, user, password,
                tail=False, save_source=True):
     """Interface to MySQLConnector, to be imported by, e.g. DatabaseWriter."""
@@ -54,9 +67,18 @@ class MySQLConnector:
       logging.warning('MySQL not found, so MySQL functionality not available.')
       return
 
-    self.connection = mysql.connector.connect(database=database, host=host,
-                                              user=user, password=password,
-                                              auth_plugin='mysql_native_password')
+    # Get our connection from a pool shared by all MySQLConnectors in
+    # this process that use the same database. If we lose it, we'll
+    # get another (see _check_connection()).
+    def connect():
+      return mysql.connector.connect(database=database, host=host,
+                                     user=user, password=password,
+                                     auth_plugin='mysql_native_password',
+                                     autocommit=True)
+    self.pool = connection_pool.get_pool(
+      ('mysql', database, host, user, password), connect,
+      is_healthy=lambda connection: connection.is_connected())
+    self.connection = self.pool.acquire()
     self.save_source = save_source
 
     # What's the next id we're supposed to read? Or if we've been
@@ -64,7 +86,12 @@ class MySQLConnector:
     self.next_id = 1
     self.last_timestamp = 0
 
-    self.exec_sql_command('set autocommit = 1')
+    # Prepared statement cursors, keyed by statement text
+    self.prepared_cursors = {}
+
+    # If we can infer the ids of source records inserted in bulk, how
+    # far apart they will be (zero if we can't)
+    self.insert_id_step = self._insert_id_step()
 
     # Create tables if they don't exist yet
     if not self.table_exists(self.SOURCE_TABLE):
@@ -85,6 +112,7 @@ class MySQLConnector:
                    'bool_value INT,',
                    'source INT,',
                    'INDEX (timestamp),',
+                   'INDEX %s (field_name, timestamp),' % self.FIELD_TIME_INDEX,
                    'FOREIGN KEY (source) REFERENCES %s(id)' \
                       % self.SOURCE_TABLE,
                    ')'
@@ -92,21 +120,50 @@ class MySQLConnector:
       logging.info('Creating table with command: %s', ' '.join(table_cmd))
       self.exec_sql_command(' '.join(table_cmd))
 
+    # Tables created before we indexed by field and time need the index
+    # added.
+    elif not self._index_exists(self.DATA_TABLE, self.FIELD_TIME_INDEX):
+      index_cmd = 'CREATE INDEX %s ON `%s` (field_name, timestamp)' % \
+                  (self.FIELD_TIME_INDEX, self.DATA_TABLE)
+      logging.info('Creating index with command: %s', index_cmd)
+      self.exec_sql_command(index_cmd)
+
     # Once tables are initialized, seek to end if tail is True
     if tail:
       self.seek(offset=0, origin='end')
 
   ############################
   def exec_sql_command(self, command):
+    self._check_connection()
     cursor = self.connection.cursor()
     try:
       cursor.execute(command)
       self.connection.commit()
       cursor.close()
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
     except mysql.connector.errors.Error as e:
       logging.error('Executing command: "%s", encountered error "%s"',
                     command, str(e))
 
+  ############################
+  def _check_connection(self):
+    """If we've lost our connection, try to get a new one from the pool.
+    Raises ConnectionError if the database is still unavailable."""
+    if self.connection is None:
+      self.connection = self.pool.acquire()
+
+  ############################
+  def _connection_lost(self, error):
+    """Discard our broken connection and raise a ConnectionError. The
+    next operation will try to get a new connection."""
+    logging.warning('Lost connection to MySQL database: %s', error)
+    self.prepared_cursors = {}
+    if self.connection is not None:
+      self.pool.discard(self.connection)
+      self.connection = None
+    raise ConnectionError('Lost connection to database: %s' % error)
+
   ############################
   def table_exists(self, table_name):
     """Does the specified table exist in the database?"""
@@ -119,99 +176,162 @@ class MySQLConnector:
     cursor.close()
     return exists
 
+  ############################
+  def _index_exists(self, table_name, index_name):
+    """Does the specified table have an index of the given name?"""
+    cursor = self.connection.cursor()
+    cursor.execute('SHOW INDEX FROM `%s` WHERE Key_name = %%s' % table_name,
+                   (index_name,))
+    exists = bool(cursor.fetchall())
+    cursor.close()
+    return exists
+
   ############################
   def write_record(self, record):
     """Write record to table."""
+    self.write_records([record])
 
+  ############################
+  def write_records(self, records):
+    """Write a list of DASRecords to the database in a single
+    transaction. Source records (if we're saving them) are inserted
+    first, so that their ids can be attached to the data rows, then all
+    the data rows are inserted with one parameterized, multi-row insert.
+    """
     # First, check that we've got something we can work with
-    if not record:
-      return
-    if not type(record) == DASRecord:
-      logging.error('write_record() received non-DASRecord as input. '
-                    'Type: %s', type(record))
+    das_records = []
+    for record in records:
+      if not record:
+        continue
+      if not type(record) == DASRecord:
+        logging.error('write_record() received non-DASRecord as input. '
+                      'Type: %s', type(record))
+        continue
+      das_records.append(record)
+    if not das_records:
       return
 
-    # If we're saving source records, we have to do a little
-    # legerdemain: after we've saved the record, we need to retrieve
-    # the id of the record we've just saved so that we can attach it
-    # to the data values we're about to save.
-    if self.save_source:
-      write_cmd = 'insert into `%s` (record) values (\'%s\')' % \
-                  (self.SOURCE_TABLE, record.as_json())
-      logging.debug('Inserting source into table with command: %s', write_cmd)
-      self.exec_sql_command(write_cmd)
-
-      # Get the id of the saved source record. Note: documentation
-      # *claims* that this is kept on a per-client basis, so it's safe
-      # even if another client does an intervening write.
-      query = 'select last_insert_id()'
-      cursor = self.connection.cursor()
-      cursor.execute(query)
-      source_field = ', source'
-      source_id = next(cursor)[0]
-    else:
-      source_field = ''
-      source_id = None
+    self._check_connection()
+    cursor = self.connection.cursor()
+    write_individually = False
+    try:
+      self.connection.start_transaction()
+      if self.save_source:
+        source_ids = self._insert_sources(cursor, das_records)
+      else:
+        source_ids = [None] * len(das_records)
+
+      rows = []
+      for record, source_id in zip(das_records, source_ids):
+        if not record.fields:
+          logging.info('DASRecord has no parsed fields. Skipping record.')
+          continue
+        rows.extend(self._data_rows(record, source_id))
+
+      if rows:
+        write_cmd = ('insert into `%s` (timestamp, field_name, int_value, '
+                     'float_value, str_value, bool_value, source) '
+                     'values (%%s, %%s, %%s, %%s, %%s, %%s, %%s)'
+                     % self.DATA_TABLE)
+        logging.debug('Inserting %d rows into table with command: %s',
+                      len(rows), write_cmd)
+        cursor.executemany(write_cmd, rows)
+      self.connection.commit()
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
+    except mysql.connector.errors.Error as e:
+      self.connection.rollback()
+      if len(das_records) == 1:
+        logging.error('Writing record, encountered error "%s"', str(e))
+      else:
+        # Don't let one bad value lose the whole batch
+        logging.warning('Writing %d records, encountered error "%s"; '
+                        'writing them one at a time', len(das_records), str(e))
+        write_individually = True
+    finally:
+      cursor.close()
 
-    if not record.fields:
-      logging.info('DASRecord has no parsed fields. Skipping record.')
-      return
+    if write_individually:
+      for record in das_records:
+        self.write_records([record])
 
-    # Write one row for each field-value pair. Columns are:
+  ############################
+  def _insert_sources(self, cursor, records):
+    """Insert the JSON source of each record into the source table and
+    return a list of the ids they were assigned."""
+    write_cmd = 'insert into `%s` (record) values (%%s)' % self.SOURCE_TABLE
+    sources = [(record.as_json(),) for record in records]
+
+    # If the server assigns evenly-spaced ids to the rows of a multi-row
+    # insert, insert them all at once and infer their ids from the
+    # first. Otherwise insert them one at a time.
+    if self.insert_id_step:
+      cursor.executemany(write_cmd, sources)
+      first_id = cursor.lastrowid
+      return list(range(first_id,
+                        first_id + len(sources) * self.insert_id_step,
+                        self.insert_id_step))
+
+    source_ids = []
+    for source in sources:
+      cursor.execute(write_cmd, source)
+      source_ids.append(cursor.lastrowid)
+    return source_ids
+
+  ############################
+  def _data_rows(self, record, source_id):
+    """Return a list of rows (tuples), one for each field-value pair in
+    the record."""
+    # Columns are:
     #     timestamp
     #     field_name
     #     int_value   \
     #     float_value, \ Only one of these fields will be non-NULL,
     #     str_value    / depending on the type of the value.
     #     bool_value  /
-
-    timestamp = record.timestamp
-    values = []
+    #     source
+    rows = []
     for field_name, value in record.fields.items():
-      value_array = ['%f' % timestamp, '"%s"' % field_name,
-                     'NULL', 'NULL', 'NULL', 'NULL']
+      row = [record.timestamp, field_name, None, None, None, None, source_id]
       if type(value) is int:
-        value_array[2] = '%d' % value
+        row[2] = value
       elif type(value) is float:
-        value_array[3] = '%f' % value
+        row[3] = value
       elif type(value) is str:
-        value_array[4] = '"%s"' % value
+        row[4] = value
       elif type(value) is bool:
-        value_array[5] = '%d' % ('1' if value else '0')
+        row[5] = 1 if value else 0
       elif value is None:
-        value_array[4] = '""'
+        row[4] = ''
       else:
         logging.error('Unknown record value type (%s) for %s: %s',
-                      type(value), key, value)
+                      type(value), field_name, value)
         continue
+      rows.append(tuple(row))
+    return rows
 
-      # If we've saved this field's source record, append source's
-      # foreign key to row so we can look it up.
-      if source_id:
-         value_array.append('%d' % source_id)
-
-      # Join entries into a string, append to list of other values
-      # we've already saved.
-      value_str = '(%s)' % ','.join(value_array)
-      values.append(value_str)
-
-    # Build the SQL query
-    fields = ['timestamp',
-              'field_name',
-              'int_value',
-              'float_value',
-              'str_value',
-              'bool_value']
-    if source_id:
-      fields.append('source')
-
-    if not values:
-      logging.warning('No values found in record %s', str(record))
-                      
-    write_cmd = 'insert into `%s` (%s) values %s' % \
-                  (self.DATA_TABLE, ','.join(fields), ','.join(values))
-    logging.debug('Inserting record into table with command: %s', write_cmd)
-    self.exec_sql_command(write_cmd)
+  ############################
+  def _insert_id_step(self):
+    """Will the server assign evenly-spaced auto-increment ids to the
+    rows of a single multi-row insert? InnoDB guarantees this in its
+    "traditional" (0) and "consecutive" (1) lock modes, but not in
+    "interleaved" (2) mode. If it does, return the spacing, which is
+    auto_increment_increment (e.g. 2 on replicated masters that
+    interleave their ids); if not, return 0."""
+    cursor = self.connection.cursor()
+    try:
+      cursor.execute('select @@innodb_autoinc_lock_mode, '
+                     '@@auto_increment_increment')
+      lock_mode, increment = cursor.fetchone()
+      if int(lock_mode) not in [0, 1]:
+        return 0
+      return max(int(increment), 1)
+    except (mysql.connector.errors.Error, TypeError, ValueError) as e:
+      logging.info('Unable to determine how auto-increment ids are '
+                   'assigned: %s', e)
+      return 0
+    finally:
+      cursor.close()
 
   ############################
   def read(self, field_list=None, start=None, num_records=1):
@@ -220,21 +340,23 @@ class MySQLConnector:
 
     if start is None:
       start = self.next_id
-    condition = 'id >= %d' % start
+    condition = 'id >= %s'
+    params = [start]
 
     # If they haven't given us any fields, retrieve everything
-    if field_list:
-      field_conditions = ['field_name="%s"' % f for f in field_list.split(',')]
-      condition += ' and (%s)' % ' or '.join(field_conditions)
+    field_condition, field_params = self._field_condition(field_list)
+    condition += field_condition
+    params += field_params
 
     condition += ' order by id'
 
     if num_records is not None:
-      condition += ' limit %d' % num_records
+      condition += ' limit %s'
+      params.append(num_records)
 
     query = 'select * from `%s` where %s' % (self.DATA_TABLE, condition)
-    logging.debug('read query: %s', query)
-    return self._process_query(query)
+    logging.debug('read query: %s, %s', query, params)
+    return self._process_query(query, params)
 
   ############################
   def read_time(self, field_list=None, start_time=None, stop_time=None):
@@ -243,23 +365,38 @@ class MySQLConnector:
     read all records since then."""
 
     if start_time is None:
-      condition = 'timestamp > %f' % self.last_timestamp
+      condition = 'timestamp > %s'
+      params = [self.last_timestamp]
     else:
-      condition = 'timestamp > %f' % start_time
+      condition = 'timestamp > %s'
+      params = [start_time]
 
     if stop_time is not None:
-      condition = '(%s and timestamp < %f)' % (condition, stop_time)
+      condition = '(%s and timestamp < %%s)' % condition
+      params.append(stop_time)
 
     # If they haven't given us any fields, retrieve everything
-    if field_list:
-      field_conditions = ['field_name="%s"' % f for f in field_list]
-      condition += ' and (%s)' % ' or '.join(field_conditions)
+    field_condition, field_params = self._field_condition(field_list)
+    condition += field_condition
+    params += field_params
 
     condition += ' order by timestamp'
 
     query = 'select * from `%s` where %s' % (self.DATA_TABLE, condition)
-    logging.debug('read query: %s', query)
-    return self._process_query(query)
+    logging.debug('read query: %s, %s', query, params)
+    return self._process_query(query, params)
+
+  ############################
+  def _field_condition(self, field_list):
+    """Return a tuple (condition, params) of the SQL condition and
+    parameters that restrict a query to the fields in field_list, which
+    may be a list or comma-separated string of field names."""
+    if not field_list:
+      return '', []
+    if type(field_list) is str:
+      field_list = field_list.split(',')
+    placeholders = ','.join(['%s'] * len(field_list))
+    return ' and field_name in (%s)' % placeholders, list(field_list)
 
   ############################
   def seek(self, offset=0, origin='current'):
@@ -267,56 +404,91 @@ class MySQLConnector:
     respect to records: 'offset' means number of records, and origin
     is either 'start', 'current' or 'end'."""
 
-    num_rows = self._num_rows(self.DATA_TABLE)
-
     if origin == 'current':
       self.next_id += offset
     elif origin == 'start':
       self.next_id = offset + 1
     elif origin == 'end':
-      self.next_id = num_rows + offset + 1
-
-    self._next_id = min(num_rows, self.next_id)
+      self.next_id = self._last_id(self.DATA_TABLE) + offset + 1
 
     logging.debug('Seek: next position %d', self.next_id)
 
+  ############################
+  def _last_id(self, table_name):
+    """Return the largest id in the table, or 0 if it's empty. Unlike
+    counting rows, this is a single index lookup."""
+    cursor = self._execute('select max(id) from `%s`' % table_name)
+    last_id = cursor.fetchone()[0]
+    cursor.fetchall()  # drain the result so the cursor can be reused
+    return last_id or 0
+
   ############################
   def _num_rows(self, table_name):
-    query = 'select count(1) from `%s`' % table_name
-    cursor = self.connection.cursor()
-    cursor.execute(query)
-    num_rows = next(cursor)[0]
+    """Return the number of rows in the table. This scans the table;
+    use _last_id() to find where it ends."""
+    cursor = self._execute('select count(1) from `%s`' % table_name)
+    num_rows = cursor.fetchone()[0]
+    cursor.fetchall()  # drain the result so the cursor can be reused
     return num_rows
 
   ############################
-  def _process_query(self, query):
-    cursor = self.connection.cursor()
-    cursor.execute(query)
+  def _execute(self, query, params=()):
+    """Execute a query using a prepared statement, preparing it if we
+    haven't seen it before, and return the cursor. Results are left on
+    the server until they're fetched, so the caller must fetch all of
+    them before issuing another query."""
+    self._check_connection()
+    try:
+      cursor = self.prepared_cursors.get(query, None)
+      if cursor is None:
+        cursor = self.connection.cursor(prepared=True)
+        self.prepared_cursors[query] = cursor
+      cursor.execute(query, tuple(params))
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
+    return cursor
+
+  ############################
+  def _process_query(self, query, params=()):
+    cursor = self._execute(query, params)
 
     results = {}
-    for values in cursor:
-      (id, timestamp, field_name,
-       int_value, float_value, str_value, bool_value,
-       source) = values
-
-      if not field_name in results:
-        results[field_name] = []
-
-      if int_value is not None:
-        val = int_value
-      elif float_value is not None:
-        val = float_value
-      elif str_value is not None:
-        val = str_value
-      elif float_value is not None:
-        val = int_value
-      elif bool_value is not None:
-        val = bool(bool_value)
-
-      results[field_name].append((timestamp, val))
+    while True:
+      try:
+        rows = cursor.fetchmany(FETCH_SIZE)
+      except CONNECTION_ERRORS as e:
+        self._connection_lost(e)
+      if not rows:
+        break
+      for values in rows:
+        (id, timestamp, field_name,
+         int_value, float_value, str_value, bool_value,
+         source) = values
+
+        # Some versions of the connector return text from prepared
+        # statements undecoded.
+        if type(field_name) is bytearray:
+          field_name = field_name.decode('utf-8')
+
+        if int_value is not None:
+          val = int_value
+        elif float_value is not None:
+          val = float_value
+        elif str_value is not None:
+          val = str_value
+          if type(val) is bytearray:
+            val = val.decode('utf-8')
+        elif bool_value is not None:
+          val = bool(bool_value)
+        else:
+          val = None
+
+        field_results = results.get(field_name, None)
+        if field_results is None:
+          field_results = results[field_name] = []
+        field_results.append((timestamp, val))
       self.next_id = id + 1
       self.last_timestamp = timestamp
-    cursor.close()
     return results
 
   ############################
@@ -328,5 +500,13 @@ class MySQLConnector:
 
   ############################
   def close(self):
-    """Close connection."""
-    self.connection.close()
+    """Close our cursors and return our connection to the pool."""
+    for cursor in self.prepared_cursors.values():
+      try:
+        cursor.close()
+      except mysql.connector.errors.Error:
+        pass
+    self.prepared_cursors = {}
+    if self.connection is not None:
+      self.pool.release(self.connection)
+      self.connection = None
@@ -32,6 +32,16 @@ class MySQLRecordConnector:
     # Map from table_name->next id we're going to read from that table
     self.next_id = {}
 
+    # Our cache of the database schema, so that we don't have to ask
+    # the database about it on every read and write. The only schema
+    # changes that invalidate it are our own, so we update it as we
+    # make them. Map from the name of each table we know to exist to
+    # its list of columns (or None if we haven't needed them yet):
+    self.table_columns = {}
+
+    # Map from field_name->name of table containing that field
+    self.field_tables = {}
+
     self.exec_sql_command('set autocommit = 1')
 
   ############################
@@ -55,6 +65,9 @@ class MySQLRecordConnector:
   ############################
   def table_name_from_field(self,  field):
     """Look up which table a particular field is stored in."""
+    table_name = self.field_tables.get(field, None)
+    if table_name:
+      return table_name
 
     # If mapping table doesn't exist, then either we've not seen any
     # records yet, or something has gone horribly wrong.
@@ -62,28 +75,46 @@ class MySQLRecordConnector:
       logging.info('Mapping table "%s" does not exist - is something wrong?')
       return None
 
-    query = 'select table_name from %s where (field_name = "%s")' % \
-            (self.FIELD_NAME_MAPPING_TABLE, field)
+    query = 'select table_name from %s where (field_name = %%s)' % \
+            self.FIELD_NAME_MAPPING_TABLE
     logging.debug('executing query "%s"', query)
     cursor = self.connection.cursor()
-    cursor.execute(query)
-    try:
-      return next(cursor)[0]
-    except (StopIteration, IndexError):
+    cursor.execute(query, (field,))
+    row = cursor.fetchone()
+    cursor.close()
+    if not row:
       return None
+    self.field_tables[field] = row[0]
+    return row[0]
 
   ############################
   def table_exists(self, table_name):
-    """Does the specified table exist in the database?"""
+    """Does the specified table exist in the database? We remember
+    tables that do, but keep asking about those that don't, in case
+    someone else has created them since."""
+    if table_name in self.table_columns:
+      return True
     cursor = self.connection.cursor()
     cursor.execute('SHOW TABLES LIKE "%s"' % table_name)
     if cursor.fetchone():
       exists = True
+      self.table_columns[table_name] = None
     else:
       exists = False
     cursor.close()
     return exists
 
+  ############################
+  def _load_field_tables(self):
+    """Refresh our field_name->table_name cache from the mapping table
+    in a single query."""
+    cursor = self.connection.cursor()
+    cursor.execute('select field_name, table_name from %s'
+                   % self.FIELD_NAME_MAPPING_TABLE)
+    self.field_tables = {field_name: table_name
+                         for field_name, table_name in cursor}
+    cursor.close()
+
   ############################
   TYPE_MAP = {
     int:   'int',
@@ -106,18 +137,63 @@ class MySQLRecordConnector:
       logging.info('Creating table with command: %s', table_cmd)
       self.exec_sql_command(table_cmd)
 
-    # What table does this record type belong to?
-    table_name = self.table_name_from_record(record)
+    self._register_fields(self.table_name_from_record(record),
+                          list(record.fields))
 
-    # Iterate through fields in record, figure out their type and
-    # create an table type appropriate for each. Skip if a matching
-    # field_name already exists.
-    for field_name in record.fields:
-      if not self.table_name_from_field(field_name):
-        write_cmd = 'insert into %s values ("%s", "%s")' % \
-                    (self.FIELD_NAME_MAPPING_TABLE, field_name, table_name)
-        logging.debug('Inserting record into table with command: %s', write_cmd)
-        self.exec_sql_command(write_cmd)
+  ############################
+  def _register_fields(self, table_name, field_names):
+    """Map each of the named fields that isn't already mapped to a
+    table to table_name, in a single insert."""
+    new_fields = [f for f in field_names if f not in self.field_tables]
+    if not new_fields:
+      return
+
+    # Someone else may have registered them since we last looked
+    self._load_field_tables()
+    new_fields = [f for f in new_fields if f not in self.field_tables]
+    if not new_fields:
+      return
+
+    write_cmd = 'insert ignore into %s (field_name, table_name) ' \
+                'values (%%s, %%s)' % self.FIELD_NAME_MAPPING_TABLE
+    logging.debug('Registering %d fields with command: %s',
+                  len(new_fields), write_cmd)
+    cursor = self.connection.cursor()
+    cursor.executemany(write_cmd, [(f, table_name) for f in new_fields])
+    cursor.close()
+    for field_name in new_fields:
+      self.field_tables[field_name] = table_name
+
+  ############################
+  def _column_type(self, record, field):
+    """Return the SQL type of the column in which to store the field's
+    values, based on the type of its value in the record."""
+    value = record.fields[field]
+    if value is None:
+      value = ''
+    if not type(value) in self.TYPE_MAP:
+      logging.error('Unrecognized value type in record: %s', type(value))
+      logging.error('Record: %s', str(record))
+      raise TypeError('Unrecognized value type in record: %s', type(value))
+    return self.TYPE_MAP[type(value)]
+
+  ############################
+  def _add_missing_columns(self, table_name, record):
+    """If the record has fields that the table doesn't have columns for,
+    add all of them in a single alter table command."""
+    columns = self._get_table_columns(table_name)
+    missing = [field for field in record.fields if not field in columns]
+    if not missing:
+      return
+
+    alter_cmd = 'alter table `%s` %s' % \
+                (table_name, ', '.join(['add column `%s` %s'
+                                        % (field, self._column_type(record, field))
+                                        for field in missing]))
+    logging.info('Adding columns with command: %s', alter_cmd)
+    self.exec_sql_command(alter_cmd)
+    self.table_columns[table_name] = columns + missing
+    self._register_fields(table_name, missing)
 
   ############################
   def create_table_from_record(self,  record):
@@ -140,20 +216,14 @@ class MySQLRecordConnector:
     # Iterate through fields in record, figure out their type and
     # create an table type appropriate for each.
     for field in record.fields:
-      value = record.fields[field]
-      if value is None:
-        value = ''
-      if not type(value) in self.TYPE_MAP:
-        logging.error('Unrecognized value type in record: %s', type(value))
-        logging.error('Record: %s', str(record))
-        raise TypeError('Unrecognized value type in record: %s', type(value))
-      columns.append('`%s` %s' %( field, self.TYPE_MAP[type(value)]))
+      columns.append('`%s` %s' %( field, self._column_type(record, field)))
 
     table_cmd = 'create table `%s` (%s, primary key (`id`), ' \
                 'index(id, timestamp))' % \
                 (table_name, ','.join(columns))
     logging.info('Creating table with command: %s', table_cmd)
     self.exec_sql_command(table_cmd)
+    self.table_columns[table_name] = ['id', 'timestamp'] + list(record.fields)
 
     # Register the fields in the record as being contained in this table.
     self._register_record_fields(record)
@@ -178,6 +248,10 @@ class MySQLRecordConnector:
 
     table_name = self.table_name_from_record(record)
 
+    # If the record has fields the table doesn't, add them
+    if self.table_exists(table_name):
+      self._add_missing_columns(table_name, record)
+
     keys = record.fields.keys()
     write_cmd = 'insert into `%s` (`timestamp`,%s) values (%f,%s)' % \
                 (table_name, ','.join(keys), record.timestamp,
@@ -198,13 +272,16 @@ class MySQLRecordConnector:
 
   ############################
   def _get_table_columns(self, table_name):
-    """Get columns (we could probably cache these, checking against the
-    existence of self.last_record_read[table_name] to know when we
-    need to rebuild."""
+    """Get columns of table, from our cache if we can."""
+    columns = self.table_columns.get(table_name, None)
+    if columns is not None:
+      return columns
     cursor = self.connection.cursor()
     cursor.execute('show columns in `%s`' % table_name)
     columns = [c[0] for c in cursor]
+    cursor.close()
     logging.debug('Columns: %s', columns)
+    self.table_columns[table_name] = columns
     return columns
 
   ############################
@@ -216,11 +293,16 @@ class MySQLRecordConnector:
     return num_rows
 
   ############################
-  def _fetch_and_parse_records(self, table_name, query):
-    """Fetch records, give DB query, and parse into DASRecords."""
+  def _fetch_and_parse_records(self, table_name, query, field_list=None):
+    """Fetch records, give DB query, and parse into DASRecords. If the
+    query selects only id, timestamp and the fields in field_list,
+    those are the columns we get back; otherwise we get all columns."""
 
     (data_id, message_type) = self._parse_table_name(table_name)
-    columns = self._get_table_columns(table_name)
+    if field_list:
+      columns = ['id', 'timestamp'] + list(field_list)
+    else:
+      columns = self._get_table_columns(table_name)
 
     cursor = self.connection.cursor()
     cursor.execute(query)
@@ -255,7 +337,7 @@ class MySQLRecordConnector:
       fields = 'id,timestamp,' + ','.join(field_list)
 
     query = 'select %s from `%s` where (id = %d)' % (fields, table_name, start)
-    result = self._fetch_and_parse_records(table_name, query)
+    result = self._fetch_and_parse_records(table_name, query, field_list)
 
     if not result:
       return None
@@ -304,7 +386,7 @@ class MySQLRecordConnector:
       fields = 'id,timestamp,' + ','.join(field_list)
 
     query = 'select %s from `%s` %s' % (fields, table_name, condition_clause)
-    return self._fetch_and_parse_records(table_name, query)
+    return self._fetch_and_parse_records(table_name, query, field_list)
 
   ############################
   def read_time_range(self, table_name, field_list=None,
@@ -331,7 +413,7 @@ class MySQLRecordConnector:
       fields = 'id,timestamp,' + ','.join(field_list)
 
     query = 'select %s from `%s` %s' % (fields, table_name, condition_clause)
-    return self._fetch_and_parse_records(table_name, query)
+    return self._fetch_and_parse_records(table_name, query, field_list)
 
   ############################
   def delete_table(self,  table_name):
@@ -340,9 +422,17 @@ class MySQLRecordConnector:
     logging.info('Dropping table with command: %s', delete_cmd)
     self.exec_sql_command(delete_cmd)
 
-    # Clear out our recollection of how far into the table we've read
+    # Clear out our recollection of how far into the table we've read,
+    # and of its schema
     if table_name in self.next_id:
       del self.next_id[table_name]
+    self.table_columns.pop(table_name, None)
+    if table_name == self.FIELD_NAME_MAPPING_TABLE:
+      self.field_tables = {}
+    else:
+      self.field_tables = {field: table
+                           for field, table in self.field_tables.items()
+                           if table != table_name}
 
     # Delete any references to that table from the file name mapping
     delete_refs = 'delete from %s where table_name = "%s"' % \
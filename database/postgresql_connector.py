@@ -25,23 +25,54 @@ and storage.
 
 TODO: Allow wildcarding field selection, so client can specify 'S330*,Knud*'
 
+For bulk loading, write_records() streams rows into the tables with
+COPY ... FROM STDIN in CSV form, rather than issuing an INSERT for
+each record.
 """
+import io
 import logging
+import math
 import sys
 
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
 from logger.utils.formats import Python_Record
 from logger.utils.das_record import DASRecord
+from database import connection_pool
 
 try:
   import psycopg2
   POSTGRES_ENABLED = True
+
+  # Errors that mean we've lost our connection, rather than that
+  # something was wrong with what we asked of it.
+  CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
 except ImportError:
   POSTGRES_ENABLED = False
 
 # import psycopg2
 # POSTGRES_ENABLED = True
 
+# Default maximum size (in characters) of the CSV text sent by a
+# single COPY command in write_records().
+DEFAULT_COPY_BATCH_CHARS = 4 * 1024 * 1024
+
+############################
+def csv_value(value):
+  """Encode a value for a CSV-format COPY. None becomes an unquoted
+  empty field, which COPY reads as NULL; strings are always quoted,
+  so that empty strings are not."""
+  if value is None:
+    return ''
+  if type(value) is str:
+    return '"%s"' % value.replace('"', '""')
+  if type(value) is float:
+    if math.isnan(value):
+      return 'NaN'
+    if math.isinf(value):
+      return 'Infinity' if value > 0 else '-Infinity'
+    return repr(value)
+  return str(value)
+
 ################################################################################
 class PostgreSQLConnector:
   # Name of table in which we will store mappings from record field
@@ -50,15 +81,31 @@ class PostgreSQLConnector:
   FIELD_TABLE = 'fields'
   SOURCE_TABLE = 'source'
 
-  def __init__(self, database, host, user, password, tail=False, save_source=True):
-    """Interface to PostgreSQLConnector, to be imported by, e.g. DatabaseWriter."""
+  def __init__(self, database, host, user, password, tail=False, save_source=True,
+               copy_batch_chars=DEFAULT_COPY_BATCH_CHARS):
+    """Interface to PostgreSQLConnector, to be imported by, e.g. DatabaseWriter.
+
+    copy_batch_chars is the maximum size, in characters, of the CSV
+    text that write_records() will send in a single COPY command."""
     if not POSTGRES_ENABLED:
       logging.warning('PostGres not found, so PostGres functionality not available.')
       return
 
     self.database = database
-
-    self.connection = psycopg2.connect(database=database, host=host, user=user, password=password)
+    self.copy_batch_chars = copy_batch_chars
+
+    # Get our connection from a pool shared by all PostgreSQLConnectors
+    # in this process that use the same database. If we lose it, we'll
+    # get another (see _check_connection()).
+    def connect():
+      connection = psycopg2.connect(database=database, host=host,
+                                    user=user, password=password)
+      connection.set_session(autocommit=True)
+      return connection
+    self.pool = connection_pool.get_pool(
+      ('postgresql', database, host, user, password), connect,
+      is_healthy=self._is_healthy)
+    self.connection = self.pool.acquire()
     self.save_source = save_source
 
     # What's the next id we're supposed to read? Or if we've been
@@ -66,9 +113,6 @@ class PostgreSQLConnector:
     self.next_id = 1
     self.last_timestamp = 0
 
-    # self.exec_sql_command('SET AUTOCOMMIT TO ON')
-    self.connection.set_session(autocommit=True)
-
     # Create tables if they don't exist yet
     if not self.table_exists(self.SOURCE_TABLE):
       table_cmd = 'CREATE TABLE %s (id SERIAL PRIMARY KEY, ' \
@@ -103,11 +147,14 @@ class PostgreSQLConnector:
 
   ############################
   def exec_sql_command(self, command):
+    self._check_connection()
     cursor = self.connection.cursor()
     try:
       cursor.execute(command)
       self.connection.commit()
       cursor.close()
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
     except psycopg2.errors.ProgrammingError as e:
       logging.error('Executing command: "%s", encountered error "%s"',
                     command, str(e))
@@ -115,9 +162,38 @@ class PostgreSQLConnector:
       logging.error('Other error: "%s", encountered error "%s"',
                     command, str(e))
 
+  ############################
+  @staticmethod
+  def _is_healthy(connection):
+    """Is a pooled connection still usable?"""
+    if connection.closed:
+      return False
+    cursor = connection.cursor()
+    cursor.execute('select 1')
+    cursor.close()
+    return True
+
+  ############################
+  def _check_connection(self):
+    """If we've lost our connection, try to get a new one from the pool.
+    Raises ConnectionError if the database is still unavailable."""
+    if self.connection is None:
+      self.connection = self.pool.acquire()
+
+  ############################
+  def _connection_lost(self, error):
+    """Discard our broken connection and raise a ConnectionError. The
+    next operation will try to get a new connection."""
+    logging.warning('Lost connection to PostgreSQL database: %s', error)
+    if self.connection is not None:
+      self.pool.discard(self.connection)
+      self.connection = None
+    raise ConnectionError('Lost connection to database: %s' % error)
+
   ############################
   def table_exists(self, table_name):
     """Does the specified table exist in the database?"""
+    self._check_connection()
     cursor = self.connection.cursor()
     # logging.warning(cursor.mogrify('SELECT EXISTS ( SELECT FROM information_schema.tables WHERE table_schema = \'public\' AND table_name = \'%s\')' % (table_name)))
     cursor.execute('SELECT EXISTS ( SELECT FROM information_schema.tables WHERE table_schema = \'public\' AND table_name = \'%s\')' % (table_name))
@@ -222,6 +298,124 @@ class PostgreSQLConnector:
     logging.debug('Inserting record into table with command: %s', write_cmd)
     self.exec_sql_command(write_cmd)
 
+  ############################
+  def write_records(self, records):
+    """Write a list of DASRecords to the database in a single
+    transaction, streaming the rows in with COPY rather than INSERT."""
+    das_records = []
+    for record in records:
+      if not record:
+        continue
+      if not type(record) == DASRecord:
+        logging.error('write_records() received non-DASRecord as input. '
+                      'Type: %s', type(record))
+        continue
+      das_records.append(record)
+    if not das_records:
+      return
+
+    self._check_connection()
+    cursor = self.connection.cursor()
+    write_individually = False
+    try:
+      cursor.execute('BEGIN')
+
+      # If we're saving source records, reserve ids for them up front
+      # so that we can attach them to the data rows.
+      if self.save_source:
+        cursor.execute('select nextval(pg_get_serial_sequence(%s, %s)) '
+                       'from generate_series(1, %s)',
+                       (self.SOURCE_TABLE, 'id', len(das_records)))
+        source_ids = [row[0] for row in cursor.fetchall()]
+        self._copy_rows(cursor, self.SOURCE_TABLE, ['id', 'record'],
+                        [(source_id, record.as_json())
+                         for source_id, record in zip(source_ids, das_records)])
+      else:
+        source_ids = [None] * len(das_records)
+
+      def data_rows():
+        for record, source_id in zip(das_records, source_ids):
+          if not record.fields:
+            logging.info('DASRecord has no parsed fields. Skipping record.')
+            continue
+          yield from self._data_rows(record, source_id)
+
+      self._copy_rows(cursor, self.DATA_TABLE,
+                      ['timestamp', 'field_name', 'int_value', 'float_value',
+                       'str_value', 'bool_value', 'source'],
+                      data_rows())
+      cursor.execute('COMMIT')
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
+    except Exception as e:
+      cursor.execute('ROLLBACK')
+      if len(das_records) == 1:
+        logging.error('Writing record, encountered error "%s"', str(e))
+      else:
+        # Don't let one bad value lose the whole batch
+        logging.warning('Writing %d records, encountered error "%s"; '
+                        'writing them one at a time', len(das_records), str(e))
+        write_individually = True
+    finally:
+      cursor.close()
+
+    if write_individually:
+      for record in das_records:
+        self.write_record(record)
+
+  ############################
+  def _copy_rows(self, cursor, table_name, columns, rows):
+    """COPY rows (tuples of values for the named columns) into the table,
+    in batches of at most self.copy_batch_chars characters of CSV."""
+    command = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % \
+              (table_name, ', '.join(columns))
+    lines = []
+    size = 0
+    for row in rows:
+      line = ','.join([csv_value(value) for value in row]) + '\n'
+      lines.append(line)
+      size += len(line)
+      if size >= self.copy_batch_chars:
+        logging.debug('Copying %d rows into %s', len(lines), table_name)
+        cursor.copy_expert(command, io.StringIO(''.join(lines)))
+        lines = []
+        size = 0
+    if lines:
+      logging.debug('Copying %d rows into %s', len(lines), table_name)
+      cursor.copy_expert(command, io.StringIO(''.join(lines)))
+
+  ############################
+  def _data_rows(self, record, source_id):
+    """Return a list of rows (tuples), one for each field-value pair in
+    the record."""
+    # Columns are:
+    #     timestamp
+    #     field_name
+    #     int_value   \
+    #     float_value, \ Only one of these fields will be non-NULL,
+    #     str_value    / depending on the type of the value.
+    #     bool_value  /
+    #     source
+    rows = []
+    for field_name, value in record.fields.items():
+      row = [record.timestamp, field_name, None, None, None, None, source_id]
+      if type(value) is int:
+        row[2] = value
+      elif type(value) is float:
+        row[3] = value
+      elif type(value) is str:
+        row[4] = value
+      elif type(value) is bool:
+        row[5] = 1 if value else 0
+      elif value is None:
+        row[4] = ''
+      else:
+        logging.error('Unknown record value type (%s) for %s: %s',
+                      type(value), field_name, value)
+        continue
+      rows.append(tuple(row))
+    return rows
+
   ############################
   def read(self, field_list=None, start=None, num_records=1):
     """Read the next record from table. If start is specified, reset read
@@ -292,15 +486,23 @@ class PostgreSQLConnector:
   ############################
   def _num_rows(self, table_name):
     query = 'select count(1) from %s' % table_name
+    self._check_connection()
     cursor = self.connection.cursor()
-    cursor.execute(query)
-    num_rows = next(cursor)[0]
+    try:
+      cursor.execute(query)
+      num_rows = next(cursor)[0]
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
     return num_rows
 
   ############################
   def _process_query(self, query):
+    self._check_connection()
     cursor = self.connection.cursor()
-    cursor.execute(query)
+    try:
+      cursor.execute(query)
+    except CONNECTION_ERRORS as e:
+      self._connection_lost(e)
 
     results = {}
     for values in cursor:
@@ -337,5 +539,7 @@ class PostgreSQLConnector:
 
   ############################
   def close(self):
-    """Close connection."""
-    self.connection.close()
+    """Return our connection to the pool."""
+    if self.connection is not None:
+      self.pool.release(self.connection)
+      self.connection = None
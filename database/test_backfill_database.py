@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import logging
+import os.path
+import sys
+import tempfile
+import unittest
+
+sys.path.append('.')
+
+from logger.utils.nmea_parser import NMEAParser
+from database.backfill_database import backfill, path_data_id
+
+# Logfile lines without the leading data_id
+SAMPLE_DATA = [
+  '2017-11-04T05:12:19.479303Z $INZDA,000000.17,07,08,2014,,*78',
+  '2017-11-04T05:12:19.729748Z $INGGA,000000.16,3934.831698,S,03727.695242,W,1,12,0.7,0.82,M,-3.04,M,,*6F',
+  '2017-11-04T05:12:19.984911Z $INVTG,227.19,T,245.64,M,10.8,N,20.0,K,A*36',
+  '2017-11-04T05:12:20.240177Z $INRMC,000000.16,A,3934.831698,S,03727.695242,W,10.8,227.19,070814,18.5,W,A*00',
+  '2017-11-04T05:12:20.495430Z $INHDT,235.18,T*18',
+]
+
+################################################################################
+class FakeConnector:
+  """Stand-in for a database connector that remembers the batches
+  passed to write_records()."""
+  def __init__(self):
+    self.batches = []
+
+  def write_records(self, records):
+    self.batches.append(list(records))
+
+################################################################################
+class TestBackfillDatabase(unittest.TestCase):
+  ############################
+  def setUp(self):
+    # Two days of s330 logfiles, in a 'raw' directory as in test/NBP1406
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.raw_dir = os.path.join(self.tmpdir.name, 's330', 'raw')
+    os.makedirs(self.raw_dir)
+    with open(os.path.join(self.raw_dir, 's330-2017-11-04'), 'w') as f:
+      f.write('\n'.join(SAMPLE_DATA[:3]) + '\n\n')
+    with open(os.path.join(self.raw_dir, 's330-2017-11-05'), 'w') as f:
+      f.write('\n'.join(SAMPLE_DATA[3:]) + '\n')
+    self.file_spec = os.path.join(self.raw_dir, 's330-*')
+
+  ############################
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  ############################
+  def test_path_data_id(self):
+    self.assertEqual(path_data_id(os.path.join(self.raw_dir, 'x')), 's330')
+    self.assertEqual(path_data_id(os.path.join(self.tmpdir.name, 'gyr1', 'x')),
+                     'gyr1')
+
+  ############################
+  def test_data_id_from_path(self):
+    db = FakeConnector()
+    num_lines, num_records = backfill(db, NMEAParser(), self.file_spec,
+                                      data_id_from_path=True,
+                                      batch_records=2)
+    self.assertEqual((num_lines, num_records), (5, 5))
+
+    # Files are read in order, in batches of batch_records
+    self.assertEqual([len(batch) for batch in db.batches], [2, 2, 1])
+    records = sum(db.batches, [])
+    self.assertEqual([r.data_id for r in records], ['s330'] * 5)
+    self.assertEqual([r.message_type for r in records],
+                     ['$INZDA', '$INGGA', '$INVTG', '$INRMC', '$INHDT'])
+
+  ############################
+  def test_data_id(self):
+    # data_id_from_path takes precedence over data_id
+    db = FakeConnector()
+    backfill(db, NMEAParser(), self.file_spec, data_id='gyr1',
+             data_id_from_path=True)
+    self.assertEqual([r.data_id for r in db.batches[0]], ['s330'] * 5)
+
+    # All records fit in a single batch
+    db = FakeConnector()
+    num_lines, num_records = backfill(db, NMEAParser(), self.file_spec,
+                                      data_id='s330')
+    self.assertEqual((num_lines, num_records), (5, 5))
+    self.assertEqual(len(db.batches), 1)
+
+  ############################
+  def test_unparseable_lines(self):
+    # Without a data_id, lines can't be parsed, and nothing is written
+    db = FakeConnector()
+    num_lines, num_records = backfill(db, NMEAParser(), self.file_spec)
+    self.assertEqual((num_lines, num_records), (5, 0))
+    self.assertEqual(db.batches, [])
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import time
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from database.connection_pool import ConnectionPool, get_pool
+
+################################################################################
+class FakeConnection:
+  def __init__(self):
+    self.healthy = True
+    self.closed = False
+
+  def close(self):
+    self.closed = True
+
+################################################################################
+class TestConnectionPool(unittest.TestCase):
+  ############################
+  def test_reuse(self):
+    opened = []
+    def connect():
+      opened.append(FakeConnection())
+      return opened[-1]
+
+    pool = ConnectionPool(connect, is_healthy=lambda c: c.healthy, max_idle=1)
+    first = pool.acquire()
+    pool.release(first)
+    self.assertIs(pool.acquire(), first)
+    self.assertEqual(len(opened), 1)
+
+    # Unhealthy idle connections are closed rather than handed out
+    pool.release(first)
+    first.healthy = False
+    second = pool.acquire()
+    self.assertIsNot(second, first)
+    self.assertTrue(first.closed)
+
+    # We only keep max_idle idle connections
+    third = pool.acquire()
+    pool.release(second)
+    pool.release(third)
+    self.assertFalse(second.closed)
+    self.assertTrue(third.closed)
+
+    pool.discard(second)
+    self.assertTrue(second.closed)
+
+  ############################
+  def test_backoff(self):
+    available = False
+    attempts = []
+    def connect():
+      attempts.append(time.time())
+      if not available:
+        raise OSError('Connection refused')
+      return FakeConnection()
+
+    pool = ConnectionPool(connect, initial_backoff=0.1, max_backoff=0.2)
+    with self.assertRaises(ConnectionError):
+      pool.acquire()
+    self.assertEqual(pool.backoff, 0.1)
+
+    # While backing off, we don't even try to connect
+    with self.assertRaises(ConnectionError):
+      pool.acquire()
+    self.assertEqual(len(attempts), 1)
+
+    # Backoff doubles after each failure, up to max_backoff
+    time.sleep(0.15)
+    with self.assertRaises(ConnectionError):
+      pool.acquire()
+    self.assertEqual(pool.backoff, 0.2)
+    time.sleep(0.25)
+    with self.assertRaises(ConnectionError):
+      pool.acquire()
+    self.assertEqual(pool.backoff, 0.2)
+    self.assertEqual(len(attempts), 3)
+
+    # Once we connect, backoff is reset
+    available = True
+    time.sleep(0.25)
+    self.assertIsInstance(pool.acquire(), FakeConnection)
+    self.assertEqual(pool.backoff, 0)
+
+  ############################
+  def test_get_pool(self):
+    pool = get_pool(('test', 'db1'), FakeConnection)
+    self.assertIs(get_pool(('test', 'db1'), FakeConnection), pool)
+    self.assertIsNot(get_pool(('test', 'db2'), FakeConnection), pool)
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -11,6 +11,7 @@ sys.path.append('.')
 
 from logger.utils.das_record import DASRecord
 from logger.utils.nmea_parser import NMEAParser
+from database.mongo_record_connector import bucket_documents, records_from_bucket
 
 try:
   from database.settings import MONGO_ENABLED
@@ -30,6 +31,37 @@ SAMPLE_DATA = [
   's330 2017-11-04T05:12:21.256010Z $PSXN,23,-2.82,1.00,235.18,-1.66*3D',
 ]
 
+class TestBuckets(unittest.TestCase):
+
+  ############################
+  def test_bucket_documents(self):
+    records = [DASRecord(data_id='gyr1', timestamp=100.0 + i * 0.5,
+                         fields={'Heading': i, 'Rate': i * 0.1})
+               for i in range(300)]
+    # An odd record out, with a different set of fields
+    records.append(DASRecord(data_id='gyr1', timestamp=130.25,
+                             fields={'Heading': 999}))
+
+    docs = bucket_documents(records, 60)
+    self.assertEqual([(d['bucket'], d['count']) for d in docs],
+                     [(60.0, 40), (120.0, 120), (120.0, 1), (180.0, 120),
+                      (240.0, 20)])
+    self.assertEqual(docs[0]['first'], 100.0)
+    self.assertEqual(docs[0]['last'], 119.5)
+    self.assertEqual(docs[2]['fields'], {'Heading': [999]})
+
+    expanded = []
+    for doc in docs:
+      expanded.extend(records_from_bucket(doc))
+    self.assertEqual(sorted(expanded, key=lambda r: r.timestamp),
+                     sorted(records, key=lambda r: r.timestamp))
+
+    # Pick out a subset of records, and records from a projected document
+    self.assertEqual(records_from_bucket(docs[0], 2, 4), records[2:4])
+    projected = dict(docs[0], fields={'Rate': docs[0]['fields']['Rate']})
+    self.assertEqual(records_from_bucket(projected, 0, 1)[0].fields,
+                     {'Rate': 0.0})
+
 class TestDatabase(unittest.TestCase):
 
   ############################
@@ -109,6 +141,56 @@ class TestDatabase(unittest.TestCase):
 
     db.close()
 
+  ############################
+  @unittest.skipUnless(MONGO_ENABLED, 'Mongo not installed; tests of Mongo '
+                       'functionality will not be run.')
+  def test_bucketed(self):
+    db = MongoRecordConnector(database='test', host='localhost',
+                              user='test', password='test',
+                              bucket_seconds=60, buffer_records=50)
+    test_num = random.randint(0,100000)
+    records = [DASRecord(data_id='%d_bucket' % test_num,
+                         timestamp=1000.0 + i * 0.5,
+                         fields={'Heading': i, 'Rate': i * 0.1})
+               for i in range(200)]
+    table_name = db.table_name_from_record(records[0])
+    db.create_table_from_record(records[0])
+    for record in records[:120]:
+      db.write_record(record)
+    db.write_records(records[120:])
+    db.flush()
+
+    self.assertLess(db.db[table_name].count_documents({}), 10)
+    self.assertEqual(db._num_rows(table_name), 200)
+    self.assertEqual(db.read_range(table_name, start=0), records)
+    self.assertEqual(db.read_range(table_name, start=45, stop=55),
+                     records[45:55])
+    self.assertEqual(db.read_time_range(table_name, start_time=1010,
+                                        stop_time=1020), records[20:40])
+    result = db.read(table_name, field_list=['Rate'], start=3)
+    self.assertEqual(result.fields, {'Rate': records[3].fields['Rate']})
+
+    # Reads resume from where the last left off, and can go back again
+    db.seek(table_name, 115, 'start')
+    self.assertEqual([db.read(table_name) for i in range(10)],
+                     records[115:125])
+    self.assertEqual(db.read_range(table_name, start=10, stop=12),
+                     records[10:12])
+    self.assertEqual(db.read(table_name), records[12])
+
+    # write_records() should set up a table it hasn't seen before
+    other = DASRecord(data_id='%d_other' % test_num, timestamp=1000.0,
+                      fields={'Other': 1})
+    other_table = db.table_name_from_record(other)
+    db.write_records([other])
+    self.assertTrue(db.table_exists(other_table))
+    self.assertIn('bucket_1_keys_1_count_1',
+                  db.db[other_table].index_information())
+
+    db.delete_table(other_table)
+    db.delete_table(table_name)
+    db.close()
+
 if __name__ == '__main__':
   import argparse
   parser = argparse.ArgumentParser()
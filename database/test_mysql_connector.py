@@ -122,6 +122,64 @@ class TestDatabase(unittest.TestCase):
 
     db.close()
 
+  ############################
+  @unittest.skipUnless(MYSQL_ENABLED, 'MySQL not installed; tests of MySQL '
+                       'functionality will not be run.')
+  def test_write_records(self):
+    parser = NMEAParser()
+    try:
+      db = MySQLConnector(database='test', host='localhost',
+                          user='test', password='test')
+      db.exec_sql_command('truncate table data')
+    except Exception as e:
+      self.assertTrue(False,'Unable to create database connection. Have you '
+                      'set up the appropriate setup script in database/setup?')
+
+    # Writing in one batch should be indistinguishable from writing
+    # record by record.
+    records = [parser.parse_record(s) for s in SAMPLE_DATA]
+    db.write_records(records)
+
+    for r in SINGLE_RESULTS:
+      result = db.read()
+      self.assertEqual(result, r)
+    self.assertEqual(db.read(), {})
+
+    db.close()
+
+  ############################
+  @unittest.skipUnless(MYSQL_ENABLED, 'MySQL not installed; tests of MySQL '
+                       'functionality will not be run.')
+  def test_read_time(self):
+    parser = NMEAParser()
+    try:
+      db = MySQLConnector(database='test', host='localhost',
+                          user='test', password='test')
+      db.exec_sql_command('truncate table data')
+    except Exception as e:
+      self.assertTrue(False,'Unable to create database connection. Have you '
+                      'set up the appropriate setup script in database/setup?')
+    self.assertTrue(db._index_exists(db.DATA_TABLE, db.FIELD_TIME_INDEX))
+
+    db.write_records([parser.parse_record(s) for s in SAMPLE_DATA])
+    self.assertEqual(db._num_rows(db.DATA_TABLE), len(SINGLE_RESULTS))
+
+    # Field lists may be lists or comma-separated strings
+    for field_list in [['S330CourseTrue', 'S330CourseMag'],
+                       'S330CourseTrue,S330CourseMag']:
+      result = db.read_time(field_list, start_time=0)
+      self.assertEqual(result, BATCH_RESULTS[0])
+
+    result = db.read_time(['S330CourseTrue'], start_time=1509772339.984911,
+                          stop_time=1509772341)
+    self.assertEqual(result, {'S330CourseTrue': [(1509772340.240177, 227.19)]})
+
+    db.seek(-1, 'end')
+    self.assertEqual(db.read(), SINGLE_RESULTS[-1])
+    self.assertEqual(db.read(), {})
+
+    db.close()
+
 
 if __name__ == '__main__':
   import argparse
@@ -110,6 +110,41 @@ class TestDatabase(unittest.TestCase):
 
     db.close()
 
+  ############################
+  @unittest.skipUnless(MYSQL_ENABLED, 'MySQL not installed; tests of MySQL '
+                       'functionality will not be run.')
+  def test_schema_cache(self):
+    db = MySQLRecordConnector(database='test', host='localhost',
+                              user='test', password='test')
+    test_num = random.randint(0,100000)
+    record = DASRecord(data_id='%d_cache' % test_num, timestamp=1.0,
+                       fields={'%d_f1' % test_num: 1})
+    table_name = db.table_name_from_record(record)
+    db.create_table_from_record(record)
+    db.write_record(record)
+
+    # A record with new fields gets them added as columns in one go
+    wider = DASRecord(data_id=record.data_id, timestamp=2.0,
+                      fields={'%d_f1' % test_num: 2,
+                              '%d_f2' % test_num: 2.5,
+                              '%d_f3' % test_num: 'x'})
+    db.write_record(wider)
+    self.assertEqual(db.table_columns[table_name],
+                     ['id', 'timestamp'] + list(wider.fields))
+    for field in wider.fields:
+      self.assertEqual(db.field_tables[field], table_name)
+    self.assertEqual(db.read_range(table_name, start=2), [wider])
+
+    # Our cache agrees with what the database says
+    del db.table_columns[table_name]
+    self.assertEqual(db._get_table_columns(table_name),
+                     ['id', 'timestamp'] + list(wider.fields))
+
+    db.delete_table(table_name)
+    self.assertFalse(db.table_exists(table_name))
+    self.assertNotIn('%d_f1' % test_num, db.field_tables)
+    db.close()
+
 if __name__ == '__main__':
   import argparse
   parser = argparse.ArgumentParser()
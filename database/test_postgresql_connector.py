@@ -120,6 +120,33 @@ class TestDatabase(unittest.TestCase):
 
     db.close()
 
+  ############################
+  @unittest.skipUnless(POSTGRES_ENABLED, 'PostgreSQL not installed; tests of '
+                       'PostgreSQL functionality will not be run.')
+  def test_write_records(self):
+    parser = NMEAParser()
+    try:
+      # Use a tiny COPY batch size to exercise splitting into batches
+      db = PostgreSQLConnector(database='test', host='localhost',
+                               user='test', password='test',
+                               copy_batch_chars=100)
+      db.exec_sql_command('truncate table data')
+    except Exception as e:
+      self.assertTrue(False,'Unable to create database connection. Have you '
+                      'set up the appropriate setup script in database/setup?')
+
+    # Copying in one batch should be indistinguishable from writing
+    # record by record.
+    records = [parser.parse_record(s) for s in SAMPLE_DATA]
+    db.write_records(records)
+
+    for r in SINGLE_RESULTS:
+      result = db.read()
+      self.assertEqual(result, r)
+    self.assertEqual(db.read(), {})
+
+    db.close()
+
 
 if __name__ == '__main__':
   import argparse
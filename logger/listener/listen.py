@@ -57,6 +57,7 @@ from logger.readers.serial_reader import SerialReader
 from logger.readers.polled_serial_reader import PolledSerialReader
 from logger.readers.text_file_reader import TextFileReader
 from logger.readers.database_reader import DatabaseReader
+from logger.readers.parquet_reader import ParquetReader
 from logger.readers.timeout_reader import TimeoutReader
 
 from logger.transforms.prefix_transform import PrefixTransform
@@ -90,12 +91,14 @@ from logger.writers.text_file_writer import TextFileWriter
 from logger.writers.logfile_writer import LogfileWriter
 from logger.writers.influxdb_writer import InfluxDBWriter
 from logger.writers.database_writer import DatabaseWriter
+from logger.writers.parquet_writer import ParquetWriter
 from logger.writers.record_screen_writer import RecordScreenWriter
 from logger.writers.cached_data_writer import CachedDataWriter
 from logger.writers.timeout_writer import TimeoutWriter
 
 from logger.utils.timestamp import TIME_FORMAT, LOGGING_TIME_FORMAT
 from logger.utils import read_config, timestamp, nmea_parser, record_parser
+from logger.utils import definition_cache
 from logger.utils.stderr_logging import StdErrLoggingHandler, STDERR_FORMATTER
 
 from logger.listener.listener import Listener
@@ -412,6 +415,13 @@ if __name__ == '__main__':
                       help='Comma-separated globs of device definition '
                       'file names, e.g. '
                       'local/devices/*.yaml,test/skq/devices.yaml')
+  parser.add_argument('--parse_definition_cache_dir',
+                      dest='parse_definition_cache_dir',
+                      default=definition_cache.DEFAULT_CACHE_DIR,
+                      help='Directory in which to cache the definitions read '
+                      'from --parse_definition_path, so that other loggers '
+                      'can start without re-reading them. Specify an empty '
+                      'string to not cache them.')
   parser.add_argument('--parse_to_json',
                       dest='parse_to_json', action='store_true',
                       help='If specified, parser outputs JSON.')
@@ -745,7 +755,8 @@ if __name__ == '__main__':
           ParseTransform(
             definition_path=all_args.parse_definition_path,
             return_json=all_args.parse_to_json,
-            return_das_record=all_args.parse_to_das_record)
+            return_das_record=all_args.parse_to_das_record,
+            definition_cache_dir=all_args.parse_definition_cache_dir or None)
         )
       if new_args.aggregate_xml:
         transforms.append(XMLAggregatorTransform(new_args.aggregate_xml))
@@ -12,7 +12,9 @@ from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(r
 from logger.readers.text_file_reader import TextFileReader
 from logger.writers.text_file_writer import TextFileWriter
 from logger.readers.composed_reader import ComposedReader
+from logger.readers.composed_reader import DEFAULT_READER_QUEUE_SIZE
 from logger.writers.composed_writer import ComposedWriter
+from logger.writers.composed_writer import DEFAULT_WRITER_QUEUE_SIZE
 
 ################################################################################
 class Listener:
@@ -27,6 +29,11 @@ class Listener:
   ############################
   def __init__(self, readers=[], transforms=[], writers=[], stderr_writers=[],
                host_id='', interval=0, name=None, check_format=False,
+               worker_threads=False, blocking_writes=True,
+               writer_queue_size=DEFAULT_WRITER_QUEUE_SIZE,
+               continuous_readers=False,
+               reader_queue_size=DEFAULT_READER_QUEUE_SIZE,
+               reader_overflow='block', batch_size=None, batch_timeout=None,
                log_level=None):
     """listener = Listener(readers, transforms=[], writers=[],
                         interval=0, check_format=False)
@@ -54,6 +61,43 @@ class Listener:
                    output_format() of the whole reader will be
                    formats.Unknown.
 
+    worker_threads If True, give each writer a long-lived thread and queue
+                   instead of creating a thread per writer per record. See
+                   ComposedWriter for details.
+
+    blocking_writes
+                   If True (the default), wait for all writers to write a
+                   record before reading the next one. If False (and
+                   worker_threads is True), only wait for the record to be
+                   queued for each writer.
+
+    writer_queue_size
+                   If worker_threads is True, the maximum number of records
+                   that may be waiting to be written by each writer.
+
+    continuous_readers
+                   If True, run each reader continuously in its own thread,
+                   queueing records until they're needed. See ComposedReader
+                   for details.
+
+    reader_queue_size
+                   If continuous_readers is True, the maximum number of
+                   records that may be queued for each reader.
+
+    reader_overflow
+                   If continuous_readers is True, what to do when a reader's
+                   queue is full: 'drop_oldest', 'drop_newest' or 'block'.
+
+    batch_size     If not None, read up to batch_size records at a time and
+                   pass them through transforms and writers as a list, via
+                   their read_batch(), transform_batch() and write_batch()
+                   methods.
+
+    batch_timeout  If batch_size is not None, how many seconds to wait,
+                   after receiving the first record of a batch, for the
+                   rest of the batch to arrive. If None, take only those
+                   records that are available without waiting.
+
     Sample use:
 
     listener = Listener(readers=[NetworkReader(':6221'),
@@ -71,10 +115,18 @@ class Listener:
 
     ###########
     # Create readers, writers, etc.
-    self.reader = ComposedReader(readers=readers, check_format=check_format)
+    self.reader = ComposedReader(readers=readers, check_format=check_format,
+                                 continuous=continuous_readers,
+                                 queue_size=reader_queue_size,
+                                 overflow=reader_overflow)
     self.writer = ComposedWriter(transforms=transforms, writers=writers,
-                                 check_format=check_format)
+                                 check_format=check_format,
+                                 worker_threads=worker_threads,
+                                 blocking=blocking_writes,
+                                 queue_size=writer_queue_size)
     self.interval = interval
+    self.batch_size = batch_size
+    self.batch_timeout = batch_timeout
     self.name = name or 'Unnamed listener'
     self.last_read = 0
 
@@ -104,16 +156,27 @@ class Listener:
     record = ''
     try:
       while not self.quit_signalled and record is not None:
-        record = self.reader.read()
-        self.last_read = time.time()
-        logging.debug('ComposedReader read: "%s"', record)
-        if record:
-          self.writer.write(record)
+        if self.batch_size:
+          record = self.reader.read_batch(self.batch_size, self.batch_timeout)
+          self.last_read = time.time()
+          logging.debug('ComposedReader read batch of %d records',
+                        len(record or []))
+          if record:
+            self.writer.write_batch(record)
+        else:
+          record = self.reader.read()
+          self.last_read = time.time()
+          logging.debug('ComposedReader read: "%s"', record)
+          if record:
+            self.writer.write(record)
 
         if self.interval:
           time_to_sleep = self.interval - (time.time() - self.last_read)
           time.sleep(max(time_to_sleep, 0))
 
+      # Make sure anything still queued for our writers gets written
+      self.writer.flush()
+
     # Exit in an orderly fashion if someone hits Ctl-C
     except KeyboardInterrupt:
       logging.info('Listener %s received KeyboardInterrupt - exiting.',
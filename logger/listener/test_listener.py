@@ -124,6 +124,23 @@ class TestListener(unittest.TestCase):
           self.assertEqual(SAMPLE_DATA['f1'][line_num], line.rstrip())
           line_num += 1
 
+  ############################
+  def test_batch(self):
+    readers = [TextFileReader(tmpfilename)
+               for tmpfilename in self.tmpfilenames]
+    outfilename = self.tmpdirname + '/f_out'
+    listener = Listener(readers, [PrefixTransform('prefix')],
+                        [TextFileWriter(outfilename)],
+                        continuous_readers=True, batch_size=2,
+                        batch_timeout=0.1)
+    listener.run()
+
+    with open(outfilename, 'r') as f:
+      out_lines = sorted([line.rstrip() for line in f.readlines()])
+    source_lines = sorted(['prefix ' + line for f in SAMPLE_DATA
+                           for line in SAMPLE_DATA[f]])
+    self.assertEqual(out_lines, source_lines)
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
@@ -17,6 +17,7 @@ except ModuleNotFoundError:
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.readers.reader import Reader
+from logger.utils import wire_encoding
 
 DEFAULT_SERVER_WEBSOCKET = 'localhost:8766'
 
@@ -25,7 +26,8 @@ class CachedDataReader(Reader):
   """Subscribe to and read field values from a CachedDataServer via
   websocket connection.
   """
-  def __init__(self, subscription, data_server=DEFAULT_SERVER_WEBSOCKET):
+  def __init__(self, subscription, data_server=DEFAULT_SERVER_WEBSOCKET,
+               encoding='json'):
     """
     ```
     subscription - a dictionary corresponding to the full
@@ -38,6 +40,13 @@ class CachedDataReader(Reader):
 
     data_server - the host and port at which to try to connect to a
         CachedDataServer
+
+    encoding - how the server should encode the data it sends:
+        'json' (the default), 'columnar' (delta-encoded timestamps
+        and value columns) or 'msgpack' (the columnar layout as binary
+        MessagePack, if the msgpack module is installed). See
+        logger/utils/wire_encoding.py. An 'encoding' key in the
+        subscription takes precedence.
     ```
     When invoked in a config file, this would be:
     ```
@@ -60,6 +69,9 @@ class CachedDataReader(Reader):
                                 'websockets" prior to use.')
     self.subscription = subscription
     subscription['type'] = 'subscribe'
+    subscription.setdefault('encoding', encoding)
+    wire_encoding.check_encoding(subscription['encoding'])
+    self.data_format = subscription.get('format', 'field_dict')
     self.data_server = data_server
 
     # We won't initialize our websocket until the first read()
@@ -86,6 +98,10 @@ class CachedDataReader(Reader):
       logging.debug('No data found in data server response?: %s', response)
       return
 
+    # If data are in a compact encoding, unpack them.
+    if response.get('encoding', 'json') != 'json':
+      data = wire_encoding.decode_data(data, self.data_format)
+
     # If we've gotten a list, assume/hope it's a list of
     # DASRecord-like dicts; that means it's already collated for us by
     # timestamp.
@@ -132,12 +148,15 @@ class CachedDataReader(Reader):
             # Send our subscription request
             await ws.send(json.dumps(self.subscription))
             result = await ws.recv()
-            response = json.loads(result)
+            response = wire_encoding.decode_message(result)
+            if not response.get('status', None) == 200:
+              logging.error('Data server rejected subscription: %s',
+                            response)
 
             while not self.quit_flag:
               await ws.send(json.dumps({'type':'ready'}))
               result = await ws.recv()
-              response = json.loads(result)
+              response = wire_encoding.decode_message(result)
               logging.debug('Got CachedDataServer response: %s', response)
               self._parse_response(response)
 
@@ -5,6 +5,8 @@ import sys
 import threading
 import time
 
+from collections import deque
+
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.readers.reader import Reader
@@ -16,6 +18,15 @@ from logger.utils import formats
 # so that our readers eventually terminate.
 READER_TIMEOUT_WAIT = 0.25
 
+# Default maximum number of records that may be waiting from each
+# reader when running readers continuously.
+DEFAULT_READER_QUEUE_SIZE = 1000
+
+# What to do when a continuously-running reader's queue is full:
+# discard the oldest queued record, discard the new record, or wait
+# until there is room.
+OVERFLOW_POLICIES = ['drop_oldest', 'drop_newest', 'block']
+
 ################################################################################
 class ComposedReader(Reader):
   """
@@ -48,9 +59,17 @@ class ComposedReader(Reader):
 
   It's important to have the run_reader threads time out, or any process
   using a ComposedReader will never naturally terminate.
+
+  If continuous=True, none of the above applies. Instead, each reader
+  gets a daemon thread that reads as fast as its reader will let it,
+  appending records to that reader's own bounded queue. A single
+  condition variable wakes read() when a record arrives; there is no
+  timed polling, and no thread is ever restarted.
   """
   ############################
-  def __init__(self, readers, transforms=[], check_format=False):
+  def __init__(self, readers, transforms=[], check_format=False,
+               continuous=False, queue_size=DEFAULT_READER_QUEUE_SIZE,
+               overflow='block'):
     """
     Instantiation:
     ```
@@ -64,6 +83,18 @@ class ComposedReader(Reader):
                    are compatible, and throw a ValueError if they are not.
                    If check_format is False (the default) the output_format()
                    of the whole reader will be formats.Unknown.
+
+    continuous     If True, run each reader continuously in its own thread,
+                   queueing its records until read() asks for them.
+
+    queue_size     Only meaningful if continuous is True. Maximum number
+                   of records that may be queued for each reader.
+
+    overflow       Only meaningful if continuous is True. What to do when
+                   a reader's queue is full: 'drop_oldest' discards the
+                   oldest queued record, 'drop_newest' discards the new
+                   record, and 'block' (the default) stops reading from
+                   that reader until there is room.
     ```
     Use:
     ```
@@ -126,11 +157,39 @@ class ComposedReader(Reader):
     # Set when a reader adds something to the queue
     self.queue_has_record = threading.Event()
 
+    # If we're running readers continuously, each reader gets its own
+    # queue of (sequence number, record) pairs. The sequence number lets
+    # us hand back records in the order in which they arrived. The two
+    # conditions share a single lock.
+    if overflow not in OVERFLOW_POLICIES:
+      raise ValueError('ComposedReader: overflow must be one of %s; got "%s"'
+                       % (OVERFLOW_POLICIES, overflow))
+    self.continuous = continuous
+    self.queue_size = queue_size
+    self.overflow = overflow
+    self.reader_queues = [deque() for i in range(self.num_readers)]
+    self.records_dropped = [0] * self.num_readers
+    self.next_sequence = 0
+    self.continuous_lock = threading.Lock()
+    self.queue_not_empty = threading.Condition(self.continuous_lock)
+    self.queue_not_full = threading.Condition(self.continuous_lock)
+
+  ############################
+  def queue_depth(self):
+    """
+    Return a list of the number of records currently queued for each
+    reader. Only meaningful if running readers continuously.
+    """
+    return [len(q) for q in self.reader_queues]
+
   ############################
   def read(self):
     """
     Get the next record from queue or readers.
     """
+    if self.continuous:
+      return self._read_continuous()
+
     # If we only have one reader, there's no point making things
     # complicated. Just read, transform, return.
     if len(self.readers) == 1:
@@ -246,6 +305,157 @@ class ComposedReader(Reader):
       # Now clear of queue_lock
       logging.debug('    Reader #%d released queue_lock - looping', index)
 
+  ############################
+  def read_batch(self, max_records, timeout=None):
+    """
+    Return a list of up to max_records records, or None if all readers
+    have returned EOF. If timeout is not None, wait no more than timeout
+    seconds after the first record for the batch to fill.
+    """
+    if self.continuous:
+      records = self._read_batch_continuous(max_records, timeout)
+    elif len(self.readers) == 1:
+      records = self.readers[0].read_batch(max_records, timeout)
+    else:
+      # Default implementation calls our read(), which applies transforms
+      return super().read_batch(max_records, timeout)
+
+    if records is None:
+      return None
+    return self._apply_transforms_batch(records)
+
+  ############################
+  def _start_continuous_readers(self):
+    """
+    Start reader threads if they haven't been started yet.
+    """
+    if not self.reader_threads[0]:
+      for i in range(self.num_readers):
+        thread = threading.Thread(target=self._run_continuous_reader,
+                                  args=(i,), daemon=True)
+        self.reader_threads[i] = thread
+        thread.start()
+
+  ############################
+  def _pop_oldest(self):
+    """
+    Pop and return the oldest queued record from any reader, or None if
+    all the queues are empty. Must be called with continuous_lock held.
+    """
+    oldest = None
+    for reader_queue in self.reader_queues:
+      if reader_queue and (oldest is None or
+                           reader_queue[0][0] < oldest[0][0]):
+        oldest = reader_queue
+    if oldest is None:
+      return None
+    sequence, record = oldest.popleft()
+    self.queue_not_full.notify_all()
+    return record
+
+  ############################
+  def _read_continuous(self):
+    """
+    Return the oldest queued record from any reader, waiting until one
+    arrives if necessary. Return None when all readers have returned EOF
+    and nothing is left in the queues.
+    """
+    self._start_continuous_readers()
+    with self.queue_not_empty:
+      while True:
+        record = self._pop_oldest()
+        if record is not None:
+          break
+
+        # Nothing queued. If all readers are done, so are we.
+        if False not in self.reader_returned_eof:
+          logging.debug('read() - all threads returned None; returning None')
+          return None
+        self.queue_not_empty.wait()
+
+    return self._apply_transforms(record)
+
+  ############################
+  def _read_batch_continuous(self, max_records, timeout):
+    """
+    Wait for at least one queued record, then gather up to max_records of
+    them, waiting up to timeout seconds for more to arrive. Return None
+    when all readers have returned EOF and nothing is left in the queues.
+    Transforms are *not* applied.
+    """
+    self._start_continuous_readers()
+    records = []
+    deadline = None
+    with self.queue_not_empty:
+      while len(records) < max_records:
+        record = self._pop_oldest()
+        if record is not None:
+          records.append(record)
+          if deadline is None and timeout is not None:
+            deadline = time.time() + timeout
+          continue
+
+        # Nothing queued. If all readers are done, so are we.
+        if False not in self.reader_returned_eof:
+          break
+
+        # Wait indefinitely for our first record, and until our deadline
+        # for subsequent ones.
+        if not records:
+          self.queue_not_empty.wait()
+        elif deadline is None:
+          break
+        else:
+          remaining = deadline - time.time()
+          if remaining <= 0:
+            break
+          self.queue_not_empty.wait(remaining)
+
+    if not records:
+      logging.debug('read_batch() - all threads returned None; returning None')
+      return None
+    return records
+
+  ############################
+  def _run_continuous_reader(self, index):
+    """
+    Read records from readers[index] and queue them, until it returns None
+    or raises an exception, after which we treat it as done.
+    """
+    reader = self.readers[index]
+    reader_queue = self.reader_queues[index]
+    while True:
+      try:
+        record = reader.read()
+      except Exception as e:
+        logging.error('    Reader #%d raised exception: %s', index, e)
+        record = None
+      with self.queue_not_empty:
+        if record is None:
+          logging.info('    Reader #%d returned None, is done', index)
+          self.reader_returned_eof[index] = True
+          self.queue_not_empty.notify_all()
+          return
+
+        if len(reader_queue) >= self.queue_size:
+          if self.overflow == 'drop_newest':
+            self.records_dropped[index] += 1
+            logging.debug('    Reader #%d queue full - dropping new record',
+                          index)
+            continue
+          elif self.overflow == 'drop_oldest':
+            self.records_dropped[index] += 1
+            logging.debug('    Reader #%d queue full - dropping old record',
+                          index)
+            reader_queue.popleft()
+          else:
+            while len(reader_queue) >= self.queue_size:
+              self.queue_not_full.wait()
+
+        reader_queue.append((self.next_sequence, record))
+        self.next_sequence += 1
+        self.queue_not_empty.notify()
+
   ############################
   def _apply_transforms(self, record):
     """
@@ -258,6 +468,17 @@ class ComposedReader(Reader):
           break
     return record
 
+  ############################
+  def _apply_transforms_batch(self, records):
+    """
+    Apply the transforms in series to a list of records.
+    """
+    for t in self.transforms:
+      if not records:
+        break
+      records = t.transform_batch(records)
+    return records
+
   ############################
   def _check_reader_formats(self):
     """
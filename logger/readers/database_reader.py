@@ -56,7 +56,15 @@ class DatabaseReader(TimestampedReader):
     record to read, unless no_block is specified, in which case, return
     whatever we found."""
     while True:
-      record = self.db.read(self.fields)
+      try:
+        record = self.db.read(self.fields)
+      except ConnectionError as e:
+        # Connector will try to reconnect on our next read
+        logging.warning('DatabaseReader: %s', e)
+        if no_block:
+          return None
+        time.sleep(self.sleep_interval)
+        continue
       if record or no_block:
         return record
       logging.debug('No new record returned by database read. Sleeping')
@@ -2,6 +2,7 @@
 
 import glob
 import logging
+import os.path
 import sys
 import time
 
@@ -11,6 +12,7 @@ from logger.readers.reader import TimestampedReader
 from logger.readers.text_file_reader import TextFileReader
 from logger.utils.formats import Text
 from logger.utils import timestamp
+from logger.utils.logfile_index import LogfileIndex
 
 ################################################################################
 # Open and read single-line records from one or more text files.
@@ -23,7 +25,8 @@ class LogfileReader(TimestampedReader):
   def __init__(self, filebase=None, tail=False, refresh_file_spec=False,
                retry_interval=0.1, interval=0, use_timestamps=False,
                time_format=timestamp.TIME_FORMAT,
-               date_format=timestamp.DATE_FORMAT):
+               date_format=timestamp.DATE_FORMAT,
+               use_index=True, build_index=False):
     """
     ```
     filebase     Possibly wildcarded string specifying files to be opened.
@@ -46,6 +49,15 @@ class LogfileReader(TimestampedReader):
     interval
                  How long to sleep between returning records. In general
                  this should be zero except for debugging purposes.
+
+    use_index    If True (default) and every matching file has a time
+                 index sidecar (as written by LogfileWriter with
+                 index_interval set, or by logger/utils/logfile_index.py),
+                 seek_time() and read_time_range() use the indexes to jump
+                 to the requested time rather than reading from the start.
+
+    build_index  If True, build index sidecars for any matching files
+                 that lack them the first time they're needed.
     ```
     Note that the order in which files are opened will probably be in
     alphanumeric by filename, but this is not strictly enforced and
@@ -62,8 +74,11 @@ class LogfileReader(TimestampedReader):
     self.time_format = time_format
     self.tail = tail
     self.refresh_file_spec = refresh_file_spec
+    self.use_index = use_index
+    self.build_index = build_index
 
-
+    # Map from filename to the (size, LogfileIndex) we've loaded for it
+    self.indexes = {}
     # If use_timestamps, we need to keep track of our last_read to
     # know how long to sleep
     self.last_timestamp = 0
@@ -169,12 +184,95 @@ class LogfileReader(TimestampedReader):
 
   ############################
   def _peek_msec(self):
+    # If the next record is in the current file, just peek at it,
+    # rather than reading it and having the reader seek back a record.
+    if self.reader.current_file and self.filebase is not None:
+      line = self.reader._peek_line()
+      if line:
+        return self._get_msec_timestamp(self.reader._decode(line))
+
     record = self.reader.read()
     if record is None:
       return None
     self.reader.seek(-1, 'current')
     return self._get_msec_timestamp(record)
 
+  ############################
+  def _get_indexes(self):
+    """Return a list of (filename, LogfileIndex) pairs for the files
+    matching our file_spec, or None if we're not using indexes or any
+    of the files lacks a usable one."""
+    if not self.use_index or self.filebase is None:
+      return None
+    indexes = []
+    for filename in sorted(glob.glob(self.file_spec)):
+      try:
+        size = os.path.getsize(filename)
+      except OSError:
+        return None
+      # Reload the index if the file has grown since we last loaded it
+      size_and_index = self.indexes.get(filename, None)
+      if size_and_index is None or size_and_index[0] != size:
+        index = LogfileIndex(filename, time_format=self.time_format)
+        if not index.load():
+          if not self.build_index:
+            return None
+          index.build()
+          index.close()
+        self.indexes[filename] = (size, index)
+      indexes.append((filename, self.indexes[filename][1]))
+    return indexes or None
+
+  ############################
+  def _index_seek(self, desired_time_msec):
+    """If every file has a time index, use them to position the reader
+    at the first record whose timestamp is the same as or later than
+    desired_time_msec, and return True. Otherwise return False."""
+    indexes = self._get_indexes()
+    if indexes is None:
+      return False
+
+    # Find the last file that has records before the desired time, and
+    # the last indexed record in it that is before the desired time.
+    file_num = 0
+    for i, (filename, index) in enumerate(indexes):
+      first = index.first_timestamp()
+      if first is not None and first * 1000 < desired_time_msec:
+        file_num = i
+    filename, index = indexes[file_num]
+    offset, line_num = index.find(desired_time_msec / 1000)
+
+    # Read forward from there to the first record at or after the
+    # desired time (or end of file), keeping track of its byte offset.
+    with open(filename, 'rb') as logfile:
+      logfile.seek(offset)
+      for line in logfile:
+        record = line.decode('utf-8', errors='replace').rstrip('\n')
+        self.prev_record = record
+        try:
+          if self._get_msec_timestamp(record) >= desired_time_msec:
+            break
+        except ValueError:
+          logging.warning('Unable to parse time string from record: %s', record)
+        offset += len(line)
+        line_num += 1
+
+    # Set the reader up as if it had read its way to this point.
+    reader = self.reader
+    pos = 0
+    for prev_filename, prev_index in indexes[:file_num]:
+      reader.start_pos[prev_filename] = pos
+      pos += prev_index.num_lines
+      reader.end_pos[prev_filename] = pos
+    reader.start_pos[filename] = pos
+    reader.used_file_list = [f for f, _ in indexes[:file_num + 1]]
+    reader.unused_file_list = [f for f, _ in indexes[file_num + 1:]]
+    if reader.current_file:
+      reader.current_file.close()
+    reader.current_file = reader._open(filename, offset)
+    reader.pos = pos + line_num
+    return True
+
   ############################
   # Note: this will change the file position if necessary, and should not be used
   # except where that behavior is appropriate.
@@ -228,6 +326,8 @@ class LogfileReader(TimestampedReader):
       if first_timestamp is None:
         return None
       desired_time = first_timestamp + offset
+      if self._index_seek(desired_time):
+        return desired_time
       if self.prev_record is None:
         self._reset()
       else:
@@ -245,19 +345,24 @@ class LogfileReader(TimestampedReader):
       desired_time = curr_timestamp + offset
       if offset == 0:
         return desired_time
+      if self._index_seek(desired_time):
+        return desired_time
       if offset < 0:
         self._reset()
       self._read_until(desired_time)
       return desired_time
 
     elif origin == 'end':
-      while self.read() is not None:
-        pass
+      # An indexed seek to the end of time leaves us after (and with
+      # prev_record set to) the last record.
+      if not self._index_seek(float('inf')):
+        while self.read() is not None:
+          pass
       if self.prev_record is None:
         return None
       end_timestamp = self._get_msec_timestamp(self.prev_record)
       desired_time = end_timestamp + offset
-      if offset < 0:
+      if offset < 0 and not self._index_seek(desired_time):
         self._reset()
         self._read_until(desired_time)
       return desired_time
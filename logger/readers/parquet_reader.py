@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+import bisect
+import glob
+import sys
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.readers.reader import TimestampedReader
+from logger.utils.das_record import DASRecord
+from logger.utils.formats import Python_Record
+
+try:
+  import pyarrow.parquet
+  PYARROW_FOUND = True
+except (ModuleNotFoundError, ImportError):
+  PYARROW_FOUND = False
+
+# Should match logger.writers.parquet_writer.DATA_ID_METADATA_KEY
+DATA_ID_METADATA_KEY = b'data_id'
+
+################################################################################
+# Read DASRecords from Parquet files written by ParquetWriter.
+class ParquetReader(TimestampedReader):
+  """
+  Read DASRecords from the Parquet files matching a (possibly
+  wildcarded) file_spec, in timestamp order. Files whose time ranges
+  overlap, such as those of different data_ids covering the same day,
+  are read together and their records merged.
+  """
+  ############################
+  def __init__(self, file_spec, fields=None):
+    """
+    ```
+    file_spec    Possibly wildcarded string specifying files to be read,
+                 e.g. '/data/archive/NBP1406-gyr1-*.parquet'
+
+    fields       Optional list (or comma-separated string) of the fields
+                 to read. If omitted, read all fields. Only the columns
+                 for the requested fields are read from disk.
+    ```
+    Like those of LogfileReader, seek_time() and read_time_range() take
+    times in milliseconds. read_time_range() reads only the parts of the
+    files whose timestamps fall within the requested range.
+    """
+    super().__init__(output_format=Python_Record)
+
+    if not PYARROW_FOUND:
+      raise RuntimeError('Python module pyarrow not found. Please install '
+                         'using "pip install pyarrow" prior to using '
+                         'ParquetReader.')
+
+    if type(fields) is str:
+      fields = fields.split(',')
+    self.fields = fields
+
+    # Get what we need to know about each file from its footer: its
+    # data_id, number of records, and range of timestamps.
+    self.files = []
+    for filename in glob.glob(file_spec):
+      parquet_file = pyarrow.parquet.ParquetFile(filename)
+      metadata = parquet_file.schema_arrow.metadata or {}
+      data_id = metadata.get(DATA_ID_METADATA_KEY, b'').decode('utf-8') or None
+      first, last = self._timestamp_range(parquet_file)
+      self.files.append({'filename': filename, 'data_id': data_id,
+                         'num_records': parquet_file.metadata.num_rows,
+                         'columns': parquet_file.schema_arrow.names,
+                         'first': first, 'last': last})
+    self.files.sort(key=lambda f: (f['first'] is None, f['first'] or 0,
+                                   f['filename']))
+
+    # Group files whose time ranges overlap into segments. Segments
+    # don't overlap, so reading each segment's records, merged by
+    # timestamp, in turn gives all the records in timestamp order.
+    self.segments = []
+    for file_info in self.files:
+      segment = self.segments[-1] if self.segments else None
+      if segment and segment['last'] is not None and \
+         file_info['first'] is not None and \
+         file_info['first'] <= segment['last']:
+        segment['files'].append(file_info)
+        segment['last'] = max(segment['last'], file_info['last'])
+        segment['num_records'] += file_info['num_records']
+      else:
+        self.segments.append({'files': [file_info],
+                              'first': file_info['first'],
+                              'last': file_info['last'],
+                              'num_records': file_info['num_records']})
+
+    # Index of each segment's first record among all the records
+    self.segment_starts = []
+    self.num_records = 0
+    for segment in self.segments:
+      self.segment_starts.append(self.num_records)
+      self.num_records += segment['num_records']
+
+    self.next_record = 0      # index of next record read() will return
+    self.last_timestamp = None
+
+    # Records of the segment read() is working through
+    self.current_segment = None
+    self.current_records = []
+
+  ############################
+  def _timestamp_range(self, parquet_file):
+    """Return the earliest and latest timestamps in the file, from its
+    row group statistics if possible."""
+    metadata = parquet_file.metadata
+    try:
+      column = parquet_file.schema_arrow.get_field_index('timestamp')
+      stats = [metadata.row_group(i).column(column).statistics
+               for i in range(metadata.num_row_groups)]
+      if stats and all(s is not None and s.has_min_max for s in stats):
+        return min(s.min for s in stats), max(s.max for s in stats)
+    except (ValueError, IndexError):
+      pass
+    timestamps = parquet_file.read(columns=['timestamp']).column(0).to_pylist()
+    if not timestamps:
+      return None, None
+    return min(timestamps), max(timestamps)
+
+  ############################
+  def _read_records(self, file_info, filters=None):
+    """Read the file's records, only the requested columns, and only
+    rows that match the filters (if any)."""
+    columns = ['timestamp']
+    if self.fields:
+      columns += [f for f in self.fields if f in file_info['columns']]
+    else:
+      columns += [c for c in file_info['columns'] if c != 'timestamp']
+    table = pyarrow.parquet.read_table(file_info['filename'], columns=columns,
+                                       filters=filters)
+    values = table.to_pydict()
+    timestamps = values.pop('timestamp')
+    records = []
+    for i, ts in enumerate(timestamps):
+      fields = {field: field_values[i]
+                for field, field_values in values.items()
+                if field_values[i] is not None}
+      records.append(DASRecord(data_id=file_info['data_id'], timestamp=ts,
+                               fields=fields))
+    return records
+
+  ############################
+  def _read_segment(self, segment, filters=None):
+    """Read the records of a segment's files, merged in timestamp order
+    (records with the same timestamp stay in file order)."""
+    if len(segment['files']) == 1:
+      return self._read_records(segment['files'][0], filters=filters)
+    records = []
+    for file_info in segment['files']:
+      records.extend(self._read_records(file_info, filters=filters))
+    records.sort(key=lambda record: record.timestamp)
+    return records
+
+  ############################
+  def _segment_timestamps(self, segment):
+    """Return the sorted timestamps of a segment's records."""
+    timestamps = []
+    for file_info in segment['files']:
+      timestamps.extend(pyarrow.parquet.read_table(
+        file_info['filename'], columns=['timestamp']).column(0).to_pylist())
+    timestamps.sort()
+    return timestamps
+
+  ############################
+  def read(self):
+    """Return the next record, or None if there are no more."""
+    if self.next_record >= self.num_records:
+      return None
+    index = bisect.bisect_right(self.segment_starts, self.next_record) - 1
+    if self.current_segment != index:
+      self.current_records = self._read_segment(self.segments[index])
+      self.current_segment = index
+    record = self.current_records[self.next_record -
+                                  self.segment_starts[index]]
+    self.next_record += 1
+    self.last_timestamp = record.timestamp
+    return record
+
+  ############################
+  def seek(self, offset=0, origin='current'):
+    """Behavior is intended to mimic file seek() behavior but with
+    respect to records: 'offset' means number of records, and origin
+    is either 'start', 'current' or 'end'."""
+    if origin == 'start':
+      position = offset
+    elif origin == 'current':
+      position = self.next_record + offset
+    elif origin == 'end':
+      position = self.num_records + offset
+    else:
+      raise ValueError('Unknown seek origin: "%s"' % origin)
+    self.next_record = min(max(position, 0), self.num_records)
+
+  ############################
+  def read_range(self, start=None, stop=None):
+    """Read a range of records beginning with record number start, and
+    ending *before* record number stop."""
+    start = 0 if start is None else start
+    stop = self.num_records if stop is None else min(stop, self.num_records)
+    records = []
+    for segment_start, segment in zip(self.segment_starts, self.segments):
+      segment_stop = segment_start + segment['num_records']
+      if segment_stop <= start or segment_start >= stop:
+        continue
+      segment_records = self._read_segment(segment)
+      records.extend(segment_records[max(start - segment_start, 0):
+                                     stop - segment_start])
+    return records
+
+  ############################
+  def seek_time(self, offset=0, origin='current'):
+    """Behavior is intended to mimic file seek() behavior but with
+    respect to timestamps: 'offset' is in milliseconds and origin is
+    either 'start', 'current' or 'end'. The next record read will be
+    the first one with a timestamp at or after the requested time."""
+    if origin == 'start':
+      base = min((f['first'] for f in self.files if f['first'] is not None),
+                 default=0)
+    elif origin == 'current':
+      base = self.last_timestamp
+      if base is None:
+        base = min((f['first'] for f in self.files
+                    if f['first'] is not None), default=0)
+    elif origin == 'end':
+      base = max((f['last'] for f in self.files if f['last'] is not None),
+                 default=0)
+    else:
+      raise ValueError('Unknown seek origin: "%s"' % origin)
+    target = base + offset / 1000
+
+    # Count the records before the target time: all of those in
+    # segments that end before it, and, in the segment that spans it,
+    # those that precede it.
+    position = 0
+    for segment_start, segment in zip(self.segment_starts, self.segments):
+      if segment['first'] is None or segment['first'] >= target:
+        continue
+      if segment['last'] < target:
+        position = segment_start + segment['num_records']
+        continue
+      timestamps = self._segment_timestamps(segment)
+      position = segment_start + bisect.bisect_left(timestamps, target)
+      break
+    self.next_record = position
+
+  ############################
+  def read_time_range(self, start=None, stop=None):
+    """Read all records with timestamps at or after start and before
+    stop milliseconds (either of which may be None, meaning no limit),
+    in timestamp order."""
+    start_time = None if start is None else start / 1000
+    stop_time = None if stop is None else stop / 1000
+
+    filters = []
+    if start_time is not None:
+      filters.append(('timestamp', '>=', start_time))
+    if stop_time is not None:
+      filters.append(('timestamp', '<', stop_time))
+
+    records = []
+    for file_info in self.files:
+      # Skip files we know have nothing in the range
+      if file_info['first'] is None:
+        continue
+      if start_time is not None and file_info['last'] < start_time:
+        continue
+      if stop_time is not None and file_info['first'] >= stop_time:
+        continue
+      records.extend(self._read_records(file_info, filters=filters or None))
+    records.sort(key=lambda record: record.timestamp)
+    return records
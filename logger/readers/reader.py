@@ -4,6 +4,7 @@ Abstract base class for data Readers.
 """
 
 import sys
+import time
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.utils import formats
@@ -37,6 +38,30 @@ class Reader:
                               'implementation of read() method.'
                               % self.__class__.__name__)
 
+  ############################
+  def read_batch(self, max_records, timeout=None):
+    """
+    Return a list of up to max_records records, or None if there are no
+    more records. If timeout is not None, stop calling read() once
+    timeout seconds have elapsed, even if we have fewer than max_records.
+
+    This default implementation simply calls read() repeatedly; readers
+    that can do better should override it.
+    """
+    start = time.time()
+    records = []
+    record = ''
+    while len(records) < max_records:
+      record = self.read()
+      if record is None:
+        break
+      records.append(record)
+      if timeout is not None and time.time() - start >= timeout:
+        break
+    if record is None and not records:
+      return None
+    return records
+
 ################################################################################
 class StorageReader(Reader):
   """
@@ -14,6 +14,7 @@ from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(r
 
 from logger.readers.text_file_reader import TextFileReader
 from logger.readers.cached_data_reader import CachedDataReader
+from logger.writers.cached_data_writer import CachedDataWriter
 from server.cached_data_server import CachedDataServer
 from logger.listener.listen import ListenerFromLoggerConfigFile
 
@@ -76,6 +77,42 @@ class TestCachedDataReader(unittest.TestCase):
     # we get 'quit'
     response = cdr.read()
 
+  ############################
+  def test_columnar_encoding(self):
+    """Feed a server via a CachedDataWriter and read from it, both
+    using the compact columnar encoding."""
+    port = WEBSOCKET_PORT + 1
+    cds = CachedDataServer(port=port)
+    cdw = CachedDataWriter(data_server='localhost:%d' % port,
+                           encoding='columnar')
+    cdw.write({'timestamp': 1000.5, 'fields':{'field_1':1.5, 'field_2':'a'}})
+    cdw.write({'timestamp': 1001.5, 'fields':{'field_1':2.5}})
+
+    subscription = {'fields':{'field_1':{'seconds':-1},
+                              'field_2':{'seconds':-1}}}
+    cdr = CachedDataReader(subscription=subscription,
+                           data_server='localhost:%d' % port,
+                           encoding='columnar')
+
+    # Wait for the writer to have delivered its records
+    for i in range(50):
+      if len(cds.cache.data.get('field_1', [])) == 2:
+        break
+      time.sleep(0.1)
+    self.assertEqual(cds.cache.data['field_1'].to_list(),
+                     [(1000.5, 1.5), (1001.5, 2.5)])
+
+    # Most recent values of the two fields have different timestamps
+    self.assertEqual(cdr.read(), {'timestamp': 1000.5,
+                                  'fields':{'field_2': 'a'}})
+    self.assertEqual(cdr.read(), {'timestamp': 1001.5,
+                                  'fields':{'field_1': 2.5}})
+
+    cdw.write({'timestamp': 1002.25, 'fields':{'field_1':3.5}})
+    self.assertEqual(cdr.read(), {'timestamp': 1002.25,
+                                  'fields':{'field_1': 3.5}})
+    cdr.quit()
+
 ############################
 if __name__ == '__main__':
   import argparse
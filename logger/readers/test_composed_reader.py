@@ -116,6 +116,104 @@ class TestComposedReader(unittest.TestCase):
           next_lines.remove(record)
     self.assertEqual(None, reader.read())
 
+  ############################
+  def test_continuous(self):
+    readers = [TextFileReader(tmpfilename)
+               for tmpfilename in self.tmpfilenames]
+    reader = ComposedReader(readers, [PrefixTransform('prefix')],
+                            continuous=True)
+    records = []
+    record = reader.read()
+    while record is not None:
+      records.append(record)
+      record = reader.read()
+
+    # Lines may be interleaved between files, but should be in order
+    # within each file.
+    for f in sorted(SAMPLE_DATA):
+      self.assertEqual([r for r in records if r.startswith('prefix ' + f)],
+                       ['prefix ' + line for line in SAMPLE_DATA[f]])
+    self.assertEqual(reader.queue_depth(), [0, 0, 0])
+
+  ############################
+  def test_read_batch(self):
+    expected = ['prefix ' + line
+                for f in sorted(SAMPLE_DATA) for line in SAMPLE_DATA[f]]
+
+    # A single reader should use its own read_batch()
+    reader = ComposedReader(TextFileReader(self.tmpdirname + '/f*'),
+                            [PrefixTransform('prefix')])
+    self.assertEqual(reader.read_batch(5), expected[0:5])
+    self.assertEqual(reader.read_batch(100), expected[5:])
+    self.assertEqual(reader.read_batch(100), None)
+
+    # Multiple readers, continuous and not
+    for continuous in [False, True]:
+      readers = [TextFileReader(tmpfilename)
+                 for tmpfilename in self.tmpfilenames]
+      reader = ComposedReader(readers, [PrefixTransform('prefix')],
+                              continuous=continuous)
+      records = []
+      batch = reader.read_batch(4, timeout=0.1)
+      while batch is not None:
+        self.assertLessEqual(len(batch), 4)
+        records.extend(batch)
+        batch = reader.read_batch(4, timeout=0.1)
+      self.assertEqual(sorted(records), sorted(expected))
+
+  ############################
+  def test_continuous_reader_exception(self):
+    class BrokenReader(Reader):
+      def read(self):
+        raise OSError('device unplugged')
+
+    # A reader that raises should count as done rather than leaving
+    # read() waiting for it forever.
+    readers = [BrokenReader(), TextFileReader(self.tmpfilenames[0])]
+    reader = ComposedReader(readers, continuous=True)
+    records = []
+    with self.assertLogs(level='ERROR'):
+      record = reader.read()
+      while record is not None:
+        records.append(record)
+        record = reader.read()
+    self.assertEqual(records, SAMPLE_DATA['f1'])
+    self.assertEqual(reader.reader_returned_eof, [True, True])
+
+  ############################
+  def test_continuous_overflow(self):
+    lines = ['line %d' % i for i in range(10)]
+    filename = self.tmpdirname + '/overflow'
+    create_file(filename, lines)
+
+    for overflow in ['drop_oldest', 'drop_newest', 'block']:
+      reader = ComposedReader([TextFileReader(filename)],
+                              continuous=True, queue_size=2,
+                              overflow=overflow)
+      # Give the reader time to overfill its queue before reading more
+      records = [reader.read()]
+      time.sleep(0.2)
+      self.assertLessEqual(reader.queue_depth()[0], 2)
+      record = reader.read()
+      while record is not None:
+        records.append(record)
+        record = reader.read()
+
+      # Whatever we got should be in order, and account for all lines
+      self.assertEqual(records, [l for l in lines if l in records])
+      self.assertEqual(len(records) + reader.records_dropped[0], len(lines))
+      if overflow == 'drop_oldest':
+        self.assertEqual(records[-2:], lines[-2:])
+      elif overflow == 'drop_newest':
+        self.assertEqual(records[0], lines[0])
+        self.assertGreater(reader.records_dropped[0], 0)
+      else:
+        self.assertEqual(records, lines)
+
+    with self.assertRaises(ValueError):
+      ComposedReader([TextFileReader(filename)],
+                     continuous=True, overflow='drop_everything')
+
 if __name__ == '__main__':
   import argparse
   parser = argparse.ArgumentParser()
@@ -12,6 +12,7 @@ from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(r
 
 from logger.readers.logfile_reader import LogfileReader
 from logger.utils import formats, timestamp
+from logger.utils.logfile_index import LogfileIndex, index_filename
 
 SAMPLE_DATA = """\
 2017-11-04T05:12:19.441672Z 3.5kHz,5360.54,1,,,,1500,-39.580717,-37.461886
@@ -53,6 +54,11 @@ def get_msec_timestamp(record):
   time_str = record.split(' ', 1)[0]
   return timestamp.timestamp(time_str, time_format=timestamp.TIME_FORMAT) * 1000
 
+def create_index(filename, interval=2):
+  index = LogfileIndex(filename, interval=interval)
+  index.build()
+  index.close()
+
 def create_file(filename, lines, interval=0, pre_sleep_interval=0):
   time.sleep(pre_sleep_interval)
   logging.info('creating file "%s"', filename)
@@ -304,6 +310,75 @@ class TestLogfileReader(unittest.TestCase):
       with self.assertRaises(ValueError):
         records = reader.read_time_range(START_TIMESTAMP - 1, END_TIMESTAMP)
 
+  ############################
+  def test_indexed_seek(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      logging.info('created temporary directory "%s"', tmpdirname)
+      filebase = tmpdirname + '/mylog-'
+      sample_lines = []
+      for f in sorted(SAMPLE_DATA_2):
+        create_file(filebase + f, SAMPLE_DATA_2[f])
+        create_index(filebase + f)
+        sample_lines.extend(SAMPLE_DATA_2[f])
+      START_TIMESTAMP = get_msec_timestamp(sample_lines[0])
+      END_TIMESTAMP   = get_msec_timestamp(sample_lines[-1])
+
+      reader = LogfileReader(filebase)
+      self.assertIsNotNone(reader._get_indexes())
+      self.assertEqual(START_TIMESTAMP + 1000, reader.seek_time(1000, 'start'))
+      self.assertEqual(sample_lines[4], reader.read())
+      self.assertEqual(get_msec_timestamp(sample_lines[5]) - 600,
+                       reader.seek_time(-600, 'current'))
+      self.assertEqual(sample_lines[3], reader.read())
+      self.assertEqual(END_TIMESTAMP, reader.seek_time(0, 'end'))
+      self.assertEqual(None, reader.read())
+      self.assertEqual(END_TIMESTAMP - 1000, reader.seek_time(-1000, 'end'))
+      self.assertEqual(sample_lines[9], reader.read())
+
+      # Record positions should be as if we'd read our way there
+      self.assertEqual(10, reader.reader.pos)
+      self.assertEqual(3, reader.reader.seek(-7, 'current'))
+      self.assertEqual(sample_lines[3], reader.read())
+
+      records = reader.read_time_range(START_TIMESTAMP + 1, END_TIMESTAMP)
+      self.assertEqual(records, sample_lines[1:-1])
+      records = reader.read_time_range(START_TIMESTAMP + 1000,
+                                       END_TIMESTAMP - 1000)
+      self.assertEqual(records, sample_lines[4:9])
+      records = reader.read_time_range(None, None)
+      self.assertEqual(records, sample_lines)
+
+  ############################
+  def test_build_index(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      logging.info('created temporary directory "%s"', tmpdirname)
+      filebase = tmpdirname + '/mylog-'
+      sample_lines = []
+      for f in sorted(SAMPLE_DATA_2):
+        create_file(filebase + f, SAMPLE_DATA_2[f])
+        sample_lines.extend(SAMPLE_DATA_2[f])
+      START_TIMESTAMP = get_msec_timestamp(sample_lines[0])
+
+      # Without indexes, we shouldn't use (or build) them
+      reader = LogfileReader(filebase)
+      self.assertIsNone(reader._get_indexes())
+
+      reader = LogfileReader(filebase, build_index=True)
+      records = reader.read_time_range(START_TIMESTAMP + 1000, None)
+      self.assertEqual(records, sample_lines[4:])
+      for f in SAMPLE_DATA_2:
+        index = LogfileIndex(filebase + f)
+        self.assertTrue(index.load())
+        self.assertEqual(len(SAMPLE_DATA_2[f]), index.num_lines)
+
+      # A file whose index no longer matches it is ignored
+      with open(index_filename(filebase + '2017-11-05'), 'w') as index_file:
+        index_file.write('1509840000.0 10 1\n')
+      reader = LogfileReader(filebase)
+      self.assertIsNone(reader._get_indexes())
+      records = reader.read_time_range(START_TIMESTAMP + 1000, None)
+      self.assertEqual(records, sample_lines[4:])
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
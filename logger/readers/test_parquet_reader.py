@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import tempfile
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.das_record import DASRecord
+from logger.readers.parquet_reader import ParquetReader, PYARROW_FOUND
+from logger.writers.parquet_writer import ParquetWriter
+
+# 2017-11-04T05:12:19Z
+START = 1509772339.0
+
+def make_records(num_records):
+  return [DASRecord(data_id='gyr1', timestamp=START + i * 3600,
+                    fields={'Heading': 100.5 + i, 'Rate': i})
+          for i in range(num_records)]
+
+@unittest.skipUnless(PYARROW_FOUND, 'pyarrow not installed')
+class TestParquetReader(unittest.TestCase):
+  ############################
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.filebase = self.tmpdir.name + '/NBP1406'
+    self.records = make_records(50)
+    writer = ParquetWriter(self.filebase, buffer_records=7)
+    writer.write(self.records)
+    writer.flush()
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  ############################
+  def test_read(self):
+    reader = ParquetReader(self.filebase + '-gyr1-*.parquet')
+    self.assertEqual(reader.num_records, 50)
+    for record in self.records:
+      self.assertEqual(reader.read(), record)
+    self.assertIsNone(reader.read())
+
+    reader.seek(-3, 'end')
+    self.assertEqual(reader.read(), self.records[47])
+    reader.seek(10, 'start')
+    self.assertEqual(reader.read(), self.records[10])
+    self.assertEqual(reader.read_range(15, 30), self.records[15:30])
+
+  ############################
+  def test_read_time_range(self):
+    reader = ParquetReader(self.filebase + '-gyr1-*.parquet', fields='Rate')
+    start = (START + 10 * 3600) * 1000
+    stop = (START + 30 * 3600) * 1000
+    records = reader.read_time_range(start, stop)
+    self.assertEqual([r.fields for r in records],
+                     [{'Rate': i} for i in range(10, 30)])
+    self.assertEqual(len(reader.read_time_range(start=stop)), 20)
+
+    reader.seek_time(5 * 3600 * 1000, 'start')
+    self.assertEqual(reader.read().timestamp, START + 5 * 3600)
+    reader.seek_time(1800 * 1000, 'current')
+    self.assertEqual(reader.read().timestamp, START + 6 * 3600)
+    reader.seek_time(-1, 'end')
+    self.assertEqual(reader.read().timestamp, START + 49 * 3600)
+
+  ############################
+  def test_multiple_data_ids(self):
+    # A second instrument whose records interleave with the first's
+    other_records = [DASRecord(data_id='mwx1',
+                               timestamp=START + 1800 + i * 7200,
+                               fields={'AirTemp': 10.5 + i})
+                     for i in range(25)]
+    writer = ParquetWriter(self.filebase, buffer_records=7)
+    writer.write(other_records)
+    writer.flush()
+
+    expected = sorted(self.records + other_records,
+                      key=lambda record: record.timestamp)
+    reader = ParquetReader(self.filebase + '-*.parquet')
+    self.assertEqual(reader.num_records, 75)
+    records = []
+    record = reader.read()
+    while record is not None:
+      records.append(record)
+      record = reader.read()
+    self.assertEqual(records, expected)
+    self.assertEqual(reader.read_range(20, 40), expected[20:40])
+
+    reader.seek_time(5 * 3600 * 1000, 'start')
+    self.assertEqual(reader.read(), expected[expected.index(self.records[5])])
+    reader.seek_time(1, 'current')
+    self.assertEqual(reader.read(), self.records[6])
+    self.assertEqual(reader.read(), other_records[3])
+    self.assertEqual(reader.read_time_range(), expected)
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
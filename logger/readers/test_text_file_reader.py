@@ -10,6 +10,7 @@ import warnings
 
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
+from logger.readers import text_file_reader
 from logger.readers.text_file_reader import TextFileReader
 from logger.utils import formats
 
@@ -55,6 +56,25 @@ class TestTextFileReader(unittest.TestCase):
         self.assertEqual(line, reader.read())
       self.assertEqual(None, reader.read())
 
+  ############################
+  def test_read_batch(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      expected_lines = []
+      for f in sorted(SAMPLE_DATA):
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+        expected_lines.extend(SAMPLE_DATA[f])
+
+      # Batches should span files
+      reader = TextFileReader(tmpdirname + '/f*')
+      self.assertEqual(expected_lines[0:4], reader.read_batch(4))
+      self.assertEqual(expected_lines[4], reader.read())
+      self.assertEqual(expected_lines[5:], reader.read_batch(100))
+      self.assertEqual(None, reader.read_batch(100))
+
+      # Seeking should still work after batch reads
+      self.assertEqual(reader.seek(-2, 'current'), len(expected_lines) - 2)
+      self.assertEqual(expected_lines[-2:], reader.read_batch(10))
+
   ############################
   def test_tail_false(self):
     # Don't specify 'tail' and expect there to be no data
@@ -361,5 +381,128 @@ class TestTextFileReader(unittest.TestCase):
 
       self.assertEqual(expected_lines[1:4], reader.read_range(1, 4))
 
+  ############################
+  def test_line_offsets(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      logging.info('created temporary directory "%s"', tmpdirname)
+      expected_lines = []
+      for f in sorted(SAMPLE_DATA):
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+        expected_lines.extend(SAMPLE_DATA[f])
+
+      # Keep the offsets of every other line
+      interval = text_file_reader.LINE_OFFSET_INTERVAL
+      text_file_reader.LINE_OFFSET_INTERVAL = 2
+      try:
+        reader = TextFileReader(tmpdirname + '/f*')
+        for i in range(5):
+          reader.read()
+        self.assertEqual([0, 20],
+                         list(reader.line_offsets[tmpdirname + '/f1']))
+        self.assertEqual([0, 20],
+                         list(reader.line_offsets[tmpdirname + '/f2']))
+
+        # Seeking back and forth over lines we've read should jump to
+        # the nearest offset before them.
+        self.assertEqual(1, reader.seek(-4, 'current'))
+        self.assertEqual(10, reader.current_file.tell())
+        self.assertEqual(4, reader.seek(3, 'current'))
+        self.assertEqual(10, reader.current_file.tell())
+        self.assertEqual(expected_lines[4], reader.read())
+        self.assertEqual(expected_lines[5], reader.read())
+        self.assertEqual(3, reader.seek(-3, 'current'))
+        self.assertEqual(expected_lines[3:], reader.read_range(3, 9))
+      finally:
+        text_file_reader.LINE_OFFSET_INTERVAL = interval
+
+  ############################
+  def test_scan_back(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      logging.info('created temporary directory "%s"', tmpdirname)
+      expected_lines = []
+      for f in sorted(SAMPLE_DATA):
+        create_file(tmpdirname + '/' + f, SAMPLE_DATA[f])
+        expected_lines.extend(SAMPLE_DATA[f])
+
+      # Use a tiny block size so we have to scan back over several
+      # blocks, and leave the last file without a final newline.
+      with open(tmpdirname + '/f3', 'w') as f:
+        f.write('\r\n'.join(SAMPLE_DATA['f3']))
+
+      block_size = text_file_reader.SCAN_BLOCK_SIZE
+      text_file_reader.SCAN_BLOCK_SIZE = 7
+      try:
+        reader = TextFileReader(tmpdirname + '/f*')
+        self.assertEqual(8, reader.seek(-1, 'end'))
+        self.assertEqual(expected_lines[8], reader.read())
+        self.assertEqual(None, reader.read())
+        self.assertEqual(2, reader.seek(-7, 'end'))
+        self.assertEqual(expected_lines[2:], reader.read_range(2, 9))
+
+        # Back from a position we jumped to without reading from the
+        # start of the file.
+        reader.seek(-1, 'end')
+        self.assertEqual(6, reader.seek(-2, 'current'))
+        self.assertEqual(expected_lines[6], reader.read())
+      finally:
+        text_file_reader.SCAN_BLOCK_SIZE = block_size
+
+  ############################
+  def test_line_endings(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      logging.info('created temporary directory "%s"', tmpdirname)
+      # As in text mode, '\r', '\n' and '\r\n' all end lines
+      contents = {'f1': b'a\rb\rc\rd\r',
+                  'f2': b'e\r\nf\rg\nh\r\r\ni',
+                  'f3': b'\rj\n\r\nk'}
+      for f, content in contents.items():
+        with open(tmpdirname + '/' + f, 'wb') as data_file:
+          data_file.write(content)
+      expected_lines = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', '', 'i',
+                        '', 'j', '', 'k']
+
+      reader = TextFileReader(tmpdirname + '/f*')
+      self.assertEqual(expected_lines, reader.read_range())
+      reader = TextFileReader(tmpdirname + '/f*')
+      self.assertEqual(expected_lines[:3], reader.read_batch(3))
+      self.assertEqual(expected_lines[3:9], reader.read_batch(6))
+
+      # Seeking should count lines the same way, whether it's by the
+      # offsets we keep, by scanning back or by counting lines. Use a
+      # block size that splits '\r\n's between blocks.
+      interval = text_file_reader.LINE_OFFSET_INTERVAL
+      block_size = text_file_reader.SCAN_BLOCK_SIZE
+      text_file_reader.LINE_OFFSET_INTERVAL = 2
+      text_file_reader.SCAN_BLOCK_SIZE = 3
+      try:
+        reader = TextFileReader(tmpdirname + '/f*')
+        for i in range(7):
+          reader.read()
+        self.assertEqual([0, 5], list(reader.line_offsets[tmpdirname + '/f2']))
+        self.assertEqual(5, reader.seek(-2, 'current'))
+        self.assertEqual(expected_lines[5:9], reader.read_range(5, 9))
+        self.assertEqual(14, reader.seek(0, 'end'))
+        self.assertEqual(8, reader.seek(-6, 'end'))
+        self.assertEqual(expected_lines[8], reader.read())
+        self.assertEqual(10, reader.seek(-4, 'end'))
+        self.assertEqual(expected_lines[10:], [reader.read() for i in range(4)])
+        self.assertEqual(None, reader.read())
+        reader.seek(0, 'end')
+        self.assertEqual(6, reader.seek(-8, 'current'))
+        self.assertEqual(expected_lines[6], reader.read())
+      finally:
+        text_file_reader.LINE_OFFSET_INTERVAL = interval
+        text_file_reader.SCAN_BLOCK_SIZE = block_size
+
+  ############################
+  def test_decode_error(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      with open(tmpdirname + '/f1', 'wb') as data_file:
+        data_file.write(b'good\n\xff\xfe bad\n')
+      reader = TextFileReader(tmpdirname + '/f1')
+      self.assertEqual('good', reader.read())
+      with self.assertRaises(UnicodeDecodeError):
+        reader.read()
+
 if __name__ == '__main__':
     unittest.main()
@@ -171,6 +171,75 @@ class TestUDPReader(unittest.TestCase):
     # Silence the alarm
     signal.alarm(0)
 
+  ############################
+  def test_udp_read_batch(self):
+    port = 8002
+    dest = ''
+
+    # Set timeout we can catch if things are taking too long
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(1)
+
+    try:
+      reader = UDPReader(port=port, source=dest)
+      self.write_udp(port, dest, SAMPLE_DATA)
+      time.sleep(0.1)
+      self.assertEqual(SAMPLE_DATA[0:2], reader.read_batch(2))
+      self.assertEqual(SAMPLE_DATA[2:], reader.read_batch(10))
+
+      # With an eol, packets should be split into records
+      eol_reader = UDPReader(port=port + 1, source=dest, eol='\n')
+      self.write_udp(port + 1, dest, EOL_SAMPLE_DATA)
+      time.sleep(0.1)
+      self.assertEqual(['f1 line 1', 'f1 line 1a', 'f1 line 1b',
+                        'f1 line 2', 'f1 line 3'], eol_reader.read_batch(10))
+    except ReaderTimeout:
+      self.assertTrue(False, 'UDPReader timed out in test - is port '
+                      '%s:%s open?' % (dest, port))
+
+    # Silence the alarm
+    signal.alarm(0)
+
+  ############################
+  def test_udp_read_batch_timeout(self):
+    port = 8004
+    dest = ''
+
+    # Set timeout we can catch if things are taking too long
+    signal.signal(signal.SIGALRM, self._handler)
+    signal.alarm(3)
+
+    try:
+      # With a timeout, wait that long for the rest of a batch, and
+      # return what's arrived by then.
+      reader = UDPReader(port=port, source=dest)
+      threading.Thread(target=self.write_udp, daemon=True,
+                       args=(port, dest, SAMPLE_DATA),
+                       kwargs={'interval': 0.2}).start()
+      self.assertEqual(SAMPLE_DATA, reader.read_batch(10, timeout=1))
+
+      self.write_udp(port, dest, SAMPLE_DATA[:1])
+      start = time.time()
+      self.assertEqual(SAMPLE_DATA[:1], reader.read_batch(10, timeout=0.3))
+      self.assertLess(time.time() - start, 1)
+
+      # Likewise if we're waiting for the end of a partial record
+      eol_reader = UDPReader(port=port + 1, source=dest, eol='\n')
+      self.write_udp(port + 1, dest, EOL_SAMPLE_DATA[:2])
+      start = time.time()
+      self.assertEqual(['f1 line 1', 'f1 line 1a', 'f1 line 1b'],
+                       eol_reader.read_batch(10, timeout=0.3))
+      self.assertLess(time.time() - start, 1)
+      self.write_udp(port + 1, dest, EOL_SAMPLE_DATA[2:])
+      self.assertEqual(['f1 line 2', 'f1 line 3'],
+                       eol_reader.read_batch(10, timeout=0.3))
+    except ReaderTimeout:
+      self.assertTrue(False, 'UDPReader timed out in test - is port '
+                      '%s:%s open?' % (dest, port))
+
+    # Silence the alarm
+    signal.alarm(0)
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
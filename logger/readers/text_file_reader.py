@@ -1,15 +1,37 @@
 #!/usr/bin/env python3
 
 import glob
+import locale
 import logging
+import os.path
+import re
 import sys
 import time
 
+from array import array
+
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.readers.reader import StorageReader
 from logger.utils.formats import Text
 
+# How many bytes at a time to read when scanning backwards through a
+# file or counting its lines.
+SCAN_BLOCK_SIZE = 65536
+
+# Note the byte offset of the start of every this-many'th line of each
+# file, so that seeks can jump close to any line we've read past and
+# read forward from there, without keeping an offset for every line.
+LINE_OFFSET_INTERVAL = 1000
+
+# Like text mode's universal newlines, we take any of '\r\n', '\r'
+# and '\n' as the end of a line.
+LINE_END_RE = re.compile(rb'\r\n|\r|\n')
+LINE_RE = re.compile(rb'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+')
+
+# Decode lines as open() would in text mode
+ENCODING = locale.getpreferredencoding(False)
+
 ################################################################################
 # Open and read single-line records from one or more text files.
 class TextFileReader(StorageReader):
@@ -59,13 +81,21 @@ class TextFileReader(StorageReader):
     # how long to sleep
     self.last_read = 0
 
-    # The file we're currently using
+    # The file we're currently using, and any lines we've read from it
+    # but not yet returned (see _readline())
     self.current_file = None
+    self.pending_lines = []
 
     self.pos = 0
     self.start_pos = {}
     self.end_pos = {}
 
+    # For each file, the byte offsets of the starts of every
+    # LINE_OFFSET_INTERVAL'th line (0, LINE_OFFSET_INTERVAL, ...) as far
+    # as we've read through it, so that we can seek back (or forward)
+    # near any of them.
+    self.line_offsets = {}
+
     # Special case if file_spec is None
     if file_spec is None:
       self.current_file = sys.stdin
@@ -108,13 +138,155 @@ class TextFileReader(StorageReader):
       next_filename = self.unused_file_list.pop(0)
       logging.info('TextFileReader opening next file "%s"', next_filename)
       self.start_pos[next_filename] = self.pos
-      self.current_file = open(next_filename, 'r')
+      self.current_file = self._open(next_filename)
       self.used_file_list.append(next_filename)
       return self.current_file
 
     # If here, we've found no unused next file. Give up
     return None
 
+  ############################
+  def _open(self, filename, offset=0):
+    """Internal - Open a file at the given byte offset. We read files
+    as bytes so that we can keep track of line offsets; _readline()
+    splits them into lines and _decode() turns those back into text."""
+    opened_file = open(filename, 'rb')
+    if offset:
+      opened_file.seek(offset)
+    self.pending_lines = []
+    return opened_file
+
+  ############################
+  def _seek_file(self, offset):
+    """Internal - Move current_file to the given byte offset."""
+    self.current_file.seek(offset)
+    self.pending_lines = []
+
+  ############################
+  def _tell(self):
+    """Internal - Return the byte offset in current_file of the start
+    of the next line _readline() will return."""
+    return self.current_file.tell() - sum(map(len, self.pending_lines))
+
+  ############################
+  def _readline(self):
+    """Internal - Return the next line from current_file, including its
+    line ending, or an empty string/bytes at EOF. A binary readline()
+    only ends lines at '\n', so split off any lines it returns that end
+    at a lone '\r'."""
+    if self.pending_lines:
+      return self.pending_lines.pop(0)
+    line = self.current_file.readline()
+    if not self.file_spec:
+      return line      # stdin is already in text mode
+
+    if line.endswith(b'\r\n'):
+      body = line[:-2]
+    else:
+      body = line[:-1] if line.endswith((b'\r', b'\n')) else line
+    if b'\r' in body:
+      self.pending_lines = LINE_RE.findall(line)
+      line = self.pending_lines.pop(0)
+    return line
+
+  ############################
+  def _peek_line(self):
+    """Internal - Return the next line _readline() will return, without
+    consuming it."""
+    line = self._readline()
+    if line:
+      self.pending_lines.insert(0, line)
+    return line
+
+  ############################
+  @staticmethod
+  def _decode(line):
+    """Internal - Strip the line ending from a line returned by
+    _readline() and return it as text."""
+    if line.endswith(b'\r\n'):
+      line = line[:-2]
+    elif line.endswith((b'\r', b'\n')):
+      line = line[:-1]
+    return line.decode(ENCODING)
+
+  ############################
+  def _note_line(self, line):
+    """Internal - Account for a line we've just read from current_file,
+    noting where the next line starts if it's one whose offset we keep
+    and we've noted all those before it, and return the line as a
+    record."""
+    self.pos += 1
+
+    # Reading from stdin: nothing to keep track of
+    if not self.file_spec:
+      return line.rstrip('\n')
+
+    filename = self.used_file_list[-1]
+    offsets = self.line_offsets.get(filename, None)
+    if offsets is None:
+      offsets = self.line_offsets[filename] = array('q', [0])
+    # Don't note the end of a partial line; the rest may yet arrive.
+    next_line = self.pos - self.start_pos[filename]
+    if next_line % LINE_OFFSET_INTERVAL == 0 and \
+       next_line // LINE_OFFSET_INTERVAL == len(offsets) and \
+       line.endswith((b'\r', b'\n')):
+      offsets.append(self._tell())
+    return self._decode(line)
+
+  ############################
+  def _scan_back(self, filename, from_offset, num_lines):
+    """Internal - Return the byte offset of the start of the line
+    num_lines lines before from_offset, which should be the start of a
+    line or the end of the file. Read the file backwards a block at a
+    time, counting line endings, rather than reading it from the start."""
+    if num_lines <= 0:
+      return from_offset
+    line_ends_needed = num_lines
+    pos = from_offset
+    next_byte = b''
+    with open(filename, 'rb') as scan_file:
+      while pos > 0:
+        block_start = max(0, pos - SCAN_BLOCK_SIZE)
+        scan_file.seek(block_start)
+        block = scan_file.read(pos - block_start)
+        ends = [match.end() for match in LINE_END_RE.finditer(block)]
+        # A '\r' at the end of the block that's followed by a '\n' is
+        # part of a line ending we've already counted.
+        if ends and block.endswith(b'\r') and next_byte == b'\n':
+          ends.pop()
+        for end in reversed(ends):
+          # The line ending just before from_offset doesn't count; we
+          # want the start of the line num_lines lines back.
+          if block_start + end >= from_offset:
+            continue
+          line_ends_needed -= 1
+          if line_ends_needed == 0:
+            return block_start + end
+        next_byte = block[:1]
+        pos = block_start
+    return 0
+
+  ############################
+  def _count_lines(self, filename):
+    """Internal - Count the lines in a file, a block at a time."""
+    count = 0
+    last_byte = b'\n'
+    with open(filename, 'rb') as count_file:
+      while True:
+        block = count_file.read(SCAN_BLOCK_SIZE)
+        if not block:
+          break
+        count += (block.count(b'\n') + block.count(b'\r') -
+                  block.count(b'\r\n'))
+        # Don't count a '\r\n' split between blocks twice
+        if last_byte == b'\r' and block[:1] == b'\n':
+          count -= 1
+        last_byte = block[-1:]
+    # Count a final line that lacks a line ending
+    if last_byte not in (b'\r', b'\n'):
+      count += 1
+    return count
+
   ############################
   def read(self):
     """Get the next line of text. Return None if there are no more
@@ -140,12 +312,11 @@ class TextFileReader(StorageReader):
       # If we've got a current file, or if _get_next_file() gets one
       # for us, try to read a record.
       if self.current_file or self._get_next_file():
-        record = self.current_file.readline()
-        if record:
+        line = self._readline()
+        if line:
           self.last_read = time.time()
-          record = record.rstrip('\n')
+          record = self._note_line(line)
           logging.debug('TextFileReader got record "%s"', record)
-          self.pos += 1
           return record
 
         # No record: our current_file has reached EOF. See if more
@@ -168,6 +339,37 @@ class TextFileReader(StorageReader):
                     '%f seconds before trying again', self.retry_interval)
       time.sleep(self.retry_interval)
 
+  ############################
+  def read_batch(self, max_records, timeout=None):
+    """Return a list of up to max_records lines, or None if there are no
+    more records. Once we have the first line, only return those lines
+    that are available without waiting: we don't wait out 'tail' or
+    'refresh_file_spec' retries in mid-batch. If an interval has been
+    specified, or we're reading from stdin, fall back to reading one
+    record at a time.
+    """
+    if self.interval or not self.file_spec:
+      return super().read_batch(max_records, timeout)
+
+    # Let read() deal with opening files and waiting for the first record
+    record = self.read()
+    if record is None:
+      return None
+    records = [record]
+
+    while len(records) < max_records:
+      line = self._readline()
+      if line:
+        records.append(self._note_line(line))
+        continue
+
+      # EOF on current file; move on to the next one, if there is one
+      if not self._get_next_file():
+        break
+
+    self.last_read = time.time()
+    return records
+
   ############################
   # Current behavior is to just go to the end if we run out of records,
   # as io.IOBase.seek() does.
@@ -179,17 +381,30 @@ class TextFileReader(StorageReader):
       return
     if offset < 0:
       return self._seek_back_from_current(offset)
-    i = 0
-    while i < offset:
-      if self.current_file or self._get_next_file():
-        if self.current_file.readline():
-          i += 1
-          self.pos += 1
-        else:
-          if self._get_next_file() is None:
-            break
-    # TODO: take advantage of self.start_pos and self.end_pos if we've
-    # already processed later files.
+    target = self.pos + offset
+    while self.pos < target:
+      if not self.current_file and not self._get_next_file():
+        break
+
+      # If we already know where a line ahead of us starts, jump as
+      # far toward the target as we can.
+      filename = self.used_file_list[-1]
+      offsets = self.line_offsets.get(filename, None)
+      line_num = self.pos - self.start_pos[filename]
+      if offsets:
+        index = min((line_num + target - self.pos) // LINE_OFFSET_INTERVAL,
+                    len(offsets) - 1)
+        if index * LINE_OFFSET_INTERVAL > line_num:
+          self._seek_file(offsets[index])
+          self.pos += index * LINE_OFFSET_INTERVAL - line_num
+          continue
+
+      # Otherwise read our way forward, noting offsets as we go
+      line = self._readline()
+      if line:
+        self._note_line(line)
+      elif self._get_next_file() is None:
+        break
 
   ############################
   def _seek_back_from_current(self, offset=0):
@@ -201,18 +416,53 @@ class TextFileReader(StorageReader):
     if target < 0:
       raise ValueError("Can't back up past earliest record")
 
-    # Find the right file.
+    # Note where we are now, which we may scan back from
     current_filename = self.used_file_list[-1]
+    if self.current_file:
+      anchor = (current_filename, self._tell(),
+                self.pos - self.start_pos[current_filename])
+    else:
+      anchor = None
+
+    # Find the right file.
     while target < self.start_pos[current_filename]:
       self.unused_file_list.insert(0, current_filename)
       self.used_file_list.pop()
       current_filename = self.used_file_list[-1]
 
-    self.current_file = open(current_filename, 'r')
+    # Find the byte offset of the target line in the file: from the
+    # nearest offset we've noted before it, if we've read that far;
+    # otherwise by scanning back from where we are now, or from the end
+    # of the file if we're done with it.
+    line_num = target - self.start_pos[current_filename]
+    offsets = self.line_offsets.get(current_filename, None)
+    index = line_num // LINE_OFFSET_INTERVAL
+    lines_to_skip = 0
+    if offsets and index < len(offsets):
+      byte_offset = offsets[index]
+      lines_to_skip = line_num - index * LINE_OFFSET_INTERVAL
+    elif anchor and anchor[0] == current_filename:
+      byte_offset = self._scan_back(current_filename, anchor[1],
+                                    anchor[2] - line_num)
+    elif current_filename in self.end_pos:
+      num_lines = self.end_pos[current_filename] - self.start_pos[current_filename]
+      byte_offset = self._scan_back(current_filename,
+                                    os.path.getsize(current_filename),
+                                    num_lines - line_num)
+    else:
+      byte_offset = None
 
-    # TODO: implement backwards search within the file
-    for _ in range(target - self.start_pos[current_filename]):
-      self.current_file.readline()
+    if self.current_file:
+      self.current_file.close()
+    if byte_offset is None:
+      # We don't know where we are; read our way there from the start
+      self.current_file = self._open(current_filename)
+      for _ in range(line_num):
+        self._readline()
+    else:
+      self.current_file = self._open(current_filename, byte_offset)
+      for _ in range(lines_to_skip):
+        self._readline()
     self.pos = target
 
   ############################
@@ -224,7 +474,7 @@ class TextFileReader(StorageReader):
     }
     if self.current_file:
       state['current_filename'] = self.used_file_list[-1]
-      state['current_file_pos'] = self.current_file.tell()
+      state['current_file_pos'] = self._tell()
     return state
 
   ############################
@@ -232,8 +482,8 @@ class TextFileReader(StorageReader):
     self.used_file_list = state['used_file_list']
     self.unused_file_list = state['unused_file_list']
     if 'current_filename' in state:
-      self.current_file = open(state['current_filename'], 'r')
-      self.current_file.seek(state['current_file_pos'])
+      self.current_file = self._open(state['current_filename'],
+                                     state['current_file_pos'])
     else:
       self.current_file = None
     self.pos = state['pos']
@@ -271,13 +521,7 @@ class TextFileReader(StorageReader):
             pos = self.end_pos[filename]
           else:
             self.start_pos[filename] = pos
-
-            # TODO: this can be made faster, if needed
-            with open(filename) as f:
-              for n, _ in enumerate(f, 1):
-                pass
-
-            pos += n
+            pos += self._count_lines(filename)
             self.end_pos[filename] = pos
 
         self.used_file_list = file_list
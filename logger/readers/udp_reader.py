@@ -4,6 +4,7 @@ import logging
 import socket
 import struct
 import sys
+import time
 
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
@@ -105,3 +106,43 @@ class UDPReader(Reader):
       logging.debug('UDPReader.read() received %d bytes', len(record))
       if record:
         self.record_buffer += record.decode('utf-8')
+
+  ############################
+  def read_batch(self, max_records, timeout=None):
+    """
+    Wait for the next record, then return it along with any others that
+    arrive, up to max_records in all. If timeout is None, take only
+    those that have already arrived; otherwise, wait up to timeout
+    seconds (from when the first record arrived) for the rest.
+    """
+    records = [self.read()]
+    deadline = None if timeout is None else time.time() + timeout
+
+    # Now drain whatever is waiting for us (or arrives before the
+    # deadline), keeping any partial record for the next read.
+    try:
+      while len(records) < max_records:
+        if self.eol and self.eol in self.record_buffer:
+          records.append(self.read())
+          continue
+        if deadline is None:
+          self.socket.setblocking(False)
+        else:
+          remaining = deadline - time.time()
+          if remaining <= 0:
+            break
+          self.socket.settimeout(remaining)
+        try:
+          record = self.socket.recv(self.read_buffer_size)
+        except (BlockingIOError, socket.timeout):
+          break
+        logging.debug('UDPReader.read_batch() received %d bytes', len(record))
+        if not record:
+          continue
+        if self.eol:
+          self.record_buffer += record.decode('utf-8')
+        else:
+          records.append(record.decode('utf-8'))
+    finally:
+      self.socket.setblocking(True)
+    return records
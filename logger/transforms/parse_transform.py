@@ -15,7 +15,9 @@ class ParseTransform(Transform):
   def __init__(self, record_format=None, field_patterns=None, metadata=None,
                definition_path=record_parser.DEFAULT_DEFINITION_PATH,
                return_json=False, return_das_record=False,
-               metadata_interval=None, quiet=False):
+               metadata_interval=None, quiet=False, compile_formats=True,
+               reorder_interval=None,
+               definition_cache_dir=None):
     """
     ```
     record_format
@@ -48,6 +50,21 @@ class ParseTransform(Transform):
             haven't been returned in the last metadata_interval seconds.
 
     quiet - if not False, don't complain when unable to parse a record.
+
+    compile_formats
+            If True, compile delimiter-separated formats into
+            specialized parsers. Results are the same either way.
+
+    reorder_interval
+            If not None, after every reorder_interval records from a
+            data_id, reorder its formats so that the most frequently
+            matched are tried first.
+
+    definition_cache_dir
+            If not None, directory in which to cache definitions read
+            from definition_path, so that other loggers using the same
+            definitions can start without re-reading them, e.g. the
+            DEFAULT_CACHE_DIR in logger/utils/definition_cache.py.
     ```
     """
     self.parser = record_parser.RecordParser(
@@ -58,7 +75,10 @@ class ParseTransform(Transform):
       return_json=return_json,
       return_das_record=return_das_record,
       metadata_interval=metadata_interval,
-      quiet=quiet)
+      quiet=quiet,
+      compile_formats=compile_formats,
+      reorder_interval=reorder_interval,
+      definition_cache_dir=definition_cache_dir)
 
   ############################
   def transform(self, record):
@@ -76,3 +96,17 @@ class ParseTransform(Transform):
       return results
 
     return self.parser.parse_record(record)
+
+  ############################
+  def transform_batch(self, records):
+    """Parse a list of records, returning a list of the non-empty results."""
+    parse_record = self.parser.parse_record
+    results = []
+    for record in records:
+      if type(record) is list:
+        result = self.transform(record)
+      else:
+        result = parse_record(record)
+      if result:
+        results.append(result)
+    return results
@@ -37,5 +37,16 @@ class TestTransform(unittest.TestCase):
     with self.assertRaises(TypeError):
       transform.output_format('not a format')
 
+  ############################
+  # Check that the default transform_batch() calls transform()
+  def test_transform_batch(self):
+    class UpperTransform(Transform):
+      def transform(self, record):
+        return record.upper() if record != 'skip' else None
+
+    transform = UpperTransform()
+    self.assertEqual(transform.transform_batch(['a', 'skip', 'b']), ['A', 'B'])
+    self.assertEqual(transform.transform_batch([]), [])
+
 if __name__ == '__main__':
     unittest.main()
@@ -46,3 +46,15 @@ class Transform:
     raise NotImplementedError('Class %s (subclass of Transform) is missing '
                               'implementation of transform() method.'
                               % self.__class__.__name__)
+
+  ############################
+  def transform_batch(self, records):
+    """Transform a list of records, returning a list of the non-empty
+    results. This default implementation simply calls transform() on
+    each record; transforms that can do better should override it."""
+    results = []
+    for record in records:
+      result = self.transform(record)
+      if result:
+        results.append(result)
+    return results
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""On-disk cache of the device and device type definitions read by
+RecordParser.
+
+Reading the YAML definition files is by far the most expensive part of
+creating a RecordParser, and a cruise configuration may start dozens of
+loggers that each read the same definitions. The first RecordParser to
+read a definition_path stores the merged definitions (and, if computed,
+the metadata map derived from them) in a cache file; subsequent parsers
+using the same definition_path load them from there.
+
+A cache file is named for a hash of the current working directory and
+the definition_path (which may contain relative paths and wildcards),
+and records:
+
+  - the list of files each filespec in the definition_path (and in any
+    files it includes) matched, and
+
+  - the path, modification time, size and SHA-256 hash of each file read.
+
+A cached entry is used only if every filespec still matches the same
+files and every file still has the same contents. A file whose
+modification time or size has changed is re-hashed, so merely touching
+a definition file doesn't invalidate the cache.
+
+Note that the compiled formats themselves are not cached: they include
+type converter functions that can't be serialized, and compiling them
+takes a small fraction of the time it takes to read the YAML.
+"""
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import stat
+import sys
+import tempfile
+
+# Append openrvdas root to syspath prior to importing openrvdas modules
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+# Bump this if the layout of cached entries changes
+CACHE_VERSION = 1
+
+# Make the default cache directory user-specific. Because it's in a
+# shared directory, another user could create it first, so before
+# loading a pickle we also check that it and the directory holding it
+# belong to us and are writable by no one else; see _is_private().
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(),
+                                 'openrvdas_definition_cache_%d' % os.getuid())
+
+################################################################################
+def file_signature(filename, stat=None):
+  """Return a dict of the modification time, size and SHA-256 hash of
+  filename's contents."""
+  stat = stat or os.stat(filename)
+  with open(filename, 'rb') as file:
+    file_hash = hashlib.sha256(file.read()).hexdigest()
+  return {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': file_hash}
+
+################################################################################
+def _is_private(path):
+  """Is path a file or directory (not a symlink) owned by the current
+  user and not writable by group or others?"""
+  try:
+    path_stat = os.lstat(path)
+  except OSError:
+    return False
+  return (not stat.S_ISLNK(path_stat.st_mode) and
+          path_stat.st_uid == os.getuid() and
+          not path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+################################################################################
+class DefinitionCache:
+  """Load and save definitions read from a definition_path."""
+  ############################
+  def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    ```
+    cache_dir  Directory in which to store cache files. Will be created
+               (readable only by the current user) if it doesn't exist.
+    ```
+    """
+    self.cache_dir = cache_dir
+
+  ############################
+  def cache_filename(self, definition_path):
+    """Return the name of the file in which to cache definitions for this
+    definition_path, read from the current working directory."""
+    key = os.getcwd() + '\0' + definition_path
+    return os.path.join(self.cache_dir,
+                        hashlib.sha256(key.encode('utf-8')).hexdigest()
+                        + '.pickle')
+
+  ############################
+  def load(self, definition_path):
+    """Return the entry saved for definition_path, a dict that includes
+    'definitions' and 'metadata' keys, or None if there is no valid
+    cached entry."""
+    filename = self.cache_filename(definition_path)
+    if not os.path.exists(filename):
+      return None
+
+    # Unpickling can run arbitrary code, so only load files that no one
+    # else could have written or replaced.
+    if not (_is_private(self.cache_dir) and _is_private(filename)):
+      logging.warning('Not loading definition cache file %s: it or its '
+                      'directory is not owned by us or is writable by '
+                      'others', filename)
+      return None
+    try:
+      with open(filename, 'rb') as cache_file:
+        entry = pickle.load(cache_file)
+    except FileNotFoundError:
+      return None
+    except Exception as e:
+      logging.warning('Unable to read definition cache file %s: %s',
+                      filename, e)
+      return None
+
+    if not type(entry) is dict or entry.get('version') != CACHE_VERSION:
+      return None
+    if not self._is_current(entry):
+      logging.debug('Definition cache for "%s" is out of date',
+                    definition_path)
+      return None
+
+    logging.debug('Loaded definitions for "%s" from cache %s',
+                  definition_path, filename)
+    return entry
+
+  ############################
+  def save(self, definition_path, definitions, metadata, files, globs):
+    """Save definitions and metadata read from definition_path.
+
+    ```
+    definitions  The merged definitions that were read
+
+    metadata     Metadata map derived from the definitions, or None if
+                 it wasn't computed.
+
+    files        List of the files that were read
+
+    globs        Dict mapping each filespec that was globbed to the list
+                 of files it matched.
+    ```
+    """
+    try:
+      entry = {
+        'version': CACHE_VERSION,
+        'definition_path': definition_path,
+        'definitions': definitions,
+        'metadata': metadata,
+        'files': {filename: file_signature(filename) for filename in files},
+        'globs': {filespec: sorted(matches)
+                  for filespec, matches in globs.items()},
+      }
+      os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+      if not _is_private(self.cache_dir):
+        logging.warning('Not saving definition cache: directory %s is not '
+                        'owned by us or is writable by others',
+                        self.cache_dir)
+        return
+
+      # Write to a temporary file and rename it, so that loggers starting
+      # simultaneously never see a partially-written cache file.
+      filename = self.cache_filename(definition_path)
+      fd, tmp_filename = tempfile.mkstemp(dir=self.cache_dir)
+      try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+          pickle.dump(entry, tmp_file)
+        os.replace(tmp_filename, filename)
+      except BaseException:
+        os.unlink(tmp_filename)
+        raise
+      logging.debug('Saved definitions for "%s" to cache %s',
+                    definition_path, filename)
+    except Exception as e:
+      logging.warning('Unable to save definition cache for "%s": %s',
+                      definition_path, e)
+
+  ############################
+  def _is_current(self, entry):
+    """Do the filespecs and files recorded in entry still match what's
+    on disk?"""
+    for filespec, matches in entry.get('globs', {}).items():
+      if sorted(glob.glob(filespec)) != matches:
+        return False
+
+    for filename, signature in entry.get('files', {}).items():
+      try:
+        stat = os.stat(filename)
+        if (stat.st_mtime_ns == signature['mtime'] and
+            stat.st_size == signature['size']):
+          continue
+        if file_signature(filename, stat)['hash'] != signature['hash']:
+          return False
+      except OSError:
+        return False
+    return True
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""Sparse time indexes for timestamped logfiles, so that readers can
+jump close to a desired time rather than reading from the start.
+
+The index for a logfile is kept in a hidden sidecar file in the same
+directory (so it doesn't match the logfile's wildcards), e.g.
+/log/NBP1406/gyr1/raw/.NBP1406_gyr1-2014-08-01.idx. Each line of it
+records the timestamp, byte offset and line number of one logfile
+record, for (roughly) every interval'th record:
+
+  1406851200.23 0 0
+  1406851300.17 52340 1000
+  ...
+
+LogfileWriter appends to the index as it writes (if asked to); indexes
+for existing logfiles are built on demand by LogfileReader (if asked
+to) or with this script:
+
+  logger/utils/logfile_index.py --build '/log/NBP1406/*/raw/NBP1406_*'
+"""
+import bisect
+import glob
+import logging
+import os.path
+import sys
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils import timestamp
+
+# Index every this many records by default
+DEFAULT_INDEX_INTERVAL = 1000
+
+############################
+def index_filename(filename):
+  """Return the name of the index sidecar for a logfile."""
+  dir_name, base_name = os.path.split(filename)
+  return os.path.join(dir_name, '.' + base_name + '.idx')
+
+############################
+def record_timestamp(record, time_format=timestamp.TIME_FORMAT):
+  """Return the timestamp (in seconds) at the start of a record, or
+  None if it doesn't start with one."""
+  try:
+    time_str = record.split(' ', 1)[0]
+    return timestamp.timestamp(time_str, time_format=time_format)
+  except ValueError:
+    return None
+
+################################################################################
+class LogfileIndex:
+  """Sparse index of the timestamps in a single logfile."""
+  ############################
+  def __init__(self, filename, interval=DEFAULT_INDEX_INTERVAL,
+               time_format=timestamp.TIME_FORMAT):
+    """
+    ```
+    filename     Name of the logfile being indexed.
+
+    interval     Index every this many records.
+
+    time_format  Format of the timestamps at the start of each record.
+    ```
+    """
+    self.filename = filename
+    self.index_filename = index_filename(filename)
+    self.interval = interval
+    self.time_format = time_format
+
+    # List of (timestamp, byte offset, line number) tuples, and a list
+    # of just the timestamps, for bisecting.
+    self.entries = []
+    self.timestamps = []
+
+    # Line number of next record to be added, and its byte offset
+    self.num_lines = 0
+    self.size = 0
+
+    # Line number of last indexed record
+    self.last_indexed = None
+
+    self.index_file = None   # open for appending, if we're adding
+
+  ############################
+  def load(self):
+    """Read the index sidecar, if it exists and is consistent with the
+    logfile. Return True if we did."""
+    if not os.path.exists(self.index_filename):
+      return False
+    entries = []
+    try:
+      with open(self.index_filename, 'r') as index_file:
+        for line in index_file:
+          ts, offset, line_num = line.split()
+          entries.append((float(ts), int(offset), int(line_num)))
+    except ValueError:
+      logging.warning('Malformed logfile index %s', self.index_filename)
+      return False
+
+    # Make sure the index matches the logfile, checking that the last
+    # indexed record is where the index says it is.
+    if entries:
+      ts, offset, line_num = entries[-1]
+      with open(self.filename, 'rb') as logfile:
+        logfile.seek(offset)
+        record = logfile.readline().decode('utf-8', errors='replace')
+      if record_timestamp(record, self.time_format) != ts:
+        logging.warning('Logfile index %s does not match %s',
+                        self.index_filename, self.filename)
+        return False
+
+    self._set_entries(entries)
+    self._count_tail()
+    return True
+
+  ############################
+  def build(self):
+    """Index the logfile from scratch and write the index sidecar."""
+    logging.info('Building index for %s', self.filename)
+    self.close()
+    self._set_entries([])
+    self.num_lines = self.size = 0
+    if os.path.exists(self.index_filename):
+      os.remove(self.index_filename)
+    with open(self.filename, 'rb') as logfile:
+      for line in logfile:
+        self.add(line.decode('utf-8', errors='replace').rstrip('\n'),
+                 len(line))
+
+  ############################
+  def add(self, record, record_bytes=None, ts=None):
+    """Note a record just appended to the logfile, indexing it if it is
+    time to. record_bytes is its length in bytes, including newline;
+    ts is its timestamp, if the caller already knows it."""
+    if record_bytes is None:
+      record_bytes = len(record.encode('utf-8')) + 1
+    if self.last_indexed is None or \
+       self.num_lines - self.last_indexed >= self.interval:
+      if ts is None:
+        ts = record_timestamp(record, self.time_format)
+      if ts is not None:
+        entry = (ts, self.size, self.num_lines)
+        self.entries.append(entry)
+        self.timestamps.append(ts)
+        self.last_indexed = self.num_lines
+        if self.index_file is None:
+          self.index_file = open(self.index_filename, 'a')
+        self.index_file.write('%r %d %d\n' % entry)
+        self.index_file.flush()
+    self.num_lines += 1 + record.count('\n')
+    self.size += record_bytes
+
+  ############################
+  def close(self):
+    if self.index_file:
+      self.index_file.close()
+      self.index_file = None
+
+  ############################
+  def find(self, ts):
+    """Return the (byte offset, line number) of the last indexed record
+    whose timestamp is earlier than ts, or of the start of the file if
+    there is none."""
+    i = bisect.bisect_left(self.timestamps, ts)
+    if i == 0:
+      return 0, 0
+    return self.entries[i - 1][1:]
+
+  ############################
+  def first_timestamp(self):
+    """Timestamp of the first indexed record, or None if there is none."""
+    return self.timestamps[0] if self.timestamps else None
+
+  ############################
+  def _set_entries(self, entries):
+    self.entries = entries
+    self.timestamps = [entry[0] for entry in entries]
+    self.last_indexed = entries[-1][2] if entries else None
+
+  ############################
+  def _count_tail(self):
+    """Count the records after the last indexed one, so that we know
+    how many lines the logfile has, and how long it is."""
+    offset, line_num = (self.entries[-1][1:] if self.entries else (0, 0))
+    with open(self.filename, 'rb') as logfile:
+      logfile.seek(offset)
+      for line in logfile:
+        offset += len(line)
+        line_num += 1
+    self.num_lines = line_num
+    self.size = offset
+
+############################
+def get_index(filename, build=False, interval=DEFAULT_INDEX_INTERVAL,
+              time_format=timestamp.TIME_FORMAT):
+  """Return the LogfileIndex for a logfile, loaded from its sidecar. If
+  it has no (valid) sidecar, build one if 'build' is True; otherwise
+  return None."""
+  index = LogfileIndex(filename, interval=interval, time_format=time_format)
+  if index.load():
+    return index
+  if not build:
+    return None
+  index.build()
+  index.close()
+  return index
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--build', dest='build', required=True,
+                      help='Wildcarded path of logfiles to index')
+  parser.add_argument('--interval', dest='interval', type=int,
+                      default=DEFAULT_INDEX_INTERVAL,
+                      help='Index every this many records')
+  parser.add_argument('--time_format', dest='time_format',
+                      default=timestamp.TIME_FORMAT,
+                      help='Format of logfile record timestamps')
+  parser.add_argument('--rebuild', dest='rebuild', action='store_true',
+                      default=False,
+                      help='Rebuild indexes even if they appear up to date')
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(filename)s:%(lineno)d %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  for filename in sorted(glob.glob(args.build)):
+    index = LogfileIndex(filename, interval=args.interval,
+                         time_format=args.time_format)
+    if args.rebuild or not index.load():
+      index.build()
+      index.close()
+    print('%s: %d records, %d index entries'
+          % (filename, index.num_lines, len(index.entries)))
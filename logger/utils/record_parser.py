@@ -14,6 +14,7 @@ import logging
 import parse
 import pprint
 import sys
+import time
 
 # Append openrvdas root to syspath prior to importing openrvdas modules
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
@@ -24,6 +25,8 @@ from logger.utils.das_record import DASRecord
 # Dict of format types that extend the default formats recognized by the
 # parse module.
 from logger.utils.record_parser_formats import extra_format_types
+from logger.utils.record_parser_compiler import compile_format
+from logger.utils import definition_cache
 
 DEFAULT_DEFINITION_PATH = 'local/devices/*.yaml'
 DEFAULT_RECORD_FORMAT = '{data_id:w} {timestamp:ti} {field_string}'
@@ -35,7 +38,9 @@ class RecordParser:
                field_patterns=None, metadata=None,
                definition_path=DEFAULT_DEFINITION_PATH,
                return_das_record=False, return_json=False,
-               metadata_interval=None, quiet=False):
+               metadata_interval=None, quiet=False, compile_formats=True,
+               reorder_interval=None, collect_format_timing=False,
+               definition_cache_dir=None):
     """Create a parser that will parse field values out of a text record
     and return either a Python dict of data_id, timestamp and fields,
     a JSON encoding of that dict, or a binary DASRecord.
@@ -66,6 +71,30 @@ class RecordParser:
         metadata_interval seconds.
 
     quiet - if not False, don't complain when unable to parse a record.
+
+    compile_formats - if True, compile delimiter-separated formats into
+        specialized parsers (see logger/utils/record_parser_compiler.py)
+        rather than using parse's general-purpose regular expressions.
+        Results are the same either way.
+
+    reorder_interval - if not None, after every reorder_interval
+        records parsed for a data_id, reorder that data_id's formats so
+        that those that matched most often during the interval are
+        tried first. Note that if more than one of a device type's
+        formats can match the same string, reordering may change which
+        of them is used.
+
+    collect_format_timing - if True, keep track of the time spent trying
+        each format, to be reported by format_stats(). Timing every
+        attempt adds measurably to the cost of parsing, so by default
+        only the number of matches and misses is kept.
+
+    definition_cache_dir - if not None, directory in which to cache the
+        definitions read from definition_path so that other parsers
+        using the same definition_path can skip reading the YAML files,
+        e.g. definition_cache.DEFAULT_CACHE_DIR. Worth it for loggers
+        that are started many at a time; see
+        logger/utils/definition_cache.py.
     ```
     """
     self.quiet = quiet
@@ -83,65 +112,63 @@ class RecordParser:
     self.metadata_interval = metadata_interval
     self.metadata_last_sent = {}
 
+    # Per-format match statistics, and the order in which to try
+    # formats, for each data_id. See parse() and format_stats().
+    self.reorder_interval = reorder_interval
+    self.collect_format_timing = collect_format_timing
+    self.format_entries = {}
+    self.format_parse_count = {}
+
+    if compile_formats:
+      self._compile = compile_format
+    else:
+      self._compile = lambda f: parse.compile(format=f,
+                                              extra_types=extra_format_types)
+
     # If we've been explicitly given the field_patterns we're to use for
     # parsing, compile them now.
     if field_patterns:
-      self.compiled_field_patterns = [
-        parse.compile(format=p, extra_types=extra_format_types)
-        for p in field_patterns
-      ]
+      self.compiled_field_patterns = [self._compile(p)
+                                      for p in field_patterns]
 
     # If we've not been given field_patterns to use for parsing, read in all
     # the devices and device types to compile them.
     else:
       # Fill in the devices and device_types - NOTE: we won't be using
-      # these if 'field_patterns' is provided as an argument.
-      definitions = self._new_read_definitions(definition_path)
+      # these if 'field_patterns' is provided as an argument. If another
+      # parser has already read this definition_path, and none of the
+      # files have changed, use the definitions it cached.
+      cache = None
+      cache_entry = None
+      if definition_cache_dir:
+        cache = definition_cache.DefinitionCache(definition_cache_dir)
+        cache_entry = cache.load(definition_path)
+
+      if cache_entry:
+        definitions = cache_entry['definitions']
+        definition_files = list(cache_entry['files'])
+        definition_globs = cache_entry['globs']
+        cached_metadata = cache_entry.get('metadata', None)
+      else:
+        # Keep track of the files we read so we can cache what's in them
+        self.definition_files = []
+        self.definition_globs = {}
+        definitions = self._new_read_definitions(definition_path)
+        definition_files = self.definition_files
+        definition_globs = self.definition_globs
+        cached_metadata = None
       self.devices = definitions.get('devices', {})
       self.device_types = definitions.get('device_types', {})
 
       # If we haven't been handed a dict of metadata, compile it from
-      # the devices we've read.
-      #
-      # It's a map from variable name to the device and device type it
-      # came from, along with device type variable and its units and
-      # description, if provided in the device type
-      # definition. Compiling this information is kind of excruciating
-      # and voluminous.
+      # the devices we've read, unless it's already been cached.
+      new_metadata = None
       if not metadata and metadata_interval is not None:
-        for device, device_def in self.devices.items(): # e.g. s330
-          device_type_name = device_def.get('device_type', None) # Seapath330
-          if not device_type_name:
-            raise ValueError('Device definition for "%s" has no declaration of '
-                             'its device_type.' % device)
-          device_type_def = self.device_types.get(device_type_name, None)
-          if not device_type_def:
-            raise ValueError('Device type "%s" (declared in definition of "%s")'
-                             ' is undefined.' % (device_type_name, device))
-          device_type_fields = device_type_def.get('fields', None)
-          if not device_type_fields:
-            raise ValueError('Device type "%s" has no fields?'
-                             % device_type_name)
-
-          fields = device_def.get('fields', None)
-          if not fields:
-            raise ValueError('Device "%s" has no fields?!?' % device)
-
-          # e.g. device_type_field = GPSTime, device_field = S330GPSTime
-          for device_type_field, device_field in fields.items():
-            # e.g. GPSTime: {'units':..., 'description':...}
-            field_desc = device_type_fields.get(device_type_field, None)
-            if not field_desc:
-              logging.warning('Device type "%s" has no field corresponding to '
-                              'device field "%s"' % (device_type_name,
-                                                     device_type_field))
-              continue
-            self.metadata[device_field] = {
-              'device': device,
-              'device_type': device_type_name,
-              'device_type_field': device_type_field,
-            }
-            self.metadata[device_field].update(field_desc)
+        if cached_metadata is not None:
+          self.metadata = cached_metadata
+        else:
+          new_metadata = self._compile_metadata()
+          self.metadata = new_metadata
 
       # Some limited error checking: make sure that all devices have a
       # defined device_type.
@@ -154,6 +181,13 @@ class RecordParser:
           raise ValueError('Device type "%s" (declared in definition of "%s") '
                            'is undefined.' % (device_type, device))
 
+      # Now that we've validated the definitions, save them for the
+      # next parser, if they're not already cached.
+      if cache and (not cache_entry or new_metadata is not None):
+        cache.save(definition_path, definitions,
+                   metadata=new_metadata or cached_metadata,
+                   files=definition_files, globs=definition_globs)
+
       # Compile format definitions so that we can run them more
       # quickly. If format is a single string, normalize it into a list
       # to simplify later code.
@@ -164,16 +198,59 @@ class RecordParser:
                            % device_type)
         if type(format) is str:
           try:
-            compiled_format = [parse.compile(format=format,
-                                             extra_types=extra_format_types)]
+            compiled_format = [self._compile(format)]
           except ValueError as e:
             raise ValueError('Bad parser format: "%s": %s' % (format, e))
         else:
-          compiled_format = [parse.compile(format=f,
-                                           extra_types=extra_format_types)
-                             for f in format]
+          compiled_format = [self._compile(f) for f in format]
         self.device_types[device_type]['compiled_format'] = compiled_format
 
+  ############################
+  def _compile_metadata(self):
+    """Compile a metadata dict from the devices and device types we've
+    read.
+
+    It's a map from variable name to the device and device type it
+    came from, along with device type variable and its units and
+    description, if provided in the device type definition. Compiling
+    this information is kind of excruciating and voluminous.
+    """
+    metadata = {}
+    for device, device_def in self.devices.items(): # e.g. s330
+      device_type_name = device_def.get('device_type', None) # Seapath330
+      if not device_type_name:
+        raise ValueError('Device definition for "%s" has no declaration of '
+                         'its device_type.' % device)
+      device_type_def = self.device_types.get(device_type_name, None)
+      if not device_type_def:
+        raise ValueError('Device type "%s" (declared in definition of "%s")'
+                         ' is undefined.' % (device_type_name, device))
+      device_type_fields = device_type_def.get('fields', None)
+      if not device_type_fields:
+        raise ValueError('Device type "%s" has no fields?'
+                         % device_type_name)
+
+      fields = device_def.get('fields', None)
+      if not fields:
+        raise ValueError('Device "%s" has no fields?!?' % device)
+
+      # e.g. device_type_field = GPSTime, device_field = S330GPSTime
+      for device_type_field, device_field in fields.items():
+        # e.g. GPSTime: {'units':..., 'description':...}
+        field_desc = device_type_fields.get(device_type_field, None)
+        if not field_desc:
+          logging.warning('Device type "%s" has no field corresponding to '
+                          'device field "%s"' % (device_type_name,
+                                                 device_type_field))
+          continue
+        metadata[device_field] = {
+          'device': device,
+          'device_type': device_type_name,
+          'device_type_field': device_type_field,
+        }
+        metadata[device_field].update(field_desc)
+    return metadata
+
   ############################
   def parse_record(self, record):
     """Parse an id-prefixed text record into a Python dict of data_id,
@@ -251,7 +328,8 @@ class RecordParser:
     if metadata:
       parsed_record['metadata'] = metadata
 
-    logging.debug('Created parsed record: %s', pprint.pformat(parsed_record))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+      logging.debug('Created parsed record: %s', pprint.pformat(parsed_record))
 
     # What are we going to do with the result we've created?
     if self.return_das_record:
@@ -295,8 +373,10 @@ class RecordParser:
     # Now parse the field_string, based on device type. If something goes
     # wrong during parsing, expect a ValueError.
     try:
-      parsed_fields = self.parse(device_type=device_type, field_string=field_string)
-      logging.debug('Got fields: %s', pprint.pformat(parsed_fields))
+      parsed_fields = self.parse(device_type=device_type,
+                                 field_string=field_string, data_id=data_id)
+      if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug('Got fields: %s', pprint.pformat(parsed_fields))
     except ValueError as e:
       logging.error(str(e))
       return None
@@ -323,25 +403,108 @@ class RecordParser:
         value = value.timestamp()
       fields[variable_name] = value
 
-    logging.debug('Got fields: %s', pprint.pformat(fields))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+      logging.debug('Got fields: %s', pprint.pformat(fields))
     return fields
 
   ############################
-  def parse(self, device_type, field_string):
+  def format_stats(self, data_id=None):
+    """Return a dict, keyed by data_id (or by device_type for calls to
+    parse() that didn't specify a data_id), of lists of per-format
+    statistics, in the order the formats are currently tried:
+
+      {'s330': [{'format': '$INHDT,{HeadingTrue:f},T*{CheckSum:x}',
+                 'hits': 1203, 'misses': 0, 'time': 0.0089},
+                {'format': '$INVTG,...', 'hits': 1190, 'misses': 1203,
+                 'time': 0.0132},
+                ...
+               ],
+       ...
+      }
+
+    'hits' and 'misses' count the records each format did and didn't
+    match, and 'time' (present only if the parser was created with
+    collect_format_timing=True) is the total number of seconds spent
+    trying it. If data_id is specified, return only the stats for that
+    data_id.
+    """
+    stat_names = ['format', 'hits', 'misses']
+    if self.collect_format_timing:
+      stat_names.append('time')
+    keys = [data_id] if data_id is not None else list(self.format_entries)
+    return {key: [{name: entry[name] for name in stat_names}
+                  for entry in self.format_entries.get(key, [])]
+            for key in keys}
+
+  ############################
+  def _new_format_entries(self, key, device_definition):
+    """Create and store the list of formats and their match statistics
+    for key (a data_id or device_type)."""
+    formats = device_definition.get('format', [])
+    if type(formats) is str:
+      formats = [formats]
+    compiled_formats = device_definition.get('compiled_format', None) or []
+    entries = [{'format': format, 'compiled_format': compiled_format,
+                'hits': 0, 'misses': 0, 'time': 0.0, 'recent_hits': 0}
+               for format, compiled_format in zip(formats, compiled_formats)]
+    self.format_entries[key] = entries
+    self.format_parse_count[key] = 0
+    return entries
+
+  ############################
+  def _reorder_formats(self, key):
+    """Reorder the formats for key so that those that matched most often
+    since we last reordered are tried first. The sort is stable, so
+    formats that matched equally often keep their relative order."""
+    entries = self.format_entries[key]
+    entries.sort(key=lambda entry: -entry['recent_hits'])
+    for entry in entries:
+      entry['recent_hits'] = 0
+    self.format_parse_count[key] = 0
+    logging.debug('Reordered formats for %s: %s', key,
+                  [entry['format'] for entry in entries])
+
+  ############################
+  def parse(self, device_type, field_string, data_id=None):
     """Parse a text field_string for the given device_type into a flat Python
     dict; raise ValueError if there are problems, return empty dict if
     there is no match to the provided formats.
 
+    If data_id is specified, match statistics (and, if reorder_interval
+    is set, the order in which formats are tried) are kept for that
+    data_id, otherwise for the device_type.
     """
     device_definition = self.device_types.get(device_type, None)
     if not device_definition:
       raise ValueError('No definition found for device_type "%s"', device_type)
 
-    compiled_format = device_definition.get('compiled_format', None)
-    for trial_format in compiled_format:
-      fields = trial_format.parse(field_string)
+    key = data_id or device_type
+    entries = self.format_entries.get(key, None)
+    if entries is None:
+      entries = self._new_format_entries(key, device_definition)
+
+    fields = None
+    for entry in entries:
+      if self.collect_format_timing:
+        start = time.perf_counter()
+        fields = entry['compiled_format'].parse(field_string)
+        entry['time'] += time.perf_counter() - start
+      else:
+        fields = entry['compiled_format'].parse(field_string)
       if fields:
-        return fields.named
+        entry['hits'] += 1
+        entry['recent_hits'] += 1
+        break
+      entry['misses'] += 1
+
+    # Is it time to move the most frequently matched formats up front?
+    if self.reorder_interval:
+      self.format_parse_count[key] += 1
+      if self.format_parse_count[key] >= self.reorder_interval:
+        self._reorder_formats(key)
+
+    if fields:
+      return fields.named
 
     # Nothing matched, go home empty-handed
     if not self.quiet:
@@ -387,11 +550,13 @@ class RecordParser:
 
     for filespec in filespec_paths.split(','):
       filenames = glob.glob(filespec)
+      self.definition_globs[filespec] = filenames
       if not filenames:
         logging.warning('No files match definition file spec "%s"', filespec)
 
       for filename in filenames:
         file_definitions = read_config.read_config(filename)
+        self.definition_files.append(filename)
 
         for key, val in file_definitions.items():
           # If we have a dict of device definitions, copy them into the
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+"""Compile RecordParser field formats into fast, specialized parsers.
+
+Most device formats are NMEA-like: a literal prefix, then a series of
+fields separated by a delimiter, possibly followed by a literal suffix:
+
+  "$GPHDT,{HeadingTrue:f},T*{CheckSum:x}"
+
+The parse module turns such a format into a single regular expression
+and then converts the matched groups into typed values. For formats like
+the one above we can do better: split the string at the delimiters and
+run a small validator and converter on each column.
+
+compile_format() returns a DelimitedFormat for formats where splitting is
+guaranteed to give the same answer as the full regular expression, and
+falls back to parse.compile() for everything else. Both kinds of object
+have a parse(string) method that returns None if the string doesn't
+match, or an object whose 'named' attribute is a dict of field values.
+
+Splitting is safe when every field but the last is followed by a
+literal whose first character that field can never contain. The
+characters each type may contain are described by 'chars' below for
+built-in parse types, and by a 'chars' attribute on the functions in
+record_parser_formats.extra_format_types for our own types. Types
+without such a description can only appear as the last field.
+
+To keep results identical to those of parse, the column validators
+below mirror the regular expressions parse itself generates for each
+type, and are matched case-insensitively, as parse does.
+"""
+import logging
+import parse
+import re
+import sys
+
+# Append openrvdas root to syspath prior to importing openrvdas modules
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.record_parser_formats import extra_format_types
+
+# Flags parse uses when compiling its (case-insensitive) expressions
+PARSE_RE_FLAGS = re.IGNORECASE | re.DOTALL
+
+# Matches a simple named field, e.g. {GPSTime:f} or {Message}
+FIELD_RE = re.compile(r'{([A-Za-z]\w*)(?::([^}]+))?}')
+
+# Types that parse considers numeric, allowing them a leading sign. Note
+# that parse checks for a *substring* of this, so we do too.
+NUMERIC_TYPES = 'n%fFegdobxEGX'
+
+################################################################################
+def _int_convert(base=None):
+  """Return a function that converts an integer string the way parse does."""
+  parse_int_convert = parse.int_convert(base)
+
+  def convert(text):
+    # Shortcut the common case of a plain decimal number
+    if base is None and (text.isdigit() or
+                         (text[:1] == '-' and text[1:].isdigit())):
+      return int(text)
+    return parse_int_convert(text, None)
+  return convert
+
+# Regular expressions, converters and possible characters for the built-in
+# parse types we know how to handle. The patterns are those that parse
+# generates for a bare {name:type} field, less the sign prefix it adds
+# to numeric types.
+BUILTIN_TYPES = {
+  'd': (r'[-+ ]?[0-9]+|[-+ ]?0[xX][0-9a-fA-F]+'
+        r'|[-+ ]?0[bB][01]+|[-+ ]?0[oO][0-7]+',
+        _int_convert(),
+        r'[-+ 0-9a-fxob]'),
+  'x': (r'(0[xX])?[0-9a-fA-F]+',
+        _int_convert(16),
+        r'[-+ 0-9a-fx]'),
+  'f': (r'(?:\d*\.\d+|nan|NAN|inf|INF)',
+        float,
+        r'[-+ \d.naif]'),
+  'g': (r'\d+(\.\d+)?([eE][-+]?\d+)?|nan|NAN|[-+]?inf|[-+]?INF',
+        float,
+        r'[-+ \d.enaif]'),
+  'w': (r'\w+', None, r'\w'),
+  's': (r'\s+', None, r'\s'),
+}
+
+################################################################################
+class DelimitedFormat:
+  """A parser for formats made of a literal prefix, fields separated by
+  literals and a literal suffix. Use compile_format() to create one."""
+  ############################
+  def __init__(self, format, prefix, fields, separators, suffix):
+    """
+    ```
+    format      The original format string
+
+    prefix      Literal text preceding the first field
+
+    fields      List of (name, validator, converter) tuples, where
+                validator is a compiled regex that must match the whole
+                column, and converter is a function or None.
+
+    separators  List of literals separating fields; one fewer than fields.
+
+    suffix      Literal text following the last field
+    ```
+    """
+    self.format = format
+    self.fields = fields
+    self.prefix_len = len(prefix)
+    self.prefix_re = re.compile(re.escape(prefix), PARSE_RE_FLAGS)
+    self.suffix_len = len(suffix)
+    self.suffix_re = re.compile(re.escape(suffix) + r'\Z', PARSE_RE_FLAGS)
+    self.separators = [(sep[0], re.compile(re.escape(sep), PARSE_RE_FLAGS),
+                        len(sep))
+                       for sep in separators]
+
+  ############################
+  def __repr__(self):
+    return '<DelimitedFormat %r>' % self.format
+
+  ############################
+  def parse(self, string):
+    """Parse string, returning None if it doesn't match the format, and a
+    parse.Result whose 'named' attribute holds the field values if it does.
+    """
+    start = 0
+    if self.prefix_len:
+      if not self.prefix_re.match(string):
+        return None
+      start = self.prefix_len
+
+    end = len(string) - self.suffix_len
+    if end < start:
+      return None
+    if self.suffix_len and not self.suffix_re.match(string, end):
+      return None
+
+    # Check every column before converting any of them: like parse,
+    # converters should only ever see strings that match the whole
+    # format, so that a string that doesn't can't make them raise or
+    # complain.
+    columns = []
+    fields = self.fields
+    for i, (first_char, separator_re, separator_len) in enumerate(self.separators):
+      # The field can't contain the separator's first character, so the
+      # first occurrence of that character is where the field ends.
+      sep_start = string.find(first_char, start, end)
+      if sep_start == -1:
+        return None
+      if not separator_re.match(string, sep_start, end):
+        return None
+      column = string[start:sep_start]
+      if not fields[i][1].fullmatch(column):
+        return None
+      columns.append(column)
+      start = sep_start + separator_len
+
+    column = string[start:end]
+    if not fields[-1][1].fullmatch(column):
+      return None
+    columns.append(column)
+
+    named = {}
+    for (name, validator, converter), column in zip(fields, columns):
+      named[name] = converter(column) if converter else column
+    return parse.Result((), named, {})
+
+################################################################################
+def _field_type(format_type, extra_types):
+  """Return (pattern, converter, chars) for a field type, or None if we
+  don't know how to handle it. Extra types take precedence, as in parse."""
+  if not format_type:
+    # A bare {name}: parse uses a lazy '.+?', which may contain anything
+    return (r'.+?', None, None)
+
+  if format_type in extra_types:
+    type_converter = extra_types[format_type]
+    pattern = getattr(type_converter, 'pattern', None)
+    if pattern is None:
+      return None
+    chars = getattr(type_converter, 'chars', None)
+  elif format_type in BUILTIN_TYPES:
+    pattern, type_converter, chars = BUILTIN_TYPES[format_type]
+  else:
+    return None
+
+  # Like parse, allow numeric types a leading sign
+  if format_type in NUMERIC_TYPES:
+    pattern = r'[-+ ]?' + pattern
+    if chars is not None:
+      chars = r'[-+ ]|' + chars
+  return (pattern, type_converter, chars)
+
+############################
+def _compile_delimited(format, extra_types):
+  """Try to create a DelimitedFormat for format. Return None if we can't
+  guarantee it will give the same results as parse."""
+  if '{{' in format or '}}' in format:
+    return None
+
+  pieces = FIELD_RE.split(format)
+  # pieces is [literal, name, type, literal, name, type, ..., literal]
+  literals = pieces[0::3]
+  names = pieces[1::3]
+  types = pieces[2::3]
+  if not names:
+    return None
+
+  # Anything left over that looks like a field is something we don't
+  # handle: positional fields, attribute lookups, etc.
+  if any('{' in literal or '}' in literal for literal in literals):
+    return None
+  # Repeated names require matching earlier values; leave those to parse
+  if len(set(names)) != len(names):
+    return None
+
+  fields = []
+  for i, (name, format_type) in enumerate(zip(names, types)):
+    field_type = _field_type(format_type or '', extra_types)
+    if field_type is None:
+      return None
+    pattern, converter, chars = field_type
+
+    # Every field but the last must be followed by a non-empty literal
+    # whose first character the field cannot contain.
+    if i < len(names) - 1:
+      separator = literals[i + 1]
+      if not separator or chars is None:
+        return None
+      if re.match(chars, separator[0], PARSE_RE_FLAGS):
+        return None
+
+    validator = re.compile('(?:%s)' % pattern, PARSE_RE_FLAGS)
+    fields.append((name, validator, converter))
+
+  return DelimitedFormat(format=format, prefix=literals[0], fields=fields,
+                         separators=literals[1:-1], suffix=literals[-1])
+
+############################
+def compile_format(format, extra_types=extra_format_types):
+  """Compile a parse-style format, returning a DelimitedFormat if the
+  format allows it, and a parse.Parser otherwise. Raise ValueError if
+  parse itself can't compile the format."""
+  # Always compile with parse, so that bad formats are reported the same
+  # way whether or not we can speed them up.
+  compiled = parse.compile(format=format, extra_types=extra_types)
+  delimited = _compile_delimited(format, extra_types)
+  if delimited:
+    logging.debug('Compiled format "%s" as delimited format', format)
+    return delimited
+  return compiled
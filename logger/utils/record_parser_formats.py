@@ -35,6 +35,11 @@ The recognized format types we add are:
 See 'Custom Type Conversions' in https://pypi.org/project/parse/ for a
 discussion of how format types work.
 
+In addition to its 'pattern', each type declares the 'chars' that
+pattern may match, as a regex character class. The compiler in
+logger/utils/record_parser_compiler.py uses these to decide whether a
+format can be parsed by simply splitting it at its delimiters.
+
 TODO: allow device_type definitions to hand in their own format types.
 """
 import sys
@@ -51,6 +56,7 @@ def optional_d(text):
   else:
     return None
 optional_d.pattern = r'\s*\d*'
+optional_d.chars = r'[\s\d]'
 
 ##########
 def optional_f(text):
@@ -60,6 +66,7 @@ def optional_f(text):
   else:
     return None
 optional_f.pattern = r'(\s*[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?|)'
+optional_f.chars = r'[\s\d.+\-e]'
 
 ##########
 def optional_g(text):
@@ -71,6 +78,7 @@ def optional_g(text):
   else:
     return None
 optional_g.pattern = r'(#VALUE!|\s*[-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?|\d*)'
+optional_g.chars = r'[\s\d.+\-e#valu!]'
 
 ##########
 def optional_w(text):
@@ -81,6 +89,7 @@ def optional_w(text):
   else:
     return None
 optional_w.pattern = r'\w*'
+optional_w.chars = r'\w'
 
 ##########
 def nmea_lat_lon(text):
@@ -102,6 +111,7 @@ def nmea_lat_lon(text):
   else:
     return None
 nmea_lat_lon.pattern = r'(\s*(\d+(\.\d*)?|\.\d+)?|)'
+nmea_lat_lon.chars = r'[\s\d.]'
 
 ##########
 def nmea_lat_lon_dir(text):
@@ -129,6 +139,7 @@ def nmea_lat_lon_dir(text):
   else:
     return None
 nmea_lat_lon_dir.pattern = r'(\s*(\d+(\.\d*)?|\.\d+),[NEWS]?|)'
+nmea_lat_lon_dir.chars = r'[\s\d.,news]'
 
 ##########
 def not_comma(text):
@@ -139,6 +150,7 @@ def not_comma(text):
   else:
     return None
 not_comma.pattern = r'[^,]*'
+not_comma.chars = r'[^,]'
 
 extra_format_types = dict(
   od=optional_d,
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""A first-in, first-out holding area for DASRecords that couldn't be
+delivered (e.g. because the database is unreachable), so that they
+can be delivered later.
+
+If given a filename, the spool is a write-ahead file of JSON-encoded
+records, one per line: records are appended and flushed to disk
+before put() returns, so they survive the process being killed, and a
+spool file left over by an earlier process is picked up on startup.
+Without a filename, records are held only in memory.
+
+The file begins with a fixed-width header line holding the number of
+records at its start that have already been removed, so removing
+records means rewriting only the header. The file is compacted once
+the removed records outnumber those remaining.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.das_record import DASRecord
+
+# Width of the spool file's header line, not counting the newline
+HEADER_WIDTH = 20
+
+################################################################################
+class RecordSpool:
+  ############################
+  def __init__(self, filename=None, max_records=0):
+    """
+    ```
+    filename     Path of the file in which to hold spooled records. If
+                 None, hold them in memory.
+
+    max_records  If non-zero, the maximum number of records to hold;
+                 once reached, the oldest records are discarded to make
+                 room for new ones.
+    ```
+    """
+    self.filename = filename
+    self.max_records = max_records
+    self.spooled = []  # records, of which the first self.head are removed
+    self.head = 0
+    self.lock = threading.Lock()
+
+    if filename and os.path.exists(filename):
+      with open(filename, 'r') as spool_file:
+        removed = 0
+        header = spool_file.readline().strip()
+        if header.isdigit():
+          removed = int(header)
+        else:
+          spool_file.seek(0)
+        for line in spool_file:
+          if removed:
+            removed -= 1
+            continue
+          line = line.strip()
+          if not line:
+            continue
+          try:
+            self.spooled.append(self._from_json(line))
+          except (ValueError, AttributeError):
+            logging.warning('Skipping unreadable line in spool file %s: %s',
+                            filename, line)
+      if self.spooled:
+        logging.warning('Found %d spooled records in %s',
+                        len(self.spooled), filename)
+      self._trim()
+
+      # Start with a compacted file, so its lines match self.spooled
+      self._compact()
+
+  ############################
+  def __len__(self):
+    return len(self.spooled) - self.head
+
+  ############################
+  def put(self, records):
+    """Add a list of DASRecords to the end of the spool."""
+    if not records:
+      return
+    with self.lock:
+      self.spooled.extend(records)
+      if self.filename:
+        new_file = not os.path.exists(self.filename)
+        with open(self.filename, 'a') as spool_file:
+          if new_file:
+            spool_file.write(self._header())
+          for record in records:
+            spool_file.write(record.as_json() + '\n')
+          spool_file.flush()
+          os.fsync(spool_file.fileno())
+      if self._trim():
+        self._removed()
+
+  ############################
+  def records(self, max_records=0):
+    """Return (without removing them) the oldest max_records records in
+    the spool, or all of them if max_records is zero."""
+    with self.lock:
+      if max_records:
+        return self.spooled[self.head:self.head + max_records]
+      return self.spooled[self.head:]
+
+  ############################
+  def remove(self, num_records):
+    """Remove the oldest num_records records from the spool, e.g. once
+    they've been delivered."""
+    with self.lock:
+      self.head += min(num_records, len(self.spooled) - self.head)
+      self._removed()
+
+  ############################
+  @staticmethod
+  def _from_json(line):
+    """Recreate a DASRecord from its as_json() encoding. (We parse it
+    ourselves rather than with DASRecord(json=...), which uses the much
+    slower YAML parser.)"""
+    parsed = json.loads(line)
+    return DASRecord(data_id=parsed.get('data_id', None),
+                     message_type=parsed.get('message_type', None),
+                     timestamp=parsed.get('timestamp', None),
+                     fields=parsed.get('fields', {}),
+                     metadata=parsed.get('metadata', {}))
+
+  ############################
+  def _trim(self):
+    """If we're holding more than max_records records, discard the
+    oldest. Return True if we discarded any. Caller must hold lock."""
+    excess = len(self.spooled) - self.head - self.max_records
+    if not self.max_records or excess <= 0:
+      return False
+    logging.error('Record spool full; discarding %d oldest records', excess)
+    self.head += excess
+    return True
+
+  ############################
+  def _header(self):
+    """Return the spool file header recording how many records at the
+    start of the file have been removed."""
+    return '%0*d\n' % (HEADER_WIDTH, self.head)
+
+  ############################
+  def _removed(self):
+    """Note that records have been removed from the head of the spool,
+    compacting it if they now outnumber those remaining, or else just
+    updating the spool file's header. Caller must hold lock."""
+    if self.head >= len(self.spooled) - self.head:
+      self._compact()
+    elif self.filename:
+      with open(self.filename, 'r+') as spool_file:
+        spool_file.write(self._header())
+        spool_file.flush()
+        os.fsync(spool_file.fileno())
+
+  ############################
+  def _compact(self):
+    """Drop removed records, replacing the spool file with our current
+    contents. Write to a temporary file first so that a crash can't
+    leave us with a partial spool. Caller must hold lock."""
+    self.spooled = self.spooled[self.head:]
+    self.head = 0
+    if not self.filename:
+      return
+    if not self.spooled:
+      if os.path.exists(self.filename):
+        os.remove(self.filename)
+      return
+    temp_filename = self.filename + '.tmp'
+    with open(temp_filename, 'w') as spool_file:
+      spool_file.write(self._header())
+      for record in self.spooled:
+        spool_file.write(record.as_json() + '\n')
+      spool_file.flush()
+      os.fsync(spool_file.fileno())
+    os.replace(temp_filename, self.filename)
@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
-"""
+"""Algorithms for subsampling (e.g. averaging) timestamped values.
+
+subsample() computes results for a single request. SubsampleCache
+computes results incrementally and shares them among all requests for
+the same field and algorithm; the CachedDataServer uses it to serve
+subsampled values to its clients.
 """
 import asyncio
+import bisect
 import json
 import logging
+import math
 import pprint
 import sys
-import threading
 import time
 import websockets
 
@@ -101,3 +107,189 @@ def subsample(algorithm, values, latest_timestamp, now):
     logging.warning('Function subsample() received unrecognized algorithm '
                     'type: %s', alg_type)
     return None
+
+################################################################################
+class BoxcarAverage:
+  """Incrementally compute boxcar averages of a field's values.
+
+  Unlike subsample(), which places output timestamps relative to the
+  last one a particular client received, BoxcarAverage emits averages
+  at fixed multiples of 'interval' seconds. That lets a single series
+  of averages be computed once and shared by every client that asks
+  for the same algorithm on the same field. Averages are computed by
+  sliding a running sum over the values that fall within their windows.
+
+  An average is emitted once 'now' has passed the end of its window,
+  but values may arrive late, so it is only final once a value at or
+  beyond the end of its window has arrived. Until then it is
+  provisional, and recomputed on each update, so that late values are
+  included and windows that were empty get averages once their values
+  arrive. Values are assumed to arrive in timestamp order.
+  """
+  def __init__(self, interval=10, window=10):
+    """
+    ```
+    interval  Seconds between output values
+
+    window    Width in seconds of the window of values averaged for each
+              output value. All values within the window get equal weight.
+    ```
+    """
+    self.interval = interval
+    self.window = window
+
+    # Parallel lists of output timestamps and their final averages
+    self.timestamps = []
+    self.averages = []
+
+    # (timestamp, average) pairs for later, provisional averages
+    self.provisional = []
+
+    # Index (timestamp / interval) of the last final output timestamp
+    self.last_index = None
+
+  ############################
+  def update(self, values, now):
+    """Compute averages for any output timestamps whose windows have
+    closed by 'now', and recompute provisional ones. Values may be a list of (timestamp, value) pairs,
+    in timestamp order, or an object with a since(timestamp) method
+    that returns such a list, such as the FieldBuffer and FieldList
+    classes in server/field_buffer.py."""
+    if not values:
+      return
+    half_window = self.window / 2
+
+    # Drop averages that could no longer be computed from the values
+    # we've been given, e.g. because the values have been cleaned up.
+    oldest_timestamp = values[0][0] + half_window
+    discard = bisect.bisect_left(self.timestamps, oldest_timestamp)
+    if discard:
+      del self.timestamps[:discard]
+      del self.averages[:discard]
+
+    # Which output timestamps are due? Start after the last final one
+    # (or at the first whose window is entirely covered by our values),
+    # and end at the last one whose window has closed. Of those, the
+    # ones whose windows end before our newest value are final; later
+    # windows that begin before it are provisional, and windows that
+    # begin after it are empty (for now).
+    if self.last_index is None:
+      first_index = math.ceil(oldest_timestamp / self.interval)
+    else:
+      first_index = self.last_index + 1
+    newest_timestamp = values[-1][0]
+    last_index = min(math.floor((now - half_window) / self.interval),
+                     math.ceil((newest_timestamp + half_window) / self.interval))
+    final_index = min(last_index,
+                      math.floor((newest_timestamp - half_window) / self.interval))
+    self.provisional = []
+    if first_index > last_index:
+      return
+
+    # Get the values that may fall within these windows
+    window_start = first_index * self.interval - half_window
+    if hasattr(values, 'since'):
+      window_values = values.since(window_start)
+    else:
+      window_values = [pair for pair in values if pair[0] > window_start]
+
+    # Slide a window across the values, adding values as they enter it
+    # and subtracting them as they leave.
+    total = 0
+    count = 0
+    enter = leave = 0
+    num_values = len(window_values)
+    for index in range(first_index, last_index + 1):
+      ts = index * self.interval
+      while (enter < num_values and
+             window_values[enter][0] < ts + half_window):
+        value = window_values[enter][1]
+        if type(value) in [int, float, bool]:
+          total += value
+          count += 1
+        else:
+          logging.warning('Non-numeric input in subsample: %s', value)
+        enter += 1
+      while leave < enter and window_values[leave][0] <= ts - half_window:
+        value = window_values[leave][1]
+        if type(value) in [int, float, bool]:
+          total -= value
+          count -= 1
+        leave += 1
+
+      if not count:
+        continue
+      if index <= final_index:
+        self.timestamps.append(ts)
+        self.averages.append(total / count)
+      else:
+        self.provisional.append((ts, total / count))
+    if final_index >= first_index:
+      self.last_index = final_index
+
+  ############################
+  def results_since(self, timestamp):
+    """Return a list of (timestamp, average) pairs for output timestamps
+    later than the passed timestamp."""
+    start = bisect.bisect_right(self.timestamps, timestamp)
+    return (list(zip(self.timestamps[start:], self.averages[start:])) +
+            [pair for pair in self.provisional if pair[0] > timestamp])
+
+################################################################################
+class SubsampleCache:
+  """Subsampled results shared across clients, keyed by field name and
+  algorithm specification, so that each is computed only once however
+  many clients ask for it. Not locked; it must only be used from a
+  single thread (in CachedDataServer, the one running its event loop)."""
+  # Subsample algorithms we know how to compute incrementally
+  ALGORITHMS = {
+    'boxcar_average': BoxcarAverage,
+  }
+
+  def __init__(self):
+    self.engines = {}
+
+  ############################
+  def subsample(self, field, algorithm, values, latest_timestamp, now):
+    """Drop-in replacement for subsample() that shares its results.
+    Callers must ensure that the values passed for a given field
+    are not modified while this call is in progress.
+
+    field        Name of field whose values are being subsampled
+
+    algorithm    Specification of the algorithm to be used, e.g.
+                 {'type': 'boxcar_average', 'interval': 10, 'window': 10}
+
+    values       List of values to be averaged in format of
+                 [(timestamp, value), (timestamp, value),...]
+
+    latest_timestamp
+                 Timestamp of the last value that was output
+
+    now          Timestamp now
+    """
+    if not type(algorithm) is dict:
+      logging.warning('SubsampleCache handed non-dict algorithm '
+                      'specification: %s', algorithm)
+      return None
+    if not values:
+      logging.info('SubsampleCache handed empty values list')
+      return None
+
+    alg_type = algorithm.get('type', None)
+    engine_class = self.ALGORITHMS.get(alg_type, None)
+    if engine_class is None:
+      logging.warning('SubsampleCache received unrecognized algorithm '
+                      'type: %s', alg_type)
+      return None
+
+    interval = algorithm.get('interval', 10)
+    window = algorithm.get('window', 10)
+    key = (field, alg_type, interval, window)
+    engine = self.engines.get(key, None)
+    if engine is None:
+      engine = engine_class(interval=interval, window=window)
+      self.engines[key] = engine
+
+    engine.update(values, now)
+    return engine.results_since(latest_timestamp) or None
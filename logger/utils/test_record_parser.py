@@ -2,6 +2,7 @@
 
 import json
 import logging
+import os
 import pprint
 import sys
 import tempfile
@@ -14,6 +15,7 @@ from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(r
 
 from logger.utils.record_parser import RecordParser
 from logger.utils.das_record import DASRecord
+from logger.utils.definition_cache import DefinitionCache
 
 DEFINITIONS = """
 ######################################
@@ -419,6 +421,21 @@ grv1 2017-11-10T01:00:09.568Z 01:024858 00
 grv1 2017-11-10T01:00:10.570Z 01:025187 00
 grv1 2017-11-10T01:00:11.571Z 01:025013 00""".split('\n')
 
+GYRO_DEFINITIONS = """
+devices:
+  gyro:
+    device_type: "Gyro"
+    fields:
+      HeadingTrue: "GyroHeadingTrue"
+device_types:
+  Gyro:
+    format: "$HEHDT,{HeadingTrue:f},T*{CheckSum:x}"
+    fields:
+      HeadingTrue:
+        units: "degrees"
+        description: "True heading"
+"""
+
 KNUD_RECORDS = """knud 2017-11-04T05:15:42.994693Z 3.5kHz,5188.29,0,,,,1500,-39.836439,-37.847002
 knud 2017-11-04T05:15:43.250057Z 3.5kHz,5188.69,0,,,,1500,-39.836743,-37.847468
 knud 2017-11-04T05:15:43.500259Z 3.5kHz,5189.04,0,,,,1500,-39.837049,-37.847935
@@ -540,6 +557,95 @@ class TestRecordParser(unittest.TestCase):
                                        'Seap200HeadingTrue': 235.77,
                                        'Seap200Pitch': 0.01}})
 
+  ############################
+  def test_format_stats_and_reordering(self):
+    plain = RecordParser(definition_path=self.device_filename)
+    p = RecordParser(definition_path=self.device_filename, reorder_interval=5,
+                     collect_format_timing=True)
+
+    # HDT records are matched by the second format listed
+    hdt_records = [r for r in SEAP_RECORDS if '$GPHDT' in r]
+    for record in hdt_records:
+      self.assertEqual(p.parse_record(record), plain.parse_record(record))
+
+    stats = p.format_stats('seap')['seap']
+    hdt_stats = [s for s in stats if s['format'].startswith('$GPHDT')][0]
+    self.assertEqual(hdt_stats['hits'], len(hdt_records))
+    self.assertEqual(hdt_stats['misses'], 0)
+    self.assertGreater(hdt_stats['time'], 0)
+
+    # After five records, HDT should have been moved to the front, so
+    # the GGA format before it stops accumulating misses.
+    self.assertTrue(stats[0]['format'].startswith('$GPHDT'))
+    gga_stats = [s for s in stats if s['format'].startswith('$GPGGA')][0]
+    self.assertEqual(gga_stats['misses'], 5)
+
+    # Everything should still parse the same after reordering
+    for record in SEAP_RECORDS:
+      self.assertEqual(p.parse_record(record), plain.parse_record(record))
+
+    # Without reorder_interval, formats stay in the order defined
+    stats = plain.format_stats()['seap']
+    self.assertTrue(stats[0]['format'].startswith('$GPGGA'))
+
+    # Without collect_format_timing, only hits and misses are counted
+    self.assertNotIn('time', stats[0])
+    self.assertGreater(sum(s['hits'] for s in stats), 0)
+
+  ############################
+  def test_definition_cache(self):
+    cache_dir = self.tmpdir_name + '/cache'
+    cache = DefinitionCache(cache_dir)
+    self.assertIsNone(cache.load(self.new_device_filename))
+
+    p = RecordParser(definition_path=self.new_device_filename,
+                     definition_cache_dir=cache_dir)
+    entry = cache.load(self.new_device_filename)
+    self.assertIsNotNone(entry)
+    self.assertEqual(sorted(entry['files']),
+                     sorted([self.new_device_filename, self.included_filename]))
+
+    # Parsers created from the cache should parse the same as others,
+    # which by default don't use a cache.
+    cached = RecordParser(definition_path=self.new_device_filename,
+                          definition_cache_dir=cache_dir)
+    uncached = RecordParser(definition_path=self.new_device_filename)
+    for record in GRV1_RECORDS + SEAP_RECORDS:
+      self.assertEqual(cached.parse_record(record),
+                       uncached.parse_record(record))
+
+    # Touching an included file without changing it leaves the cache
+    # valid; changing its contents invalidates it.
+    os.utime(self.included_filename, (0, 0))
+    self.assertIsNotNone(cache.load(self.new_device_filename))
+    with open(self.included_filename, 'a') as f:
+      f.write('\n# A new comment\n')
+    self.assertIsNone(cache.load(self.new_device_filename))
+
+    # A parser that wants metadata should add it to the cache entry
+    gyro_filename = self.tmpdir_name + '/gyro.yaml'
+    with open(gyro_filename, 'w') as f:
+      f.write(GYRO_DEFINITIONS)
+    p = RecordParser(definition_path=gyro_filename,
+                     definition_cache_dir=cache_dir)
+    self.assertIsNone(cache.load(gyro_filename)['metadata'])
+    p = RecordParser(definition_path=gyro_filename,
+                     definition_cache_dir=cache_dir, metadata_interval=10)
+    self.assertEqual(p.metadata['GyroHeadingTrue']['units'], 'degrees')
+    self.assertEqual(cache.load(gyro_filename)['metadata'], p.metadata)
+
+    # Cache files that others could have written shouldn't be loaded
+    os.chmod(cache_dir, 0o777)
+    with self.assertLogs(logging.getLogger(), logging.WARNING):
+      self.assertIsNone(cache.load(gyro_filename))
+    os.chmod(cache_dir, 0o700)
+    cache_filename = cache.cache_filename(gyro_filename)
+    os.chmod(cache_filename, 0o666)
+    with self.assertLogs(logging.getLogger(), logging.WARNING):
+      self.assertIsNone(cache.load(gyro_filename))
+    os.chmod(cache_filename, 0o600)
+    self.assertIsNotNone(cache.load(gyro_filename))
+
   ############################
   def test_inline_definitions(self):
     p = RecordParser(record_format='{timestamp:ti} {field_string}',
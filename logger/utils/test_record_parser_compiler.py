@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import logging
+import parse
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.record_parser_compiler import compile_format, DelimitedFormat
+from logger.utils.record_parser_formats import extra_format_types
+
+# Formats that should compile to DelimitedFormats, and strings to try them on
+DELIMITED = {
+  '$GPHDT,{HeadingTrue:f},T*{CheckSum:x}': [
+    '$GPHDT,235.95,T*1B',
+    '$gphdt,235.95,t*1b',
+    '$GPHDT,-235.95,T*1B',
+    '$GPHDT,235,T*1B',
+    '$GPHDT,235.95,T*',
+    '$GPHDT,235.95,X*1B',
+    '$GPHDT,235.95,T*1B,',
+  ],
+  '$GPGGA,{GPSTime:f},{Latitude:nlat},{NorS:w},{Longitude:nlat},{EorW:w},'
+  '{FixQuality:d},{NumSats:d},{HDOP:of},{AntennaHeight:of},M,'
+  '{GeoidHeight:of},M,{LastDGPSUpdate:of},{DGPSStationID:od}*{CheckSum:x}': [
+    '$GPGGA,002705.69,7633.076963,S,16833.725568,E,1,11,0.8,-5.24,M,'
+    ',M,,*6E',
+    '$GPGGA,002705.69,7633.076963,S,16833.725568,E,1,11,0.8,-5.24,M,'
+    '-55.33,M,3.0,0101*6E',
+    '$GPGGA,002705.69,7633.076963,S,16833.725568,E,1,0x1,0.8,-5.24,M,'
+    ',M,,*6E',
+    '$GPGGA,002705.69,7633.076963,S,16833.725568,E,1,11,0.8,-5.24,M,,*6E',
+  ],
+  '{Message}': ['anything at all', ''],
+  '{Value:d},{Units}': ['12,m/s', '+12,m/s', '12', 'x,m/s', '12,a,b'],
+}
+
+# Formats that we expect to be left to parse
+NOT_DELIMITED = [
+  '{Value:g} {Units:w}',          # space may be part of a number's sign
+  '{First},{Second}',             # untyped field followed by a separator
+  '{Value:d}{Units:w}',           # no separator between fields
+  '{:d},{Name:w}',                # anonymous field
+  '{Value:d},{Value:d}',          # repeated field name
+  '{{{Value:d}}}',                # escaped braces
+  '{Time:ti},{Value:d}',          # type we don't know how to split
+]
+
+class TestRecordParserCompiler(unittest.TestCase):
+  ############################
+  def test_delimited(self):
+    for format, strings in DELIMITED.items():
+      compiled = compile_format(format)
+      self.assertIsInstance(compiled, DelimitedFormat, format)
+
+      parser = parse.compile(format, extra_types=extra_format_types)
+      for string in strings:
+        expected = parser.parse(string)
+        result = compiled.parse(string)
+        if expected is None:
+          self.assertIsNone(result, string)
+        else:
+          self.assertEqual(result.named, expected.named, string)
+
+  ############################
+  def test_not_delimited(self):
+    for format in NOT_DELIMITED:
+      self.assertIsInstance(compile_format(format), parse.Parser, format)
+
+  ############################
+  def test_convert_only_matches(self):
+    # Strings whose first columns would make their converters raise or
+    # warn, but which don't match the whole format, should just fail to
+    # match, as they do with parse.
+    formats = {'$X,{A:od},{B:d}': ['$X, ,abc'],
+               '$X,{Lat:nlat},{NorS:w},{Count:d}': ['$X,9999.0,N,abc',
+                                                    '$X,7633.07,N,']}
+    for format, strings in formats.items():
+      compiled = compile_format(format)
+      self.assertIsInstance(compiled, DelimitedFormat, format)
+      parser = parse.compile(format, extra_types=extra_format_types)
+      for string in strings:
+        self.assertIsNone(parser.parse(string), string)
+        with self.assertNoLogs(level='WARNING'):
+          self.assertIsNone(compiled.parse(string), string)
+
+  ############################
+  def test_bad_format(self):
+    with self.assertRaises(ValueError):
+      compile_format('{Value:no_such_type}')
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
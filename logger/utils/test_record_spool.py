@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.das_record import DASRecord
+from logger.utils.record_spool import RecordSpool
+
+def make_records(start, stop):
+  return [DASRecord(data_id='gyr1', timestamp=1000.0 + i,
+                    fields={'Heading': i * 1.5, 'Label': 'h%d' % i})
+          for i in range(start, stop)]
+
+class TestRecordSpool(unittest.TestCase):
+  ############################
+  def test_memory(self):
+    spool = RecordSpool()
+    spool.put(make_records(0, 5))
+    spool.put(make_records(5, 10))
+    self.assertEqual(len(spool), 10)
+    self.assertEqual(spool.records(3), make_records(0, 3))
+    spool.remove(3)
+    self.assertEqual(spool.records(), make_records(3, 10))
+
+  ############################
+  def test_file(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/spool'
+      spool = RecordSpool(filename=filename)
+      spool.put(make_records(0, 5))
+      spool.put(make_records(5, 10))
+      spool.remove(4)
+
+      # A new spool picks up where the old one left off
+      spool = RecordSpool(filename=filename)
+      self.assertEqual(spool.records(), make_records(4, 10))
+
+      # Once emptied, the spool file goes away
+      spool.remove(len(spool))
+      self.assertFalse(os.path.exists(filename))
+      self.assertEqual(len(RecordSpool(filename=filename)), 0)
+
+  ############################
+  def test_compaction(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/spool'
+      spool = RecordSpool(filename=filename)
+      spool.put(make_records(0, 10))
+      size = os.path.getsize(filename)
+
+      # Removing fewer records than remain only updates the header...
+      spool.remove(3)
+      spool.remove(1)
+      self.assertEqual(os.path.getsize(filename), size)
+      self.assertEqual(RecordSpool(filename=filename).records(),
+                       make_records(4, 10))
+
+      # ...until the removed records outnumber the rest
+      spool = RecordSpool(filename=filename)
+      spool.put(make_records(10, 14))
+      size = os.path.getsize(filename)
+      spool.remove(4)
+      self.assertEqual(os.path.getsize(filename), size)
+      spool.remove(1)
+      self.assertLess(os.path.getsize(filename), size)
+      self.assertEqual(spool.records(), make_records(9, 14))
+      self.assertEqual(RecordSpool(filename=filename).records(),
+                       make_records(9, 14))
+
+  ############################
+  def test_max_records(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filename = tmpdirname + '/spool'
+      spool = RecordSpool(filename=filename, max_records=6)
+      with self.assertLogs(logging.getLogger(), logging.ERROR):
+        spool.put(make_records(0, 10))
+      self.assertEqual(spool.records(), make_records(4, 10))
+      self.assertEqual(RecordSpool(filename=filename).records(),
+                       make_records(4, 10))
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
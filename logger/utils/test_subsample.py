@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import logging
+import random
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.subsample import BoxcarAverage, SubsampleCache, subsample
+
+class TestSubsample(unittest.TestCase):
+  ############################
+  def test_boxcar_average(self):
+    random.seed(1)
+    values = []
+    ts = 1000.0
+    for i in range(500):
+      ts += random.uniform(0.1, 2)
+      values.append((ts, random.uniform(-10, 10)))
+
+    interval, window = 5, 12
+    average = BoxcarAverage(interval=interval, window=window)
+
+    # Feed values in incrementally, as they'd arrive
+    for now in range(1000, int(ts) + 20, 7):
+      average.update([pair for pair in values if pair[0] <= now], now)
+    results = average.results_since(0)
+    self.assertTrue(results)
+
+    # Compare against brute-force averages over the same windows
+    for result_ts, result in results:
+      self.assertEqual(result_ts % interval, 0)
+      in_window = [v for t, v in values
+                   if result_ts - window/2 < t < result_ts + window/2]
+      self.assertAlmostEqual(result, sum(in_window) / len(in_window))
+
+    self.assertEqual(average.results_since(results[-2][0]), results[-1:])
+
+  ############################
+  def test_boxcar_average_late_values(self):
+    random.seed(2)
+    values = [(1000 + i / 2, random.uniform(-10, 10)) for i in range(400)]
+    values += [(1300 + i / 2, random.uniform(-10, 10)) for i in range(100)]
+    interval, window = 5, 10
+    spec = {'type': 'boxcar_average', 'interval': interval, 'window': window}
+    average = BoxcarAverage(interval=interval, window=window)
+
+    # Values arrive 'delay' seconds late - after 'now' has passed the
+    # end of their windows - and, once, after a 40 second gap.
+    delay = 8
+    for now in range(1000, 1400, 3):
+      arrived = [pair for pair in values if pair[0] <= now - delay]
+      if 1250 <= now < 1290:
+        arrived = [pair for pair in arrived if pair[0] < 1240]
+      average.update(arrived, now)
+
+    # Once everything has arrived, results should be as if it had all
+    # been there from the start, which they are for subsample().
+    average.update(values, 1400)
+    results = average.results_since(0)
+    expected = subsample(spec, values, 0, 1400)
+    self.assertEqual([ts for ts, _ in results], [ts for ts, _ in expected])
+    for (_, result), (_, expected_result) in zip(results, expected):
+      self.assertAlmostEqual(result, expected_result)
+
+    # Windows whose values may still be on their way are provisional
+    self.assertEqual(average.timestamps[-1], 1340)
+    provisional = average.results_since(1340)
+    self.assertEqual([ts for ts, _ in provisional], [1345, 1350])
+    self.assertAlmostEqual(provisional[0][1], expected[-2][1])
+
+  ############################
+  def test_subsample_cache(self):
+    values = [(float(ts), float(ts)) for ts in range(100)]
+    spec = {'type': 'boxcar_average', 'interval': 10, 'window': 10}
+
+    cache = SubsampleCache()
+    results = cache.subsample('f1', spec, values, 0, 100)
+    self.assertEqual(results, [(10, 10.0), (20, 20.0), (30, 30.0),
+                               (40, 40.0), (50, 50.0), (60, 60.0),
+                               (70, 70.0), (80, 80.0), (90, 90.0)])
+
+    # A second client asking for the same thing shares the results
+    self.assertEqual(cache.subsample('f1', spec, values, 60, 100),
+                     results[-3:])
+    self.assertEqual(len(cache.engines), 1)
+    self.assertEqual(cache.subsample('f1', spec, values, 90, 100), None)
+
+    self.assertEqual(cache.subsample('f1', {'type': 'no_such_alg'},
+                                     values, 0, 100), None)
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils import wire_encoding
+
+class TestWireEncoding(unittest.TestCase):
+  ############################
+  def test_field_dict(self):
+    data = {'f1': [(1555468528.452, 12.3), (1555468529.452, 12.4),
+                   (1555468530.453, 12.6)],
+            'f2': [(1555468528.0, 'A')],
+            'f3': []}
+    encoded = wire_encoding.encode_data(data, 'columnar')
+    self.assertEqual(encoded['f1'], {'t': [1555468528452, 1000, 1001],
+                                     'v': [12.3, 12.4, 12.6]})
+    self.assertEqual(wire_encoding.decode_data(encoded), data)
+
+    self.assertIs(wire_encoding.encode_data(data, 'json'), data)
+
+    # Columnar should be considerably smaller than the original encoding
+    data = {'f1': [(1555468528.452 + i, 12.3) for i in range(100)]}
+    self.assertLess(len(json.dumps(wire_encoding.encode_data(data, 'columnar'))),
+                    0.6 * len(json.dumps(data)))
+
+  ############################
+  def test_timestamp_rounding(self):
+    # Rounding to milliseconds shouldn't accumulate error
+    timestamps = [1000.0 + i * 0.3333 for i in range(1000)]
+    decoded = wire_encoding.decode_timestamps(
+      wire_encoding.encode_timestamps(timestamps))
+    for original, result in zip(timestamps, decoded):
+      self.assertAlmostEqual(original, result, delta=0.00051)
+
+  ############################
+  def test_record_list(self):
+    records = [{'timestamp': 10.5, 'fields': {'f1': 1, 'f2': 2}},
+               {'timestamp': 11.5, 'fields': {'f1': 3}}]
+    encoded = wire_encoding.encode_data(records, 'columnar')
+    self.assertEqual(encoded['t'], [10500, 1000])
+    self.assertEqual(wire_encoding.decode_data(encoded, 'record_list'),
+                     records)
+
+  ############################
+  def test_messages(self):
+    message = {'type': 'data', 'status': 200, 'data': {'f1': {'t': [1]}}}
+    encoded = wire_encoding.encode_message(message)
+    self.assertEqual(wire_encoding.decode_message(encoded), message)
+
+    with self.assertRaises(ValueError):
+      wire_encoding.check_encoding('semaphore')
+
+    if wire_encoding.MSGPACK_ENABLED:
+      encoded = wire_encoding.encode_message(message, 'msgpack')
+      self.assertIs(type(encoded), bytes)
+      self.assertEqual(wire_encoding.decode_message(encoded), message)
+    else:
+      self.assertNotIn('msgpack', wire_encoding.available_encodings())
+      with self.assertRaises(ValueError):
+        wire_encoding.check_encoding('msgpack')
+      with self.assertRaises(ValueError):
+        wire_encoding.decode_message(b'\x81\xa1a\x01')
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
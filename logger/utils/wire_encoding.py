@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Encodings for the messages that a CachedDataServer exchanges with
+its websocket clients (e.g. CachedDataReader and CachedDataWriter).
+
+A client chooses an encoding by including an 'encoding' key in its
+subscribe (or publish) request. Recognized encodings are:
+
+  json      - The original, verbose encoding: JSON text in which the
+              values of each field are a list of [timestamp, value]
+              pairs.
+
+  columnar  - JSON text in which the values of each field are sent as
+              two columns: timestamps, delta-encoded as integer
+              milliseconds, and values. A field's values
+
+                [[1555468528.452, 12.3], [1555468529.452, 12.4],
+                 [1555468530.453, 12.6]]
+
+              are sent as
+
+                {"t": [1555468528452, 1000, 1001], "v": [12.3, 12.4, 12.6]}
+
+              where the first element of "t" is the first timestamp in
+              milliseconds and each subsequent element is the number of
+              milliseconds since the previous one. Timestamps are
+              rounded to the nearest millisecond.
+
+  msgpack   - The columnar layout, sent as binary MessagePack frames
+              rather than JSON text. Only available if the msgpack
+              module is installed.
+
+In a columnar 'record_list' response, the list of records is sent as a
+dict with a "t" column of delta-encoded timestamps and a "fields"
+column of the records' field dicts.
+
+Messages in a non-json encoding carry an 'encoding' key naming it, so
+that the recipient knows to decode their 'data'.
+"""
+import json
+
+try:
+  import msgpack
+  MSGPACK_ENABLED = True
+except ImportError:
+  MSGPACK_ENABLED = False
+
+ENCODINGS = ['json', 'columnar', 'msgpack']
+
+# Timestamps in columnar encodings are sent as integer multiples of
+# 1/TICKS_PER_SECOND seconds.
+TICKS_PER_SECOND = 1000
+
+############################
+def available_encodings():
+  """Return a list of the encodings that can be used here."""
+  return [encoding for encoding in ENCODINGS
+          if encoding != 'msgpack' or MSGPACK_ENABLED]
+
+############################
+def check_encoding(encoding):
+  """Raise a ValueError if the named encoding can't be used here."""
+  if not encoding in ENCODINGS:
+    raise ValueError('Unrecognized encoding "%s"; valid encodings are %s'
+                     % (encoding, ENCODINGS))
+  if encoding == 'msgpack' and not MSGPACK_ENABLED:
+    raise ValueError('Encoding "msgpack" requires the msgpack module. '
+                     'Please try "pip3 install msgpack" prior to use.')
+
+############################
+def encode_timestamps(timestamps):
+  """Convert a list of timestamps into integer ticks, the first
+  absolute and the remainder relative to their predecessors."""
+  deltas = []
+  previous = 0
+  for timestamp in timestamps:
+    tick = round(timestamp * TICKS_PER_SECOND)
+    deltas.append(tick - previous)
+    previous = tick
+  return deltas
+
+############################
+def decode_timestamps(deltas):
+  """Invert encode_timestamps()."""
+  timestamps = []
+  tick = 0
+  for delta in deltas:
+    tick += delta
+    timestamps.append(tick / TICKS_PER_SECOND)
+  return timestamps
+
+############################
+def encode_pairs(pairs):
+  """Convert a list of (timestamp, value) pairs into columns."""
+  return {'t': encode_timestamps([pair[0] for pair in pairs]),
+          'v': [pair[1] for pair in pairs]}
+
+############################
+def decode_pairs(columns):
+  """Convert columns back into a list of (timestamp, value) pairs."""
+  return list(zip(decode_timestamps(columns.get('t', [])),
+                  columns.get('v', [])))
+
+############################
+def encode_data(data, encoding):
+  """Convert the 'data' of a response into the layout used by the
+  named encoding. 'data' is either a field dict of
+
+    {field_name: [(timestamp, value), (timestamp, value),...], ...}
+
+  or a list of DASRecord-like dicts, sorted by timestamp.
+  """
+  if encoding == 'json':
+    return data
+  if type(data) is list:
+    return {'t': encode_timestamps([record['timestamp'] for record in data]),
+            'fields': [record['fields'] for record in data]}
+  return {field_name: encode_pairs(pairs)
+          for field_name, pairs in data.items()}
+
+############################
+def decode_data(data, data_format='field_dict'):
+  """Invert encode_data() for data in a non-json encoding. 'data_format'
+  is the format, 'field_dict' or 'record_list', that was requested."""
+  if data_format == 'record_list':
+    return [{'timestamp': timestamp, 'fields': fields}
+            for timestamp, fields in zip(decode_timestamps(data.get('t', [])),
+                                         data.get('fields', []))]
+  return {field_name: decode_pairs(columns)
+          for field_name, columns in data.items()}
+
+############################
+def encode_message(message, encoding='json'):
+  """Serialize a message dict: as JSON text, or as bytes if the encoding
+  is msgpack. The message's 'data' should already be in the
+  encoding's layout (see encode_data())."""
+  if encoding == 'msgpack':
+    return msgpack.packb(message, use_bin_type=True)
+  return json.dumps(message)
+
+############################
+def decode_message(raw_message):
+  """Deserialize a message received as JSON text or MessagePack bytes.
+  Raises ValueError if it can't be decoded."""
+  if type(raw_message) in [bytes, bytearray]:
+    if not MSGPACK_ENABLED:
+      raise ValueError('Received binary message, but msgpack module is '
+                       'not installed')
+    try:
+      return msgpack.unpackb(raw_message, raw=False)
+    except Exception as e:
+      raise ValueError('Unable to decode binary message: %s' % e)
+  return json.loads(raw_message)
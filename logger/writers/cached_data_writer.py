@@ -11,13 +11,14 @@ import websockets
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.utils.das_record import DASRecord
+from logger.utils import wire_encoding
 from logger.writers.writer import Writer
 
 ################################################################################
 class CachedDataWriter(Writer):
   def __init__(self, data_server, start_server=False, back_seconds=480,
                cleanup_interval=6, update_interval=1,
-               max_backup=60*60*24):
+               max_backup=60*60*24, encoding='json'):
     """Feed passed records to a CachedDataServer via a websocket. Expects
     records in DASRecord or dict formats.
     ```
@@ -36,6 +37,13 @@ class CachedDataWriter(Writer):
                   oldest records. By default, cache one day's worth of
                   records at 1 Hz (86,400 records). If max_backup is zero,
                   cache size is unbounded.
+
+    encoding      How to encode records sent to the data server. If
+                  'json' (the default), send each record as its own
+                  publish request. If 'columnar' or 'msgpack', send all
+                  records waiting in the queue as a single request of
+                  delta-encoded timestamp and value columns (see
+                  logger/utils/wire_encoding.py).
     ```
     """
     host_port = data_server.split(':')
@@ -46,6 +54,9 @@ class CachedDataWriter(Writer):
     else:
       self.data_server = data_server                 # they gave us 'host:8766'
 
+    wire_encoding.check_encoding(encoding)
+    self.encoding = encoding
+
     self.websocket = None
     self.back_seconds = back_seconds
     self.cleanup_interval = cleanup_interval
@@ -84,8 +95,11 @@ class CachedDataWriter(Writer):
               try:
                 record = self.send_queue.get_nowait()
                 logging.debug('sending record: %s', record)
-                record = {'type':'publish', 'data':record}
-                await ws.send(json.dumps(record))
+                if self.encoding == 'json':
+                  request = json.dumps({'type':'publish', 'data':record})
+                else:
+                  request = self._encode_batch(record)
+                await ws.send(request)
                 response = await ws.recv()
                 logging.debug('received response: %s', response)
               except asyncio.QueueEmpty:
@@ -107,6 +121,34 @@ class CachedDataWriter(Writer):
     self.event_loop.run_until_complete(_async_send_records_loop(self))
     self.event_loop.close()
 
+  ############################
+  def _encode_batch(self, record):
+    """Collate the passed record and any others waiting in the queue
+    into per-field columns, and return an encoded publish request."""
+    field_values = {}
+    metadata_fields = {}
+    while record is not None:
+      timestamp = record.get('timestamp', None) or time.time()
+      for field, value in record.get('fields', {}).items():
+        # Values may be a list of (timestamp, value) pairs
+        if type(value) is list:
+          field_values.setdefault(field, []).extend(value)
+        else:
+          field_values.setdefault(field, []).append((timestamp, value))
+      metadata = record.get('metadata', None)
+      if metadata:
+        metadata_fields.update(metadata.get('fields', {}))
+      try:
+        record = self.send_queue.get_nowait()
+      except asyncio.QueueEmpty:
+        record = None
+
+    data = {'fields': wire_encoding.encode_data(field_values, self.encoding)}
+    if metadata_fields:
+      data['metadata'] = {'fields': metadata_fields}
+    return wire_encoding.encode_message(
+      {'type':'publish', 'encoding':self.encoding, 'data':data}, self.encoding)
+
   ############################
   def write(self, record):
     """Write out record. Expects passed records to be in one of three
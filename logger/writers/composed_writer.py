@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import logging
+import queue
 import sys
 import threading
 
@@ -10,10 +11,16 @@ from logger.transforms.transform import Transform
 from logger.writers.writer import Writer
 from logger.utils import formats
 
+# Default number of records that may be waiting in each writer's queue
+# when using worker threads.
+DEFAULT_WRITER_QUEUE_SIZE = 100
+
 ################################################################################
 class ComposedWriter(Writer):
   ############################
-  def __init__(self, transforms=[], writers=[], check_format=False):
+  def __init__(self, transforms=[], writers=[], check_format=False,
+               worker_threads=False, blocking=True,
+               queue_size=DEFAULT_WRITER_QUEUE_SIZE):
     """
     Apply zero or more Transforms (in series) to passed records, then
     write them (in parallel threads) using the specified Writers.
@@ -27,6 +34,20 @@ class ComposedWriter(Writer):
                    are compatible, and throw a ValueError if they are not.
                    If check_format is False (the default) the output_format()
                    of the whole reader will be formats.Unknown.
+
+    worker_threads If True, give each writer its own long-lived thread,
+                   fed by a bounded queue, rather than creating a new
+                   thread per writer for every record written.
+
+    blocking       Only meaningful if worker_threads is True. If True (the
+                   default), write() returns only once every writer has
+                   written the record, as when worker_threads is False.
+                   If False, write() returns as soon as the record has been
+                   queued for each writer, blocking only if a writer's
+                   queue is full.
+
+    queue_size     Only meaningful if worker_threads is True. Maximum
+                   number of records that may be waiting for each writer.
     ```
     Example:
     ```
@@ -44,6 +65,10 @@ class ComposedWriter(Writer):
     module. We do *not* make this assumption of our writers, and impose a
     lock to prevent a writer's write() method from being called a second
     time if the first has not yet completed.
+
+    If a writer raises an exception, it will be raised by write(). When
+    worker_threads is True and blocking is False, the exception will be
+    raised by the next call to write() or flush() following the failure.
     """
     # Make transforms a list if it's not. Even if it's only one transform.
     if not type(transforms) == type([]):
@@ -60,7 +85,26 @@ class ComposedWriter(Writer):
     # One lock per writer, to prevent us from accidental re-entry if a
     # new write is requested before the previous one has completed.
     self.writer_lock = [threading.Lock() for w in self.writers]
+
+    # Exceptions raised by each writer and not yet reported. Worker
+    # threads may record one at any time, so only touch under lock.
     self.exceptions = [None for w in self.writers]
+    self.exceptions_lock = threading.Lock()
+
+    # If we're using worker threads, create a queue and a thread for
+    # each writer. Threads are daemons and will exit with the process.
+    self.worker_threads = worker_threads
+    self.blocking = blocking
+    self.writer_queues = []
+    self.writer_threads = []
+    if worker_threads:
+      for i in range(len(self.writers)):
+        writer_queue = queue.Queue(maxsize=queue_size)
+        t = threading.Thread(target=self._run_worker, args=(i, writer_queue),
+                             name=str(type(self.writers[i])), daemon=True)
+        self.writer_queues.append(writer_queue)
+        self.writer_threads.append(t)
+        t.start()
 
     # If they want, check that our writers and transforms have
     # compatible input/output formats.
@@ -75,14 +119,77 @@ class ComposedWriter(Writer):
 
 
   ############################
-  def _run_writer(self, index, record):
+  def _run_writer(self, index, record, batch=False):
     """Internal: grab the appropriate lock and call the appropriate
-    write() method. If there's an exception, save it."""
+    write() method (or write_batch(), if batch is True). If there's an
+    exception, save it."""
     with self.writer_lock[index]:
       try:
-        self.writers[index].write(record)
+        if batch:
+          self.writers[index].write_batch(record)
+        else:
+          self.writers[index].write(record)
       except Exception as e:
-        self.exceptions[index] = e
+        self._save_exception(index, e)
+
+  ############################
+  def _save_exception(self, index, e):
+    """Internal: note that writer 'index' has raised an exception."""
+    with self.exceptions_lock:
+      self.exceptions[index] = e
+
+  ############################
+  def _run_worker(self, index, writer_queue):
+    """Internal: loop forever, handing records from the writer's queue
+    to _run_writer()."""
+    while True:
+      record, batch = writer_queue.get()
+      try:
+        self._run_writer(index, record, batch)
+      finally:
+        writer_queue.task_done()
+
+  ############################
+  def _raise_exceptions(self):
+    """Internal: if any writers have raised exceptions, log them, then
+    arbitrarily raise the first one in list."""
+    with self.exceptions_lock:
+      exceptions = [e for e in self.exceptions if e]
+      # If we've got persistent workers, we'll keep on writing after the
+      # exception, so don't report the same exception twice.
+      if exceptions and self.worker_threads:
+        self.exceptions = [None for w in self.writers]
+    for e in exceptions:
+      logging.error(e)
+    if exceptions:
+      raise exceptions[0]
+
+  ############################
+  def flush(self):
+    """Wait until all queued records have been written, and ask any
+    writers that buffer records (i.e. that have a flush() method) to
+    write them out. Then raise any exceptions that our writers have
+    encountered."""
+    self._wait_for_queues()
+    flush_failed = False
+    for index, writer in enumerate(self.writers):
+      flush = getattr(writer, 'flush', None)
+      if callable(flush):
+        with self.writer_lock[index]:
+          try:
+            flush()
+          except Exception as e:
+            self._save_exception(index, e)
+            flush_failed = True
+    if self.worker_threads or flush_failed:
+      self._raise_exceptions()
+
+  ############################
+  def _wait_for_queues(self):
+    """Internal: wait until our worker threads have written all the
+    records queued for them. A no-op unless we're using worker threads."""
+    for writer_queue in self.writer_queues:
+      writer_queue.join()
 
   ############################
   def apply_transforms(self, record):
@@ -94,6 +201,15 @@ class ComposedWriter(Writer):
           break
     return record
 
+  ############################
+  def apply_transforms_batch(self, records):
+    """Internal: apply the transforms in series to a list of records."""
+    for t in self.transforms:
+      if not records:
+        break
+      records = t.transform_batch(records)
+    return records
+
   ############################
   def write(self, record):
     """Transform the passed record and dispatch it to writers."""
@@ -101,22 +217,51 @@ class ComposedWriter(Writer):
     record = self.apply_transforms(record)
     if record is None:
       return
+    self._dispatch(record, batch=False)
 
+  ############################
+  def write_batch(self, records):
+    """Transform the passed list of records and dispatch the results to
+    writers' write_batch() methods."""
+    records = self.apply_transforms_batch(records)
+    if not records:
+      return
+    self._dispatch(records, batch=True)
+
+  ############################
+  def _dispatch(self, record, batch):
+    """Internal: hand a record (or, if batch is True, a list of records)
+    to our writers."""
     # No idea why someone would instantiate without writers, but it's
     # plausible. Try to be accommodating.
     if not self.writers:
       return
 
+    # If we have persistent worker threads, queue the record for each
+    # of them (blocking if a queue is full). Raise any exceptions from
+    # earlier records that we've not had a chance to report yet.
+    if self.worker_threads:
+      self._raise_exceptions()
+      for writer_queue in self.writer_queues:
+        writer_queue.put((record, batch))
+      if self.blocking:
+        self._wait_for_queues()
+        self._raise_exceptions()
+      return
+
     # If we only have one writer, there's no point making things
     # complicated. Just write and return.
     if len(self.writers) == 1:
-      self.writers[0].write(record)
+      if batch:
+        self.writers[0].write_batch(record)
+      else:
+        self.writers[0].write(record)
       return
 
     # Fire record off to write() requests for each writer.
     writer_threads = []
     for i in range(len(self.writers)):
-      t = threading.Thread(target=self._run_writer, args=(i, record),
+      t = threading.Thread(target=self._run_writer, args=(i, record, batch),
                            name=str(type(self.writers[i])), daemon=True)
       t.start()
       writer_threads.append(t)
@@ -126,11 +271,7 @@ class ComposedWriter(Writer):
       t.join()
 
     # Were there any exceptions? Arbitrarily raise the first one in list
-    exceptions = [e for e in self.exceptions if e]
-    for e in exceptions:
-      logging.error(e)
-    if exceptions:
-      raise exceptions[0]
+    self._raise_exceptions()
 
   ############################
   def _check_writer_formats(self):
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
+import atexit
 import logging
 import pprint
 import sys
+import threading
 import time
 
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.utils.formats import Python_Record
 from logger.utils.das_record import DASRecord
+from logger.utils.record_spool import RecordSpool
 from logger.writers.writer import Writer
 
 # Don't freak out if we can't find database settings - unless they actually
@@ -23,16 +26,56 @@ except ModuleNotFoundError:
   DEFAULT_DATABASE = DEFAULT_DATABASE_HOST = None
   DEFAULT_DATABASE_USER = DEFAULT_DATABASE_PASSWORD = None
 
+# Maximum number of spooled records to write to the database at once
+# when it comes back after an outage.
+SPOOL_DRAIN_RECORDS = 10000
+
 ################################################################################
 class DatabaseWriter(Writer):
   def __init__(self, database=DEFAULT_DATABASE, host=DEFAULT_DATABASE_HOST,
                user=DEFAULT_DATABASE_USER, password=DEFAULT_DATABASE_PASSWORD,
-               save_source=True):
+               save_source=True, batch_size=0, batch_timeout=1.0,
+               spool_file=None, max_spool_records=0):
     """Write to the passed record to a database table. With connectors
     written so far (MySQL and Mongo), writes values in the records as
     timestamped field-value pairs. If save_source=True, also save the
     source record we are passed.
 
+    If batch_size is non-zero, records are buffered and written in
+    batches. If the connector implements write_records(), each batch
+    is written with a single call, which for MySQLConnector means a
+    single transaction of multi-row inserts:
+    ```
+    batch_size     Write buffered records once this many have accumulated.
+                   If zero (the default), write each record as it arrives.
+
+    batch_timeout  Write buffered records once the oldest of them has been
+                   waiting this many seconds, whether or not batch_size
+                   records have accumulated. This is the most data (in
+                   seconds) that can be lost if the process dies without
+                   warning.
+    ```
+    Buffered records are also written when flush() is called (which
+    a Listener does when it shuts down) and when the process exits
+    normally.
+    If the connector rejects a batch for any reason other than a lost
+    connection, its records are retried one at a time, so that a
+    single bad record doesn't cost the rest of the batch.
+
+    Connectors get their connections from a shared pool (see
+    database/connection_pool.py) and reconnect, with backoff, if the
+    connection is lost. Records that can't be written while the
+    database is unreachable are spooled and written in bulk once it
+    returns:
+    ```
+    spool_file         Path of a file in which to spool records while the
+                       database is unreachable, so that they survive a
+                       restart. If None, spool them in memory.
+
+    max_spool_records  If non-zero, the most records to spool; beyond
+                       that, the oldest are discarded.
+    ```
+
     Expects passed source records to be in one of two formats:
 
     1) DASRecord
@@ -81,6 +124,23 @@ class DatabaseWriter(Writer):
     self.db = Connector(database=database, host=host,
                         user=user, password=password,
                         save_source=save_source)
+    self.spool = RecordSpool(filename=spool_file,
+                             max_records=max_spool_records)
+
+    # If we're buffering records, keep them here until it's time to
+    # write them. A thread makes sure they don't wait longer than
+    # batch_timeout.
+    self.batch_size = batch_size
+    self.batch_timeout = batch_timeout
+    self.buffer = []
+    self.buffer_start = None  # when the oldest buffered record arrived
+    self.buffer_lock = threading.Lock()
+    if batch_size:
+      self.flush_thread = threading.Thread(target=self._flush_loop,
+                                           name='database_writer_flush',
+                                           daemon=True)
+      self.flush_thread.start()
+      atexit.register(self.flush)
 
   ############################
   def _table_exists(self, table_name):
@@ -114,25 +174,182 @@ class DatabaseWriter(Writer):
     """Write out record. Connectors assume we've got a DASRecord, so check
     what we've got and convert as necessary.
     """
-    if not record:
+    if self.batch_size:
+      self._buffer_records(self._das_records(record))
+      return
+    das_records = self._das_records(record)
+    if len(self.spool):
+      self._write_records(das_records)
       return
+    for i, das_record in enumerate(das_records):
+      try:
+        self._write_record(das_record)
+      except ConnectionError as e:
+        logging.warning('DatabaseWriter spooling records: %s', e)
+        self.spool.put(das_records[i:])
+        return
+
+  ############################
+  def write_batch(self, records):
+    """Write out a list of records. If our connector knows how to write
+    several records at once, hand them all over in a single call."""
+    das_records = []
+    for record in records:
+      das_records.extend(self._das_records(record))
+    if self.batch_size:
+      self._buffer_records(das_records)
+    else:
+      self._write_records(das_records)
+
+  ############################
+  def flush(self):
+    """Write out any buffered or spooled records, including any our
+    connector is buffering."""
+    with self.buffer_lock:
+      self._flush_buffer()
+      self._drain_spool()
+      db_flush = getattr(self.db, 'flush', None)
+      if db_flush:
+        db_flush()
+
+  ############################
+  def _buffer_records(self, das_records):
+    """Add records to our buffer, writing them out if it's full."""
+    if not das_records:
+      return
+    with self.buffer_lock:
+      if not self.buffer:
+        self.buffer_start = time.time()
+      self.buffer.extend(das_records)
+      if len(self.buffer) >= self.batch_size:
+        self._flush_buffer()
+
+  ############################
+  def _flush_buffer(self):
+    """Write out buffered records. Caller must hold self.buffer_lock."""
+    if not self.buffer:
+      return
+    das_records = self.buffer
+    self.buffer = []
+    self.buffer_start = None
+    try:
+      self._write_records(das_records)
+    except Exception as e:
+      logging.error('DatabaseWriter failed to write %d records: %s',
+                    len(das_records), str(e))
+
+  ############################
+  def _flush_loop(self):
+    """Run in a separate thread, making sure that no record waits in
+    our buffer for longer than batch_timeout seconds."""
+    while True:
+      with self.buffer_lock:
+        if self.buffer_start is None:
+          time_to_sleep = self.batch_timeout
+        else:
+          time_to_sleep = self.buffer_start + self.batch_timeout - time.time()
+          if time_to_sleep <= 0:
+            self._flush_buffer()
+            time_to_sleep = self.batch_timeout
+      time.sleep(time_to_sleep)
+
+  ############################
+  def _write_records(self, das_records):
+    """Write a list of DASRecords, in a single call if our connector
+    knows how. If the database is unreachable, spool them. If records
+    are already spooled, write those first so that records reach the
+    database in order."""
+    if not das_records:
+      return
+    if len(self.spool) and not self._drain_spool():
+      self.spool.put(das_records)
+      return
+    stored = self._store_records(das_records)
+    if stored < len(das_records):
+      logging.warning('DatabaseWriter spooling %d records',
+                      len(das_records) - stored)
+      self.spool.put(das_records[stored:])
+
+  ############################
+  def _store_records(self, das_records):
+    """Hand a list of DASRecords to our connector. Return how many of
+    them were dealt with (written, or logged as unwritable) before the
+    database became unreachable."""
+    write_records = getattr(self.db, 'write_records', None)
+    if not write_records:
+      return self._store_individually(das_records)
+    try:
+      write_records(das_records)
+      return len(das_records)
+    except ConnectionError as e:
+      logging.debug('Unable to reach database: %s', e)
+      return 0
+    except Exception as e:
+      if len(das_records) == 1:
+        logging.error('DatabaseWriter failed to write record %s: %s',
+                      das_records[0], e)
+        return 1
+      # Something in the batch is bad; write the records one at a time
+      # so that only the bad ones are lost.
+      logging.warning('DatabaseWriter failed to write %d records (%s); '
+                      'writing them one at a time', len(das_records), e)
+      return self._store_individually(das_records)
+
+  ############################
+  def _store_individually(self, das_records):
+    """Write records one at a time, logging and skipping any that fail.
+    Return how many were dealt with before the database became
+    unreachable."""
+    for i, das_record in enumerate(das_records):
+      try:
+        self.db.write_record(das_record)
+      except ConnectionError as e:
+        logging.debug('Unable to reach database: %s', e)
+        return i
+      except Exception as e:
+        logging.error('DatabaseWriter failed to write record %s: %s',
+                      das_record, e)
+    return len(das_records)
+
+  ############################
+  def _drain_spool(self):
+    """Write spooled records to the database in bulk. Return True if
+    the spool is now empty, False if the database is still unreachable."""
+    while len(self.spool):
+      das_records = self.spool.records(SPOOL_DRAIN_RECORDS)
+      stored = self._store_records(das_records)
+      if stored:
+        self.spool.remove(stored)
+        logging.warning('DatabaseWriter wrote %d spooled records; %d remain',
+                        stored, len(self.spool))
+      if stored < len(das_records):
+        return False
+    return True
+
+  ############################
+  def _das_records(self, record):
+    """Convert the passed record into a list of DASRecords, logging an
+    error if we can't make sense of it.
+    """
+    if not record:
+      return []
 
     # If we've got a list, hope it's a list of records. Recurse,
-    # calling write() on each of the list elements in order.
+    # calling _das_records() on each of the list elements in order.
     if type(record) is list:
+      das_records = []
       for single_record in record:
-        self.write(single_record)
-      return
+        das_records.extend(self._das_records(single_record))
+      return das_records
 
-    # If we've been passed a DASRecord, things are easy: write it and return.
+    # If we've been passed a DASRecord, things are easy.
     if type(record) is DASRecord:
-      self._write_record(record)
-      return
-    
+      return [record]
+
     if not type(record) is dict:
       logging.error('Record passed to DatabaseWriter is not of type '
                     '"DASRecord" or dict; is type "%s"', type(record))
-      return
+      return []
 
     # If here, our record is a dict, figure out whether it is a top-level
     # field dict or not.
@@ -145,7 +362,7 @@ class DatabaseWriter(Writer):
                     'passing, or it is in the old "field_dict" format that '
                     'assumes key:value pairs are at the top level.')
       logging.error('The record in question: %s', str(record))
-      return
+      return []
 
     # Now check whether our 'values' are singletons (in which case
     # we've got a single record) or lists of tuples. Shortcut by
@@ -155,14 +372,12 @@ class DatabaseWriter(Writer):
     except StopIteration:
       # Empty fields
       logging.debug('Empty "fields" dict in record: %s', str(record))
-      return
+      return []
 
     # If we've got a singleton, it's a single record. Convert to
-    # DASRecord and write it out.
+    # DASRecord and return it.
     if not type(first_value) is list:
-      das_record = DASRecord(data_id=data_id, timestamp=timestamp, fields=fields)
-      self._write_record(das_record)
-      return
+      return [DASRecord(data_id=data_id, timestamp=timestamp, fields=fields)]
 
     # If we're here, our values (or at least our first one) are lists
     # of (value, timestamp) pairs. First thing we do is
@@ -180,9 +395,8 @@ class DatabaseWriter(Writer):
       logging.error('Badly-structured field dictionary: %s: %s',
                     field, pprint.pformat(ts_value_list))
 
-    # Now go through each timestamp, generate a DASRecord from its
-    # values, and write them.
-    for timestamp in sorted(values_by_timestamp):
-      das_record = DASRecord(data_id=data_id, timestamp=timestamp,
-                             fields=values_by_timestamp[timestamp])
-      self._write_record(das_record)
+    # Now go through each timestamp and generate a DASRecord from its
+    # values.
+    return [DASRecord(data_id=data_id, timestamp=timestamp,
+                      fields=values_by_timestamp[timestamp])
+            for timestamp in sorted(values_by_timestamp)]
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
+import atexit
+import collections
 import logging
+import math
+import random
 import sys
-import json
+import threading
+import time
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.utils import timestamp
+from logger.utils.das_record import DASRecord
 from logger.utils.formats import Text
 from logger.writers.writer import Writer
 
@@ -18,24 +24,87 @@ except (ModuleNotFoundError, ImportError):
   INFLUXDB_SETTINGS_FOUND = False
 
 try:
-  from influxdb_client import InfluxDBClient
-  from influxdb_client.client.write_api import ASYNCHRONOUS
+  from influxdb_client import InfluxDBClient, WritePrecision
+  from influxdb_client.client.write_api import SYNCHRONOUS
   INFLUXDB_CLIENT_FOUND = True
 except (ModuleNotFoundError, ImportError):
   INFLUXDB_CLIENT_FOUND = False
 
-import time
+################################################################################
+# Line protocol serialization. See
+# https://docs.influxdata.com/influxdb/v2.0/reference/syntax/line-protocol/
+MEASUREMENT_ESCAPES = str.maketrans({',': '\\,', ' ': '\\ '})
+KEY_ESCAPES = str.maketrans({',': '\\,', '=': '\\=', ' ': '\\ '})
+STRING_ESCAPES = str.maketrans({'"': '\\"', '\\': '\\\\'})
+
+############################
+def field_value(value):
+  """Return the line protocol encoding of a field value, or None if
+  it can't be represented (None, NaN, infinities, unknown types)."""
+  value_type = type(value)
+  if value_type is float:
+    if math.isnan(value) or math.isinf(value):
+      return None
+    return repr(value)
+  if value_type is int:
+    return '%di' % value
+  if value_type is bool:
+    return 'true' if value else 'false'
+  if value_type is str:
+    return '"%s"' % value.translate(STRING_ESCAPES)
+  return None
+
+############################
+def line_protocol(data_id, fields, record_timestamp):
+  """Return the line protocol encoding of a record's fields, with the
+  data_id as measurement and 'sensor' tag, or None if it has no fields
+  that can be represented."""
+  field_strs = []
+  for key, value in fields.items():
+    value_str = field_value(value)
+    if value_str is not None:
+      field_strs.append('%s=%s' % (key.translate(KEY_ESCAPES), value_str))
+  if not field_strs:
+    return None
+  return '%s,sensor=%s %s %d' % (data_id.translate(MEASUREMENT_ESCAPES),
+                                 data_id.translate(KEY_ESCAPES),
+                                 ','.join(field_strs),
+                                 int(record_timestamp * 1000000000))
 
 ################################################################################
 class InfluxDBWriter(Writer):
-  """Write to the specified file. If filename is empty, write to stdout."""
-  def __init__(self, bucket_name):
+  """Write records to InfluxDB in batches, as line protocol."""
+  def __init__(self, bucket_name, batch_size=5000, flush_interval=1.0,
+               jitter_interval=0, retry_buffer_size=100000,
+               report_interval=60):
     """
     Write data records to the InfluxDB.
     ```
     bucket_name  the name of the bucket in InfluxDB.  If the bucket does
     not exists then this writer will try to create it.
+
+    batch_size   Write to InfluxDB once this many points have accumulated.
+
+    flush_interval
+                 Write accumulated points at least this often (in seconds).
+
+    jitter_interval
+                 If non-zero, add a random delay of up to this many seconds
+                 to each flush_interval, so that many writers started at
+                 the same time don't all write at the same moment.
+
+    retry_buffer_size
+                 If a write fails, hold on to its points and retry them
+                 on the next write, keeping at most this many points
+                 (discarding the oldest beyond that).
+
+    report_interval
+                 Log the number of points and batches written, and the
+                 mean write latency, this often (in seconds). If zero,
+                 don't.
     ```
+    Records are serialized to line protocol as they arrive and written
+    by a background thread.
     """
     super().__init__(input_format=Text)
 
@@ -83,32 +152,161 @@ class InfluxDBWriter(Writer):
     else:
       self.bucket_id = bucket.id
 
-    self.write_api = self.client.write_api(write_options=ASYNCHRONOUS)
+    # We do our own batching, so write each batch synchronously from
+    # our flush thread.
+    self.write_api = self.client.write_api(write_options=SYNCHRONOUS)
+    self.write_precision = WritePrecision.NS
+
+    self.batch_size = batch_size
+    self.flush_interval = flush_interval
+    self.jitter_interval = jitter_interval
+    self.retry_buffer_size = retry_buffer_size
+    self.report_interval = report_interval
+
+    # Lines waiting to be written, and lines from failed writes waiting
+    # to be retried.
+    self.buffer = []
+    self.retry_buffer = collections.deque()
+    self.buffer_lock = threading.Lock()
+    self.write_lock = threading.Lock()   # one batch write at a time
+    self.flush_now = threading.Event()
+
+    # Statistics for reporting
+    self.stats = {'points': 0, 'batches': 0, 'failed_batches': 0,
+                  'dropped_points': 0, 'write_seconds': 0.0}
+    self.last_report = time.time()
+    self.last_report_stats = dict(self.stats)
+
+    self.flush_thread = threading.Thread(target=self._flush_loop,
+                                         name='influxdb_writer_flush',
+                                         daemon=True)
+    self.flush_thread.start()
+    atexit.register(self.flush)
 
   ############################
   def write(self, record):
     """
-    Note: Assume record is a dict or list of dict. Each dict contains a list
-    of "fields" and float "timestamp" (UTC epoch seconds)
+    Note: Assume record is a dict, DASRecord, or list of them. Each dict
+    contains a list of "fields" and float "timestamp" (UTC epoch seconds)
     """
     if record is None:
       return
 
-    logging.info('InfluxDBWriter writing record: %s', record)
+    if type(record) is list:
+      for single_record in record:
+        self.write(single_record)
+      return
 
-    if type(record) is not dict and type(record) is not list:
+    logging.debug('InfluxDBWriter writing record: %s', record)
+    try:
+      if type(record) is DASRecord:
+        line = line_protocol(record.data_id, record.fields, record.timestamp)
+      elif type(record) is dict:
+        line = line_protocol(record['data_id'], record['fields'],
+                             record['timestamp'])
+      else:
+        raise TypeError('unexpected record type')
+    except (KeyError, TypeError, AttributeError, ValueError):
       logging.warning('InfluxDBWriter could not ingest record '
                       'type %s: %s', type(record), str(record))
+      return
 
+    if line is None:
+      return
+    with self.buffer_lock:
+      self.buffer.append(line)
+      if len(self.buffer) >= self.batch_size:
+        self.flush_now.set()
+
+  ############################
+  def flush(self):
+    """Write out all accumulated points (including any awaiting retry)."""
+    with self.write_lock:
+      with self.buffer_lock:
+        lines = list(self.retry_buffer) + self.buffer
+        self.retry_buffer.clear()
+        self.buffer = []
+      for start in range(0, len(lines), self.batch_size):
+        if not self._write_batch(lines[start:start + self.batch_size]):
+          self._retry_later(lines[start:])
+          break
+    self._report()
+
+  ############################
+  def _flush_loop(self):
+    """Run in a separate thread, flushing when a batch's worth of points
+    have accumulated or flush_interval (plus jitter) has passed."""
+    while True:
+      interval = self.flush_interval
+      if self.jitter_interval:
+        interval += random.uniform(0, self.jitter_interval)
+      self.flush_now.wait(interval)
+      self.flush_now.clear()
+      try:
+        self.flush()
+      except Exception as e:
+        logging.error('InfluxDBWriter flush failed: %s', e)
+
+  ############################
+  def _write_batch(self, lines):
+    """Write a batch of lines. Return False if the write failed in a
+    way that's worth retrying."""
+    start = time.time()
     try:
-      if type(record) is list:
-        influxDB_record = map(lambda single_record: {"measurement": single_record['data_id'], "tags": {"sensor": single_record['data_id'] }, "fields": single_record['fields'], "time": int(single_record['timestamp']*1000000000) }, record)
-      else:
-        influxDB_record = {"measurement": record['data_id'], "tags": {"sensor": record['data_id'] }, "fields": record['fields'], "time": int(record['timestamp']*1000000000) }
+      self.write_api.write(bucket=self.bucket_id, org=self.org_id,
+                           record=lines,
+                           write_precision=self.write_precision)
+    except Exception as e:
+      self.stats['failed_batches'] += 1
+      # A 4xx status (other than 429 - too many requests) means the
+      # batch itself was bad, and retrying won't help.
+      status = getattr(e, 'status', None)
+      if status and 400 <= status < 500 and status != 429:
+        logging.error('InfluxDBWriter discarding batch of %d points '
+                      'rejected by InfluxDB: %s', len(lines), e)
+        self.stats['dropped_points'] += len(lines)
+        return True
+      logging.warning('InfluxDBWriter failed to write %d points; will '
+                      'retry: %s', len(lines), e)
+      return False
 
-      self.write_api.write(self.bucket_id, self.org_id, influxDB_record)
-      return
+    self.stats['points'] += len(lines)
+    self.stats['batches'] += 1
+    self.stats['write_seconds'] += time.time() - start
+    return True
 
-    except:
-      logging.warning('InfluxDBWriter could not ingest record '
-                      'type %s: %s', type(record), str(record))
+  ############################
+  def _retry_later(self, lines):
+    """Put lines at the front of the retry buffer, discarding the
+    oldest if that makes it larger than retry_buffer_size."""
+    with self.buffer_lock:
+      self.retry_buffer.extendleft(reversed(lines))
+      excess = len(self.retry_buffer) - self.retry_buffer_size
+      if excess > 0:
+        logging.error('InfluxDBWriter retry buffer full; discarding %d '
+                      'oldest points', excess)
+        for i in range(excess):
+          self.retry_buffer.popleft()
+        self.stats['dropped_points'] += excess
+
+  ############################
+  def _report(self):
+    """Log statistics for the last report_interval, if it's time."""
+    now = time.time()
+    if not self.report_interval or now - self.last_report < self.report_interval:
+      return
+    last = self.last_report_stats
+    current = dict(self.stats)
+    batches = current['batches'] - last['batches']
+    latency = current['write_seconds'] - last['write_seconds']
+    logging.info('InfluxDBWriter wrote %d points in %d batches in last %d '
+                 'seconds; mean batch latency %.1f ms; %d failed batches; '
+                 '%d points awaiting retry; %d points dropped',
+                 current['points'] - last['points'], batches,
+                 now - self.last_report,
+                 1000 * latency / batches if batches else 0,
+                 current['failed_batches'] - last['failed_batches'],
+                 len(self.retry_buffer),
+                 current['dropped_points'] - last['dropped_points'])
+    self.last_report = now
+    self.last_report_stats = current
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 
 import logging
+import os.path
 import sys
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
 
 from logger.utils import timestamp
+from logger.utils.logfile_index import LogfileIndex
 from logger.utils.formats import Text
 from logger.writers.writer import Writer
 from logger.writers.text_file_writer import TextFileWriter
@@ -16,7 +18,7 @@ class LogfileWriter(Writer):
                time_format=timestamp.TIME_FORMAT,
                date_format=timestamp.DATE_FORMAT,
                split_char=' ', suffix='',
-               rollover_hourly=False):
+               rollover_hourly=False, index_interval=0):
     """
     Write timestamped text records to file. Base filename will have
     date appended, in keeping with R2R format recommendations
@@ -38,6 +40,12 @@ class LogfileWriter(Writer):
 
     rollover_hourly Set files to truncate by hour.  By default files will
                     truncate by day
+
+    index_interval  If non-zero, maintain a sparse time index of each
+                    logfile, recording the byte offset of every
+                    index_interval'th record, so that LogfileReader can
+                    seek to a time without reading the file from the
+                    start. See logger/utils/logfile_index.py.
     ```
     """
     super().__init__(input_format=Text)
@@ -49,11 +57,13 @@ class LogfileWriter(Writer):
     self.split_char = split_char
     self.suffix = suffix
     self.rollover_hourly = rollover_hourly
+    self.index_interval = index_interval
 
     self.current_date = None
     self.current_hour = None
     self.current_filename = None
     self.writer = None
+    self.index = None
 
   ############################
   def write(self, record):
@@ -90,7 +100,26 @@ class LogfileWriter(Writer):
       self.current_date = date_str
       self.current_hour = self.rollover_hourly and hr_str or ""
       logging.info('LogfileWriter opening new file: %s', self.current_filename)
+      if self.index_interval:
+        self._open_index()
       self.writer = TextFileWriter(self.current_filename, self.flush)
 
     logging.debug('LogfileWriter writing record: %s', record)
     self.writer.write(record)
+    if self.index:
+      self.index.add(record, ts=ts)
+
+  ############################
+  def _open_index(self):
+    """Start indexing the file we're about to write to. If it already
+    has records, make sure its index is complete before we append."""
+    if self.index:
+      self.index.close()
+    self.index = LogfileIndex(self.current_filename,
+                              interval=self.index_interval,
+                              time_format=self.time_format)
+    if os.path.exists(self.current_filename):
+      if not self.index.load():
+        self.index.build()
+    elif os.path.exists(self.index.index_filename):
+      os.remove(self.index.index_filename)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+import atexit
+import logging
+import os.path
+import sys
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils import timestamp
+from logger.utils.das_record import DASRecord
+from logger.utils.formats import Python_Record
+from logger.writers.writer import Writer
+
+try:
+  import pyarrow
+  import pyarrow.parquet
+  PYARROW_FOUND = True
+except (ModuleNotFoundError, ImportError):
+  PYARROW_FOUND = False
+
+# Key in each file's schema metadata under which we store the data_id
+# of the records in it.
+DATA_ID_METADATA_KEY = b'data_id'
+
+################################################################################
+def column_type(values):
+  """Return the name of the Arrow type (one of 'bool', 'int64',
+  'float64', 'string') that can hold all the non-None values in
+  'values', or None if they're all None."""
+  types = set(type(value) for value in values if value is not None)
+  if not types:
+    return None
+  if types == {bool}:
+    return 'bool'
+  if types == {int}:
+    return 'int64'
+  if types <= {int, float}:
+    return 'float64'
+  return 'string'
+
+############################
+def merge_types(old_type, new_type):
+  """Return the type of a column that must hold values of both types."""
+  if old_type is None or old_type == new_type:
+    return new_type or old_type
+  if new_type is None:
+    return old_type
+  if {old_type, new_type} == {'int64', 'float64'}:
+    return 'float64'
+  return 'string'
+
+############################
+def convert_value(value, to_type):
+  """Convert a value to the Python type that goes in a column of the
+  named type."""
+  if value is None:
+    return None
+  if to_type == 'float64':
+    return float(value)
+  if to_type == 'string':
+    return value if type(value) is str else str(value)
+  return value
+
+################################################################################
+class ParquetWriter(Writer):
+  """Write parsed records to compressed, columnar Parquet files."""
+  def __init__(self, filebase, date_format=timestamp.DATE_FORMAT,
+               rollover_hourly=False, buffer_records=10000,
+               compression='zstd'):
+    """
+    Write DASRecords (or dicts with 'data_id', 'timestamp' and 'fields'
+    keys, as emitted by ParseTransform) to one Parquet file per data_id
+    per day (or hour), named, e.g.
+    ```
+      filebase-gyr1-2014-08-01.parquet
+    ```
+    Each file has a 'timestamp' column and one column for each of the
+    fields in its records, and can be read back with ParquetReader.
+    ```
+    filebase        Base name of files to write to.
+
+    date_format     A strftime-compatible string, such as '%Y-%m-%d';
+                    defaults to whatever's defined in
+                    utils.timestamps.DATE_FORMAT.
+
+    rollover_hourly Start a new file every hour, rather than every day.
+
+    buffer_records  Number of records of a data_id to accumulate before
+                    writing them to its file as a row group. Larger row
+                    groups compress better and are faster to read.
+
+    compression     Parquet compression codec, e.g. 'zstd', 'snappy',
+                    'gzip' or 'none'.
+    ```
+    Note that a Parquet file can't be read until it is complete. A file
+    is completed when its day (or hour) rolls over, when flush() is
+    called (as it is when a Listener shuts down), or when the process
+    exits normally. If new records for the same day then arrive, or
+    records arrive with fields (or types of values) that the file's
+    columns can't hold, they go to a new file with a numeric suffix,
+    e.g. filebase-gyr1-2014-08-01.1.parquet.
+    """
+    super().__init__(input_format=Python_Record)
+
+    if not PYARROW_FOUND:
+      raise RuntimeError('Python module pyarrow not found. Please install '
+                         'using "pip install pyarrow" prior to using '
+                         'ParquetWriter.')
+
+    self.filebase = filebase
+    self.date_format = date_format
+    self.rollover_hourly = rollover_hourly
+    self.buffer_records = buffer_records
+    self.compression = compression
+
+    # Per data_id: the records we're accumulating, the file period
+    # ('2014-08-01' or '2014-08-01_1300') they belong to, and the file
+    # we're writing them to, if it's open: a dict of its Parquet writer,
+    # filename and column types.
+    self.buffers = {}
+    self.periods = {}
+    self.files = {}
+
+    atexit.register(self.flush)
+
+  ############################
+  def write(self, record):
+    """Buffer a record, writing out its data_id's records if they fill
+    the buffer or it's time to start a new file."""
+    if record is None:
+      return
+
+    # If we've got a list, hope it's a list of records. Recurse,
+    # calling write() on each of the list elements in order.
+    if type(record) is list:
+      for single_record in record:
+        self.write(single_record)
+      return
+
+    if type(record) is dict:
+      try:
+        record = DASRecord(data_id=record.get('data_id', 'no_data_id'),
+                           timestamp=record.get('timestamp', None),
+                           fields=record['fields'])
+      except KeyError:
+        logging.error('ParquetWriter unable to create DASRecord from dict: %s',
+                      record)
+        return
+    if not type(record) is DASRecord:
+      logging.error('ParquetWriter received non-DASRecord: %s', record)
+      return
+    if not record.fields:
+      return
+
+    data_id = record.data_id or 'no_data_id'
+    period = timestamp.date_str(record.timestamp, date_format=self.date_format)
+    if self.rollover_hourly:
+      period += timestamp.date_str(record.timestamp, date_format='_%H00')
+
+    # Time to start a new file?
+    if self.periods.get(data_id, period) != period:
+      self._write_buffer(data_id)
+      self._close_file(data_id)
+    self.periods[data_id] = period
+
+    buffer = self.buffers.setdefault(data_id, [])
+    buffer.append(record)
+    if len(buffer) >= self.buffer_records:
+      self._write_buffer(data_id)
+
+  ############################
+  def flush(self):
+    """Write out all buffered records and complete all open files."""
+    for data_id in list(self.buffers):
+      self._write_buffer(data_id)
+    for data_id in list(self.files):
+      self._close_file(data_id)
+
+  ############################
+  def _write_buffer(self, data_id):
+    """Write the buffered records of a data_id as a row group."""
+    records = self.buffers.get(data_id, None)
+    if not records:
+      return
+    self.buffers[data_id] = []
+
+    field_names = []
+    for record in records:
+      for field in record.fields:
+        if not field in field_names:
+          field_names.append(field)
+    batch_types = {field: column_type([r.fields.get(field) for r in records])
+                   for field in field_names}
+
+    # If the open file's columns can't hold these records, complete it
+    # and start another whose columns can hold both.
+    open_file = self.files.get(data_id, None)
+    if open_file:
+      types = dict(open_file['types'])
+      for field, batch_type in batch_types.items():
+        types[field] = merge_types(types.get(field, None), batch_type) or 'string'
+      if types != open_file['types']:
+        self._close_file(data_id)
+        open_file = None
+    else:
+      types = batch_types
+
+    if not open_file:
+      open_file = self._open_file(data_id, types)
+
+    types = open_file['types']
+    columns = {'timestamp': [record.timestamp for record in records]}
+    for field, field_type in types.items():
+      columns[field] = [convert_value(record.fields.get(field), field_type)
+                        for record in records]
+    table = pyarrow.Table.from_pydict(columns, schema=open_file['schema'])
+    open_file['writer'].write_table(table)
+
+  ############################
+  def _open_file(self, data_id, types):
+    """Open a new file for the data_id with columns of the given types."""
+    # Columns whose type we don't know yet (because all values so far
+    # have been None) are stored as strings.
+    types = {field: field_type or 'string' for field, field_type in types.items()}
+    schema = pyarrow.schema(
+      [('timestamp', pyarrow.float64())] +
+      [(field, pyarrow.type_for_alias(field_type))
+       for field, field_type in types.items()],
+      metadata={DATA_ID_METADATA_KEY: data_id.encode('utf-8')})
+
+    base = '%s-%s-%s' % (self.filebase, data_id, self.periods[data_id])
+    filename = base + '.parquet'
+    suffix = 0
+    while os.path.exists(filename):
+      suffix += 1
+      filename = '%s.%d.parquet' % (base, suffix)
+
+    logging.info('ParquetWriter opening new file: %s', filename)
+    writer = pyarrow.parquet.ParquetWriter(filename, schema,
+                                           compression=self.compression)
+    self.files[data_id] = {'writer': writer, 'filename': filename,
+                           'schema': schema, 'types': types}
+    return self.files[data_id]
+
+  ############################
+  def _close_file(self, data_id):
+    """Complete the data_id's open file, if any."""
+    open_file = self.files.pop(data_id, None)
+    if open_file:
+      logging.info('ParquetWriter closing file: %s', open_file['filename'])
+      open_file['writer'].close()
@@ -21,6 +21,39 @@ SAMPLE_DATA = ['f1 line 1',
                'f1 line 2',
                'f1 line 3']
 
+################################################################################
+class SlowWriter(Writer):
+  """Writer that takes a while to write, and remembers what it wrote."""
+  def __init__(self, delay=0.1):
+    super().__init__(input_format=formats.Text)
+    self.delay = delay
+    self.records = []
+
+  def write(self, record):
+    time.sleep(self.delay)
+    self.records.append(record)
+
+################################################################################
+class BrokenWriter(Writer):
+  """Writer that raises an exception when asked to write."""
+  def write(self, record):
+    raise ValueError('BrokenWriter can\'t write "%s"' % record)
+
+################################################################################
+class BufferingWriter(Writer):
+  """Writer that holds records until asked to flush them."""
+  def __init__(self):
+    super().__init__(input_format=formats.Text)
+    self.buffer = []
+    self.records = []
+
+  def write(self, record):
+    self.buffer.append(record)
+
+  def flush(self):
+    self.records.extend(self.buffer)
+    self.buffer = []
+
 ################################################################################
 class TestComposedWriter(unittest.TestCase):
 
@@ -99,6 +132,89 @@ class TestComposedWriter(unittest.TestCase):
       self.assertEqual('p2 p1 ' + line, f1_line)
       self.assertEqual('p2 p1 ' + line, f2_line)
 
+  ############################
+  def test_write_batch(self):
+    for worker_threads in [False, True]:
+      slow_1 = SlowWriter(delay=0)
+      slow_2 = SlowWriter(delay=0)
+      writer = ComposedWriter(transforms=[PrefixTransform('p1')],
+                              writers=[slow_1, slow_2],
+                              worker_threads=worker_threads)
+      writer.write_batch(SAMPLE_DATA)
+      expected = ['p1 ' + line for line in SAMPLE_DATA]
+      self.assertEqual(slow_1.records, expected)
+      self.assertEqual(slow_2.records, expected)
+
+  ############################
+  def test_worker_threads_blocking(self):
+    slow_1 = SlowWriter(delay=0.05)
+    slow_2 = SlowWriter(delay=0.05)
+    writer = ComposedWriter(transforms=[PrefixTransform('p1')],
+                            writers=[slow_1, slow_2],
+                            worker_threads=True)
+    for line in SAMPLE_DATA:
+      writer.write(line)
+      # Blocking, so every writer should have the record by now
+      self.assertEqual(slow_1.records[-1], 'p1 ' + line)
+      self.assertEqual(slow_2.records[-1], 'p1 ' + line)
+
+    # Worker threads should be reused, not recreated
+    self.assertEqual(len(writer.writer_threads), 2)
+    for t in writer.writer_threads:
+      self.assertTrue(t.is_alive())
+
+  ############################
+  def test_worker_threads_nonblocking(self):
+    slow_1 = SlowWriter(delay=0.1)
+    slow_2 = SlowWriter(delay=0.01)
+    writer = ComposedWriter(writers=[slow_1, slow_2],
+                            worker_threads=True, blocking=False,
+                            queue_size=len(SAMPLE_DATA))
+    start = time.time()
+    for line in SAMPLE_DATA:
+      writer.write(line)
+
+    # We should have returned before the slow writer finished
+    self.assertLess(time.time() - start, 0.1 * len(SAMPLE_DATA))
+    self.assertLess(len(slow_1.records), len(SAMPLE_DATA))
+
+    # After flushing, everything should be there, in order
+    writer.flush()
+    self.assertEqual(slow_1.records, SAMPLE_DATA)
+    self.assertEqual(slow_2.records, SAMPLE_DATA)
+
+  ############################
+  def test_worker_threads_exceptions(self):
+    slow = SlowWriter(delay=0)
+    writer = ComposedWriter(writers=[slow, BrokenWriter()],
+                            worker_threads=True)
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      with self.assertRaises(ValueError):
+        writer.write(SAMPLE_DATA[0])
+
+    # Non-blocking: exception shows up on flush, or next write
+    writer = ComposedWriter(writers=[slow, BrokenWriter()],
+                            worker_threads=True, blocking=False)
+    writer.write(SAMPLE_DATA[0])
+    with self.assertLogs(logging.getLogger(), logging.ERROR):
+      with self.assertRaises(ValueError):
+        writer.flush()
+
+  ############################
+  def test_flush_buffering_writers(self):
+    for worker_threads in [False, True]:
+      buffering = BufferingWriter()
+      slow = SlowWriter(delay=0)
+      writer = ComposedWriter(writers=[buffering, slow],
+                              worker_threads=worker_threads)
+      for line in SAMPLE_DATA:
+        writer.write(line)
+      self.assertEqual(slow.records, SAMPLE_DATA)
+      self.assertEqual(buffering.records, [])
+
+      writer.flush()
+      self.assertEqual(buffering.records, SAMPLE_DATA)
+
 ################################################################################
 if __name__ == '__main__':
   import argparse
@@ -3,6 +3,8 @@
 import logging
 import random
 import sys
+import threading
+import time
 import unittest
 import warnings
 
@@ -10,6 +12,7 @@ from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(r
 from database.settings import DATABASE_ENABLED
 
 from logger.utils.das_record import DASRecord
+from logger.utils.record_spool import RecordSpool
 from logger.writers.database_writer import DatabaseWriter
 from logger.utils.nmea_parser import NMEAParser
 
@@ -63,8 +66,76 @@ SINGLE_RESULTS = [
   {'S330HeadingTrue': [(1509772341.25601, 235.18)]}
 ]
 
+################################################################################
+class FakeConnector:
+  """Stand-in for a database connector that refuses any batch
+  containing a record with a field named 'bad', and can be told that
+  the database is unreachable."""
+  def __init__(self):
+    self.written = []
+    self.connected = True
+
+  def write_record(self, record):
+    self.write_records([record])
+
+  def write_records(self, records):
+    if not self.connected:
+      raise ConnectionError('database unreachable')
+    if any('bad' in record.fields for record in records):
+      raise ValueError('bad value')
+    self.written.extend(records)
+
+################################################################################
+def fake_writer(connector):
+  """Return a DatabaseWriter using connector, without needing a
+  configured database."""
+  writer = DatabaseWriter.__new__(DatabaseWriter)
+  writer.db = connector
+  writer.spool = RecordSpool()
+  writer.batch_size = 0
+  writer.buffer = []
+  writer.buffer_start = None
+  writer.buffer_lock = threading.Lock()
+  return writer
+
+################################################################################
 class TestDatabaseWriter(unittest.TestCase):
 
+  ############################
+  def test_bad_record_in_batch(self):
+    connector = FakeConnector()
+    writer = fake_writer(connector)
+    records = [DASRecord(timestamp=i, fields={'good': i})
+               for i in range(1, 6)]
+    records[2] = DASRecord(timestamp=3, fields={'bad': 3})
+
+    # One bad record shouldn't lose the rest of the batch
+    with self.assertLogs(level='ERROR'):
+      writer.write_batch(records)
+    self.assertEqual([r.timestamp for r in connector.written], [1, 2, 4, 5])
+    self.assertEqual(len(writer.spool), 0)
+
+  ############################
+  def test_bad_record_in_spool(self):
+    connector = FakeConnector()
+    writer = fake_writer(connector)
+    records = [DASRecord(timestamp=i, fields={'good': i})
+               for i in range(1, 6)]
+    records[1] = DASRecord(timestamp=2, fields={'bad': 2})
+
+    # Spool while the database is unreachable...
+    connector.connected = False
+    with self.assertLogs(level='WARNING'):
+      writer.write_batch(records)
+    self.assertEqual(len(writer.spool), 5)
+
+    # ...and don't let the bad record keep the spool from draining
+    connector.connected = True
+    with self.assertLogs(level='ERROR'):
+      writer.flush()
+    self.assertEqual([r.timestamp for r in connector.written], [1, 3, 4, 5])
+    self.assertEqual(len(writer.spool), 0)
+
   ############################
   @unittest.skipUnless(DATABASE_ENABLED, 'Skipping test of DatabaseWriter; '
                        'Database not configured in database/settings.py.')
@@ -90,6 +161,38 @@ class TestDatabaseWriter(unittest.TestCase):
           self.assertEqual(result, SINGLE_RESULTS[index])
           index += 1
 
+  ############################
+  @unittest.skipUnless(DATABASE_ENABLED, 'Skipping test of DatabaseWriter; '
+                       'Database not configured in database/settings.py.')
+  def test_database_writer_batch(self):
+    parser = NMEAParser()
+    writer = DatabaseWriter(database='test', host='localhost',
+                            user='test', password='test',
+                            batch_size=5, batch_timeout=0.5)
+    writer.db.exec_sql_command('truncate table data')
+
+    records = [parser.parse_record(s) for s in SAMPLE_DATA]
+
+    # Fewer than batch_size records should wait in the buffer...
+    for record in records[:3]:
+      writer.write(record)
+    self.assertEqual(writer.db.read(), {})
+
+    # ...until batch_timeout has elapsed
+    time.sleep(1)
+    self.assertEqual(writer.db.read(), SINGLE_RESULTS[0])
+
+    for record in records[3:]:
+      writer.write(record)
+    writer.flush()
+    index = 1
+    result = writer.db.read()
+    while result:
+      self.assertEqual(result, SINGLE_RESULTS[index])
+      index += 1
+      result = writer.db.read()
+    self.assertEqual(index, len(SINGLE_RESULTS))
+
 
 if __name__ == '__main__':
   import argparse
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import collections
+import logging
+import sys
+import threading
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.writers.influxdb_writer import InfluxDBWriter
+from logger.writers.influxdb_writer import field_value, line_protocol
+
+################################################################################
+class FakeWriteError(Exception):
+  """Stand-in for the client's ApiException, with an HTTP status."""
+  def __init__(self, status=None):
+    super().__init__('status %s' % status)
+    self.status = status
+
+################################################################################
+class FakeWriteAPI:
+  """Stand-in for the client's write API that records the batches it's
+  given, and raises the next of 'failures' (if any isn't None) instead
+  of accepting a batch."""
+  def __init__(self, failures=None):
+    self.batches = []
+    self.failures = list(failures or [])
+
+  def write(self, bucket, org, record, write_precision):
+    failure = self.failures.pop(0) if self.failures else None
+    if failure:
+      raise failure
+    self.batches.append(list(record))
+
+################################################################################
+def fake_writer(write_api, batch_size=3, retry_buffer_size=100):
+  """Return an InfluxDBWriter using write_api, without needing a
+  running InfluxDB or a flush thread."""
+  writer = InfluxDBWriter.__new__(InfluxDBWriter)
+  writer.write_api = write_api
+  writer.bucket_id = 'bucket'
+  writer.org_id = 'org'
+  writer.write_precision = 'ns'
+  writer.batch_size = batch_size
+  writer.retry_buffer_size = retry_buffer_size
+  writer.report_interval = 0
+  writer.buffer = []
+  writer.retry_buffer = collections.deque()
+  writer.buffer_lock = threading.Lock()
+  writer.write_lock = threading.Lock()
+  writer.flush_now = threading.Event()
+  writer.stats = {'points': 0, 'batches': 0, 'failed_batches': 0,
+                  'dropped_points': 0, 'write_seconds': 0.0}
+  return writer
+
+################################################################################
+class TestInfluxDBWriter(unittest.TestCase):
+  ############################
+  def test_field_value(self):
+    self.assertEqual(field_value(1.5), '1.5')
+    self.assertEqual(field_value(3), '3i')
+    self.assertEqual(field_value(True), 'true')
+    self.assertEqual(field_value('say "hi" \\o/'), '"say \\"hi\\" \\\\o/"')
+    self.assertIsNone(field_value(None))
+    self.assertIsNone(field_value(float('nan')))
+    self.assertIsNone(field_value(float('inf')))
+
+  ############################
+  def test_line_protocol(self):
+    self.assertEqual(
+      line_protocol('gyr1', {'Heading': 235.18, 'Count': 7, 'Flag': 'A'},
+                    1509772339.5),
+      'gyr1,sensor=gyr1 Heading=235.18,Count=7i,Flag="A" 1509772339500000000')
+
+    # Escape spaces, commas and equals signs; skip unrepresentable values
+    self.assertEqual(
+      line_protocol('my sensor', {'a,b': 1.0, 'c=d': None}, 1.0),
+      'my\\ sensor,sensor=my\\ sensor a\\,b=1.0 1000000000')
+
+    self.assertIsNone(line_protocol('gyr1', {'Heading': None}, 1.0))
+    self.assertIsNone(line_protocol('gyr1', {}, 1.0))
+
+  ############################
+  def test_write_batch(self):
+    write_api = FakeWriteAPI(failures=[None, FakeWriteError(400),
+                                       FakeWriteError(429),
+                                       FakeWriteError(503), ValueError()])
+    writer = fake_writer(write_api)
+
+    self.assertTrue(writer._write_batch(['a', 'b']))
+    self.assertEqual(write_api.batches, [['a', 'b']])
+
+    # A bad batch is discarded rather than retried...
+    with self.assertLogs(level='ERROR'):
+      self.assertTrue(writer._write_batch(['c', 'd', 'e']))
+    self.assertEqual(writer.stats['dropped_points'], 3)
+
+    # ...but throttling, server errors and lost connections are retried
+    with self.assertLogs(level='WARNING'):
+      self.assertFalse(writer._write_batch(['f']))
+      self.assertFalse(writer._write_batch(['f']))
+      self.assertFalse(writer._write_batch(['f']))
+    self.assertEqual(write_api.batches, [['a', 'b']])
+    self.assertEqual(writer.stats['points'], 2)
+    self.assertEqual(writer.stats['batches'], 1)
+    self.assertEqual(writer.stats['failed_batches'], 4)
+    self.assertEqual(writer.stats['dropped_points'], 3)
+
+  ############################
+  def test_retry_later(self):
+    writer = fake_writer(FakeWriteAPI(), retry_buffer_size=4)
+    writer._retry_later(['a', 'b'])
+    self.assertEqual(list(writer.retry_buffer), ['a', 'b'])
+
+    # Beyond retry_buffer_size, the oldest points are discarded
+    with self.assertLogs(level='ERROR'):
+      writer._retry_later(['c', 'd', 'e'])
+    self.assertEqual(list(writer.retry_buffer), ['d', 'e', 'a', 'b'])
+    self.assertEqual(writer.stats['dropped_points'], 1)
+
+  ############################
+  def test_flush(self):
+    write_api = FakeWriteAPI()
+    writer = fake_writer(write_api, batch_size=3)
+    writer.write([{'data_id': 'gyr1', 'timestamp': i,
+                   'fields': {'Heading': float(i)}} for i in range(1, 8)])
+    self.assertEqual(len(writer.buffer), 7)
+    self.assertTrue(writer.flush_now.is_set())
+
+    # Points are written in batches of at most batch_size
+    writer.flush()
+    self.assertEqual([len(batch) for batch in write_api.batches], [3, 3, 1])
+    self.assertEqual(sum(write_api.batches, []),
+                     [line_protocol('gyr1', {'Heading': float(i)}, i)
+                      for i in range(1, 8)])
+    self.assertEqual(writer.buffer, [])
+    self.assertEqual(writer.stats['points'], 7)
+    self.assertEqual(writer.stats['batches'], 3)
+
+  ############################
+  def test_flush_retry(self):
+    write_api = FakeWriteAPI(failures=[None, FakeWriteError(503)])
+    writer = fake_writer(write_api, batch_size=2)
+    writer.buffer = ['a', 'b', 'c', 'd', 'e']
+
+    # When a batch fails, it and everything after it wait for a retry...
+    with self.assertLogs(level='WARNING'):
+      writer.flush()
+    self.assertEqual(write_api.batches, [['a', 'b']])
+    self.assertEqual(list(writer.retry_buffer), ['c', 'd', 'e'])
+
+    # ...and are written, in order, before anything newer
+    writer.buffer = ['f']
+    writer.flush()
+    self.assertEqual(write_api.batches, [['a', 'b'], ['c', 'd'], ['e', 'f']])
+    self.assertEqual(len(writer.retry_buffer), 0)
+    self.assertEqual(writer.stats['points'], 6)
+    self.assertEqual(writer.stats['failed_batches'], 1)
+    self.assertEqual(writer.stats['dropped_points'], 0)
+
+  ############################
+  def test_flush_retry_buffer_full(self):
+    write_api = FakeWriteAPI(failures=[FakeWriteError(503)])
+    writer = fake_writer(write_api, batch_size=2, retry_buffer_size=3)
+    writer.buffer = ['a', 'b', 'c', 'd', 'e']
+
+    with self.assertLogs(level='WARNING'):
+      writer.flush()
+    self.assertEqual(list(writer.retry_buffer), ['c', 'd', 'e'])
+    self.assertEqual(writer.stats['dropped_points'], 2)
+
+    writer.flush()
+    self.assertEqual(write_api.batches, [['c', 'd'], ['e']])
+    self.assertEqual(writer.stats['points'], 3)
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
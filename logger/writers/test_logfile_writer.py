@@ -11,6 +11,7 @@ from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(r
 
 from logger.writers.logfile_writer import LogfileWriter
 from logger.utils import formats
+from logger.utils.logfile_index import LogfileIndex
 
 SAMPLE_DATA = """2017-11-03T17:23:04.832875Z Nel mezzo del cammin di nostra vita
 2017-11-03T17:23:04.833188Z mi ritrovai per una selva oscura,
@@ -72,6 +73,34 @@ class TestLogfileWriter(unittest.TestCase):
       for i in r:
         self.assertEqual(lines[i], outfile.readline().rstrip())
 
+  ############################
+  def test_index(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      lines = SAMPLE_DATA.split('\n')
+      filebase = tmpdirname + '/logfile'
+
+      writer = LogfileWriter(filebase, index_interval=2)
+      for i in range(0, 5):
+        writer.write(lines[i])
+
+      # A new writer appending to the same file should pick up where
+      # the index left off.
+      writer = LogfileWriter(filebase, index_interval=2)
+      writer.write(lines[5])
+
+      for date, first, last in [('2017-11-03', 0, 3), ('2017-11-04', 3, 6)]:
+        index = LogfileIndex(filebase + '-' + date)
+        self.assertTrue(index.load())
+        self.assertEqual(last - first, index.num_lines)
+        self.assertEqual([0, 2], [entry[2] for entry in index.entries])
+
+        # Each entry should point at the start of its record
+        with open(filebase + '-' + date, 'rb') as logfile:
+          for ts, offset, line_num in index.entries:
+            logfile.seek(offset)
+            record = logfile.readline().decode('utf-8').rstrip()
+            self.assertEqual(lines[first + line_num], record)
+
 if __name__ == '__main__':
   import argparse
   parser = argparse.ArgumentParser()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import glob
+import logging
+import sys
+import tempfile
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(dirname(realpath(__file__)))))
+
+from logger.utils.das_record import DASRecord
+from logger.writers.parquet_writer import ParquetWriter, PYARROW_FOUND
+from logger.writers.parquet_writer import column_type, merge_types
+
+if PYARROW_FOUND:
+  import pyarrow.parquet
+
+# 2017-11-04T05:12:19Z
+START = 1509772339.0
+
+class TestParquetWriter(unittest.TestCase):
+  ############################
+  def test_types(self):
+    self.assertEqual(column_type([1, None, 2]), 'int64')
+    self.assertEqual(column_type([1, 2.5]), 'float64')
+    self.assertEqual(column_type([True, False]), 'bool')
+    self.assertEqual(column_type(['a', 1]), 'string')
+    self.assertIsNone(column_type([None]))
+
+    self.assertEqual(merge_types('int64', 'float64'), 'float64')
+    self.assertEqual(merge_types('float64', 'int64'), 'float64')
+    self.assertEqual(merge_types('int64', None), 'int64')
+    self.assertEqual(merge_types(None, 'bool'), 'bool')
+    self.assertEqual(merge_types('bool', 'float64'), 'string')
+
+  ############################
+  @unittest.skipUnless(PYARROW_FOUND, 'pyarrow not installed')
+  def test_write(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      filebase = tmpdirname + '/NBP1406'
+      writer = ParquetWriter(filebase, buffer_records=10)
+
+      # Two data_ids, one of which rolls over to the next day
+      for i in range(25):
+        writer.write(DASRecord(data_id='gyr1', timestamp=START + i * 3600,
+                               fields={'Heading': 100 + i, 'Flag': 'A'}))
+        writer.write({'data_id': 'mwx1', 'timestamp': START + i,
+                      'fields': {'Temp': 20.5 + i}})
+      writer.flush()
+
+      self.assertEqual(sorted(glob.glob(tmpdirname + '/*')),
+                       [filebase + '-gyr1-2017-11-04.parquet',
+                        filebase + '-gyr1-2017-11-05.parquet',
+                        filebase + '-mwx1-2017-11-04.parquet'])
+
+      table = pyarrow.parquet.read_table(filebase + '-gyr1-2017-11-04.parquet')
+      self.assertEqual(table.schema.names, ['timestamp', 'Heading', 'Flag'])
+      self.assertEqual(table.schema.metadata[b'data_id'], b'gyr1')
+      self.assertEqual(table.column('Heading').to_pylist(),
+                       list(range(100, 119)))
+
+      # Records for a completed day, or that don't fit the existing
+      # columns, go to a new file
+      writer.write(DASRecord(data_id='mwx1', timestamp=START + 100,
+                             fields={'Temp': 30, 'Pressure': 1013.2}))
+      writer.flush()
+      table = pyarrow.parquet.read_table(filebase + '-mwx1-2017-11-04.1.parquet')
+      self.assertEqual(table.to_pydict(), {'timestamp': [START + 100],
+                                           'Temp': [30.0],
+                                           'Pressure': [1013.2]})
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -29,6 +29,20 @@ class TestWriter(unittest.TestCase):
     byte_w = writer.Writer(input_format=formats.Bytes)
     with self.assertRaises(NotImplementedError):
       byte_w.write('this should fail')
+    with self.assertRaises(NotImplementedError):
+      byte_w.write_batch(['this should fail'])
+
+  def test_write_batch(self):
+    class ListWriter(writer.Writer):
+      def __init__(self):
+        super().__init__()
+        self.records = []
+      def write(self, record):
+        self.records.append(record)
+
+    list_w = ListWriter()
+    list_w.write_batch(['a', 'b', 'c'])
+    self.assertEqual(list_w.records, ['a', 'b', 'c'])
 
   """
   def test_unknown(self):
@@ -67,6 +67,13 @@ class Writer:
                               'implementation of write () method.'
                               % self.__class__.__name__)
 
+  ############################
+  def write_batch(self, records):
+    """Write a list of records. This default implementation simply calls
+    write() on each record; writers that can do better should override it."""
+    for record in records:
+      self.write(record)
+
 ################################################################################
 class TimestampedWriter(Writer):
   """
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""Measure how long CachedDataServer subscribers wait for their updates
+while records stream in from another thread and the cache is
+periodically cleaned up and backed up to disk, as it is in a running
+server.
+
+Clients are served by real WebSocketConnections over in-process
+stand-ins for websockets, so what's measured is the server's own
+delay: the time from a client sending 'ready' to the server sending
+the update in reply, including any time the event loop spends waiting
+on, or busy with, other work.
+
+  > server/benchmark_cached_data_server.py --fields 2000 --rate 1 \
+        --back_seconds 3600 --cleanup_interval 5 --seconds 30
+
+  Prefilled 2000 fields with 3600 values each
+  Served 5180 updates to 20 clients in 30 seconds
+  Update latency (ms): p50 0.75  p90 13.48  p99 64.21  p99.9 568.24  max 578.75
+
+With this many values cached, the longest delays are the garbage
+collector's occasional full passes over the cache's millions of
+objects.
+
+Use --storage ring_buffer to benchmark the circular buffer storage, and
+--disk_cache_format journal for journaled backups.
+"""
+import asyncio
+import json
+import logging
+import os.path
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from server.cached_data_server import RecordCache, WebSocketConnection
+from server.record_journal import RecordJournal
+
+################################################################################
+class BenchmarkWebSocket:
+  """Stand-in for a client's websocket: passes requests to a
+  WebSocketConnection and times its responses to 'ready' requests."""
+  def __init__(self):
+    self.requests = asyncio.Queue()
+    self.responses = asyncio.Queue()
+
+  async def recv(self):
+    return await self.requests.get()
+
+  async def send(self, message):
+    await self.responses.put((time.time(), message))
+
+################################################################################
+async def run_client(websocket, fields, interval, latencies, quit_time):
+  """Subscribe to fields, then ask for and time updates until quit_time."""
+  await websocket.requests.put(json.dumps(
+    {'type':'subscribe', 'interval':interval,
+     'fields':{field: {'seconds': -1} for field in fields}}))
+  await websocket.responses.get()
+  while time.time() < quit_time:
+    ready_time = time.time()
+    await websocket.requests.put(json.dumps({'type':'ready'}))
+    sent_time, _ = await websocket.responses.get()
+    latencies.append(sent_time - ready_time)
+    await asyncio.sleep(interval)
+
+################################################################################
+def feed_records(cache, fields, rate, quit_time):
+  """Submit a record with a value for every field 'rate' times a second."""
+  while time.time() < quit_time:
+    now = time.time()
+    cache.submit_record({'timestamp': now,
+                         'fields': {field: now % 360 for field in fields}})
+    time.sleep(max(0, 1 / rate - (time.time() - now)))
+
+################################################################################
+async def clean_up(cache, back_seconds, disk_cache, journal):
+  """Clean up and back up the cache, as CachedDataServer does."""
+  cache.cleanup(oldest=time.time() - back_seconds)
+  loop = asyncio.get_event_loop()
+  if journal:
+    batches, snapshot = cache.journal_batches(snapshot=journal.snapshot_due())
+    await loop.run_in_executor(None, journal.save, batches, snapshot)
+  else:
+    await cache.save_changes_to_disk(disk_cache)
+
+def clean_up_loop(cache, event_loop, cleanup_interval, back_seconds,
+                  disk_cache, journal, quit_time):
+  while time.time() < quit_time:
+    time.sleep(cleanup_interval)
+    asyncio.run_coroutine_threadsafe(
+      clean_up(cache, back_seconds, disk_cache, journal), event_loop).result()
+
+################################################################################
+def percentile(sorted_values, fraction):
+  return sorted_values[min(len(sorted_values) - 1,
+                           int(fraction * len(sorted_values)))]
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--fields', dest='fields', type=int, default=100,
+                      help='Number of fields in each record')
+  parser.add_argument('--rate', dest='rate', type=float, default=10,
+                      help='Records per second to feed the cache')
+  parser.add_argument('--back_seconds', dest='back_seconds', type=float,
+                      default=600,
+                      help='Seconds of values to prefill and keep')
+  parser.add_argument('--clients', dest='clients', type=int, default=20,
+                      help='Number of subscribing clients')
+  parser.add_argument('--fields_per_client', dest='fields_per_client',
+                      type=int, default=20,
+                      help='Number of fields each client subscribes to')
+  parser.add_argument('--interval', dest='interval', type=float, default=0.1,
+                      help='Interval at which clients are served updates')
+  parser.add_argument('--cleanup_interval', dest='cleanup_interval',
+                      type=float, default=2,
+                      help='Seconds between cleanups and disk backups')
+  parser.add_argument('--storage', dest='storage', default='list',
+                      help='RecordCache storage type')
+  parser.add_argument('--disk_cache_format', dest='disk_cache_format',
+                      default='json', help='"json" or "journal"')
+  parser.add_argument('--seconds', dest='seconds', type=float, default=20,
+                      help='How long to run')
+  args = parser.parse_args()
+
+  logging.basicConfig(format='%(asctime)-15s %(message)s')
+
+  fields = ['Field%03d' % i for i in range(args.fields)]
+  event_loop = asyncio.new_event_loop()
+  asyncio.set_event_loop(event_loop)
+  cache = RecordCache(storage=args.storage, event_loop=event_loop)
+
+  # Prefill the cache with back_seconds of values
+  num_prefill = int(args.back_seconds * args.rate)
+  start = time.time() - args.back_seconds
+  for i in range(num_prefill):
+    cache.cache_record({'timestamp': start + i / args.rate,
+                        'fields': {field: i % 360 for field in fields}})
+  print('Prefilled %d fields with %d values each' % (len(fields), num_prefill))
+
+  tmpdir = tempfile.TemporaryDirectory()
+  journal = None
+  if args.disk_cache_format == 'journal':
+    journal = RecordJournal(os.path.join(tmpdir.name, 'journal'))
+
+  quit_time = time.time() + args.seconds
+  threading.Thread(target=feed_records, daemon=True,
+                   args=(cache, fields, args.rate, quit_time)).start()
+  threading.Thread(target=clean_up_loop, daemon=True,
+                   args=(cache, event_loop, args.cleanup_interval,
+                         args.back_seconds, tmpdir.name, journal,
+                         quit_time)).start()
+
+  # Each client subscribes to a different slice of the fields
+  latencies = []
+  clients = []
+  for i in range(args.clients):
+    websocket = BenchmarkWebSocket()
+    connection = WebSocketConnection(websocket, cache, args.interval)
+    first = (i * args.fields_per_client) % len(fields)
+    client_fields = (fields + fields)[first:first + args.fields_per_client]
+    clients.append(connection.serve_requests())
+    clients.append(run_client(websocket, client_fields, args.interval,
+                              latencies, quit_time))
+
+  async def run_clients():
+    tasks = [asyncio.ensure_future(client) for client in clients]
+    await asyncio.sleep(args.seconds)
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+  event_loop.run_until_complete(run_clients())
+  if journal:
+    journal.close()
+
+  latencies.sort()
+  print('Served %d updates to %d clients in %g seconds'
+        % (len(latencies), args.clients, args.seconds))
+  if latencies:
+    print('Update latency (ms): ' + '  '.join(
+      '%s %.2f' % (label, 1000 * percentile(latencies, fraction))
+      for label, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99),
+                              ('p99.9', 0.999), ('max', 1)]))
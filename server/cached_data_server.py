@@ -29,7 +29,10 @@ says to
    by setting ``--max_records=0`` on the command line.)
 3. Periodically back up the in-memory cache to a disk-based cache at
    /var/tmp/openrvdas/disk_cache (By default, back up every 60 seconds;
-   this can be overridden with the --cleanup_interval argument).
+   this can be overridden with the --cleanup_interval argument). With
+   ``--disk_cache_format journal``, only the values that have arrived
+   since the last backup are written, appended to a binary journal
+   (see server/record_journal.py).
 4. Wait for clients to connect to the websocket at port 8766 and serve
    them the requested data. Web clients may issue JSON-encoded
    requests of the following formats (see the definition of
@@ -49,7 +52,10 @@ says to
             0  - provide only new values that arrive after subscription
            -1  - provide the most recent value, and then all future new ones
            num - provide num seconds of back data, then all future new ones
-         If 'seconds' is missing, use '0' as the default.
+         If 'seconds' is missing, use '0' as the default. The request
+         may also specify an 'encoding' of 'json' (the default),
+         'columnar' or 'msgpack' for the responses that follow (see
+         logger/utils/wire_encoding.py).
    {'type':'ready'}
        - indicate that client is ready to receive the next set of updates
          for subscribed fields.
@@ -61,12 +67,13 @@ says to
 ```
 """
 import asyncio
+import collections
+import concurrent.futures
 import json
 import logging
 import os
 import os.path
 import pprint
-import re
 import sys
 import threading
 import time
@@ -77,22 +84,153 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from logger.writers.text_file_writer import TextFileWriter
 from logger.utils.das_record import DASRecord
 from logger.utils.stderr_logging import StdErrLoggingHandler
+from logger.utils.subsample import SubsampleCache
+from logger.utils import wire_encoding
+from server.change_log import ChangeLog
+from server.downsample import downsample
+from server.field_buffer import FieldBuffer, FieldList
+from server.field_index import FieldIndex
+from server.record_journal import RecordJournal
+from server.rollup import FieldRollup, parse_rollup_tiers
+
+# Ways RecordCache can store each field's (timestamp, value) pairs
+STORAGE_TYPES = ['list', 'ring_buffer']
+
+# Ways CachedDataServer can back its cache up to disk
+DISK_CACHE_FORMATS = ['json', 'journal']
+
+# How many fields' values to copy out of the cache at a time when
+# backing it up to JSON files, letting the event loop serve clients
+# between batches; see RecordCache.save_changes_to_disk().
+DISK_CACHE_BATCH_FIELDS = 20
+
+# How long a CachedDataServer thread waits for a cleanup or backup it
+# has handed to the event loop before giving up on it.
+EVENT_LOOP_TIMEOUT = 60
+
+############################
+def write_disk_cache(disk_cache, values):
+  """Write one JSON-encoded cache file per field in the directory named
+  by disk_cache, from a dict mapping fields to lists of (timestamp,
+  value) pairs, as returned by RecordCache.copy_values().
+  """
+  logging.debug('Saving to cache.')
+  if not disk_cache:
+    logging.warning('save_to_disk called, but no disk_cache defined')
+    return
+
+  if not os.path.exists(disk_cache):
+    os.makedirs(disk_cache)
+
+  # Encode each field in one go: json.dump() writes a field in
+  # thousands of small pieces, holding the GIL against the event loop.
+  for field, pairs in values.items():
+    with open(disk_cache + '/' + field, 'w') as cache_file:
+      cache_file.write(json.dumps(pairs))
 
 ############################
 class RecordCache:
-  """Structure for storing/retrieving record data and metadata."""
-  def __init__(self):
+  """Structure for storing/retrieving record data and metadata.
+
+  A RecordCache is not locked: everything that reads or modifies its
+  contents must run on a single thread. In a CachedDataServer, that is
+  the thread running its event loop, so websocket connections can
+  serve data without waiting on other threads. Other threads hand
+  records to the cache via submit_record(), which queues them for the
+  event loop to add.
+  """
+  def __init__(self, storage='list', capacity=None, rollup_tiers=None,
+               event_loop=None):
     """
     In-memory storage for key:value pairs.
+    ```
+    storage   How to store each field's (timestamp, value) pairs:
+              'list' - in a Python list (see FieldList).
+              'ring_buffer' - in a circular buffer, with numeric values
+                  packed into arrays (see FieldBuffer).
+
+    capacity  If storage is 'ring_buffer' and capacity is not None, the
+              maximum number of pairs to keep for each field. When a
+              field's buffer is full, each new value displaces the oldest.
+
+    rollup_tiers
+              Optional list of (resolution, retention) tuples, in
+              seconds. For each, maintain rollups (mean, min, max and
+              count) of each numeric field's values in buckets of
+              'resolution' seconds, keeping 'retention' seconds of them,
+              regardless of how long raw values are kept. See
+              server/rollup.py.
+
+    event_loop
+              If not None, the asyncio event loop whose thread owns the
+              cache. Records passed to submit_record() are added by a
+              call to drain() scheduled on it.
+    ```
     """
+    if not storage in STORAGE_TYPES:
+      raise ValueError('RecordCache storage must be one of %s; found "%s"'
+                       % (STORAGE_TYPES, storage))
+    self.storage = storage
+    self.capacity = capacity
+    self.rollup_tiers = rollup_tiers or []
+
+    # field: list of FieldRollups, one for each of the rollup tiers
+    self.rollups = {}
+
     self.data = {}
-    self.data_lock = threading.Lock() # When operating on whole dict
+
+    # Count of values ever added to each field. The most recent value
+    # in a field's storage has this sequence number; see values_between().
+    self.sequence = {}
+
+    # Fields that have received values since pop_changed_fields() was
+    # last called, mapped to their sequence numbers before they did.
+    self.changed_fields = {}
+
+    # Shared, pre-encoded log of new values for serving subscriptions
+    self.change_log = ChangeLog(self)
+
+    # Shared subsampled (e.g. averaged) values for serving subscriptions
+    self.subsample_cache = SubsampleCache()
 
     self.metadata = {}
-    self.metadata_lock = threading.Lock()
 
-    # Create a lock for each key so threads don't step on each other
-    self.locks = {key: threading.Lock() for key in self.keys()}
+    # Index of field names by the wildcard patterns they match
+    self.field_index = FieldIndex()
+
+    # Sequence number of the last value of each field that we've
+    # appended to a RecordJournal; see save_to_journal().
+    self.journaled_sequence = {}
+
+    # Sequence number of each field's last value when we last wrote it
+    # to a JSON disk cache; see save_changes_to_disk().
+    self.saved_sequence = {}
+
+    # Records submitted from other threads, waiting to be added by
+    # drain(). Deque appends and pops are thread-safe.
+    self.event_loop = event_loop
+    self.ingest_queue = collections.deque()
+    self.drain_scheduled = False
+
+  ############################
+  def submit_record(self, record):
+    """Queue a record to be added to the cache by drain(). Unlike the
+    other methods, this may be called from any thread. If the cache has
+    an event loop, schedule a call to drain() on it, unless one is
+    already scheduled."""
+    self.ingest_queue.append(record)
+    if self.event_loop and not self.drain_scheduled:
+      self.drain_scheduled = True
+      self.event_loop.call_soon_threadsafe(self.drain)
+
+  ############################
+  def drain(self):
+    """Add any records queued by submit_record() to the cache."""
+    # Clear the flag first, so that a record submitted while we're
+    # draining gets a drain scheduled if we miss it.
+    self.drain_scheduled = False
+    while self.ingest_queue:
+      self.cache_record(self.ingest_queue.popleft())
 
   ############################
   def cache_record(self, record):
@@ -185,40 +323,95 @@ class RecordCache:
 
     # Add values from record to cache
     for field, value in fields.items():
-      if not field in self.locks:
-        self.locks[field] = threading.Lock()
-      with self.locks[field]:
-        if not field in self.data:
-          self.data[field] = []
-
-        if type(value) is list:
-          # Okay, for this field we have a list of values - iterate through
-          for val in value:
-            # If element in the list is itself a list or a tuple,
-            # we'll assume it's a (timestamp, value) pair. Otherwise,
-            # use the default timestamp of 'now'.
-            if type(val) in [list, tuple]:
-              self._add_tuple(field, val)
-            else:
-              self._add_tuple(field, (record_timestamp, value))
-        else:
-          # If type(value) is *not* a list, assume it's the value
-          # itself. Add it using the default timestamp.
-          self._add_tuple(field, (record_timestamp, value))
+      if not field in self.data:
+        self.data[field] = self._new_field_storage()
+        self.field_index.add(field)
+      previous_sequence = self.sequence.get(field, 0)
+
+      if type(value) is list:
+        # Okay, for this field we have a list of values - iterate through
+        for val in value:
+          # If element in the list is itself a list or a tuple,
+          # we'll assume it's a (timestamp, value) pair. Otherwise,
+          # use the default timestamp of 'now'.
+          if type(val) in [list, tuple]:
+            self._add_tuple(field, val)
+          else:
+            self._add_tuple(field, (record_timestamp, value))
+      else:
+        # If type(value) is *not* a list, assume it's the value
+        # itself. Add it using the default timestamp.
+        self._add_tuple(field, (record_timestamp, value))
+
+      self.changed_fields.setdefault(field, previous_sequence)
 
       # Is there any metadata to add? Cache whatever is in the
       # metadata.data.fields dict. Blithely overwrite whatever might
       # be there already.
       if metadata:
         metadata_fields = metadata.get('fields', {})
-        with self.metadata_lock:
-          for field, value in metadata_fields.items():
-            self.metadata[field] = value
+        for field, value in metadata_fields.items():
+          self.metadata[field] = value
+
+  ############################
+  def _new_field_storage(self, values=None):
+    """Return an empty storage object for a field, or one initialized
+    with the passed list of (timestamp, value) pairs."""
+    if self.storage == 'ring_buffer':
+      return FieldBuffer(capacity=self.capacity, values=values)
+    return FieldList(values)
 
   ############################
   def _add_tuple(self, field, value_tuple):
     #logging.debug('adding cache[%s] = %s', field, value_tuple)
-    self.data[field].append(value_tuple)
+    self.data[field].add(value_tuple[0], value_tuple[1])
+    self.sequence[field] = self.sequence.get(field, 0) + 1
+    if self.rollup_tiers:
+      self._add_to_rollups(field, [value_tuple])
+
+  ############################
+  def _add_to_rollups(self, field, values):
+    """Add a list of (timestamp, value) pairs to the field's rollups."""
+    rollups = self.rollups.get(field, None)
+    if rollups is None:
+      rollups = self.rollups[field] = [
+        FieldRollup(resolution, retention)
+        for resolution, retention in self.rollup_tiers]
+    for rollup in rollups:
+      for timestamp, value in values:
+        rollup.add(timestamp, value)
+
+  ############################
+  def get_rollup(self, field, resolution):
+    """Return the field's FieldRollup with the given resolution, or
+    None if it has none."""
+    for rollup in self.rollups.get(field, []):
+      if rollup.resolution == resolution:
+        return rollup
+    return None
+
+  ############################
+  def values_between(self, field, after, until):
+    """Return a list of the (timestamp, value) pairs for field with
+    sequence numbers greater than 'after' and no greater than 'until'
+    that are still in the cache."""
+    storage = self.data.get(field, None)
+    if not storage:
+      return []
+    last = self.sequence.get(field, 0)
+    first = last - len(storage) + 1  # sequence number of storage[0]
+    start = max(after + 1, first) - first
+    end = min(until, last) - first + 1
+    return [storage[i] for i in range(start, end)]
+
+  ############################
+  def pop_changed_fields(self):
+    """Return a dict of the fields that have received values since the
+    last call, mapped to their sequence numbers before they did, and
+    reset it."""
+    changed_fields = self.changed_fields
+    self.changed_fields = {}
+    return changed_fields
 
   ############################
   def keys(self):
@@ -230,60 +423,122 @@ class RecordCache:
     """Return a dict of metadata for the specified list of fields. If no
     fields are specified, return metadata for all fields.
     """
-    with self.metadata_lock:
-      if fields:
-        return {field:self.metadata.get(field, {}) for field in fields}
-      else:
-        return self.metadata
+    if fields:
+      return {field:self.metadata.get(field, {}) for field in fields}
+    else:
+      return self.metadata
+
+  ############################
+  def get_range(self, fields, start, end, max_points=0, method='lttb',
+                now=None):
+    """Return a dict mapping each of the listed fields (which may
+    include wildcards) to a list of its (timestamp, value) pairs with
+    timestamps from start to end, inclusive. If max_points is non-zero,
+    reduce each list to at most that many pairs using the named
+    downsampling method (see server/downsample.py). Raise ValueError
+    on a bad pattern or method.
+
+    If start is older than a field's oldest cached value, and the field
+    has rollups, its values are instead the rollup summaries of the
+    tier chosen by range_rollup().
+    """
+    now = now or time.time()
+    results = {}
+    for field_name in fields:
+      for field in self.field_index.match(field_name):
+        field_cache = self.data.get(field, None)
+        if field_cache is None:
+          continue
+        rollup = self.range_rollup(field, start, end, max_points, now)
+        if rollup:
+          pairs = rollup.between(start, end, now)
+        else:
+          pairs = field_cache.between(start, end)
+        results[field] = downsample(pairs, max_points, method)
+    return results
+
+  ############################
+  def range_rollup(self, field, start, end, max_points=0, now=None):
+    """If start is older than the field's oldest cached value, return
+    the FieldRollup to answer a range request from: the finest tier
+    whose retention reaches back to start and that has no more than
+    max_points buckets in the range, or if none has, the coarsest tier
+    reaching back to start. If no tier reaches back that far, return
+    the one that reaches furthest. Return None if the cache holds
+    values back to start, or the field has no rollups with values.
+    """
+    field_cache = self.data.get(field, None)
+    if field_cache and field_cache[0][0] <= start:
+      return None
+    rollups = [rollup for rollup in self.rollups.get(field, []) if rollup]
+    if not rollups:
+      return None
+    now = now or time.time()
+    covering = sorted([rollup for rollup in rollups
+                       if now - rollup.retention <= start],
+                      key=lambda rollup: rollup.resolution)
+    if not covering:
+      return max(rollups, key=lambda rollup: rollup.retention)
+    for rollup in covering:
+      if not max_points or (end - start) / rollup.resolution <= max_points:
+        return rollup
+    return covering[-1]
 
   ############################
   def cleanup(self, oldest=0, max_records=0):
     """Remove any data from cache with a timestamp older than 'oldest'
     seconds, but keep at least one (most recent) value.
     If max_records is non-zero, truncate to that many of the most
-    recent records.
+    recent records. Also discard rollups older than their tiers'
+    retention.
     """
     logging.debug('Cleaning up cache')
+    now = time.time()
     fields = self.keys()
     for field in fields:
-      if not field in self.locks:
-        self.locks[field] = threading.Lock()
-      with self.locks[field]:
-        value_list = self.data[field]
-
-        # If max_records is specified, truncate to keep that many of
-        # most recent records.
-        if max_records and len(value_list) > max_records:
-          #logging.warning('Truncating %s %d->%d records', field,
-          #                len(value_list), max_records)
-          value_list = value_list[-max_records:]
+      self.data[field].trim(oldest=oldest, max_records=max_records)
+      for rollup in self.rollups.get(field, []):
+        rollup.trim(now)
 
-        for i in range(len(value_list)): # Iterate until find value that's
-          if value_list[i][0] > oldest:  # not too old
-            break
-        last_index = min(i, len(value_list)-1) # But keep at least one value
-        self.data[field] = value_list[i:]
+  ############################
+  def copy_values(self, fields=None):
+    """Return a dict mapping each field (or each of the passed fields)
+    to a list of its (timestamp, value) pairs, e.g. for another thread
+    to write to disk."""
+    if fields is None:
+      fields = self.keys()
+    return {field: self.data[field].to_list() for field in fields}
 
   ############################
   def save_to_disk(self, disk_cache):
     """Create one JSON-encoded cache file per field in the directory named
     by disk_cache.
     """
-    logging.debug('Saving to cache.')
-    if not disk_cache:
-      logging.warning('save_to_disk called, but no disk_cache defined')
-      return
+    write_disk_cache(disk_cache, self.copy_values())
 
-    if not os.path.exists(disk_cache):
-      os.makedirs(disk_cache)
-
-    fields = self.keys()
+  ############################
+  def unsaved_fields(self):
+    """Return a list of the fields that have received values since the
+    last call, i.e. whose JSON disk cache files are out of date."""
+    fields = [field for field, sequence in self.sequence.items()
+              if self.saved_sequence.get(field, 0) != sequence]
     for field in fields:
-      if not field in self.locks:
-        self.locks[field] = threading.Lock()
-      with self.locks[field]:
-        with open(disk_cache + '/' + field, 'w') as cache_file:
-          json.dump(self.data[field], cache_file)
+      self.saved_sequence[field] = self.sequence[field]
+    return fields
+
+  ############################
+  async def save_changes_to_disk(self, disk_cache,
+                                 batch_fields=DISK_CACHE_BATCH_FIELDS):
+    """Rewrite the JSON cache files in disk_cache of the fields that
+    have received values since the last call. Values are copied out of
+    the cache batch_fields fields at a time and written from another
+    thread, so the event loop is free to serve clients in between.
+    """
+    loop = asyncio.get_event_loop()
+    fields = self.unsaved_fields()
+    for start in range(0, len(fields), batch_fields):
+      values = self.copy_values(fields[start:start + batch_fields])
+      await loop.run_in_executor(None, write_disk_cache, disk_cache, values)
 
   ############################
   def load_from_disk(self, disk_cache):
@@ -302,16 +557,60 @@ class RecordCache:
                    if os.path.isfile(os.path.join(disk_cache, f))]
     logging.debug('Got cached fields: %s', field_files)
     for field in field_files:
-      if not field in self.locks:
-        self.locks[field] = threading.Lock()
       try:
-        with self.locks[field]:
-          with open(disk_cache + '/' + field, 'r') as cache_file:
-            self.data[field] = json.load(cache_file)
+        with open(disk_cache + '/' + field, 'r') as cache_file:
+          self.data[field] = self._new_field_storage(json.load(cache_file))
+          self.field_index.add(field)
+          if self.rollup_tiers:
+            self._add_to_rollups(field, self.data[field])
+          self.sequence[field] = self.sequence.get(field, 0) + \
+                                 len(self.data[field])
+          # Values we've loaded are already on disk
+          self.saved_sequence[field] = self.sequence[field]
 
       except (json.decoder.JSONDecodeError, UnicodeDecodeError):
         logging.warning('Failed to parse cache for %s', field)
 
+  ############################
+  def journal_batches(self, snapshot=False):
+    """Return a tuple (batches, values), where batches maps each field
+    to a list of the values that have arrived since the last call, to
+    be appended to a RecordJournal, and values is None or, if snapshot
+    is True, a copy of the cache's current values for the journal to
+    snapshot. See RecordJournal.save().
+    """
+    batches = {}
+    for field in self.keys():
+      last = self.sequence.get(field, 0)
+      batches[field] = self.values_between(
+        field, self.journaled_sequence.get(field, 0), last)
+      self.journaled_sequence[field] = last
+    return batches, (self.copy_values() if snapshot else None)
+
+  ############################
+  def save_to_journal(self, journal):
+    """Append the values that have arrived since the last call to the
+    passed RecordJournal. If the journal is due for a snapshot, also
+    hand it a copy of the cache's current values to write out in the
+    background.
+    """
+    logging.debug('Saving to journal.')
+    journal.save(*self.journal_batches(snapshot=journal.snapshot_due()))
+
+  ############################
+  def load_from_journal(self, journal):
+    """Load the values saved in the passed RecordJournal."""
+    logging.info('Loading from journal at %s', journal.directory)
+    for field, values in journal.replay().items():
+      self.data[field] = self._new_field_storage(values)
+      self.field_index.add(field)
+      if self.rollup_tiers:
+        self._add_to_rollups(field, self.data[field])
+      self.sequence[field] = self.sequence.get(field, 0) + \
+                             len(self.data[field])
+      # Values we've loaded are already in the journal
+      self.journaled_sequence[field] = self.sequence[field]
+
 ############################
 class WebSocketConnection:
   """Handle the websocket connection, serving data as requested."""
@@ -322,6 +621,10 @@ class WebSocketConnection:
     self.interval = interval
     self.quit_flag = False
 
+    # How responses are encoded; may be changed by a subscribe request.
+    # See logger/utils/wire_encoding.py.
+    self.encoding = 'json'
+
   ############################
   def closed(self):
     """Has our client closed the connection?"""
@@ -341,29 +644,20 @@ class WebSocketConnection:
 
     field_name - the name of the field as specified in the subscription request
     """
+    return self.cache.field_index.match(field_name)
 
-    matching_field_names = set()
-
-    # If the field name is a wildcard
-    if '*' in field_name:
-      field_name = field_name.replace("*", ".+")
-
-      for field in self.cache.keys():
-        if re.search(field_name, field):
-          matching_field_names.add(field)
-
-    # If here, the field name is not a wildcard
-    else:
-      matching_field_names.add(field_name)
+  ############################
 
-    return list(matching_field_names)
+  async def send_encoded_response(self, encoded_response):
+    """Send a response that has already been encoded."""
+    logging.debug('CachedDataServer sending %d bytes', len(encoded_response))
+    await self.websocket.send(encoded_response)
 
   ############################
-
   async def send_json_response(self, response, is_error=False):
-    logging.debug('CachedDataServer sending %d bytes',
-                  len(json.dumps(response)))
-    await self.websocket.send(json.dumps(response))
+    """Encode a response in the connection's encoding and send it."""
+    await self.send_encoded_response(
+      wire_encoding.encode_message(response, self.encoding))
     if is_error:
       logging.warning(response)
 
@@ -393,6 +687,9 @@ class WebSocketConnection:
         intervals):
         ```
         ```
+        It may also have a field called 'encoding', one of 'json'
+        (the default), 'columnar' or 'msgpack', specifying how
+        responses should be encoded (see logger/utils/wire_encoding.py).
         A subscription will instruct the CachedDataServer to begin
         serving JSON messages of the format
         ```
@@ -407,8 +704,28 @@ class WebSocketConnection:
         arrived since last call.
         NOTE: if the 'seconds' field is -1, server will only ever provide
         the single most recent value for the relevant field.
+        If the server keeps rollups (see RecordCache), a field's spec
+        may also include a 'resolution', in seconds, of the rollup
+        tier to serve instead of raw values, e.g.
+        ```
+          {field_name:{seconds:86400, resolution:60}}
+        ```
+        Each value served is then a dict of the mean, min, max and
+        count of the values in the rollup bucket starting at its
+        timestamp.
     ready - client has processed the previous data message and is ready
         for more.
+    range - return the cached values of the listed fields that fall in
+        a time range, optionally downsampled to a number of points:
+        ```
+          {type:'range', fields:[field_name, ...], start:1555468528,
+           end:1555554928, max_points:1000, method:'lttb'}
+        ```
+        'end' defaults to now, 'max_points' to 0 (all values) and
+        'method' to 'lttb'; the alternative is 'min_max'. See
+        server/downsample.py. Fields whose raw values don't reach back
+        to 'start' are answered from their rollups, if any, and listed
+        with the rollup resolution in the response's 'resolutions'.
     ```
     """
     # The field details specified in a subscribe request
@@ -419,6 +736,18 @@ class WebSocketConnection:
     # most recent value we have for the field, regardless of how many
     # there are, or whether we've sent it before.
     field_timestamps = {}
+
+    # A map from field_name:cursor for fields whose initial data we've
+    # sent. The cursor is the change log position of the last value
+    # we've sent, and subsequent updates for the field are assembled
+    # from the shared, pre-encoded change log fragments that follow it.
+    field_cursors = {}
+
+    # A map from wildcarded field name in the subscribe request to the
+    # timestamp to send data from for fields matching it, and a cursor
+    # into the fields that have matched it, so that we can pick up new
+    # matching fields as they appear. See server/field_index.py.
+    field_patterns = {}
     interval = self.interval # Use the default interval, uh, by default
 
     while not self.quit_flag:
@@ -426,7 +755,11 @@ class WebSocketConnection:
       try:
         logging.debug('Waiting for client')
         raw_request = await self.websocket.recv()
-        request = json.loads(raw_request)
+        request = wire_encoding.decode_message(raw_request)
+
+        # Add anything other threads have submitted, so that we respond
+        # with everything that arrived before the request.
+        self.cache.drain()
 
         # Make sure we've received a dict
         if not type(request) is dict:
@@ -474,9 +807,58 @@ class WebSocketConnection:
                'error':'request has non-dict data field'},
                is_error=True)
           else:
+            # Values sent in a columnar encoding come as a field dict
+            if request.get('encoding', 'json') != 'json':
+              data = dict(data)
+              data['fields'] = wire_encoding.decode_data(
+                data.get('fields', {}))
             self.cache.cache_record(data)
             await self.send_json_response({'type':'publish', 'status':200})
 
+        # Client wants the values of some fields over a time range,
+        # possibly downsampled. Unlike a subscription, this is one-shot.
+        elif request['type'] == 'range':
+          logging.debug('range request')
+          fields = request.get('fields', None)
+          start = request.get('start', None)
+          end = request.get('end', now)
+          max_points = request.get('max_points', 0)
+          error = None
+          if not type(fields) is list or \
+             not all(type(field) is str for field in fields):
+            error = 'range request must have a list of "fields" names'
+          elif type(start) not in (int, float) or \
+               type(end) not in (int, float):
+            error = 'range request must have numeric "start" and "end"'
+          elif type(max_points) is not int or max_points < 0:
+            error = '"max_points" must be a non-negative integer'
+          else:
+            try:
+              results = self.cache.get_range(
+                fields, start, end, max_points=max_points,
+                method=request.get('method', 'lttb'), now=now)
+            except ValueError as e:
+              error = str(e)
+          if error:
+            await self.send_json_response(
+              {'type':'range', 'status':400, 'error':error}, is_error=True)
+          else:
+            response = {'type':'range', 'status':200, 'data':results}
+            if self.encoding != 'json':
+              response['encoding'] = self.encoding
+              response['data'] = wire_encoding.encode_data(results,
+                                                           self.encoding)
+            # Note which fields' values are rollup summaries
+            resolutions = {}
+            for field in results:
+              rollup = self.cache.range_rollup(field, start, end,
+                                               max_points, now)
+              if rollup:
+                resolutions[field] = rollup.resolution
+            if resolutions:
+              response['resolutions'] = resolutions
+            await self.send_json_response(response)
+
         # Client wants to subscribe, and provides a dict of requested fields
         elif request['type'] == 'subscribe':
           logging.debug('subscribe request')
@@ -501,6 +883,32 @@ class WebSocketConnection:
               is_error=True)
             continue
 
+          # How do they want responses encoded?
+          requested_encoding = request.get('encoding', 'json')
+          try:
+            wire_encoding.check_encoding(requested_encoding)
+          except ValueError as e:
+            await self.send_json_response(
+              {'type':'subscribe', 'status':400, 'error':str(e)},
+              is_error=True)
+            continue
+
+          # Are they asking for rollups we don't keep?
+          resolutions = [resolution for resolution, _
+                         in self.cache.rollup_tiers]
+          bad_resolutions = [
+            field_spec['resolution']
+            for field_spec in raw_requested_fields.values()
+            if type(field_spec) is dict and 'resolution' in field_spec
+            and not field_spec['resolution'] in resolutions]
+          if bad_resolutions:
+            await self.send_json_response(
+              {'type':'subscribe', 'status':400,
+               'error':'no rollups with resolution %s; available '
+               'resolutions are %s' % (bad_resolutions[0], resolutions)},
+              is_error=True)
+            continue
+
           # What format do they want output in? field_dict?
           # record_list? By default, use field_dict.
           requested_format = request.get('format', 'field_dict')
@@ -514,27 +922,35 @@ class WebSocketConnection:
 
           now = time.time()
           field_timestamps = {}
+          field_cursors = {}
+          field_patterns = {}
           requested_fields = {}
 
           for field_name, field_spec in raw_requested_fields.items():
+            # If we don't have a field spec dict
+            if not type(field_spec) is dict:
+              back_seconds = 0
+            else:
+              back_seconds = field_spec.get('seconds', 0)
 
-            matching_field_names = self.get_matching_field_names(field_name)
+            if back_seconds == -1:
+              start_timestamp = -1
+            else:
+              start_timestamp = now - back_seconds
+
+            matching_field_names, cursor = \
+              self.cache.field_index.matches_since(field_name, 0)
+            if FieldIndex.is_pattern(field_name):
+              field_patterns[field_name] = (field_spec, start_timestamp,
+                                            cursor)
 
             for matching_field_name in matching_field_names:
               requested_fields[matching_field_name] = field_spec
+              field_timestamps[matching_field_name] = start_timestamp
 
-              # If we don't have a field spec dict
-              if not type(field_spec) is dict:
-                back_seconds = 0
-              else:
-                back_seconds = field_spec.get('seconds', 0)
-
-              if back_seconds == -1:
-                field_timestamps[matching_field_name] = -1
-              else:
-                field_timestamps[matching_field_name] = now - back_seconds
-
-          # Let client know request succeeded
+          # Let client know request succeeded. From here on, respond
+          # in the requested encoding.
+          self.encoding = requested_encoding
           await self.send_json_response({'type':'subscribe', 'status':200})
 
         # Client just letting us know it's ready for more. If there are
@@ -542,21 +958,61 @@ class WebSocketConnection:
         # them.
         elif request['type'] == 'ready':
           logging.debug('Websocket got ready...')
-          if not field_timestamps:
+          if not field_timestamps and not field_patterns:
             await self.send_json_response(
               {'type':'ready', 'status':400,
                'error':'client ready, but no data requested.'},
               is_error=True)
             continue
 
+          # Have any new fields appeared that match wildcards in the
+          # subscription? If so, start sending them as if they'd been
+          # there when the subscription was made.
+          for pattern, (field_spec, start_timestamp, cursor) \
+              in field_patterns.items():
+            new_fields, new_cursor = \
+              self.cache.field_index.matches_since(pattern, cursor)
+            if not new_fields:
+              continue
+            field_patterns[pattern] = (field_spec, start_timestamp, new_cursor)
+            for field_name in new_fields:
+              if not field_name in requested_fields:
+                logging.debug('New field %s matches %s', field_name, pattern)
+                requested_fields[field_name] = field_spec
+                field_timestamps[field_name] = start_timestamp
+
           ##########
           results = {}
+          encoded_results = {}
           if requested_format == 'field_dict':
+            # Bring the shared change log up to date with whatever has
+            # arrived since any connection last asked.
+            change_log = self.cache.change_log
+            change_log.update()
+
             for field_name, field_spec in requested_fields.items():
-             if not field_name in self.cache.locks:
-               logging.debug('No data for requested field %s', field_name)
-               continue
-             with self.cache.locks[field_name]:
+              # If we've already sent this field's initial data, just
+              # pass along the encoded values that have arrived since.
+              # Fragments are JSON-encoded, so connections using other
+              # encodings get the values themselves.
+              cursor = field_cursors.get(field_name, None)
+              if cursor is not None:
+                if self.encoding == 'json':
+                  fragment, field_cursors[field_name] = change_log.since(
+                    field_name, cursor)
+                  if fragment:
+                    encoded_results[field_name] = fragment
+                else:
+                  field_results, field_cursors[field_name] = \
+                    change_log.values_since(field_name, cursor)
+                  if field_results:
+                    results[field_name] = field_results
+                continue
+
+              if not field_name in self.cache.data:
+                logging.debug('No data for requested field %s', field_name)
+                continue
+              position = change_log.position(field_name)
               latest_timestamp = field_timestamps.get(field_name, 0)
               field_cache = self.cache.data.get(field_name, None)
               if field_cache is None:
@@ -571,8 +1027,9 @@ class WebSocketConnection:
               # processing/averaging them somehow.
               subsample_spec = field_spec.get('subsample', None)
               if subsample_spec:
-                field_results = subsample(subsample_spec, field_cache,
-                                          latest_timestamp, now)
+                field_results = self.cache.subsample_cache.subsample(
+                  field_name, subsample_spec, field_cache,
+                  latest_timestamp, now)
                 results[field_name] = field_results
 
                 # If we did get results, store the timestamp of that
@@ -581,29 +1038,37 @@ class WebSocketConnection:
                   field_timestamps[field_name] = field_results[-1][0]
                 continue
 
-              # If special case -1, they want just single most recent
-              # value, then future results. Grab last value, then set its
-              # timestamp as the last one we've seen.
-              elif latest_timestamp == -1:
-                last_value = field_cache[-1]
-                results[field_name] = [ last_value ]
-                field_timestamps[field_name] = last_value[0] # ts of last value
+              # Or are they asking for rollups of the values?
+              resolution = field_spec.get('resolution', None)
+              if resolution:
+                rollup = self.cache.get_rollup(field_name, resolution)
+                field_results = rollup.since(latest_timestamp, now) \
+                                if rollup else []
+                if field_results:
+                  results[field_name] = field_results
+                  field_timestamps[field_name] = field_results[-1][0]
                 continue
 
-              # Otherwise - if no data newer than the latest
-              # timestamp we've already sent, skip,
-              elif not field_cache[-1][0] > latest_timestamp:
-                continue
+              # If special case -1, they want just single most recent
+              # value (up to the change log's position), then future
+              # results.
+              elif latest_timestamp == -1:
+                field_results = self.cache.values_between(
+                  field_name, position - 1, position)
 
-              # Otherwise, copy over records arrived since
-              # latest_timestamp and update the latest_timestamp sent
-              # (first element of last pair in field_cache).
+              # Otherwise, send the values (up to the change log's
+              # position) that are newer than latest_timestamp.
               else:
-                field_results = [pair for pair in field_cache if
-                                 pair[0] > latest_timestamp]
+                field_results = [
+                  pair for pair in
+                  self.cache.values_between(field_name, 0, position)
+                  if pair[0] > latest_timestamp]
+
+              # From here on, we'll send whatever the change log has
+              # that follows the values we're sending now.
+              field_cursors[field_name] = position
+              if field_results:
                 results[field_name] = field_results
-                if field_results:
-                  field_timestamps[field_name] = field_results[-1][0]
 
           ##########
           # If not outputting data as a field dict, output as a list
@@ -611,52 +1076,50 @@ class WebSocketConnection:
           elif requested_format == 'record_list':
             records = {}
             for field_name, field_spec in requested_fields.items():
-              if not field_name in self.cache.locks:
+              if not field_name in self.cache.data:
                 logging.debug('No data for requested field %s', field_name)
                 continue
-              with self.cache.locks[field_name]:
-                latest_timestamp = field_timestamps.get(field_name, 0)
-                field_cache = self.cache.data.get(field_name, None)
-
-                if not field_cache or not field_cache[-1]:
-                  logging.debug('No cached data for %s', field_name)
-                  continue
-
-                # If latest_timestamp is special case -1, they want just
-                # single most recent value, then future results. Grab
-                # last value, then set its timestamp as the last one
-                # we've seen.
-                elif latest_timestamp == -1:
-                  last_ts, last_value = field_cache[-1]
-                  if not last_ts in records:
-                    records[last_ts] = {}
-                  records[last_ts][field_name] = last_value
-                  field_timestamps[field_name] = last_ts
-                  continue
-
-                # Otherwise - if no data newer than the latest
-                # timestamp we've already sent, skip,
-                elif not field_cache[-1][0] > latest_timestamp:
-                  continue
-
-                # Otherwise, copy over records arrived since
-                # latest_timestamp and update the latest_timestamp sent
-                # (first element of last pair in field_cache).
-                else:
-                  # Get the new (ts, value) pairs for this field
-                  field_results = [pair for pair in field_cache
-                                   if pair[0] > latest_timestamp]
+              latest_timestamp = field_timestamps.get(field_name, 0)
+              field_cache = self.cache.data.get(field_name, None)
 
-                  # We know field_results is non-empty because of previous
-                  # elif, so new latest timestamp is last ts in it.
-                  field_timestamps[field_name] = field_results[-1][0]
+              if not field_cache or not field_cache[-1]:
+                logging.debug('No cached data for %s', field_name)
+                continue
+
+              # If latest_timestamp is special case -1, they want just
+              # single most recent value, then future results. Grab
+              # last value, then set its timestamp as the last one
+              # we've seen.
+              elif latest_timestamp == -1:
+                last_ts, last_value = field_cache[-1]
+                if not last_ts in records:
+                  records[last_ts] = {}
+                records[last_ts][field_name] = last_value
+                field_timestamps[field_name] = last_ts
+                continue
 
-                  # Collate values by timestamp, folding into values for
-                  # other fields.
-                  for ts, value in field_results:
-                    if not ts in records:
-                      records[ts] = {}
-                    records[ts][field_name] = value
+              # Otherwise - if no data newer than the latest
+              # timestamp we've already sent, skip,
+              elif not field_cache[-1][0] > latest_timestamp:
+                continue
+
+              # Otherwise, copy over records arrived since
+              # latest_timestamp and update the latest_timestamp sent
+              # (first element of last pair in field_cache).
+              else:
+                # Get the new (ts, value) pairs for this field
+                field_results = field_cache.since(latest_timestamp)
+
+                # We know field_results is non-empty because of previous
+                # elif, so new latest timestamp is last ts in it.
+                field_timestamps[field_name] = field_results[-1][0]
+
+                # Collate values by timestamp, folding into values for
+                # other fields.
+                for ts, value in field_results:
+                  if not ts in records:
+                    records[ts] = {}
+                  records[ts][field_name] = value
 
             # Create and send a list with one DASRecord-like dict for
             # each timestamp.
@@ -675,9 +1138,23 @@ class WebSocketConnection:
 
           logging.debug('Websocket results: %s...', str(results)[0:100])
 
-          # Package up what results we have (if any) and send them off
-          await self.send_json_response({'type':'data', 'status':200,
-                                         'data':results})
+          # Package up what results we have (if any) and send them
+          # off. If we have pre-encoded results, splice them in.
+          if encoded_results:
+            data = ['%s: %s' % (json.dumps(field_name), json.dumps(value))
+                    for field_name, value in results.items()]
+            data += ['%s: [%s]' % (json.dumps(field_name), fragment)
+                     for field_name, fragment in encoded_results.items()]
+            await self.send_encoded_response(
+              '{"type": "data", "status": 200, "data": {%s}}'
+              % ', '.join(data))
+          elif self.encoding == 'json':
+            await self.send_json_response({'type':'data', 'status':200,
+                                           'data':results})
+          else:
+            await self.send_json_response(
+              {'type':'data', 'status':200, 'encoding':self.encoding,
+               'data':wire_encoding.encode_data(results, self.encoding)})
 
           # New results or not, take a nap before trying to fetch more results
           elapsed = time.time() - now
@@ -693,11 +1170,12 @@ class WebSocketConnection:
               is_error=True)
 
       # If we got bad input, complain and loop
-      except json.JSONDecodeError:
+      # (json.JSONDecodeError, or binary we can't unpack, are ValueErrors)
+      except ValueError:
         await self.send_json_response(
-          {'status':400, 'error':'received unparseable JSON'},
+          {'status':400, 'error':'received unparseable request'},
           is_error=True)
-        logging.warning('unparseable JSON: %s', raw_request)
+        logging.warning('unparseable request: %s', raw_request)
 
       # If our connection closed, complain and exit gracefully
       except websockets.exceptions.ConnectionClosed:
@@ -742,7 +1220,8 @@ class CachedDataServer:
 
   ############################
   def __init__(self, port, interval=1, back_seconds=60*60, max_records=60*24,
-               cleanup_interval=60, disk_cache=None, event_loop=None):
+               cleanup_interval=60, disk_cache=None, event_loop=None,
+               storage='list', disk_cache_format='json', rollup_tiers=None):
     """
     port         Port on which to serve websocket connections
     interval     How frequently to serve updates
@@ -756,7 +1235,26 @@ class CachedDataServer:
     disk_cache   If not None, name of directory in which to backup values
                  from in-memory cache
     event_loop   If not None, the event loop to use for websocket events
+    storage      How to store cached values: 'list' or 'ring_buffer'. If
+                 'ring_buffer', each field's values are held in a circular
+                 buffer of max_records values (growing without limit if
+                 max_records is 0). See server/field_buffer.py.
+    disk_cache_format
+                 How to back up to disk_cache: 'json' rewrites the JSON
+                 file of each field that has received values since the
+                 last cleanup; 'journal' appends only
+                 the values that have arrived since the last cleanup to a
+                 binary journal, compacting it into snapshots in the
+                 background. See server/record_journal.py.
+    rollup_tiers If not None, list of (resolution, retention) tuples, in
+                 seconds, of rollup tiers to maintain for each numeric
+                 field, so that clients can request e.g. a week of
+                 10-minute means while raw values are only kept for
+                 back_seconds. See server/rollup.py.
     """
+    if not disk_cache_format in DISK_CACHE_FORMATS:
+      raise ValueError('disk_cache_format must be one of %s; found "%s"'
+                       % (DISK_CACHE_FORMATS, disk_cache_format))
     self.port = port
     self.interval = interval
     self.back_seconds = back_seconds
@@ -764,12 +1262,29 @@ class CachedDataServer:
     self.cleanup_interval = cleanup_interval
     self.event_loop = event_loop
 
-    self.cache = RecordCache()
+    # If we've received an event loop, use it, otherwise create a new one
+    # of our own.
+    if not event_loop:
+      self.event_loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(self.event_loop)
+    else:
+      self.event_loop = None
+      asyncio.set_event_loop(event_loop)
+
+    # The cache belongs to the thread running the event loop; records
+    # from other threads are queued for it. See RecordCache.
+    self.cache = RecordCache(storage=storage, capacity=max_records or None,
+                             rollup_tiers=rollup_tiers,
+                             event_loop=event_loop or self.event_loop)
 
     # If they've given us the name of a disk cache, try loading our
     # RecordCache from it.
     self.disk_cache = disk_cache
-    if disk_cache:
+    self.journal = None
+    if disk_cache and disk_cache_format == 'journal':
+      self.journal = RecordJournal(os.path.join(disk_cache, 'journal'))
+      self.cache.load_from_journal(self.journal)
+    elif disk_cache:
       self.cache.load_from_disk(disk_cache)
 
     # List where we'll store our websocket connections so that we can
@@ -778,15 +1293,6 @@ class CachedDataServer:
     self._connections = []
     self._connection_lock = threading.Lock()
 
-    # If we've received an event loop, use it, otherwise create a new one
-    # of our own.
-    if not event_loop:
-      self.event_loop = asyncio.new_event_loop()
-      asyncio.set_event_loop(self.event_loop)
-    else:
-      self.event_loop = None
-      asyncio.set_event_loop(event_loop)
-
     self.quit_flag = False
 
     # Start a thread to loop through, cleaning up the cache and (if we've
@@ -808,8 +1314,9 @@ class CachedDataServer:
 
   ############################
   def cache_record(self, record):
-    """Cache the passed record."""
-    self.cache.cache_record(record)
+    """Cache the passed record. May be called from any thread; the
+    record is queued for the event loop to add."""
+    self.cache.submit_record(record)
 
   ############################
   def cleanup_loop(self):
@@ -817,13 +1324,57 @@ class CachedDataServer:
     while not self.quit_flag:
       time.sleep(self.cleanup_interval)
 
-      # What's the oldest record we should retain?
-      oldest = time.time() - self.back_seconds
-      self.cache.cleanup(oldest=oldest, max_records=self.max_records)
+      # Clean up on the thread that owns the cache
+      self._run_on_event_loop(self._cleanup())
+
+  ############################
+  async def _cleanup(self):
+    # What's the oldest record we should retain?
+    oldest = time.time() - self.back_seconds
+    self.cache.cleanup(oldest=oldest, max_records=self.max_records)
+
+    # If we're using a disk cache, save things now
+    await self._save_to_disk()
+
+  ############################
+  def save_to_disk(self):
+    """Back the cache up to disk, if we've been given a disk cache."""
+    self._run_on_event_loop(self._save_to_disk())
 
-      # If we're using a disk cache, save things now
-      if self.disk_cache:
-        self.cache.save_to_disk(self.disk_cache)
+  ############################
+  async def _save_to_disk(self):
+    """Copy what needs saving out of the cache, then write it from
+    another thread, so that connections aren't kept waiting on the
+    disk."""
+    loop = asyncio.get_event_loop()
+    if self.journal:
+      batches, snapshot = self.cache.journal_batches(
+        snapshot=self.journal.snapshot_due())
+      await loop.run_in_executor(None, self.journal.save, batches, snapshot)
+    elif self.disk_cache:
+      await self.cache.save_changes_to_disk(self.disk_cache)
+
+  ############################
+  def _run_on_event_loop(self, coroutine, timeout=EVENT_LOOP_TIMEOUT):
+    """Run a coroutine on the cache's event loop from another thread,
+    and wait up to timeout seconds for it to finish, cancelling it if
+    it hasn't. If the loop isn't running (e.g. we're shutting down),
+    run it in a temporary loop of our own."""
+    event_loop = self.cache.event_loop
+    if event_loop.is_running():
+      future = asyncio.run_coroutine_threadsafe(coroutine, event_loop)
+      try:
+        return future.result(timeout)
+      except concurrent.futures.TimeoutError:
+        logging.warning('Event loop failed to run %s within %g seconds; '
+                        'cancelling it', coroutine.__name__, timeout)
+        future.cancel()
+        return None
+    temp_loop = asyncio.new_event_loop()
+    try:
+      return temp_loop.run_until_complete(coroutine)
+    finally:
+      temp_loop.close()
 
   ############################
   def _run_websocket_server(self):
@@ -932,6 +1483,12 @@ if __name__ == '__main__':
                       'backup the in-memory cache to disk. On restart, '
                       'data will be reloaded from this cache.')
 
+  parser.add_argument('--disk_cache_format', dest='disk_cache_format',
+                      default='json', choices=DISK_CACHE_FORMATS,
+                      help='How to back up the in-memory cache: rewrite a '
+                      'JSON file per field, or append new values to a '
+                      'binary journal that is periodically compacted.')
+
   parser.add_argument('--back_seconds', dest='back_seconds', action='store',
                       type=float, default=24*60*60,
                       help='Maximum number of seconds of old data to keep '
@@ -941,6 +1498,18 @@ if __name__ == '__main__':
                       type=int, default=24*60*2,
                       help='Maximum number of records to store per variable.')
 
+  parser.add_argument('--storage', dest='storage', default='list',
+                      choices=STORAGE_TYPES,
+                      help='How to store cached values: in Python lists, '
+                      'or in fixed-size circular buffers.')
+
+  parser.add_argument('--rollups', dest='rollups', default=None,
+                      type=parse_rollup_tiers,
+                      help='Comma-separated resolution:retention pairs, in '
+                      'seconds, of tiers of rollups (mean, min, max, count) '
+                      'to maintain for each numeric field, e.g. '
+                      '"60:86400,600:604800", or "default" for that.')
+
   parser.add_argument('--cleanup_interval', dest='cleanup_interval',
                       action='store', type=float, default=60,
                       help='How often to clean old data out of the cache.')
@@ -976,7 +1545,10 @@ if __name__ == '__main__':
                             back_seconds=args.back_seconds,
                             max_records=args.max_records,
                             cleanup_interval=args.cleanup_interval,
-                            disk_cache=args.disk_cache)
+                            disk_cache=args.disk_cache,
+                            storage=args.storage,
+                            disk_cache_format=args.disk_cache_format,
+                            rollup_tiers=args.rollups)
 
   # Only create reader(s) if they've given us a network to read from;
   # otherwise, count on data coming from websocket publish
@@ -1007,5 +1579,7 @@ if __name__ == '__main__':
     logging.warning('Received KeyboardInterrupt - shutting down')
     if args.disk_cache:
       logging.warning('Will try to save to disk cache prior to shutdown...')
-      server.cache.save_to_disk(args.disk_cache)
+      server.save_to_disk()
+      if server.journal:
+        server.journal.close()
     server.quit()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Shared, pre-encoded log of the values arriving in a RecordCache, so
+that a CachedDataServer can fan the same updates out to many websocket
+clients without repeating the work for each.
+
+Each time it is updated, a ChangeLog collects the values that have
+arrived in the cache for each changed field since its last update and
+JSON-encodes them once, as a "fragment": the text of the
+(timestamp, value) pairs between the brackets of a JSON list, e.g.
+
+  '[1555468528.452, 12.3], [1555468529.452, 12.4]'
+
+Fragments are labeled with the range of per-field sequence numbers
+(see RecordCache.values_between()) they cover. A client connection
+needs to keep only a cursor for each field it is subscribed to - the
+sequence number of the last value it has sent - and can assemble its
+next update by concatenating the fragments that follow its cursor.
+
+Like the RecordCache it logs, a ChangeLog is not locked, and must only
+be used from the thread that owns the cache: the event loop thread that
+serves all of a CachedDataServer's websocket connections.
+"""
+import json
+import logging
+from collections import deque
+
+# How many fragments to keep for each field. Connections whose cursors
+# have fallen further behind than this have their values encoded for
+# them individually.
+DEFAULT_MAX_FRAGMENTS = 100
+
+################################################################################
+class ChangeLog:
+  """Per-field logs of encoded changes to a RecordCache."""
+  ############################
+  def __init__(self, cache, max_fragments=DEFAULT_MAX_FRAGMENTS):
+    """
+    ```
+    cache          The RecordCache whose changes we're to log
+
+    max_fragments  Maximum number of fragments to keep for each field
+    ```
+    """
+    self.cache = cache
+    self.max_fragments = max_fragments
+
+    # field: deque of (start, end, fragment) tuples, where fragment
+    # encodes values with sequence numbers in the range (start, end].
+    self.fragments = {}
+
+    # field: sequence number of last value in the field's fragments
+    self.positions = {}
+
+  ############################
+  def update(self):
+    """Encode the values that have arrived in any field since the last
+    update."""
+    changed_fields = self.cache.pop_changed_fields()
+    for field in changed_fields:
+      end = self.cache.sequence.get(field, 0)
+      if not field in self.positions:
+        # No connection can have a cursor for this field yet, so
+        # there's no one to encode its values for. Start logging here.
+        self.positions[field] = end
+        continue
+      start = self.positions[field]
+      if end <= start:
+        continue
+      pairs = self.cache.values_between(field, start, end)
+
+      if not field in self.fragments:
+        self.fragments[field] = deque(maxlen=self.max_fragments)
+      self.fragments[field].append((start, end, json.dumps(pairs)[1:-1]))
+      self.positions[field] = end
+
+  ############################
+  def position(self, field):
+    """Return the sequence number of the last value logged for field.
+    A connection that has sent this field's values up to this point
+    can set its cursor here."""
+    if not field in self.positions:
+      # First we've heard of this field: start logging from whatever
+      # the cache currently holds.
+      self.positions[field] = self.cache.sequence.get(field, 0)
+    return self.positions[field]
+
+  ############################
+  def since(self, field, cursor):
+    """Return a tuple (fragment, new_cursor), where fragment encodes the
+    field's values logged after cursor, or is None if there are none,
+    and new_cursor is the position of the last of those values."""
+    end = self.positions.get(field, 0)
+    if end <= cursor:
+      return None, cursor
+
+    # Gather fragments, most recent first, back to our cursor.
+    needed = []
+    for start, fragment_end, fragment in reversed(self.fragments.get(field, [])):
+      if fragment_end <= cursor:
+        break
+      if start < cursor:
+        # Fragment straddles our cursor; can't use it as-is.
+        needed = None
+        break
+      needed.append(fragment)
+      if start == cursor:
+        break
+    else:
+      # Ran out of fragments before reaching our cursor
+      needed = None
+
+    if needed is None:
+      logging.debug('Encoding %s values %d-%d individually',
+                    field, cursor + 1, end)
+      pairs = self.cache.values_between(field, cursor, end)
+      return (json.dumps(pairs)[1:-1] or None), end
+
+    needed.reverse()
+    return (', '.join([fragment for fragment in needed if fragment])
+            or None), end
+
+  ############################
+  def values_since(self, field, cursor):
+    """Return a tuple (pairs, new_cursor), where pairs is a list of the
+    field's (timestamp, value) pairs logged after cursor. For
+    connections that encode their own responses (see
+    logger/utils/wire_encoding.py) rather than using the shared
+    fragments."""
+    end = self.positions.get(field, 0)
+    if end <= cursor:
+      return [], cursor
+    return self.cache.values_between(field, cursor, end), end
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Reduce a field's list of (timestamp, value) pairs to at most a given
+number of points, preserving the shape of the series, so that a client
+asking for a day of 10 Hz data gets a plottable number of points
+rather than every value.
+
+Two methods are available:
+
+  lttb     - Largest-Triangle-Three-Buckets (Steinarsson, 2013). Keeps
+             the first and last points and, from each of max_points - 2
+             equal-sized buckets in between, the point forming the
+             largest triangle with the point kept from the previous
+             bucket and the average of the next. Gives the most
+             faithful-looking line for its point budget.
+
+  min_max  - Keeps the minimum and maximum values (in time order) from
+             each of max_points / 2 equal-sized buckets, so that no
+             spike or dropout is lost, at the cost of a more jagged
+             line.
+
+Both need numeric values; for series with any values that aren't,
+every n'th point is kept instead.
+"""
+import logging
+
+############################
+def _is_numeric(pairs):
+  return all(type(value) in (int, float) for _, value in pairs)
+
+############################
+def stride(pairs, max_points):
+  """Keep evenly-spaced points, including the last."""
+  num_pairs = len(pairs)
+  if num_pairs <= max_points:
+    return list(pairs)
+  step = num_pairs / max_points
+  return [pairs[num_pairs - 1 - int(i * step)]
+          for i in reversed(range(max_points))]
+
+############################
+def lttb(pairs, max_points):
+  """Downsample by Largest-Triangle-Three-Buckets."""
+  num_pairs = len(pairs)
+  if num_pairs <= max_points:
+    return list(pairs)
+  if max_points < 3:
+    return stride(pairs, max_points)
+
+  sampled = [pairs[0]]
+  bucket_size = (num_pairs - 2) / (max_points - 2)
+  previous = pairs[0]      # point kept from previous bucket
+  for bucket in range(max_points - 2):
+    bucket_start = int(bucket * bucket_size) + 1
+    bucket_end = int((bucket + 1) * bucket_size) + 1
+
+    # Average of the next bucket (or the last point, if this is the
+    # last bucket).
+    next_start = bucket_end
+    next_end = min(int((bucket + 2) * bucket_size) + 1, num_pairs)
+    next_pairs = pairs[next_start:next_end] or pairs[-1:]
+    avg_ts = sum(ts for ts, _ in next_pairs) / len(next_pairs)
+    avg_value = sum(value for _, value in next_pairs) / len(next_pairs)
+
+    # Point in this bucket forming the largest triangle with the
+    # previous point and the next bucket's average. (Twice the area;
+    # we only need to compare them.)
+    prev_ts, prev_value = previous
+    max_area = -1
+    for pair in pairs[bucket_start:bucket_end]:
+      area = abs((prev_ts - avg_ts) * (pair[1] - prev_value) -
+                 (prev_ts - pair[0]) * (avg_value - prev_value))
+      if area > max_area:
+        max_area = area
+        previous = pair
+    sampled.append(previous)
+
+  sampled.append(pairs[-1])
+  return sampled
+
+############################
+def min_max(pairs, max_points):
+  """Downsample by keeping the minimum and maximum of each bucket."""
+  num_pairs = len(pairs)
+  if num_pairs <= max_points:
+    return list(pairs)
+  num_buckets = max(max_points // 2, 1)
+  bucket_size = num_pairs / num_buckets
+
+  sampled = []
+  for bucket in range(num_buckets):
+    bucket_pairs = range(int(bucket * bucket_size),
+                         int((bucket + 1) * bucket_size))
+    min_index = min(bucket_pairs, key=lambda i: pairs[i][1])
+    max_index = max(bucket_pairs, key=lambda i: pairs[i][1])
+    if max_points == 1:
+      sampled.append(pairs[max_index])
+    else:
+      for index in sorted({min_index, max_index}):
+        sampled.append(pairs[index])
+  return sampled
+
+# Downsampling methods by name
+DOWNSAMPLE_METHODS = {'lttb': lttb, 'min_max': min_max}
+
+############################
+def downsample(pairs, max_points, method='lttb'):
+  """Return at most max_points of a time-ordered list of (timestamp,
+  value) pairs, chosen by the named method. If max_points is zero (or
+  there are no more pairs than that), return all the pairs."""
+  if not method in DOWNSAMPLE_METHODS:
+    raise ValueError('Downsampling method must be one of %s; found "%s"'
+                     % (sorted(DOWNSAMPLE_METHODS), method))
+  if not max_points or len(pairs) <= max_points:
+    return list(pairs)
+  if not _is_numeric(pairs):
+    logging.debug('Non-numeric values; downsampling by stride')
+    return stride(pairs, max_points)
+  return DOWNSAMPLE_METHODS[method](pairs, max_points)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""Storage for the (timestamp, value) pairs that a RecordCache holds
+for each of its fields.
+
+FieldList is the original storage: a Python list of pairs, searched
+and trimmed by linear scans and copies.
+
+FieldBuffer is a circular buffer. Timestamps are stored in a compact
+array of doubles, as are values while they are all floats (or in an
+array of 64-bit ints while they are all ints); if a field receives a
+value of any other type, its values are moved into a plain list. While
+timestamps arrive in order (as they almost always do) a FieldBuffer
+finds the values newer than a given time by binary search, and
+discarding old values just advances the index of the oldest one. If
+the buffer has a fixed capacity, appending to a full buffer overwrites
+its oldest value; otherwise the buffer doubles in size as needed.
+
+Both classes support len(), iteration and indexing (including negative
+indexing) of (timestamp, value) pairs, plus add(), since(), between(),
+trim() and to_list().
+"""
+import array
+import logging
+
+# Initial size of a FieldBuffer that has no fixed capacity
+DEFAULT_INITIAL_SIZE = 64
+
+################################################################################
+class FieldList(list):
+  """A list of (timestamp, value) pairs."""
+  def __init__(self, values=None):
+    super().__init__()
+    for timestamp, value in values or []:
+      self.add(timestamp, value)
+
+  ############################
+  def add(self, timestamp, value):
+    """Append a (timestamp, value) pair."""
+    self.append((timestamp, value))
+
+  ############################
+  def since(self, timestamp):
+    """Return a list of the pairs whose timestamps are newer than timestamp."""
+    return [pair for pair in self if pair[0] > timestamp]
+
+  ############################
+  def between(self, start, end):
+    """Return a list of the pairs whose timestamps are no earlier than
+    start and no later than end."""
+    return [pair for pair in self if start <= pair[0] <= end]
+
+  ############################
+  def trim(self, oldest=0, max_records=0):
+    """Remove pairs with timestamps no newer than 'oldest', but keep at
+    least one (most recent) value. If max_records is non-zero, first
+    truncate to that many of the most recent pairs."""
+    if max_records and len(self) > max_records:
+      del self[:len(self) - max_records]
+
+    for i in range(len(self)): # Iterate until find value that's
+      if self[i][0] > oldest:  # not too old
+        break
+    else:
+      i = len(self) - 1        # But keep at least one value
+    if i > 0:
+      del self[:i]
+
+  ############################
+  def to_list(self):
+    """Return the pairs as a list, e.g. for JSON encoding."""
+    return list(self)
+
+################################################################################
+class FieldBuffer:
+  """A circular buffer of (timestamp, value) pairs."""
+  def __init__(self, capacity=None, values=None,
+               initial_size=DEFAULT_INITIAL_SIZE):
+    """
+    ```
+    capacity      Maximum number of pairs to hold. If None, grow as needed.
+
+    values        Optional iterable of (timestamp, value) pairs with which
+                  to initialize the buffer.
+
+    initial_size  If capacity is None, number of pairs for which to
+                  initially allocate space.
+    ```
+    """
+    self.capacity = capacity
+    self.size = capacity or initial_size
+    self.timestamps = array.array('d', bytes(8 * self.size))
+
+    # Physical storage for values is chosen by the type of the first
+    # value we receive: an array of floats or ints if we can get away
+    # with it, otherwise a list.
+    self.values = None
+    self.value_type = None
+
+    self.start = 0        # physical index of oldest pair
+    self.count = 0        # number of pairs held
+    self.in_order = True  # are timestamps non-decreasing?
+
+    for timestamp, value in values or []:
+      self.add(timestamp, value)
+
+  ############################
+  def __len__(self):
+    return self.count
+
+  ############################
+  def __getitem__(self, index):
+    if index < 0:
+      index += self.count
+    if not 0 <= index < self.count:
+      raise IndexError('FieldBuffer index out of range')
+    position = (self.start + index) % self.size
+    return (self.timestamps[position], self.values[position])
+
+  ############################
+  def __iter__(self):
+    for index in range(self.count):
+      yield self[index]
+
+  ############################
+  def __repr__(self):
+    return 'FieldBuffer(%s)' % self.to_list()
+
+  ############################
+  def add(self, timestamp, value):
+    """Append a (timestamp, value) pair, overwriting the oldest pair if
+    we're at capacity."""
+    if self.values is None:
+      self._allocate_values(value)
+    elif self.value_type is not None and type(value) is not self.value_type:
+      self._convert_values_to_list()
+
+    if self.count == self.size:
+      if self.capacity:
+        self._drop(1)
+      else:
+        self._grow()
+
+    if self.count and timestamp < self[-1][0]:
+      self.in_order = False
+
+    position = (self.start + self.count) % self.size
+    self.timestamps[position] = timestamp
+    try:
+      self.values[position] = value
+    except OverflowError:  # int too big for a 64-bit array
+      self._convert_values_to_list()
+      self.values[position] = value
+    self.count += 1
+
+  ############################
+  def since(self, timestamp):
+    """Return a list of the pairs whose timestamps are newer than timestamp."""
+    if not self.in_order:
+      return [pair for pair in self if pair[0] > timestamp]
+    index = self._first_newer_than(timestamp)
+    return [self[i] for i in range(index, self.count)]
+
+  ############################
+  def between(self, start, end):
+    """Return a list of the pairs whose timestamps are no earlier than
+    start and no later than end."""
+    if not self.in_order:
+      return [pair for pair in self if start <= pair[0] <= end]
+    # Back up over any pairs timestamped exactly at start
+    index = self._first_newer_than(start)
+    while index > 0 and self[index - 1][0] >= start:
+      index -= 1
+    pairs = []
+    while index < self.count and self[index][0] <= end:
+      pairs.append(self[index])
+      index += 1
+    return pairs
+
+  ############################
+  def trim(self, oldest=0, max_records=0):
+    """Remove pairs with timestamps no newer than 'oldest', but keep at
+    least one (most recent) value. If max_records is non-zero, first
+    truncate to that many of the most recent pairs."""
+    if max_records and self.count > max_records:
+      self._drop(self.count - max_records)
+    if not self.count:
+      return
+
+    # Drop everything before the first value that's not too old
+    index = self._first_newer_than(oldest)
+    self._drop(min(index, self.count - 1))
+
+  ############################
+  def to_list(self):
+    """Return the pairs as a list, e.g. for JSON encoding."""
+    if not self.count:
+      return []
+    return list(zip(self._in_use(self.timestamps), self._in_use(self.values)))
+
+  ############################
+  def _in_use(self, storage):
+    """Return a copy of the in-use part of a storage array (or list),
+    oldest first, by slicing rather than indexing pair by pair."""
+    end = self.start + self.count
+    if end <= self.size:
+      return storage[self.start:end]
+    return storage[self.start:] + storage[:end - self.size]
+
+  ############################
+  def _first_newer_than(self, timestamp):
+    """Return the index of the first pair whose timestamp is greater than
+    timestamp, by binary search if our timestamps are in order, and
+    linear scan if not."""
+    if not self.in_order:
+      for index in range(self.count):
+        if self.timestamps[(self.start + index) % self.size] > timestamp:
+          return index
+      return self.count
+
+    low, high = 0, self.count
+    while low < high:
+      middle = (low + high) // 2
+      if self.timestamps[(self.start + middle) % self.size] > timestamp:
+        high = middle
+      else:
+        low = middle + 1
+    return low
+
+  ############################
+  def _drop(self, num):
+    """Discard the 'num' oldest pairs."""
+    if num <= 0:
+      return
+    if self.value_type is None:
+      # Release references to discarded objects
+      for index in range(num):
+        self.values[(self.start + index) % self.size] = None
+    self.start = (self.start + num) % self.size
+    self.count -= num
+    if self.count <= 1:
+      self.in_order = True
+
+  ############################
+  def _allocate_values(self, value):
+    """Allocate value storage suited to the type of the first value."""
+    if type(value) is float:
+      self.value_type = float
+      self.values = array.array('d', bytes(8 * self.size))
+    elif type(value) is int:
+      self.value_type = int
+      self.values = array.array('q', bytes(8 * self.size))
+    else:
+      self.value_type = None
+      self.values = [None] * self.size
+
+  ############################
+  def _convert_values_to_list(self):
+    """Move values into a list so that they can be of any type."""
+    logging.debug('FieldBuffer converting %s values to list', self.value_type)
+    self.values = self.values.tolist()
+    self.value_type = None
+
+  ############################
+  def _grow(self):
+    """Double our size, moving pairs to the start of the new storage."""
+    pairs = self.to_list()
+    self.size *= 2
+    self.timestamps = array.array('d', bytes(8 * self.size))
+    if self.value_type is float:
+      self.values = array.array('d', bytes(8 * self.size))
+    elif self.value_type is int:
+      self.values = array.array('q', bytes(8 * self.size))
+    else:
+      self.values = [None] * self.size
+    for index, (timestamp, value) in enumerate(pairs):
+      self.timestamps[index] = timestamp
+      self.values[index] = value
+    self.start = 0
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Registry of the wildcarded field name patterns that CachedDataServer
+clients have subscribed to, and of the cache fields matching each, so
+that subscriptions can be resolved without scanning every field, and
+can pick up matching fields that appear after they were made.
+
+A pattern is a field name containing one or more '*' characters, each
+of which stands for one or more characters, anywhere in the name:
+'S330*' matches 'S330Speed' and 'MyS330Heading', but not 'S330'.
+
+The first time a pattern is requested, it is compiled and checked
+against every field the index knows about. After that, each new field
+is checked against the registered patterns once, when it first
+appears, and appended to the matches of those it fits. A subscriber
+keeps a cursor into a pattern's list of matches - the number it has
+already seen - and asks for the matches that follow it, much as it
+does with the ChangeLog.
+"""
+import logging
+import re
+
+################################################################################
+class FieldIndex:
+  """Index of field names by the wildcard patterns they match. Not
+  locked; like the RecordCache that owns it, it must only be used from
+  a single thread."""
+  ############################
+  def __init__(self, fields=None):
+    """
+    ```
+    fields   Optional list of field names to start the index with.
+    ```
+    """
+    # All fields, in order of appearance
+    self.fields = []
+    self.field_set = set()
+
+    # pattern: compiled regex, and pattern: list of matching fields in
+    # order of appearance
+    self.patterns = {}
+    self.matches = {}
+
+    for field in fields or []:
+      self.add(field)
+
+  ############################
+  @staticmethod
+  def is_pattern(field_name):
+    return '*' in field_name
+
+  ############################
+  def add(self, field):
+    """Note a field that has just appeared in the cache."""
+    if field in self.field_set:
+      return
+    self.field_set.add(field)
+    self.fields.append(field)
+    for pattern, regex in self.patterns.items():
+      if regex.search(field):
+        self.matches[pattern].append(field)
+
+  ############################
+  def _register(self, pattern):
+    """Compile a pattern and find the fields it matches, if we haven't
+    already."""
+    if pattern in self.patterns:
+      return
+    try:
+      regex = re.compile(pattern.replace('*', '.+'))
+    except re.error as e:
+      raise ValueError('Invalid field pattern "%s": %s' % (pattern, e))
+    logging.debug('Registering field pattern %s', pattern)
+    self.patterns[pattern] = regex
+    self.matches[pattern] = [f for f in self.fields if regex.search(f)]
+
+  ############################
+  def match(self, field_name):
+    """Return a list of the fields matching field_name if it is a
+    pattern, otherwise a list of just field_name."""
+    return self.matches_since(field_name, 0)[0]
+
+  ############################
+  def matches_since(self, field_name, cursor):
+    """Return a list of the fields that have matched field_name after the
+    first 'cursor' of them, and a cursor to pass to get the matches that
+    follow. If field_name is not a pattern, it matches only itself."""
+    if not self.is_pattern(field_name):
+      return ([field_name], 1) if cursor < 1 else ([], cursor)
+    self._register(field_name)
+    matches = self.matches[field_name]
+    return matches[cursor:], len(matches)
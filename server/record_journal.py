@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Incremental disk persistence for a RecordCache: an append-only,
+segmented binary journal of the values that have arrived, plus compact
+snapshots that are written periodically in the background so that the
+journal can be discarded.
+
+The journal lives in its own directory and consists of files named
+
+  journal-00000001, journal-00000002, ...  - journal segments
+  snapshot-00000002                         - snapshot
+
+A snapshot holds every value that was in the cache when the segment
+with the same number was closed; on startup, the newest snapshot is
+read, followed by the segments numbered after it. Both kinds of file
+are sequences of frames, each holding a batch of (timestamp, value)
+pairs for a single field:
+```
+  frame:   <payload length: uint32> <CRC32 of payload: uint32> <payload>
+  payload: <name length: uint16> <kind: uint8> <count: uint32> <name>
+           <body>
+```
+where, depending on kind, body is either count little-endian doubles
+of timestamps followed by count doubles (FLOAT_BATCH) or 64-bit ints
+(INT_BATCH) of values, or the JSON encoding of the list of pairs
+(JSON_BATCH). A frame that is truncated or fails its CRC check (e.g.
+because we were killed in mid-write) ends the file it is in.
+"""
+import array
+import json
+import logging
+import mmap
+import os
+import os.path
+import re
+import struct
+import sys
+import threading
+import zlib
+
+# Ways the values of a batch may be encoded
+FLOAT_BATCH = 0
+INT_BATCH = 1
+JSON_BATCH = 2
+
+FRAME_HEADER = struct.Struct('<II')
+PAYLOAD_HEADER = struct.Struct('<HBI')
+
+# Start a new journal segment once the current one is this big
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+
+# Write a snapshot once the journal segments written since the last one
+# are at least this big, and at least as big as the last snapshot.
+DEFAULT_SNAPSHOT_BYTES = 16 * 1024 * 1024
+
+JOURNAL_FILE = re.compile(r'^(journal|snapshot)-(\d+)$')
+
+############################
+def _pack_array(typecode, values):
+  packed = array.array(typecode, values)
+  if sys.byteorder == 'big':
+    packed.byteswap()
+  return packed.tobytes()
+
+############################
+def _unpack_array(typecode, data):
+  unpacked = array.array(typecode)
+  unpacked.frombytes(data)
+  if sys.byteorder == 'big':
+    unpacked.byteswap()
+  return unpacked
+
+############################
+def _batch_kind(pairs):
+  """Return the most compact kind of batch that can hold the pairs."""
+  if not all(type(ts) in (int, float) for ts, _ in pairs):
+    return JSON_BATCH
+  value_types = set(type(value) for _, value in pairs)
+  if value_types == {float}:
+    return FLOAT_BATCH
+  if value_types == {int} and \
+     all(-2**63 <= value < 2**63 for _, value in pairs):
+    return INT_BATCH
+  return JSON_BATCH
+
+############################
+def encode_batch(field, pairs):
+  """Return a frame encoding a field's list of (timestamp, value) pairs."""
+  kind = _batch_kind(pairs)
+  if kind == JSON_BATCH:
+    body = json.dumps([list(pair) for pair in pairs]).encode('utf-8')
+  else:
+    body = (_pack_array('d', [ts for ts, _ in pairs]) +
+            _pack_array('d' if kind == FLOAT_BATCH else 'q',
+                        [value for _, value in pairs]))
+  name = field.encode('utf-8')
+  payload = PAYLOAD_HEADER.pack(len(name), kind, len(pairs)) + name + body
+  return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+############################
+def decode_batches(buffer, source='journal'):
+  """Yield the (field, pairs) batches encoded in a buffer (e.g. an mmap
+  of a journal file), stopping at the end of the buffer or at the first
+  incomplete or corrupted frame."""
+  offset = 0
+  while offset < len(buffer):
+    if offset + FRAME_HEADER.size > len(buffer):
+      logging.warning('Truncated frame at end of %s', source)
+      return
+    length, crc = FRAME_HEADER.unpack_from(buffer, offset)
+    start = offset + FRAME_HEADER.size
+    payload = buffer[start:start + length]
+    if len(payload) < length or zlib.crc32(payload) != crc:
+      logging.warning('Corrupt or truncated frame at byte %d of %s; '
+                      'ignoring remainder', offset, source)
+      return
+    offset = start + length
+
+    name_length, kind, count = PAYLOAD_HEADER.unpack_from(payload, 0)
+    body_start = PAYLOAD_HEADER.size + name_length
+    field = payload[PAYLOAD_HEADER.size:body_start].decode('utf-8')
+    if kind == JSON_BATCH:
+      pairs = [tuple(pair) for pair in json.loads(payload[body_start:])]
+    else:
+      values_start = body_start + 8 * count
+      timestamps = _unpack_array('d', payload[body_start:values_start])
+      values = _unpack_array('d' if kind == FLOAT_BATCH else 'q',
+                             payload[values_start:values_start + 8 * count])
+      pairs = list(zip(timestamps, values))
+    yield field, pairs
+
+################################################################################
+class RecordJournal:
+  """Segmented journal and snapshots of a RecordCache's values."""
+  ############################
+  def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES,
+               snapshot_bytes=DEFAULT_SNAPSHOT_BYTES):
+    """
+    ```
+    directory       Directory in which to keep journal segments and
+                    snapshots. Created if it doesn't exist.
+
+    segment_bytes   Start a new journal segment once the current one
+                    reaches this size.
+
+    snapshot_bytes  Don't write a snapshot until the journal segments
+                    written since the last one total at least this many
+                    bytes (and at least the size of the last snapshot).
+    ```
+    """
+    self.directory = directory
+    self.segment_bytes = segment_bytes
+    self.snapshot_bytes = snapshot_bytes
+    os.makedirs(directory, exist_ok=True)
+
+    snapshots, segments = self._existing_files()
+    self.snapshot_number = snapshots[-1] if snapshots else 0
+    self.last_snapshot_size = os.path.getsize(
+      self._filename('snapshot', self.snapshot_number)) if snapshots else 0
+
+    # Never append to a segment left by an earlier process; its last
+    # frame may be incomplete. Start a new one instead.
+    self.segment_number = max(segments + [self.snapshot_number]) + 1
+    self.segment_file = None
+    self.segment_size = 0
+
+    # Bytes of journal written since the last snapshot
+    self.journal_bytes = sum(
+      os.path.getsize(self._filename('journal', number))
+      for number in segments if number > self.snapshot_number)
+
+    self.snapshot_thread = None
+    self.lock = threading.Lock()
+
+  ############################
+  def _filename(self, kind, number):
+    return os.path.join(self.directory, '%s-%08d' % (kind, number))
+
+  ############################
+  def _existing_files(self):
+    """Return sorted lists of the numbers of existing snapshots and
+    journal segments."""
+    snapshots, segments = [], []
+    for filename in os.listdir(self.directory):
+      match = JOURNAL_FILE.match(filename)
+      if match:
+        number = int(match.group(2))
+        (snapshots if match.group(1) == 'snapshot' else segments).append(number)
+    return sorted(snapshots), sorted(segments)
+
+  ############################
+  def _read_file(self, filename):
+    """Yield the batches in a file, reading it via mmap."""
+    with open(filename, 'rb') as journal_file:
+      if not os.fstat(journal_file.fileno()).st_size:
+        return
+      with mmap.mmap(journal_file.fileno(), 0,
+                     access=mmap.ACCESS_READ) as buffer:
+        yield from decode_batches(buffer, source=filename)
+
+  ############################
+  def replay(self):
+    """Return a dict mapping each field to the list of (timestamp, value)
+    pairs recorded for it: those in the latest snapshot, followed by
+    those in the journal segments written after it."""
+    snapshots, segments = self._existing_files()
+    filenames = []
+    if snapshots:
+      filenames.append(self._filename('snapshot', snapshots[-1]))
+    filenames += [self._filename('journal', number) for number in segments
+                  if not snapshots or number > snapshots[-1]]
+
+    values = {}
+    for filename in filenames:
+      logging.info('Replaying %s', filename)
+      for field, pairs in self._read_file(filename):
+        values.setdefault(field, []).extend(pairs)
+    return values
+
+  ############################
+  def append(self, batches):
+    """Append to the journal a dict mapping fields to lists of new
+    (timestamp, value) pairs."""
+    data = b''.join(encode_batch(field, pairs)
+                    for field, pairs in batches.items() if pairs)
+    if not data:
+      return
+    with self.lock:
+      if self.segment_file is None:
+        self.segment_file = open(
+          self._filename('journal', self.segment_number), 'ab')
+      self.segment_file.write(data)
+      self.segment_file.flush()
+      self.segment_size += len(data)
+      self.journal_bytes += len(data)
+      if self.segment_size >= self.segment_bytes:
+        self._close_segment()
+
+  ############################
+  def _close_segment(self):
+    """Close the current segment; the next append starts a new one.
+    Caller must hold lock."""
+    if self.segment_file:
+      self.segment_file.close()
+      self.segment_file = None
+    self.segment_number += 1
+    self.segment_size = 0
+
+  ############################
+  def snapshot_due(self):
+    """Has enough been journaled since the last snapshot that it's
+    worth writing another (and are we not already writing one)?"""
+    if self.snapshot_thread and self.snapshot_thread.is_alive():
+      return False
+    return self.journal_bytes >= max(self.snapshot_bytes,
+                                     self.last_snapshot_size)
+
+  ############################
+  def snapshot(self, values, wait=False):
+    """Start writing a snapshot of the passed dict mapping fields to
+    lists of (timestamp, value) pairs, which must hold every value the
+    cache has that has been appended to the journal. The snapshot is
+    written in a background thread; once it is complete, the journal
+    segments it supersedes are deleted. If wait is True, wait for it to
+    complete before returning."""
+    with self.lock:
+      # Everything journaled so far is in segments up to the current
+      # one. Close it; the snapshot will supersede them.
+      number = self.segment_number
+      self._close_segment()
+      self.journal_bytes = 0
+    self.snapshot_thread = threading.Thread(
+      target=self._write_snapshot, args=(values, number), daemon=True)
+    self.snapshot_thread.start()
+    if wait:
+      self.snapshot_thread.join()
+
+  ############################
+  def save(self, batches, snapshot=None):
+    """Append batches to the journal and then, if given a dict of
+    values to snapshot, start writing the snapshot. See append() and
+    snapshot()."""
+    self.append(batches)
+    if snapshot is not None:
+      self.snapshot(snapshot)
+
+  ############################
+  def _write_snapshot(self, values, number):
+    filename = self._filename('snapshot', number)
+    temp_filename = filename + '.tmp'
+    try:
+      with open(temp_filename, 'wb') as snapshot_file:
+        for field, pairs in values.items():
+          if pairs:
+            snapshot_file.write(encode_batch(field, pairs))
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+      os.replace(temp_filename, filename)
+    except OSError as e:
+      logging.error('Unable to write snapshot %s: %s', filename, e)
+      return
+    self.last_snapshot_size = os.path.getsize(filename)
+    self.snapshot_number = number
+    logging.info('Wrote snapshot %s (%d bytes)', filename,
+                 self.last_snapshot_size)
+
+    # Remove what the snapshot supersedes
+    snapshots, segments = self._existing_files()
+    for old_number in snapshots:
+      if old_number < number:
+        os.remove(self._filename('snapshot', old_number))
+    for old_number in segments:
+      if old_number <= number:
+        os.remove(self._filename('journal', old_number))
+
+  ############################
+  def close(self):
+    """Wait for any snapshot in progress, and close the current segment."""
+    if self.snapshot_thread:
+      self.snapshot_thread.join()
+    with self.lock:
+      if self.segment_file:
+        self.segment_file.close()
+        self.segment_file = None
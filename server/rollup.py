@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Downsampled rollups of a field's numeric values, maintained
+incrementally as values arrive, so that a RecordCache can serve trends
+over periods far longer than it can afford to keep raw values for.
+
+A rollup tier is defined by a resolution and a retention, both in
+seconds: e.g. (60, 86400) keeps one-minute summaries for a day. Each
+summary covers the values whose timestamps fall in one
+resolution-aligned bucket, and is served as a (timestamp, value) pair
+whose timestamp is the start of the bucket and whose value is a dict
+```
+  {'mean': 12.4, 'min': 12.1, 'max': 12.9, 'count': 600}
+```
+A bucket is served once it is complete: when a value for a later
+bucket arrives, or when the time covered by the bucket has passed.
+"""
+import bisect
+import logging
+import math
+
+# Recommended tiers: one-minute rollups for a day and ten-minute
+# rollups for a week, as (resolution, retention) in seconds.
+DEFAULT_ROLLUP_TIERS = [(60, 24 * 60 * 60), (600, 7 * 24 * 60 * 60)]
+
+############################
+def parse_rollup_tiers(spec):
+  """Parse a command line spec of the form
+  'resolution:retention,resolution:retention,...', e.g.
+  '60:86400,600:604800', into a list of (resolution, retention) tuples.
+  The spec 'default' means DEFAULT_ROLLUP_TIERS."""
+  if spec == 'default':
+    return list(DEFAULT_ROLLUP_TIERS)
+  tiers = []
+  for tier_spec in spec.split(','):
+    try:
+      resolution, retention = tier_spec.split(':')
+      tiers.append((float(resolution), float(retention)))
+    except ValueError:
+      raise ValueError('Rollup tiers must be specified as '
+                       '"resolution:retention,...", e.g. "60:86400"; '
+                       'found "%s"' % spec)
+  return tiers
+
+################################################################################
+class FieldRollup:
+  """Summaries of a field's numeric values in fixed-width time buckets."""
+  ############################
+  def __init__(self, resolution, retention):
+    """
+    ```
+    resolution   Width of each bucket, in seconds.
+
+    retention    How many seconds of buckets to keep; see trim().
+    ```
+    """
+    self.resolution = resolution
+    self.retention = retention
+
+    # Completed buckets, oldest first, as [start, sum, min, max, count]
+    # lists, and a parallel list of their start times for bisecting.
+    self.buckets = []
+    self.starts = []
+
+    # The bucket currently accumulating values, if any
+    self.current = None
+
+  ############################
+  def add(self, timestamp, value):
+    """Add a value to the bucket its timestamp falls in. Non-numeric
+    values are ignored."""
+    if type(value) not in (int, float) or type(timestamp) not in (int, float):
+      return
+    start = math.floor(timestamp / self.resolution) * self.resolution
+
+    if self.current is None or start > self.current[0]:
+      self._complete_current()
+      self.current = [start, value, value, value, 1]
+      return
+
+    if start == self.current[0]:
+      bucket = self.current
+    else:
+      # Out of order: fold it into the completed bucket it belongs to,
+      # if we still have it.
+      i = bisect.bisect_left(self.starts, start)
+      if i == len(self.starts) or self.starts[i] != start:
+        logging.debug('Dropping out-of-order value at %s', timestamp)
+        return
+      bucket = self.buckets[i]
+    bucket[1] += value
+    bucket[2] = min(bucket[2], value)
+    bucket[3] = max(bucket[3], value)
+    bucket[4] += 1
+
+  ############################
+  def _complete_current(self):
+    if self.current is not None:
+      self.buckets.append(self.current)
+      self.starts.append(self.current[0])
+      self.current = None
+
+  ############################
+  @staticmethod
+  def _summary(bucket):
+    start, total, minimum, maximum, count = bucket
+    return (start, {'mean': total / count, 'min': minimum,
+                    'max': maximum, 'count': count})
+
+  ############################
+  def since(self, timestamp, now):
+    """Return a list of the summaries of the completed buckets that
+    start after timestamp. If timestamp is -1, return just the most
+    recent one."""
+    if self.current is not None and \
+       now >= self.current[0] + self.resolution:
+      self._complete_current()
+    if timestamp == -1:
+      return [self._summary(self.buckets[-1])] if self.buckets else []
+    i = bisect.bisect_right(self.starts, timestamp)
+    return [self._summary(bucket) for bucket in self.buckets[i:]]
+
+  ############################
+  def between(self, start, end, now):
+    """Return a list of the summaries of the completed buckets covering
+    any of the time from start to end, inclusive."""
+    if self.current is not None and \
+       now >= self.current[0] + self.resolution:
+      self._complete_current()
+    first = bisect.bisect_right(self.starts, start - self.resolution)
+    last = bisect.bisect_right(self.starts, end)
+    return [self._summary(bucket) for bucket in self.buckets[first:last]]
+
+  ############################
+  def trim(self, now):
+    """Discard buckets that ended more than retention seconds ago."""
+    i = bisect.bisect_right(self.starts,
+                            now - self.retention - self.resolution)
+    if i:
+      del self.buckets[:i]
+      del self.starts[:i]
+
+  ############################
+  def __len__(self):
+    return len(self.buckets) + (self.current is not None)
@@ -5,6 +5,7 @@ import json
 import logging
 import sys
 import tempfile
+import threading
 import time
 import unittest
 import warnings
@@ -13,7 +14,8 @@ import websockets
 from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
 
 from logger.readers.text_file_reader import TextFileReader
-from server.cached_data_server import CachedDataServer
+from server.cached_data_server import CachedDataServer, RecordCache, STORAGE_TYPES
+from server.record_journal import RecordJournal
 
 class TestCachedDataServer(unittest.TestCase):
 
@@ -44,6 +46,11 @@ class TestCachedDataServer(unittest.TestCase):
         self.assertEqual(response.get('data', None),
                          ['field_1', 'field_2', 'field_3'])
         #####
+        to_send = {'type':'range', 'fields':['field_1', 2], 'start':0}
+        await ws.send(json.dumps(to_send))
+        response = json.loads(await ws.recv())
+        self.assertEqual(response.get('status', None), 400)
+        #####
         to_send = {'type':'publish',
                    'data':{'timestamp':time.time(),
                            'fields':{'field_1':'value_12',
@@ -224,6 +231,26 @@ class TestCachedDataServer(unittest.TestCase):
         self.assertEqual(len(response['data']['field_3']), 1)
         self.assertEqual(response['data']['field_3'][0][1], 'value_33')
 
+        #####
+        # A new field matching the wildcard should be picked up
+        to_send = {'type':'publish',
+                   'data':{'timestamp':time.time(),
+                           'fields':{'field_7':'value_71',
+                                     'field8_1':'value_81'}}}
+        await ws.send(json.dumps(to_send))
+        await asyncio.sleep(0.1)
+        result = await ws.recv()
+
+        to_send = {'type':'ready'}
+        await ws.send(json.dumps(to_send))
+        await asyncio.sleep(0.1)
+        result = await ws.recv()
+        logging.info('got ready 4 result: %s', result)
+
+        response = json.loads(result)
+        self.assertEqual(list(response['data']), ['field_7'])
+        self.assertEqual(response['data']['field_7'][0][1], 'value_71')
+
     asyncio.new_event_loop().run_until_complete(run_test())
     time.sleep(1)
 
@@ -330,7 +357,180 @@ class TestCachedDataServer(unittest.TestCase):
 
     asyncio.new_event_loop().run_until_complete(run_test())
     time.sleep(1)
-    
+
+  ############################
+  def test_record_cache_storage(self):
+    with self.assertRaises(ValueError):
+      RecordCache(storage='filing_cabinet')
+
+    for storage in STORAGE_TYPES:
+      cache = RecordCache(storage=storage, capacity=5)
+      for i in range(8):
+        cache.cache_record({'timestamp': 100 + i,
+                            'fields':{'float_field': i + 0.5,
+                                      'str_field': 'value_%d' % i}})
+      cache.cache_record({'fields':{'str_field':[(108, 'value_8'),
+                                                 (109, 'value_9')]}})
+
+      cache.cleanup(oldest=104, max_records=6)
+      self.assertEqual(cache.data['float_field'].since(0),
+                       [(ts, ts - 100 + 0.5) for ts in range(105, 108)])
+      self.assertEqual(cache.data['str_field'].since(106),
+                       [(ts, 'value_%d' % (ts - 100))
+                        for ts in range(107, 110)])
+
+      with tempfile.TemporaryDirectory() as disk_cache:
+        cache.save_to_disk(disk_cache)
+        new_cache = RecordCache(storage=storage, capacity=5)
+        new_cache.load_from_disk(disk_cache)
+        for field in ['float_field', 'str_field']:
+          self.assertEqual(new_cache.data[field].to_list(),
+                           cache.data[field].to_list())
+
+  ############################
+  def test_record_cache_save_changes(self):
+    cache = RecordCache()
+    for i in range(5):
+      cache.cache_record({'timestamp': 100 + i,
+                          'fields':{'field_%d' % j: i for j in range(3)}})
+    event_loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as disk_cache:
+      event_loop.run_until_complete(
+        cache.save_changes_to_disk(disk_cache, batch_fields=2))
+      new_cache = RecordCache()
+      new_cache.load_from_disk(disk_cache)
+      self.assertEqual(new_cache.copy_values(), cache.copy_values())
+
+      # Only fields with new values need saving again
+      self.assertEqual(cache.unsaved_fields(), [])
+      cache.cache_record({'timestamp': 105, 'fields':{'field_1': 5}})
+      self.assertEqual(cache.unsaved_fields(), ['field_1'])
+      self.assertEqual(new_cache.unsaved_fields(), [])
+    event_loop.close()
+
+  ############################
+  def test_record_cache_journal(self):
+    with tempfile.TemporaryDirectory() as disk_cache:
+      cache = RecordCache()
+      journal = RecordJournal(disk_cache, snapshot_bytes=1)
+      for i in range(8):
+        cache.cache_record({'timestamp': 100 + i,
+                            'fields':{'float_field': i + 0.5,
+                                      'str_field': 'value_%d' % i}})
+      cache.save_to_journal(journal)
+
+      # Next save should compact the journal into a snapshot of just
+      # the values we've retained.
+      cache.cleanup(oldest=104)
+      self.assertTrue(journal.snapshot_due())
+      cache.save_to_journal(journal)
+      journal.snapshot_thread.join()
+      cache.cache_record({'timestamp': 108, 'fields':{'str_field': 'value_8'}})
+      cache.save_to_journal(journal)
+      journal.close()
+
+      new_cache = RecordCache()
+      new_cache.load_from_journal(RecordJournal(disk_cache))
+      self.assertEqual(new_cache.data['float_field'].to_list(),
+                       [(ts, ts - 100 + 0.5) for ts in range(105, 108)])
+      self.assertEqual(new_cache.data['str_field'].to_list(),
+                       [(ts, 'value_%d' % (ts - 100)) for ts in range(105, 109)])
+
+  ############################
+  def test_record_cache_rollups(self):
+    cache = RecordCache(rollup_tiers=[(10, 10**10), (60, 10**10)])
+    for i in range(120):
+      cache.cache_record({'timestamp': 600 + i,
+                          'fields':{'float_field': float(i),
+                                    'str_field': 'value_%d' % i}})
+    self.assertIsNone(cache.get_rollup('float_field', 30))
+    ten_second = cache.get_rollup('float_field', 10)
+    self.assertEqual(ten_second.since(0, now=720)[0],
+                     (600, {'mean': 4.5, 'min': 0, 'max': 9, 'count': 10}))
+    self.assertEqual(len(ten_second.since(0, now=720)), 12)
+    self.assertEqual(
+      cache.get_rollup('float_field', 60).since(600, now=720),
+      [(660, {'mean': 89.5, 'min': 60, 'max': 119, 'count': 60})])
+
+    # Rollups outlive the raw values
+    cache.cleanup(oldest=715)
+    self.assertEqual(len(cache.data['float_field']), 4)
+    self.assertEqual(len(ten_second.since(0, now=720)), 12)
+
+    # Non-numeric fields get no summaries
+    self.assertEqual(cache.get_rollup('str_field', 10).since(0, now=720), [])
+
+    # Ranges reaching back past the raw values are answered from the
+    # finest rollup tier with no more than max_points buckets in range.
+    results = cache.get_range(['*_field'], 600, 719, now=720)
+    self.assertEqual(len(results['float_field']), 12)
+    self.assertEqual(len(results['str_field']), 4)
+    results = cache.get_range(['float_field'], 600, 719, max_points=5,
+                              now=720)
+    self.assertEqual(results['float_field'],
+      [(600, {'mean': 29.5, 'min': 0, 'max': 59, 'count': 60}),
+       (660, {'mean': 89.5, 'min': 60, 'max': 119, 'count': 60})])
+    self.assertEqual(
+      cache.range_rollup('float_field', 600, 719, 5, now=720).resolution, 60)
+    self.assertIsNone(cache.range_rollup('float_field', 716, 719, now=720))
+
+  ############################
+  def test_record_cache_submit(self):
+    # Without an event loop, submitted records wait for drain()
+    cache = RecordCache()
+    cache.submit_record({'timestamp': 1, 'fields':{'field_1': 1}})
+    self.assertEqual(cache.keys(), [])
+    cache.drain()
+    self.assertEqual(cache.data['field_1'].to_list(), [(1, 1)])
+
+    # With one, records submitted from other threads are added by the
+    # event loop.
+    event_loop = asyncio.new_event_loop()
+    cache = RecordCache(event_loop=event_loop)
+    def submit(thread_num):
+      for i in range(100):
+        cache.submit_record({'timestamp': i,
+                             'fields':{'field_%d' % thread_num: i}})
+    threads = [threading.Thread(target=submit, args=(thread_num,))
+               for thread_num in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(cache.keys(), [])
+    event_loop.run_until_complete(asyncio.sleep(0.01))
+    event_loop.close()
+    self.assertEqual(sorted(cache.keys()),
+                     ['field_%d' % thread_num for thread_num in range(4)])
+    for field in cache.keys():
+      self.assertEqual(cache.data[field].to_list(),
+                       [(i, i) for i in range(100)])
+
+  ############################
+  def test_record_cache_range(self):
+    for storage in STORAGE_TYPES:
+      cache = RecordCache(storage=storage)
+      for i in range(1000):
+        cache.cache_record({'timestamp': 1000 + i,
+                            'fields':{'field_1': float(i % 50),
+                                      'field_2': i,
+                                      'str_field': 'value_%d' % i}})
+      results = cache.get_range(['field_*', 'no_field'], 1100, 1199)
+      self.assertEqual(sorted(results), ['field_1', 'field_2'])
+      self.assertEqual(results['field_2'], [(ts, ts - 1000)
+                                            for ts in range(1100, 1200)])
+
+      results = cache.get_range(['field_1', 'str_field'], 0, 2000,
+                                max_points=100, method='min_max')
+      self.assertEqual(len(results['field_1']), 100)
+      self.assertEqual(min(v for _, v in results['field_1']), 0)
+      self.assertEqual(max(v for _, v in results['field_1']), 49)
+      self.assertEqual(len(results['str_field']), 100)
+      self.assertEqual(results['str_field'][-1], (1999, 'value_999'))
+
+      with self.assertRaises(ValueError):
+        cache.get_range(['field_1'], 0, 2000, max_points=10, method='bogus')
+
 ############################
 if __name__ == '__main__':
   import argparse
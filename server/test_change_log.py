@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from server.cached_data_server import RecordCache
+
+class TestChangeLog(unittest.TestCase):
+  ############################
+  def test_fragments(self):
+    for storage in ['list', 'ring_buffer']:
+      cache = RecordCache(storage=storage)
+      change_log = cache.change_log
+
+      cache.cache_record({'timestamp': 1, 'fields': {'f1': 1.0, 'f2': 'a'}})
+      change_log.update()
+      start = change_log.position('f1')
+      self.assertEqual(start, 1)
+      self.assertEqual(change_log.since('f1', start), (None, 1))
+
+      cache.cache_record({'timestamp': 2, 'fields': {'f1': 2.0}})
+      cache.cache_record({'timestamp': 3, 'fields': {'f1': 3.0, 'f2': 'c'}})
+      change_log.update()
+      cache.cache_record({'timestamp': 4, 'fields': {'f1': 4.0}})
+      change_log.update()
+
+      # Two connections at different points in the log
+      fragment, cursor = change_log.since('f1', start)
+      self.assertEqual(json.loads('[%s]' % fragment),
+                       [[2, 2.0], [3, 3.0], [4, 4.0]])
+      self.assertEqual(cursor, 4)
+      fragment, cursor = change_log.since('f1', 3)
+      self.assertEqual(json.loads('[%s]' % fragment), [[4, 4.0]])
+
+      # Fragments should be shared, not re-encoded
+      self.assertIs(change_log.since('f2', 1)[0],
+                    change_log.since('f2', 1)[0])
+
+      # A cursor in the middle of a fragment still gets the right values
+      fragment, cursor = change_log.since('f1', 2)
+      self.assertEqual(json.loads('[%s]' % fragment), [[3, 3.0], [4, 4.0]])
+
+      # Fields that appear after the log was created start from scratch
+      cache.cache_record({'timestamp': 5, 'fields': {'f3': True}})
+      self.assertEqual(change_log.position('f3'), 1)
+      cache.cache_record({'timestamp': 6, 'fields': {'f3': False}})
+      change_log.update()
+      fragment, cursor = change_log.since('f3', 1)
+      self.assertEqual(json.loads('[%s]' % fragment), [[6, False]])
+
+  ############################
+  def test_values_between(self):
+    cache = RecordCache(storage='ring_buffer', capacity=3)
+    for i in range(1, 6):
+      cache.cache_record({'timestamp': i, 'fields': {'f1': i}})
+    self.assertEqual(cache.values_between('f1', 0, 5),
+                     [(3, 3), (4, 4), (5, 5)])
+    self.assertEqual(cache.values_between('f1', 3, 4), [(4, 4)])
+    self.assertEqual(cache.values_between('f1', 5, 5), [])
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import logging
+import math
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from server.downsample import downsample, lttb, min_max, stride
+
+class TestDownsample(unittest.TestCase):
+  ############################
+  def test_lttb(self):
+    pairs = [(ts, math.sin(ts / 100)) for ts in range(10000)]
+    sampled = lttb(pairs, 100)
+    self.assertEqual(len(sampled), 100)
+    self.assertEqual(sampled[0], pairs[0])
+    self.assertEqual(sampled[-1], pairs[-1])
+    self.assertEqual(sampled, sorted(sampled))
+
+    # A lone spike should survive
+    pairs[5000] = (5000, 100.0)
+    self.assertIn((5000, 100.0), lttb(pairs, 100))
+
+  ############################
+  def test_min_max(self):
+    pairs = [(ts, float(ts % 10)) for ts in range(100)]
+    pairs[55] = (55, -5.0)
+    sampled = min_max(pairs, 20)
+    self.assertEqual(len(sampled), 20)
+    self.assertEqual(sampled[:4], [(0, 0.0), (9, 9.0), (10, 0.0), (19, 9.0)])
+    self.assertIn((55, -5.0), sampled)
+    self.assertEqual(sampled, sorted(sampled))
+
+  ############################
+  def test_downsample(self):
+    pairs = [(ts, ts) for ts in range(10)]
+    self.assertEqual(downsample(pairs, 0), pairs)
+    self.assertEqual(downsample(pairs, 20, 'min_max'), pairs)
+    self.assertEqual(len(downsample(pairs, 5)), 5)
+    self.assertEqual(len(downsample(pairs, 2)), 2)
+    with self.assertRaises(ValueError):
+      downsample(pairs, 5, 'average')
+
+    # Non-numeric values get picked by stride
+    pairs = [(ts, 'v%d' % ts) for ts in range(10)]
+    self.assertEqual(downsample(pairs, 5), stride(pairs, 5))
+    self.assertEqual([ts for ts, _ in stride(pairs, 5)], [1, 3, 5, 7, 9])
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
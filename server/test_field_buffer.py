@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from server.field_buffer import FieldBuffer, FieldList
+
+class TestFieldBuffer(unittest.TestCase):
+  ############################
+  def test_basic(self):
+    for storage in [FieldList(), FieldBuffer(initial_size=2)]:
+      for i in range(10):
+        storage.add(float(i), i * 10)
+      self.assertEqual(len(storage), 10)
+      self.assertEqual(storage[0], (0, 0))
+      self.assertEqual(storage[-1], (9, 90))
+      self.assertEqual(storage.since(6.5), [(7, 70), (8, 80), (9, 90)])
+      self.assertEqual(storage.since(9), [])
+      self.assertEqual(storage.since(-1), list(storage))
+      self.assertEqual(storage.between(3, 5), [(3, 30), (4, 40), (5, 50)])
+      self.assertEqual(storage.between(2.5, 3.5), [(3, 30)])
+      self.assertEqual(storage.between(-5, 0), [(0, 0)])
+      self.assertEqual(storage.between(9.5, 20), [])
+
+      storage.trim(oldest=4, max_records=8)
+      self.assertEqual(storage.to_list(), [(i, i * 10) for i in range(5, 10)])
+      storage.trim(oldest=4, max_records=3)
+      self.assertEqual(storage.to_list(), [(i, i * 10) for i in range(7, 10)])
+
+      # Should always keep at least one value
+      storage.trim(oldest=100)
+      self.assertEqual(storage.to_list(), [(9, 90)])
+
+  ############################
+  def test_capacity(self):
+    buffer = FieldBuffer(capacity=3)
+    for i in range(10):
+      buffer.add(i, float(i))
+    self.assertEqual(buffer.to_list(), [(7, 7.0), (8, 8.0), (9, 9.0)])
+    self.assertEqual(buffer.since(7), [(8, 8.0), (9, 9.0)])
+    self.assertEqual(buffer.size, 3)
+
+  ############################
+  def test_value_types(self):
+    buffer = FieldBuffer(capacity=4)
+    buffer.add(1, 1)
+    self.assertEqual(buffer.values.typecode, 'q')
+    buffer.add(2, 2**70)
+    buffer.add(3, 'three')
+    buffer.add(4, None)
+    buffer.add(5, 5.5)
+    self.assertEqual(buffer.to_list(),
+                     [(2, 2**70), (3, 'three'), (4, None), (5, 5.5)])
+    self.assertIs(type(buffer[0][1]), int)
+
+    buffer = FieldBuffer()
+    buffer.add(1, 1.5)
+    self.assertEqual(buffer.values.typecode, 'd')
+    buffer.add(2, 2)
+    self.assertEqual(buffer.to_list(), [(1, 1.5), (2, 2)])
+    self.assertIs(type(buffer[1][1]), int)
+
+  ############################
+  def test_out_of_order(self):
+    for storage in [FieldList(), FieldBuffer(capacity=5)]:
+      for ts in [1, 2, 5, 3, 4, 6]:
+        storage.add(ts, ts)
+      self.assertEqual(storage.since(3), [(5, 5), (4, 4), (6, 6)])
+      self.assertEqual(storage.between(3, 5), [(5, 5), (3, 3), (4, 4)])
+
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
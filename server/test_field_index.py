@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from server.field_index import FieldIndex
+
+class TestFieldIndex(unittest.TestCase):
+  ############################
+  def test_match(self):
+    index = FieldIndex(['S330Speed', 'S330Heading', 'MyS330Course', 'S330',
+                        'KnudDepth'])
+    self.assertEqual(index.match('S330*'),
+                     ['S330Speed', 'S330Heading', 'MyS330Course'])
+    self.assertEqual(index.match('*Depth'), ['KnudDepth'])
+    self.assertEqual(index.match('NotThere'), ['NotThere'])
+    self.assertEqual(index.match('Not*There'), [])
+    with self.assertRaises(ValueError):
+      index.match('S330(*')
+
+  ############################
+  def test_matches_since(self):
+    index = FieldIndex(['S330Speed'])
+    matches, cursor = index.matches_since('S330*', 0)
+    self.assertEqual(matches, ['S330Speed'])
+
+    # New fields should be matched against registered patterns as they
+    # appear, and turn up after the cursor.
+    index.add('KnudDepth')
+    index.add('S330Heading')
+    index.add('S330Speed')  # not new
+    self.assertEqual(index.matches_since('S330*', cursor),
+                     (['S330Heading'], 2))
+    self.assertEqual(index.matches_since('S330*', 2), ([], 2))
+
+    # Plain field names match just themselves, once
+    self.assertEqual(index.matches_since('KnudDepth', 0), (['KnudDepth'], 1))
+    self.assertEqual(index.matches_since('KnudDepth', 1), ([], 1))
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
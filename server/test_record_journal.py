@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from server.record_journal import RecordJournal, encode_batch, decode_batches
+
+class TestRecordJournal(unittest.TestCase):
+  ############################
+  def test_encode_decode(self):
+    batches = [('float_field', [(1.5, 2.5), (2, 3.5)]),
+               ('int_field', [(1.5, 2), (2.5, -3)]),
+               ('str_field', [(1.5, 'a'), (2.5, None), (3.5, [1, 2])]),
+               ('big_int_field', [(1.5, 2**70)])]
+    data = b''.join(encode_batch(field, pairs) for field, pairs in batches)
+    self.assertEqual(list(decode_batches(data)), batches)
+
+    # A truncated or corrupted last frame should be ignored
+    with self.assertLogs(logging.getLogger(), logging.WARNING):
+      self.assertEqual(list(decode_batches(data[:-3])), batches[:-1])
+    corrupted = data[:-1] + bytes([data[-1] ^ 1])
+    with self.assertLogs(logging.getLogger(), logging.WARNING):
+      self.assertEqual(list(decode_batches(corrupted)), batches[:-1])
+
+  ############################
+  def test_replay(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      journal = RecordJournal(tmpdirname, segment_bytes=100)
+      for i in range(10):
+        journal.append({'f1': [(i, i + 0.5)], 'f2': [(i, 'v%d' % i)]})
+      journal.close()
+
+      # Small segments mean several segment files
+      self.assertGreater(len(os.listdir(tmpdirname)), 2)
+
+      journal = RecordJournal(tmpdirname, segment_bytes=100)
+      values = journal.replay()
+      self.assertEqual(values['f1'], [(i, i + 0.5) for i in range(10)])
+      self.assertEqual(values['f2'], [(i, 'v%d' % i) for i in range(10)])
+
+  ############################
+  def test_snapshot(self):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+      journal = RecordJournal(tmpdirname, snapshot_bytes=1)
+      self.assertFalse(journal.snapshot_due())
+      for i in range(5):
+        journal.append({'f1': [(i, float(i))]})
+      self.assertTrue(journal.snapshot_due())
+
+      # Snapshot only the values we've kept; it should replace the
+      # journal segments written so far.
+      journal.snapshot({'f1': [(3, 3.0), (4, 4.0)]}, wait=True)
+      journal.append({'f1': [(5, 5.0)]})
+      journal.close()
+      self.assertEqual(sorted(os.listdir(tmpdirname)),
+                       ['journal-00000002', 'snapshot-00000001'])
+
+      journal = RecordJournal(tmpdirname, snapshot_bytes=1)
+      self.assertEqual(journal.replay(),
+                       {'f1': [(3, 3.0), (4, 4.0), (5, 5.0)]})
+
+      # An earlier process's segments aren't appended to
+      journal.append({'f1': [(6, 6.0)]})
+      journal.close()
+      self.assertIn('journal-00000003', os.listdir(tmpdirname))
+      self.assertEqual(RecordJournal(tmpdirname).replay()['f1'][-1], (6, 6.0))
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import logging
+import sys
+import unittest
+
+from os.path import dirname, realpath; sys.path.append(dirname(dirname(realpath(__file__))))
+
+from server.rollup import FieldRollup, parse_rollup_tiers, DEFAULT_ROLLUP_TIERS
+
+class TestFieldRollup(unittest.TestCase):
+  ############################
+  def test_parse_rollup_tiers(self):
+    self.assertEqual(parse_rollup_tiers('default'), DEFAULT_ROLLUP_TIERS)
+    self.assertEqual(parse_rollup_tiers('10:3600,60:86400'),
+                     [(10, 3600), (60, 86400)])
+    with self.assertRaises(ValueError):
+      parse_rollup_tiers('10,60:86400')
+
+  ############################
+  def test_add(self):
+    rollup = FieldRollup(resolution=10, retention=100)
+    for ts in range(100, 125):
+      rollup.add(ts, float(ts))
+    rollup.add(126, 'not a number')
+    rollup.add(127, True)
+
+    # The bucket starting at 120 isn't complete yet
+    self.assertEqual(rollup.since(0, now=125), [
+      (100, {'mean': 104.5, 'min': 100, 'max': 109, 'count': 10}),
+      (110, {'mean': 114.5, 'min': 110, 'max': 119, 'count': 10})])
+    self.assertEqual(rollup.since(100, now=125)[0][0], 110)
+    self.assertEqual(rollup.since(-1, now=125)[0][0], 110)
+
+    # A late value goes in the (completed) bucket it belongs to
+    rollup.add(105, 1000)
+    self.assertEqual(rollup.since(0, now=125)[0][1]['max'], 1000)
+    self.assertEqual(rollup.since(0, now=125)[0][1]['count'], 11)
+
+    # Once its time has passed, the current bucket is complete
+    self.assertEqual(rollup.since(110, now=130), [
+      (120, {'mean': 122.0, 'min': 120, 'max': 124, 'count': 5})])
+
+  ############################
+  def test_trim(self):
+    rollup = FieldRollup(resolution=10, retention=20)
+    for ts in range(100, 150, 5):
+      rollup.add(ts, ts)
+    self.assertEqual(len(rollup), 5)
+
+    # Buckets ending more than 20 seconds before now get dropped
+    rollup.trim(now=145)
+    self.assertEqual([start for start, _ in rollup.since(0, now=145)],
+                     [120, 130])
+    self.assertEqual(len(rollup), 3)
+
+################################################################################
+if __name__ == '__main__':
+  import argparse
+  parser = argparse.ArgumentParser()
+  parser.add_argument('-v', '--verbosity', dest='verbosity',
+                      default=0, action='count',
+                      help='Increase output verbosity')
+  args = parser.parse_args()
+
+  LOGGING_FORMAT = '%(asctime)-15s %(message)s'
+  logging.basicConfig(format=LOGGING_FORMAT)
+
+  LOG_LEVELS ={0:logging.WARNING, 1:logging.INFO, 2:logging.DEBUG}
+  args.verbosity = min(args.verbosity, max(LOG_LEVELS))
+  logging.getLogger().setLevel(LOG_LEVELS[args.verbosity])
+
+  unittest.main(warnings='ignore')